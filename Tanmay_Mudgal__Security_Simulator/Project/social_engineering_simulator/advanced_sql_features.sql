@@ -27,34 +27,10 @@ BEGIN
 END//
 DELIMITER ;
 
--- Trigger to auto-calculate accuracy when user_response is added
-DELIMITER //
-CREATE TRIGGER calculate_user_accuracy
-AFTER INSERT ON user_responses
-FOR EACH ROW
-BEGIN
-    DECLARE total_responses INT;
-    DECLARE correct_responses INT;
-    DECLARE new_accuracy FLOAT;
-    
-    -- Count total and correct responses
-    SELECT COUNT(*), SUM(CASE WHEN is_correct = 1 THEN 1 ELSE 0 END)
-    INTO total_responses, correct_responses
-    FROM user_responses
-    WHERE user_id = NEW.user_id;
-    
-    -- Update user vulnerability level based on accuracy
-    SET new_accuracy = (correct_responses / total_responses) * 100;
-    
-    UPDATE users
-    SET vulnerability_level = CASE
-        WHEN new_accuracy >= 80 THEN 'Low'
-        WHEN new_accuracy >= 50 THEN 'Medium'
-        ELSE 'High'
-    END
-    WHERE user_id = NEW.user_id;
-END//
-DELIMITER ;
+-- calculate_user_accuracy (a COUNT/SUM over all of the user's responses on
+-- every insert) was replaced by delta updates of user_stats on the submit
+-- path, which also sets users.vulnerability_level; see
+-- migrations/versions/0005_summary_tables.py
 
 -- Trigger to update leaderboard automatically
 DELIMITER //
@@ -77,24 +53,9 @@ DELIMITER ;
 -- VIEWS FOR COMPLEX QUERIES
 -- ==========================================
 
--- View: User Performance Summary
-CREATE OR REPLACE VIEW user_performance_summary AS
-SELECT 
-    u.user_id,
-    u.username,
-    u.email,
-    u.total_score,
-    u.vulnerability_level,
-    COUNT(ur.response_id) AS total_attempts,
-    SUM(CASE WHEN ur.is_correct = 1 THEN 1 ELSE 0 END) AS correct_attempts,
-    ROUND((SUM(CASE WHEN ur.is_correct = 1 THEN 1 ELSE 0 END) / COUNT(ur.response_id)) * 100, 2) AS accuracy_percentage,
-    AVG(ur.response_time) AS avg_response_time,
-    COUNT(DISTINCT a.achievement_id) AS total_achievements,
-    u.created_date AS member_since
-FROM users u
-LEFT JOIN user_responses ur ON u.user_id = ur.user_id
-LEFT JOIN achievements a ON u.user_id = a.user_id
-GROUP BY u.user_id, u.username, u.email, u.total_score, u.vulnerability_level, u.created_date;
+-- user_performance_summary, global_leaderboard and user_category_performance
+-- are thin selects over the user_stats / user_category_stats summary tables,
+-- created by migrations/versions/0005_summary_tables.py (flask migrations upgrade)
 
 -- View: Scenario Difficulty Analysis
 CREATE OR REPLACE VIEW scenario_difficulty_analysis AS
@@ -111,40 +72,6 @@ LEFT JOIN user_responses ur ON s.scenario_id = ur.scenario_id
 GROUP BY s.scenario_type, s.difficulty_level
 ORDER BY s.scenario_type, s.difficulty_level;
 
--- View: Global Leaderboard (Top 50)
-CREATE OR REPLACE VIEW global_leaderboard AS
-SELECT 
-    ROW_NUMBER() OVER (ORDER BY u.total_score DESC, u.created_date ASC) AS rank,
-    u.user_id,
-    u.username,
-    u.total_score,
-    u.vulnerability_level,
-    COUNT(DISTINCT ur.response_id) AS scenarios_completed,
-    ROUND((SUM(CASE WHEN ur.is_correct = 1 THEN 1 ELSE 0 END) / COUNT(ur.response_id)) * 100, 2) AS accuracy,
-    COUNT(DISTINCT a.achievement_id) AS achievements_earned
-FROM users u
-LEFT JOIN user_responses ur ON u.user_id = ur.user_id
-LEFT JOIN achievements a ON u.user_id = a.user_id
-GROUP BY u.user_id, u.username, u.total_score, u.vulnerability_level, u.created_date
-HAVING scenarios_completed > 0
-ORDER BY u.total_score DESC
-LIMIT 50;
-
--- View: Category Performance by User
-CREATE OR REPLACE VIEW user_category_performance AS
-SELECT 
-    u.user_id,
-    u.username,
-    s.scenario_type AS category,
-    COUNT(ur.response_id) AS attempts,
-    SUM(CASE WHEN ur.is_correct = 1 THEN 1 ELSE 0 END) AS correct,
-    ROUND((SUM(CASE WHEN ur.is_correct = 1 THEN 1 ELSE 0 END) / COUNT(ur.response_id)) * 100, 2) AS accuracy,
-    AVG(ur.response_time) AS avg_time
-FROM users u
-JOIN user_responses ur ON u.user_id = ur.user_id
-JOIN scenarios s ON ur.scenario_id = s.scenario_id
-GROUP BY u.user_id, u.username, s.scenario_type;
-
 -- View: Learning Path Progress
 CREATE OR REPLACE VIEW learning_path_progress_view AS
 SELECT 
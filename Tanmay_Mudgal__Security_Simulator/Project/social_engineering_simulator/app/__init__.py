@@ -4,9 +4,10 @@ from config import config
 from flask_wtf.csrf import CSRFProtect
 from flask_limiter import Limiter
 from flask_limiter.util import get_remote_address
+from app.services.db_routing import RoutingSession
 
 # Initialize extensions
-db = SQLAlchemy()
+db = SQLAlchemy(session_options={'class_': RoutingSession})  # reads may go to replicas (see db_routing)
 csrf = CSRFProtect()
 limiter = Limiter(key_func=get_remote_address)
 
@@ -17,16 +18,63 @@ def create_app(config_name='development'):
     # Load configuration
     app.config.from_object(config[config_name])
     
-    # Initialize extensions
-    # Initialize extensions
+    # Request / DB pool / ML timing metrics (served at /metrics)
+    from app.services.request_metrics import metrics
+    metrics.configure_engine(app)
+    
+    # Pool sizing and read-replica binds (DB_POOL_*, DB_REPLICA_URIS)
+    from app.services.db_routing import replica_router
+    replica_router.configure_engines(app)
+    
+    # Tenant shard binds (DB_SHARD_URIS) and the org -> shard directory
+    from app.services.sharding import shard_router
+    shard_router.configure_engines(app)
+    
     # Initialize extensions
     db.init_app(app)
     csrf.init_app(app)
+    
+    # Counters shared across workers; also Flask-Limiter's storage (counterstore://)
+    from app.services.counter_store import counter_store
+    counter_store.init_app(app)
     limiter.init_app(app)
     
-    # Initialize Mail
-    from app.email_service import mail
-    mail.init_app(app)
+    # Roles, permissions, achievement definitions, ... cached per process (version-invalidated)
+    from app.services.reference_data import reference_data
+    reference_data.init_app(app)
+    
+    # Compiled answer keys for lesson / module quizzes, cached per process (version-invalidated)
+    from app.services.quiz_grading import quiz_keys
+    quiz_keys.init_app(app)
+    
+    # Campaign email delivery and open / click tracking (`flask campaigns dispatch` / `campaigns ingest`)
+    from app.services.campaign_scheduler import campaign_scheduler
+    campaign_scheduler.init_app(app)
+    from app.services.tracking_events import tracking_log
+    tracking_log.init_app(app)
+    
+    # Suspicious-report screenshots: stored by content hash, thumbnailed in the background
+    from app.services.screenshot_store import screenshot_store
+    screenshot_store.init_app(app)
+    
+    # Learning-module views, buffered per worker and upserted into user_progress in batches
+    from app.services.module_views import module_views
+    module_views.init_app(app)
+    
+    # Background jobs: retraining and maintenance sweeps, run by `flask jobs work`
+    from app.services.jobs import job_queue
+    job_queue.init_app(app)
+    
+    # Opt-in stack sampling for single admin requests (?_profile=1; see /admin/profiles)
+    from app.services.sampling_profiler import sampling_profiler
+    sampling_profiler.init_app(app)
+    
+    # Per-request SQL profiling (sampled; see /admin/perf)
+    from app.services.sql_profiler import sql_profiler
+    sql_profiler.init_app(app)
+    metrics.init_app(app)
+    replica_router.init_app(app)
+    shard_router.init_app(app)
 
     # Register custom filters
     import random
@@ -48,6 +96,7 @@ def create_app(config_name='development'):
         from app.notification_routes import notification_bp
         from app.admin_routes import admin_bp
         from app.payment_routes import payment_bp
+        from app.tracking_routes import tracking_bp
         
         app.register_blueprint(main_bp)
         app.register_blueprint(learning_bp)
@@ -55,9 +104,14 @@ def create_app(config_name='development'):
         app.register_blueprint(notification_bp)
         app.register_blueprint(admin_bp)
         app.register_blueprint(payment_bp)
-        
-        # Create tables if they don't exist
-        db.create_all()
+        app.register_blueprint(tracking_bp)
+    
+    # Schema creation is explicit (`flask create-schema`); Mail, sklearn and the
+    # model/chatbot artifacts load on first use unless warmed up here.
+    from app.cli import register_commands, warm_up
+    register_commands(app)
+    if app.config.get('WARMUP_ON_STARTUP'):
+        warm_up(app)
     
     return app
 
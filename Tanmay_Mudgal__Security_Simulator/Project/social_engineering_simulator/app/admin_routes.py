@@ -2,36 +2,58 @@
 Admin Routes Blueprint
 Handles global admin and organization admin functionalities
 """
-from flask import Blueprint, render_template, request, jsonify, session, redirect, url_for, flash, make_response
+from flask import Blueprint, render_template, request, jsonify, session, redirect, url_for, flash, make_response, current_app, abort
 from app.auth_decorators import require_role, require_permission, login_required
-from app.models import User, Role, Permission, UserRole, Organization, Department, Team, LearningProgress, UserResponse, db, SuspiciousReport, Scenario
-from sqlalchemy import func
+from app.models import User, Role, Permission, UserRole, Organization, Department, Team, LearningProgress, UserResponse, db, SuspiciousReport, Scenario, Campaign, ReportCluster
+from sqlalchemy import func, or_, and_
+from sqlalchemy.orm import joinedload
+from app.services.metrics_cache import MetricsCache
+from app.services.db_routing import read_only
+from app.services.sharding import org_scoped, tenant_scope
+from app.services.reference_data import reference_data
+from app.services.report_clusters import decide as decide_cluster, decide_report
+from app.services.screenshot_store import screenshot_store
+from app.services.campaign_results import results, parse_dimensions, rates as result_rates, MEASURES as RESULT_MEASURES
 import io
 import csv
-from datetime import datetime
+from contextlib import nullcontext
+from datetime import datetime, timedelta
 
 admin_bp = Blueprint('admin', __name__, url_prefix='/admin')
 
-@admin_bp.route('/')
-@require_role('GLOBAL_ADMIN')
-def dashboard(current_user):
-    """Global Admin Dashboard"""
-    # Get statistics
-    total_users = User.query.count()
-    total_roles = Role.query.count()
-    
-    # Get role distribution
-    role_stats = db.session.query(
+# ================================
+# Cached Platform Metrics
+# ================================
+# Each metric is a single (grouped) query; values are cached in
+# metric_snapshots and shared by all workers (see MetricsCache).
+
+@MetricsCache.metric('global_counts', ttl=120)
+def _metric_global_counts():
+    counts = db.session.query(
+        db.session.query(func.count(User.user_id)).scalar_subquery(),
+        db.session.query(func.count(Role.role_id)).scalar_subquery(),
+        db.session.query(func.count(Scenario.scenario_id)).scalar_subquery(),
+        db.session.query(func.count(UserResponse.response_id)).scalar_subquery()
+    ).one()
+    return {
+        'total_users': counts[0],
+        'total_roles': counts[1],
+        'total_scenarios': counts[2],
+        'total_responses': counts[3]
+    }
+
+@MetricsCache.metric('role_stats', ttl=300)
+def _metric_role_stats():
+    rows = db.session.query(
         Role.role_name,
         func.count(UserRole.user_id).label('count')
     ).join(UserRole).group_by(Role.role_name).all()
-    
-    # Recent users
-    recent_users = User.query.order_by(User.created_date.desc()).limit(10).all()
-    
-    # Achievement Distribution
+    return [[name, count] for name, count in rows]
+
+@MetricsCache.metric('achievement_stats', ttl=300)
+def _metric_achievement_stats():
     from app.models import AchievementDefinition, Achievement
-    achievement_stats = db.session.query(
+    rows = db.session.query(
         AchievementDefinition.name,
         func.count(Achievement.achievement_id)
     ).join(Achievement, AchievementDefinition.definition_id == Achievement.definition_id)\
@@ -39,35 +61,164 @@ def dashboard(current_user):
      .group_by(AchievementDefinition.name)\
      .order_by(func.count(Achievement.achievement_id).desc())\
      .limit(10).all()
+    return [[name, count] for name, count in rows]
+
+@MetricsCache.metric('users_per_org', ttl=300)
+def _metric_users_per_org():
+    rows = db.session.query(
+        Organization.name,
+        func.count(User.user_id)
+    ).join(User, Organization.org_id == User.org_id).group_by(Organization.name).all()
+    return {
+        'labels': [r[0] for r in rows],
+        'data': [r[1] for r in rows]
+    }
+
+@MetricsCache.metric('signups_7d', ttl=300)
+def _metric_signups_7d():
+    """User registrations per day for the last 7 days, in one GROUP BY"""
+    from datetime import timedelta
+    today = datetime.utcnow().date()
+    start = datetime.combine(today - timedelta(days=6), datetime.min.time())
+    
+    signup_day = func.date(User.created_date)
+    rows = db.session.query(signup_day, func.count(User.user_id))\
+        .filter(User.created_date >= start)\
+        .group_by(signup_day).all()
+    # func.date() comes back as a date on MySQL and a string on SQLite
+    per_day = {str(day): count for day, count in rows}
+    
+    dates = [(today - timedelta(days=i)).strftime('%Y-%m-%d') for i in range(6, -1, -1)]
+    return {
+        'labels': dates,
+        'data': [per_day.get(d, 0) for d in dates]
+    }
+
+@admin_bp.route('/')
+@require_role('GLOBAL_ADMIN')
+def dashboard(current_user):
+    """Global Admin Dashboard"""
+    metrics = MetricsCache.get_many('global_counts', 'role_stats', 'achievement_stats')
+    
+    # Recent users (indexed LIMIT query, cheap enough to stay live)
+    recent_users = User.query.order_by(User.created_date.desc()).limit(10).all()
 
     return render_template('admin/dashboard.html',
                          current_user=current_user,
-                         total_users=total_users,
-                         total_roles=total_roles,
-                         role_stats=role_stats,
-                         achievement_stats=achievement_stats,
+                         total_users=metrics['global_counts']['total_users'],
+                         total_roles=metrics['global_counts']['total_roles'],
+                         role_stats=metrics['role_stats'],
+                         achievement_stats=metrics['achievement_stats'],
                          recent_users=recent_users)
 
+@admin_bp.route('/metrics/refresh', methods=['POST'])
+@require_role('GLOBAL_ADMIN')
+def refresh_metrics(current_user):
+    """Recompute all cached admin metrics now"""
+    try:
+        timings = MetricsCache.refresh_all()
+        return jsonify({'success': True, 'message': 'Metrics refreshed', 'compute_ms': timings})
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({'success': False, 'message': str(e)}), 500
+
+@admin_bp.route('/metrics/timings')
+@require_role('GLOBAL_ADMIN')
+def metric_timings(current_user):
+    """Last compute time of each cached admin metric"""
+    return jsonify(MetricsCache.timings())
+
+USER_DIRECTORY_PAGE_SIZE = 50
+
+def _user_directory_page(current_user, args):
+    """
+    Fetch one keyset page of the user directory.
+    Filters: q (username/email prefix), org_id, dept_id, role (role name).
+    Pagination: 'after' is the last user_id of the previous page; users are
+    ordered by user_id so every page is an index range scan, not an OFFSET.
+    Returns (users, next_cursor).
+    """
+    limit = min(args.get('limit', USER_DIRECTORY_PAGE_SIZE, type=int) or USER_DIRECTORY_PAGE_SIZE, 200)
+    
+    # User roles are pulled in the same statement (the Role itself comes from the reference cache)
+    # so templates reading user.role don't query per row
+    query = User.query.options(joinedload(User.roles))
+    
+    # Org admins only ever see their own tenant
+    if current_user.is_org_admin():
+        query = query.filter(User.org_id == current_user.org_id)
+    elif args.get('org_id', type=int):
+        query = query.filter(User.org_id == args.get('org_id', type=int))
+    
+    if args.get('dept_id', type=int):
+        query = query.filter(User.dept_id == args.get('dept_id', type=int))
+    
+    search = (args.get('q') or '').strip()
+    if search:
+        pattern = f"{search}%"
+        query = query.filter(or_(User.username.like(pattern), User.email.like(pattern)))
+    
+    role_name = (args.get('role') or '').strip()
+    if role_name:
+        role_users = db.session.query(UserRole.user_id)\
+            .join(Role, Role.role_id == UserRole.role_id)\
+            .filter(Role.role_name == role_name)
+        query = query.filter(User.user_id.in_(role_users))
+    
+    after = args.get('after', type=int)
+    if after:
+        query = query.filter(User.user_id > after)
+    
+    users = query.order_by(User.user_id).limit(limit + 1).all()
+    next_cursor = None
+    if len(users) > limit:
+        users = users[:limit]
+        next_cursor = users[-1].user_id
+    return users, next_cursor
+
 @admin_bp.route('/users')
 @require_role('GLOBAL_ADMIN', 'ORG_ADMIN')
 def manage_users(current_user):
     """User Management Page"""
-    # Get all users with their roles
-    users = User.query.all()
-    roles = Role.query.all()
-    organizations = Organization.query.order_by(Organization.name).all()
+    users, next_cursor = _user_directory_page(current_user, request.args)
+    roles = sorted(reference_data.all(Role), key=lambda r: r.role_name)
     
-    # If org admin, filter by organization
     if current_user.is_org_admin():
-        users = [u for u in users if u.org_id == current_user.org_id]
         # Org admins can't assign organizations, so list might be irrelevant or restricted
         organizations = [Organization.query.get(current_user.org_id)]
+    else:
+        organizations = Organization.query.with_entities(Organization.org_id, Organization.name)\
+            .order_by(Organization.name).all()
+    
+    # Carry the active filters into the "next page" link
+    filters = {k: v for k, v in request.args.items() if k in ('q', 'org_id', 'dept_id', 'role') and v}
     
     return render_template('admin/users.html',
                          current_user=current_user,
                          users=users,
                          roles=roles,
-                         organizations=organizations)
+                         organizations=organizations,
+                         filters=filters,
+                         next_cursor=next_cursor)
+
+@admin_bp.route('/users/api')
+@require_role('GLOBAL_ADMIN', 'ORG_ADMIN')
+def user_directory_api(current_user):
+    """Paginated user directory (JSON)"""
+    users, next_cursor = _user_directory_page(current_user, request.args)
+    return jsonify({
+        'users': [{
+            'user_id': u.user_id,
+            'username': u.username,
+            'email': u.email,
+            'org_id': u.org_id,
+            'dept_id': u.dept_id,
+            'team_id': u.team_id,
+            'role': u.role.role_name if u.role else None,
+            'subscription_tier': u.subscription_tier
+        } for u in users],
+        'next_cursor': next_cursor
+    })
 
 @admin_bp.route('/users/<int:user_id>/role', methods=['POST'])
 @require_permission('manage_users')
@@ -232,6 +383,7 @@ def delete_organization(current_user, org_id):
 
 @admin_bp.route('/organizations/<int:org_id>/departments')
 @require_role('GLOBAL_ADMIN', 'ORG_ADMIN')
+@org_scoped()
 def manage_departments(current_user, org_id):
     """List departments for an organization"""
     # Security check for ORG_ADMIN
@@ -246,6 +398,7 @@ def manage_departments(current_user, org_id):
 
 @admin_bp.route('/organizations/<int:org_id>/departments/create', methods=['POST'])
 @require_role('GLOBAL_ADMIN', 'ORG_ADMIN')
+@org_scoped()
 def create_department(current_user, org_id):
     """Create new department"""
     if current_user.is_org_admin() and current_user.org_id != org_id:
@@ -422,52 +575,28 @@ def create_team(current_user, dept_id):
 
 @admin_bp.route('/analytics')
 @require_role('GLOBAL_ADMIN')
+@read_only
 def analytics(current_user):
     """Global Analytics Dashboard"""
-    # Get overall statistics
-    stats = {
-        'total_users': User.query.count(),
-        'total_scenarios': db.session.query(func.count()).select_from(db.Model.metadata.tables['scenarios']).scalar() if 'scenarios' in db.Model.metadata.tables else 0,
-        'total_responses': db.session.query(func.count()).select_from(db.Model.metadata.tables['user_responses']).scalar() if 'user_responses' in db.Model.metadata.tables else 0
-    }
-    
-    # Data for charts
-    # 1. Users per Organization
-    org_data = db.session.query(
-        Organization.name,
-        func.count(User.user_id)
-    ).join(User, Organization.org_id == User.org_id).group_by(Organization.name).all()
-    
-    org_chart_data = {
-        'labels': [r[0] for r in org_data],
-        'data': [r[1] for r in org_data]
-    }
+    metrics = MetricsCache.get_many('global_counts', 'users_per_org', 'signups_7d')
+    counts = metrics['global_counts']
     
-    # 2. User Registration Over Time (Last 7 days)
-    # Note: SQLite/MySQL syntax difference for date handling might exist, using generic approach
-    from datetime import datetime, timedelta
-    dates = []
-    counts = []
-    for i in range(6, -1, -1):
-        date = datetime.now().date() - timedelta(days=i)
-        count = User.query.filter(func.date(User.created_date) == date).count()
-        dates.append(date.strftime('%Y-%m-%d'))
-        counts.append(count)
-        
-    registration_chart_data = {
-        'labels': dates,
-        'data': counts
+    stats = {
+        'total_users': counts['total_users'],
+        'total_scenarios': counts['total_scenarios'],
+        'total_responses': counts['total_responses']
     }
     
     return render_template('admin/analytics.html',
                          current_user=current_user,
                          stats=stats,
-                         org_chart_data=org_chart_data,
-                         registration_chart_data=registration_chart_data)
+                         org_chart_data=metrics['users_per_org'],
+                         registration_chart_data=metrics['signups_7d'])
 
 # Organization Admin Routes
 @admin_bp.route('/org')
 @require_role('ORG_ADMIN')
+@read_only
 def org_dashboard(current_user):
     """Organization Admin Dashboard"""
     # Get users in the same organization
@@ -605,7 +734,7 @@ def create_org_user(current_user):
         db.session.flush()
         
         # Assign LEARNER role by default
-        learner_role = Role.query.filter_by(role_name='LEARNER').first()
+        learner_role = reference_data.by_key(Role, 'LEARNER')
         if learner_role:
             user_role = UserRole(
                 user_id=new_user.user_id,
@@ -623,6 +752,7 @@ def create_org_user(current_user):
 
 @admin_bp.route('/org/reports')
 @require_role('ORG_ADMIN')
+@read_only
 def org_reports(current_user):
     """Organization Reports"""
     from datetime import datetime
@@ -638,6 +768,8 @@ def org_reports(current_user):
 
 @admin_bp.route('/export/org/<int:org_id>/summary.csv')
 @require_role('GLOBAL_ADMIN')
+@org_scoped()
+@read_only
 def export_org_summary(current_user, org_id):
     """Export Organization Summary CSV"""
     # Restricted to GLOBAL_ADMIN only per requirements
@@ -699,6 +831,134 @@ def export_org_summary(current_user, org_id):
     output.headers["Content-type"] = "text/csv"
     return output
 
+# ================================
+# Campaign Results
+# ================================
+# Served from the campaign_results cube (services/campaign_results.py):
+# a few hundred aggregate rows per campaign, whatever its target count.
+
+def _campaign_results(current_user, org_id, campaign_id):
+    """(campaign, dimensions, rows, error response) for the results views"""
+    if current_user.is_org_admin() and current_user.org_id != org_id:
+        return None, None, None, (jsonify({'success': False, 'message': 'Cannot view campaigns of other organizations'}), 403)
+    campaign = Campaign.query.filter_by(campaign_id=campaign_id, org_id=org_id).first_or_404()
+    try:
+        by = parse_dimensions(request.args.get('by', 'dept,team,day'))
+    except ValueError as e:
+        return None, None, None, (jsonify({'success': False, 'message': str(e)}), 400)
+    return campaign, by, results(db.session, campaign_id, by), None
+
+@admin_bp.route('/org/<int:org_id>/campaigns/<int:campaign_id>/results')
+@require_role('GLOBAL_ADMIN', 'ORG_ADMIN')
+@org_scoped()
+@read_only
+def campaign_results_api(current_user, org_id, campaign_id):
+    """Campaign results by ?by=dept,team,day (any subset, in that order of grouping)"""
+    campaign, by, rows, error = _campaign_results(current_user, org_id, campaign_id)
+    if error:
+        return error
+    totals = {m: sum(row[m] for row in rows) for m in RESULT_MEASURES}
+    return jsonify({
+        'campaign': {'campaign_id': campaign.campaign_id, 'name': campaign.name, 'status': campaign.status},
+        'by': list(by),
+        'totals': dict(totals, **result_rates(totals)),
+        'rows': [dict(row, **result_rates(row)) for row in rows],
+    })
+
+@admin_bp.route('/export/org/<int:org_id>/campaigns/<int:campaign_id>/results.csv')
+@require_role('GLOBAL_ADMIN', 'ORG_ADMIN')
+@org_scoped()
+@read_only
+def export_campaign_results(current_user, org_id, campaign_id):
+    """Export Campaign Results CSV (same ?by= as the results API)"""
+    campaign, by, rows, error = _campaign_results(current_user, org_id, campaign_id)
+    if error:
+        return error
+    
+    si = io.StringIO()
+    cw = csv.writer(si)
+    columns = {'dept': ['department'], 'team': ['team'], 'day': ['day']}
+    header = [column for name in by for column in columns[name]]
+    rate_columns = [f'{m}_rate' for m in RESULT_MEASURES[1:]]
+    cw.writerow(header + list(RESULT_MEASURES) + rate_columns)
+    for row in rows:
+        row_rates = result_rates(row)
+        cw.writerow([row[column] or '(none)' for column in header] + [row[m] for m in RESULT_MEASURES]
+                    + [f"{row_rates[c]:.1f}%" if row_rates[c] is not None else '' for c in rate_columns])
+    
+    output = make_response(si.getvalue())
+    output.headers["Content-Disposition"] = f"attachment; filename={campaign.name.replace(' ', '_')}_results.csv"
+    output.headers["Content-type"] = "text/csv"
+    return output
+
+@admin_bp.route('/perf')
+@require_role('GLOBAL_ADMIN')
+def perf(current_user):
+    """Recent request SQL profiles and suspected N+1 queries"""
+    from app.services.sql_profiler import sql_profiler
+    from app.services.request_metrics import metrics
+    from app.services.db_routing import replica_router
+    
+    if request.args.get('format') == 'json':
+        return jsonify({'summary': sql_profiler.summary(), 'recent': sql_profiler.recent(100),
+                        'latency': metrics.percentiles(), 'replicas': replica_router.status()})
+    
+    return render_template('admin/perf.html',
+                         current_user=current_user,
+                         latency=metrics.percentiles()[:25],
+                         replicas=replica_router.status(),
+                         summary=sql_profiler.summary(),
+                         recent=sql_profiler.recent(100),
+                         sample_rate=current_app.config.get('SQL_PROFILER_SAMPLE_RATE'),
+                         threshold=current_app.config.get('SQL_PROFILER_N_PLUS_ONE_THRESHOLD'))
+
+@admin_bp.route('/perf/clear', methods=['POST'])
+@require_role('GLOBAL_ADMIN')
+def clear_perf(current_user):
+    """Empty the SQL profile ring buffer"""
+    from app.services.sql_profiler import sql_profiler
+    sql_profiler.clear()
+    return jsonify({'success': True, 'message': 'Profiles cleared'})
+
+@admin_bp.route('/profiles')
+@require_role('GLOBAL_ADMIN')
+def profiles(current_user):
+    """Captured stack-sampling profiles (newest first)"""
+    from app.services.sampling_profiler import sampling_profiler
+    
+    captured = sampling_profiler.list_profiles()
+    if request.args.get('format') == 'json':
+        return jsonify({'profiles': captured})
+    
+    return render_template('admin/profiles.html', current_user=current_user, profiles=captured)
+
+@admin_bp.route('/profiles/<profile_id>')
+@require_role('GLOBAL_ADMIN')
+def view_profile(current_user, profile_id):
+    """Flamegraph of one captured profile, or the raw folded stacks with ?download=1"""
+    from app.services.sampling_profiler import sampling_profiler
+    
+    path = sampling_profiler.path_for(profile_id)
+    if not path:
+        flash('Profile not found', 'error')
+        return redirect(url_for('admin.profiles'))
+    
+    with open(path) as f:
+        folded = f.read()
+    
+    if request.args.get('download') == '1':
+        output = make_response(folded)
+        output.headers["Content-Disposition"] = f"attachment; filename={profile_id}.folded"
+        output.headers["Content-type"] = "text/plain"
+        return output
+    
+    header, _, stacks = folded.partition('\n')
+    return render_template('admin/flamegraph.html',
+                         current_user=current_user,
+                         profile_id=profile_id,
+                         header=header.lstrip('# '),
+                         stacks=stacks)
+
 @admin_bp.route('/quick-launch')
 @require_role('GLOBAL_ADMIN')
 def quick_launch(current_user):
@@ -748,7 +1008,7 @@ def quick_launch_api(current_user):
         
         # 3. Create Users
         created_users = []
-        learner_role = Role.query.filter_by(role_name='LEARNER').first()
+        learner_role = reference_data.by_key(Role, 'LEARNER')
         
         for email in user_emails:
             email = email.strip()
@@ -783,12 +1043,16 @@ def quick_launch_api(current_user):
             send_invite_email(new_user, org_name, 'temppass123')
             
         # 4. Create Campaign
+        # Sent by the campaign dispatcher, spread over the org's business hours
+        launch_at = datetime.utcnow()
         campaign = Campaign(
             org_id=new_org.org_id,
             name='Onboarding Phishing Basics',
             type='Phishing',
-            status='Active',
-            launched_at=datetime.utcnow()
+            status='Scheduled',
+            send_window_start=launch_at,
+            send_window_end=launch_at + timedelta(hours=current_app.config['CAMPAIGN_DEFAULT_WINDOW_HOURS']),
+            send_hours=current_app.config['CAMPAIGN_DEFAULT_SEND_HOURS'] or None
         )
         db.session.add(campaign)
         db.session.flush()
@@ -806,7 +1070,7 @@ def quick_launch_api(current_user):
         
         return jsonify({
             'success': True, 
-            'message': f'Launched {org_name} with {len(created_users)} users and active campaign.',
+            'message': f'Launched {org_name} with {len(created_users)} users and a scheduled phishing campaign.',
             'org_id': new_org.org_id
         })
         
@@ -814,21 +1078,93 @@ def quick_launch_api(current_user):
         db.session.rollback()
         return jsonify({'success': False, 'message': str(e)}), 500
 
+REPORT_CLUSTERS_PAGE_SIZE = 25
+
+def _report_cluster_page(args):
+    """
+    One keyset page of the report triage queue: clusters of near-duplicate
+    reports (services/report_clusters.py), most recently reported first.
+    Filters: status (default Pending, 'all' for every cluster), org_id.
+    Pagination: 'after' is '<last_reported_at>_<cluster_id>' of the previous
+    page's last cluster. Returns (clusters, {cluster_id: representative report}, next_cursor).
+    """
+    limit = min(args.get('limit', REPORT_CLUSTERS_PAGE_SIZE, type=int) or REPORT_CLUSTERS_PAGE_SIZE, 100)
+    query = ReportCluster.query
+    
+    status = args.get('status') or 'Pending'
+    if status != 'all':
+        query = query.filter(ReportCluster.status == status)
+    if args.get('org_id', type=int):
+        query = query.filter(ReportCluster.org_id == args.get('org_id', type=int))
+    
+    after = (args.get('after') or '').rpartition('_')
+    if after[0] and after[2].isdigit():
+        try:
+            last_at = datetime.fromisoformat(after[0])
+        except ValueError:
+            last_at = None
+        if last_at is not None:
+            query = query.filter(or_(ReportCluster.last_reported_at < last_at,
+                                     and_(ReportCluster.last_reported_at == last_at,
+                                          ReportCluster.cluster_id < int(after[2]))))
+    
+    clusters = query.order_by(ReportCluster.last_reported_at.desc(), ReportCluster.cluster_id.desc())\
+        .limit(limit + 1).all()
+    next_cursor = None
+    if len(clusters) > limit:
+        clusters = clusters[:limit]
+        next_cursor = f"{clusters[-1].last_reported_at.isoformat()}_{clusters[-1].cluster_id}"
+    
+    # Representative reports in one statement, with their reporter and org
+    ids = [c.representative_id for c in clusters if c.representative_id]
+    representatives = {r.cluster_id: r for r in SuspiciousReport.query.options(
+        joinedload(SuspiciousReport.user), joinedload(SuspiciousReport.organization)
+    ).filter(SuspiciousReport.report_id.in_(ids)).all()} if ids else {}
+    return clusters, representatives, next_cursor
+
 @admin_bp.route('/reports')
 @require_role('GLOBAL_ADMIN')
+@read_only
 def suspicious_reports(current_user):
-    """List all suspicious reports."""
-    reports = SuspiciousReport.query.order_by(SuspiciousReport.created_at.desc()).all()
-    return render_template('admin/suspicious_reports.html', current_user=current_user, reports=reports)
+    """Triage queue: paginated clusters of near-duplicate reports."""
+    org_id = request.args.get('org_id', type=int)
+    with tenant_scope(org_id) if org_id else nullcontext():  # an org's clusters live on its shard
+        clusters, representatives, next_cursor = _report_cluster_page(request.args)
+    filters = {k: v for k, v in request.args.items() if k in ('status', 'org_id') and v}
+    return render_template('admin/report_clusters.html', current_user=current_user, clusters=clusters,
+                           representatives=representatives, filters=filters, next_cursor=next_cursor,
+                           status=request.args.get('status') or 'Pending')
 
-@admin_bp.route('/reports/<int:report_id>/convert', methods=['POST'])
+@admin_bp.route('/reports/clusters/<int:cluster_id>')
 @require_role('GLOBAL_ADMIN')
-def convert_report(current_user, report_id):
-    """Convert a report into a simulation scenario."""
-    report = SuspiciousReport.query.get_or_404(report_id)
-    
-    question_text = request.form.get('question_text')
-    # Parse options from form (assuming 4 options)
+@read_only
+def report_cluster(current_user, cluster_id):
+    """Reports of one cluster, oldest first, keyset-paginated by report_id."""
+    cluster = ReportCluster.query.get_or_404(cluster_id)
+    query = SuspiciousReport.query.options(joinedload(SuspiciousReport.user), joinedload(SuspiciousReport.organization))\
+        .filter(SuspiciousReport.cluster_id == cluster_id)
+    after = request.args.get('after', type=int)
+    if after:
+        query = query.filter(SuspiciousReport.report_id > after)
+    reports = query.order_by(SuspiciousReport.report_id).limit(REPORT_CLUSTERS_PAGE_SIZE * 4 + 1).all()
+    next_cursor = None
+    if len(reports) > REPORT_CLUSTERS_PAGE_SIZE * 4:
+        reports = reports[:-1]
+        next_cursor = reports[-1].report_id
+    return render_template('admin/suspicious_reports.html', current_user=current_user, reports=reports,
+                           cluster=cluster, next_cursor=next_cursor)
+
+@admin_bp.route('/screenshots/<path:name>')
+@require_role('GLOBAL_ADMIN')
+def screenshot(current_user, name):
+    """A report's screenshot (?thumb=1: its thumbnail), cached by content hash."""
+    response = screenshot_store.response(name, thumbnail=request.args.get('thumb') == '1')
+    if response is None:
+        abort(404)
+    return response
+
+def _scenario_from_form(category):
+    """New Scenario from the convert form (question, four options, correct option, explanation)"""
     options = [
         request.form.get('option1'),
         request.form.get('option2'),
@@ -836,22 +1172,52 @@ def convert_report(current_user, report_id):
         request.form.get('option4')
     ]
     correct_option_index = int(request.form.get('correct_option'))
-    explanation = request.form.get('explanation')
-    
-    # Create new Scenario
     scenario = Scenario(
-        scenario_type=report.category,
+        scenario_type=category,
         difficulty_level='medium',
-        scenario_description=question_text,
+        scenario_description=request.form.get('question_text'),
         correct_answer=options[correct_option_index],
         options_json=options,
-        explanation=explanation
+        explanation=request.form.get('explanation')
     )
-    
-    report.status = 'Converted'
-    report.admin_notes = f"Converted to scenario ID: {scenario.scenario_id} on {datetime.now()}"
-    
     db.session.add(scenario)
+    db.session.flush()
+    return scenario
+
+@admin_bp.route('/reports/clusters/<int:cluster_id>/decide', methods=['POST'])
+@require_role('GLOBAL_ADMIN')
+def decide_report_cluster(current_user, cluster_id):
+    """Approve or reject every pending report of a cluster in one statement."""
+    cluster = ReportCluster.query.get_or_404(cluster_id)
+    status = request.form.get('status')
+    if status not in ('Approved', 'Rejected'):
+        flash('Unknown decision.', 'danger')
+        return redirect(url_for('admin.suspicious_reports'))
+    notes = request.form.get('admin_notes') or f"{status} with cluster #{cluster_id} by {current_user.username} on {datetime.now()}"
+    changed = decide_cluster(db.session, cluster.cluster_id, status, notes)
+    db.session.commit()
+    flash(f'{changed} reports {status.lower()}.', 'success')
+    return redirect(url_for('admin.suspicious_reports', **{k: v for k, v in request.args.items() if k in ('status', 'org_id')}))
+
+@admin_bp.route('/reports/clusters/<int:cluster_id>/convert', methods=['POST'])
+@require_role('GLOBAL_ADMIN')
+def convert_report_cluster(current_user, cluster_id):
+    """Convert a whole cluster into one simulation scenario."""
+    cluster = ReportCluster.query.get_or_404(cluster_id)
+    scenario = _scenario_from_form(cluster.category)
+    changed = decide_cluster(db.session, cluster.cluster_id, 'Converted',
+                             f"Converted to scenario ID: {scenario.scenario_id} on {datetime.now()}")
+    db.session.commit()
+    flash(f'Cluster of {changed} reports converted to a new Quiz Scenario!', 'success')
+    return redirect(url_for('admin.suspicious_reports'))
+
+@admin_bp.route('/reports/<int:report_id>/convert', methods=['POST'])
+@require_role('GLOBAL_ADMIN')
+def convert_report(current_user, report_id):
+    """Convert a report into a simulation scenario."""
+    report = SuspiciousReport.query.get_or_404(report_id)
+    scenario = _scenario_from_form(report.category)
+    decide_report(db.session, report, 'Converted', f"Converted to scenario ID: {scenario.scenario_id} on {datetime.now()}")
     db.session.commit()
     
     flash('Report successfully converted to a new Quiz Scenario!', 'success')
@@ -1,12 +1,14 @@
 import os
 import json
-import numpy as np
-from flask import current_app
-from sklearn.feature_extraction.text import TfidfVectorizer
-from sklearn.metrics.pairwise import cosine_similarity
+import hashlib
+from flask import current_app, has_app_context
+from threading import Lock
+from app.services import model_artifacts
+from app.services.request_metrics import metrics
 
 class AIService:
     _instance = None
+    _instance_lock = Lock()
     
     def __init__(self):
         self.vectorizer = None
@@ -17,33 +19,63 @@ class AIService:
 
     @classmethod
     def get_instance(cls):
+        # Built on first chat request (or by `flask warmup`), not at import
         if cls._instance is None:
-            cls._instance = cls()
+            with cls._instance_lock:
+                if cls._instance is None:
+                    cls._instance = cls()
         return cls._instance
 
     def _load_knowledge_base(self):
-        """Load Q&A pairs from JSON and train TF-IDF model"""
+        """Load the TF-IDF index from its artifact, rebuilding it if the knowledge JSON changed"""
         try:
-            base_dir = os.path.dirname(os.path.abspath(__file__))
-            data_path = os.path.join(base_dir, 'chatbot_knowledge.json')
-            
-            with open(data_path, 'r') as f:
-                data = json.load(f)
-            
-            self.questions = [item['question'] for item in data]
-            self.answers = [item['answer'] for item in data]
-            
-            # Initialize and Fit TF-IDF Vectorizer
-            print("DEBUG: Training Local NLP Model...")
-            self.vectorizer = TfidfVectorizer(stop_words='english')
-            self.vectors = self.vectorizer.fit_transform(self.questions)
-            print(f"DEBUG: Trained on {len(self.questions)} knowledge pairs.")
+            data_path = self._knowledge_path()
+            with open(data_path, 'rb') as f:
+                raw = f.read()
+            source_hash = hashlib.sha256(raw).hexdigest()
+
+            path = model_artifacts.artifact_path('chatbot_index.joblib')
+            index = model_artifacts.load(path) if os.path.exists(path) else None
+            if index is None or index.get('source_hash') != source_hash:
+                index = self._build_index(json.loads(raw), source_hash)
+                model_artifacts.dump(index, path)
+
+            self.questions = index['questions']
+            self.answers = index['answers']
+            self.vectorizer = index['vectorizer']
+            self.vectors = index['vectors']
+            print(f"DEBUG: Loaded local NLP model ({len(self.questions)} knowledge pairs).")
             
         except Exception as e:
             print(f"ERROR: Failed to load chatbot knowledge base: {e}")
             self.questions = []
             self.answers = []
 
+    @staticmethod
+    def _knowledge_path():
+        if has_app_context() and current_app.config.get('CHATBOT_KNOWLEDGE_PATH'):
+            return current_app.config['CHATBOT_KNOWLEDGE_PATH']
+        return os.path.join(os.path.dirname(os.path.abspath(__file__)), 'chatbot_knowledge.json')
+
+    @staticmethod
+    def _build_index(data, source_hash):
+        """Fit TF-IDF on the Q&A pairs"""
+        from sklearn.feature_extraction.text import TfidfVectorizer
+
+        print("DEBUG: Training Local NLP Model...")
+        questions = [item['question'] for item in data]
+        vectorizer = TfidfVectorizer(stop_words='english')
+        vectors = vectorizer.fit_transform(questions)
+        print(f"DEBUG: Trained on {len(questions)} knowledge pairs.")
+        return {
+            'source_hash': source_hash,
+            'questions': questions,
+            'answers': [item['answer'] for item in data],
+            'vectorizer': vectorizer,
+            'vectors': vectors.tocsr()
+        }
+
+    @metrics.timed('ml_inference_seconds', model='tfidf', operation='chat')
     def get_response(self, user_message, context=None):
         """
         Get semantically similar response from local knowledge base.
@@ -51,12 +83,15 @@ class AIService:
         if not self.vectorizer or not self.questions:
             return "I'm having trouble accessing my knowledge base."
 
+        import numpy as np
+
         try:
             # Vectorize user query
             user_vec = self.vectorizer.transform([user_message])
             
-            # Calculate Cosine Similarity
-            similarities = cosine_similarity(user_vec, self.vectors).flatten()
+            # Cosine similarity: TF-IDF rows are already L2-normalised, so a dot
+            # product is enough and the (possibly memory-mapped) matrix isn't copied
+            similarities = (self.vectors @ user_vec.T).toarray().ravel()
             
             # Find best match
             best_idx = np.argmax(similarities)
@@ -0,0 +1,509 @@
+"""
+Flask CLI commands
+    flask --app run create-schema   create any missing tables (was implicit in create_app)
+    flask --app run warmup          load the ML model and chatbot index ahead of traffic
+    flask --app run db-heartbeat    keep the replica lag heartbeat updated on the primary
+    flask --app run replica-status  lag / health of each configured read replica
+    flask --app run shards ...      tenant shards: list, init, sync-catalog, move-org
+    flask --app run migrations ...  versioned migrations: status, upgrade, stamp
+    flask --app run summaries verify  diff the reporting summary tables against a recount
+    flask --app run refdata bump    make every worker reload the reference-data cache
+    flask --app run quota seed      carry weekly scenario counts from the users table into the counter store
+    flask --app run content ...     versioned content packs: export, inspect, load
+    flask --app run campaigns ...   campaign delivery and tracking: dispatch, ingest, schedule, pause, resume, status,
+                                    rebuild-results
+    flask --app run reports ...     suspicious reports: recluster, move-screenshots
+    flask --app run jobs ...        background jobs: work, enqueue, status, list, retry
+"""
+import os
+import click
+from flask.cli import AppGroup
+import time
+
+def warm_up(app):
+    """Load lazily-initialised ML/NLP artifacts now. Returns {name: seconds}"""
+    timings = {}
+    with app.app_context():
+        started = time.perf_counter()
+        from app.ml_model import ml_engine
+        ml_engine.ensure_loaded()
+        timings['ml_model'] = time.perf_counter() - started
+
+        started = time.perf_counter()
+        from app.ai_service import AIService
+        AIService.get_instance()
+        timings['chatbot_index'] = time.perf_counter() - started
+    return timings
+
+def register_commands(app):
+    @app.cli.command('create-schema')
+    def create_schema():
+        """Create tables that don't exist yet (never alters existing ones)"""
+        from app import db
+        db.create_all()
+        click.echo('Schema created.')
+
+    @app.cli.command('warmup')
+    def warmup():
+        """Load ML/NLP artifacts and report how long each took and the memory it cost"""
+        from app.services.model_artifacts import process_memory
+        before = process_memory()
+        for name, seconds in warm_up(app).items():
+            click.echo(f'{name}: {seconds * 1000:.0f} ms')
+        after = process_memory()
+        for key in ('rss', 'pss', 'uss'):
+            if after[key] is not None:
+                click.echo(f'{key}: {before[key] / 2**20:.1f} -> {after[key] / 2**20:.1f} MB')
+
+    @app.cli.command('db-heartbeat')
+    @click.option('--interval', default=1.0, help='Seconds between beats')
+    @click.option('--once', is_flag=True, help='Write one beat and exit')
+    def db_heartbeat(interval, once):
+        """Update replica_heartbeat on the primary; replicas' copy of it measures their lag"""
+        from app import db
+        from app.services.db_routing import replica_router
+        while True:
+            replica_router.beat(db.engine)
+            if once:
+                break
+            time.sleep(interval)
+
+    @app.cli.command('replica-status')
+    def replica_status():
+        """Check every read replica now and print its lag"""
+        from app import db
+        from app.services.db_routing import replica_router
+        names = app.extensions['replica_router']['names']
+        if not names:
+            click.echo('No replicas configured (DB_REPLICA_URIS).')
+        for name in names:
+            try:
+                lag = replica_router.measure_lag(db.engines[name], app.config['REPLICA_LAG_SOURCE'])
+                click.echo(f"{name}: lag {'unknown' if lag is None else f'{lag:.2f}s'}")
+            except Exception as e:
+                click.echo(f'{name}: unreachable ({e})')
+
+    shards = AppGroup('shards', help='Tenant shards (see services/sharding.py)')
+
+    @shards.command('list')
+    def shards_list():
+        """Shards and the orgs assigned to each"""
+        from app.services.sharding import shard_router
+        directory = shard_router.directory(refresh=True) if shard_router.enabled() else {}
+        for name in shard_router.names():
+            orgs = sorted((org_id, status) for org_id, (shard, status) in directory.items() if shard == name)
+            label = 'every org without an entry' if name == 'default' else f'{len(orgs)} orgs'
+            click.echo(f'{name}: {label}')
+            for org_id, status in orgs:
+                click.echo(f'  org {org_id}' + ('' if status == 'active' else f' ({status})'))
+
+    @shards.command('init')
+    def shards_init():
+        """Create missing tables on every shard"""
+        from app import db
+        from app.services.sharding import shard_router
+        for name in shard_router.names()[1:]:
+            db.metadata.create_all(shard_router.engine(name))
+            click.echo(f'{name}: schema created')
+
+    @shards.command('sync-catalog')
+    @click.option('--shard', 'only', help='Only this shard')
+    def shards_sync_catalog(only):
+        """Copy the global tables (scenarios, topics, roles, orgs, ...) from the catalog to the shards"""
+        from app.services.sharding import shard_router
+        from app.services.shard_rebalancer import sync_catalog
+        for name in shard_router.names()[1:]:
+            if only and name != only:
+                continue
+            click.echo(f'{name}:')
+            sync_catalog(name, log=click.echo)
+
+    @shards.command('move-org')
+    @click.argument('org_id', type=int)
+    @click.argument('target')
+    @click.option('--batch-size', default=1000, help='Rows per copy batch')
+    @click.option('--pause', default=0.05, help='Seconds to sleep between batches')
+    @click.option('--keep-source', is_flag=True, help="Don't delete the org's rows from the old shard")
+    def shards_move_org(org_id, target, batch_size, pause, keep_source):
+        """Move ORG_ID's data to the TARGET shard while it stays online"""
+        from app.services.shard_rebalancer import OrgMover, ShardMoveError
+        try:
+            OrgMover(org_id, target, batch_size=batch_size, pause=pause,
+                     keep_source=keep_source, log=click.echo).run()
+        except ShardMoveError as e:
+            raise click.ClickException(str(e))
+
+    app.cli.add_command(shards)
+
+    migrations = AppGroup('migrations', help='Versioned schema migrations (see services/migration_runner.py)')
+
+    def _databases(only):
+        """(name, engine) for the main database and every tenant shard"""
+        from app.services.sharding import shard_router
+        return [(name, shard_router.engine(name)) for name in shard_router.names() if not only or name == only]
+
+    @migrations.command('status')
+    @click.option('--shard', 'only', help="Only this database ('default' is the main one)")
+    def migrations_status(only):
+        """Applied / pending migrations and unfinished backfills"""
+        import sqlalchemy as sa
+        from app.models import BackfillProgress
+        from app.services.migration_runner import MigrationRunner
+        for name, engine in _databases(only):
+            click.echo(f'{name}:')
+            runner = MigrationRunner(engine)
+            for migration, row, changed in runner.status():
+                state = row['status'] if row else 'pending'
+                when = f" {row['finished_at']:%Y-%m-%d %H:%M}" if row and row['finished_at'] else ''
+                click.echo(f'  {migration.version}_{migration.name:<40} {state}{when}'
+                           + (' (file changed since applied)' if changed else ''))
+                if row and row['error']:
+                    click.echo(f"      {row['error'].splitlines()[0][:150]}")
+            table = BackfillProgress.__table__
+            with engine.connect() as conn:
+                for row in conn.execute(sa.select(table).where(table.c.status != 'done')).mappings():
+                    span = max(row['max_pk'] - row['first_pk'], 1)
+                    click.echo(f"  backfill {row['backfill_key']}: {100 * (row['last_pk'] - row['first_pk']) / span:.1f}% "
+                               f"({row['rows_done']} rows, last {row['updated_at']:%H:%M:%S})")
+
+    @migrations.command('upgrade')
+    @click.option('--to', 'target', help='Stop after this version')
+    @click.option('--shard', 'only', help="Only this database ('default' is the main one)")
+    @click.option('--batch-size', default=1000, help='Primary-key range per backfill batch')
+    @click.option('--pause', default=0.05, help='Seconds to sleep between backfill batches')
+    @click.option('--target-seconds', default=0.5, help='Batches slower than twice this are halved')
+    @click.option('--max-replica-lag', type=float, help='Pause backfills while a replica is further behind (default REPLICA_MAX_LAG_SECONDS)')
+    def migrations_upgrade(target, only, batch_size, pause, target_seconds, max_replica_lag):
+        """Apply pending migrations to the main database and every shard"""
+        from app.services.migration_runner import MigrationRunner
+        if max_replica_lag is None:
+            max_replica_lag = app.config['REPLICA_MAX_LAG_SECONDS']
+        for name, engine in _databases(only):
+            click.echo(f'{name}:')
+            runner = MigrationRunner(engine, log=click.echo, batch_size=batch_size, pause=pause,
+                                     target_seconds=target_seconds, max_replica_lag=max_replica_lag)
+            if not runner.upgrade(target):
+                click.echo('  up to date')
+
+    @migrations.command('stamp')
+    @click.argument('version', required=False)
+    @click.option('--shard', 'only', help="Only this database ('default' is the main one)")
+    def migrations_stamp(version, only):
+        """Mark migrations up to VERSION (default: all) as applied without running them"""
+        from app.services.migration_runner import MigrationRunner
+        for name, engine in _databases(only):
+            click.echo(f'{name}: {MigrationRunner(engine).stamp(version)} stamped')
+
+    app.cli.add_command(migrations)
+
+    summaries = AppGroup('summaries', help='Reporting summary tables (see services/summary_tables.py)')
+
+    @summaries.command('verify')
+    @click.option('--shard', 'only', help="Only this database ('default' is the main one)")
+    @click.option('--repair', is_flag=True, help='Rewrite the rows that differ')
+    @click.option('--batch-size', default=1000, help='Users per recount batch')
+    def summaries_verify(only, repair, batch_size):
+        """Recompute user_stats / user_category_stats from the raw tables and report differences"""
+        from app.services.summary_tables import verify
+        mismatched = 0
+        for name, engine in _databases(only):
+            click.echo(f'{name}:')
+            found = verify(engine, batch_size=batch_size, repair=repair, log=click.echo)
+            users = found.pop('users')
+            click.echo(f'  {users} users checked, differing: ' + ', '.join(f'{what} {n}' for what, n in found.items())
+                       + (' (repaired)' if repair and any(found.values()) else ''))
+            mismatched += sum(found.values())
+        if mismatched and not repair:
+            raise click.ClickException(f'{mismatched} summary rows differ; run with --repair to fix them')
+
+    app.cli.add_command(summaries)
+
+    refdata = AppGroup('refdata', help='Reference-data cache (see services/reference_data.py)')
+
+    @refdata.command('bump')
+    def refdata_bump():
+        """Invalidate every worker's cache after editing reference tables with raw SQL"""
+        from app.services.reference_data import reference_data
+        reference_data.bump()
+        click.echo('Reference data version bumped.')
+
+    app.cli.add_command(refdata)
+
+    quota = AppGroup('quota', help='Free-tier weekly scenario quota (see services/scenario_quota.py)')
+
+    @quota.command('seed')
+    @click.option('--shard', 'only', help="Only this database ('default' is the main one)")
+    def quota_seed(only):
+        """Carry this week's users.weekly_scenario_count over into the counter store"""
+        import sqlalchemy as sa
+        from datetime import datetime, timedelta
+        from app.models import User
+        from app.services.scenario_quota import ScenarioQuota
+        users = User.__table__
+        since = datetime.utcnow() - timedelta(seconds=ScenarioQuota.WINDOW_SECONDS)
+        for name, engine in _databases(only):
+            with engine.connect() as conn:
+                rows = conn.execute(sa.select(users.c.user_id, users.c.weekly_scenario_count, users.c.last_week_reset)
+                                    .where(users.c.weekly_scenario_count > 0, users.c.last_week_reset > since)).all()
+            seeded = sum(ScenarioQuota.carry_over(*row) for row in rows)
+            click.echo(f'{name}: {seeded} of {len(rows)} users with scenarios this week seeded')
+
+    app.cli.add_command(quota)
+
+    content = AppGroup('content', help='Versioned content packs (see services/content_packs.py)')
+
+    @content.command('export')
+    @click.argument('path')
+    @click.option('--name', default='content', help='Pack name recorded in the manifest')
+    @click.option('--version', 'version', required=True, help='Pack version recorded in the manifest')
+    @click.option('--kinds', help='Comma-separated subset: categories,scenarios,micro_lessons,learning_modules')
+    def content_export(path, name, version, kinds):
+        """Write the catalog's scenarios, lessons, modules and categories to a pack"""
+        from app import db
+        from app.services.content_packs import export_pack, KINDS_BY_NAME
+        selected = kinds.split(',') if kinds else None
+        unknown = set(selected or ()) - set(KINDS_BY_NAME)
+        if unknown:
+            raise click.BadParameter(f"unknown kinds: {', '.join(sorted(unknown))}", param_hint='--kinds')
+        manifest = export_pack(db.engine, path, name, version, kinds=selected)
+        click.echo(f'{path}: ' + ', '.join(f"{kind} {info['count']}" for kind, info in manifest['kinds'].items()))
+
+    @content.command('inspect')
+    @click.argument('path')
+    def content_inspect(path):
+        """Show a pack's manifest and check its content hashes"""
+        from app.services.content_packs import read_pack, ContentPackError
+        try:
+            manifest, _ = read_pack(path)
+        except ContentPackError as e:
+            raise click.ClickException(str(e))
+        click.echo(f"{manifest['name']} {manifest['version']} (created {manifest['created_at']})")
+        for kind, info in manifest['kinds'].items():
+            click.echo(f"  {kind:<18} {info['count']:>6}  {info['digest'][:16]}")
+        click.echo('All content hashes match.')
+
+    @content.command('load')
+    @click.argument('path')
+    @click.option('--dry-run', is_flag=True, help='Only report what would change')
+    @click.option('--batch-size', default=500, help='Rows per insert / update batch')
+    def content_load(path, dry_run, batch_size):
+        """Insert new and update changed content from a pack, in one transaction"""
+        from app import db
+        from app.services.content_packs import ContentLoader, ContentPackError
+        try:
+            ContentLoader(db.engine, batch_size=batch_size, log=click.echo).load(path, dry_run=dry_run)
+        except ContentPackError as e:
+            raise click.ClickException(str(e))
+        if not dry_run and app.config.get('DB_SHARD_URIS'):
+            click.echo('Run `flask shards sync-catalog` to copy the content to the tenant shards.')
+
+    app.cli.add_command(content)
+
+    campaigns = AppGroup('campaigns', help='Campaign email delivery (see services/campaign_scheduler.py)')
+
+    @campaigns.command('dispatch')
+    @click.option('--once', is_flag=True, help='Run one pass and exit')
+    def campaigns_dispatch(once):
+        """Send due campaign emails in throttled batches until interrupted"""
+        from app.services.campaign_scheduler import campaign_scheduler
+        sent = campaign_scheduler.run(once=once, log=click.echo)
+        if once:
+            click.echo(f'{sent} emails sent.')
+
+    @campaigns.command('ingest')
+    @click.option('--once', is_flag=True, help='Load the closed log segments once and exit')
+    def campaigns_ingest(once):
+        """Load tracked opens / clicks into campaign_events and roll them into target statuses"""
+        from app.services.tracking_events import tracking_log
+        tracking_log.run(once=once, log=click.echo)
+
+    @campaigns.command('schedule')
+    @click.argument('campaign_id', type=int, required=False)
+    @click.option('--start', type=click.DateTime(), help='Window start, UTC (default now)')
+    @click.option('--window-hours', type=float, help='Spread the sends over this many hours (default: as fast as the rate limits allow)')
+    @click.option('--send-hours', help="Daily hours in the org's timezone, e.g. 09:00-17:00")
+    @click.option('--reschedule-legacy', is_flag=True,
+                  help='Schedule every campaign launched before the scheduler with the default window and send hours')
+    def campaigns_schedule(campaign_id, start, window_hours, send_hours, reschedule_legacy):
+        """Set a campaign's delivery window and start sending it"""
+        from app.services.campaign_scheduler import campaign_scheduler, CampaignError
+        if reschedule_legacy:
+            if campaign_id is not None or window_hours or send_hours:
+                raise click.UsageError('--reschedule-legacy takes no campaign id, --window-hours or --send-hours')
+            try:
+                scheduled = campaign_scheduler.reschedule_legacy(start)
+            except CampaignError as e:
+                raise click.ClickException(str(e))
+            click.echo(f'{scheduled} legacy campaigns scheduled over the next '
+                       f"{app.config['CAMPAIGN_DEFAULT_WINDOW_HOURS']:g} hours.")
+            return
+        if campaign_id is None:
+            raise click.UsageError('give a campaign id, or --reschedule-legacy')
+        try:
+            start, end = campaign_scheduler.schedule(campaign_id, start, window_hours, send_hours)
+        except CampaignError as e:
+            raise click.ClickException(str(e))
+        click.echo(f"Campaign {campaign_id} scheduled from {start:%Y-%m-%d %H:%M} UTC"
+                   + (f" to {end:%Y-%m-%d %H:%M} UTC" if end else '') + (f', {send_hours} local' if send_hours else ''))
+
+    @campaigns.command('pause')
+    @click.argument('campaign_id', type=int)
+    def campaigns_pause(campaign_id):
+        """Stop sending a campaign (emails already in a batch still go out)"""
+        from app.services.campaign_scheduler import campaign_scheduler, CampaignError
+        try:
+            campaign_scheduler.pause(campaign_id)
+        except CampaignError as e:
+            raise click.ClickException(str(e))
+        click.echo(f'Campaign {campaign_id} paused.')
+
+    @campaigns.command('resume')
+    @click.argument('campaign_id', type=int)
+    def campaigns_resume(campaign_id):
+        """Continue a paused campaign; its window moves by the time it was paused"""
+        from app.services.campaign_scheduler import campaign_scheduler, CampaignError
+        try:
+            campaign_scheduler.resume(campaign_id)
+        except CampaignError as e:
+            raise click.ClickException(str(e))
+        click.echo(f'Campaign {campaign_id} resumed.')
+
+    @campaigns.command('status')
+    @click.option('--shard', 'only', help="Only this database ('default' is the main one)")
+    def campaigns_status(only):
+        """Targets per status for every campaign that isn't a draft"""
+        import sqlalchemy as sa
+        from app.models import Campaign
+        from app.services.campaign_scheduler import campaign_scheduler
+        table = Campaign.__table__
+        for name, engine in _databases(only):
+            with engine.connect() as conn:
+                rows = conn.execute(sa.select(table).where(table.c.status != 'Draft')
+                                    .order_by(table.c.campaign_id)).mappings().all()
+            for row in rows:
+                counts = campaign_scheduler.progress(engine, row['campaign_id'])
+                click.echo(f"{name} #{row['campaign_id']} {row['name']} [{row['status']}]: "
+                           + (', '.join(f'{status} {n}' for status, n in sorted(counts.items())) or 'no targets'))
+
+    @campaigns.command('rebuild-results')
+    @click.option('--campaign', 'campaign_id', type=int, help='Only this campaign')
+    @click.option('--shard', 'only', help="Only this database ('default' is the main one)")
+    def campaigns_rebuild_results(campaign_id, only):
+        """Recount the campaign results cube from targets and events; rewrites campaigns that differ"""
+        import sqlalchemy as sa
+        from app.models import Campaign
+        from app.services.campaign_results import rebuild
+        table = Campaign.__table__
+        query = sa.select(table.c.campaign_id).where(table.c.status != 'Draft').order_by(table.c.campaign_id)
+        if campaign_id is not None:
+            query = query.where(table.c.campaign_id == campaign_id)
+        for name, engine in _databases(only):
+            with engine.connect() as conn:
+                ids = conn.execute(query).scalars().all()
+            rewritten = 0
+            for campaign in ids:
+                differing = rebuild(engine, campaign)
+                if differing:
+                    rewritten += 1
+                    click.echo(f'{name} #{campaign}: {differing} cells differed, rewritten')
+            click.echo(f'{name}: {len(ids)} campaigns recounted, {rewritten} rewritten')
+
+    app.cli.add_command(campaigns)
+
+    reports = AppGroup('reports', help='Suspicious-report triage (see services/report_clusters.py)')
+
+    @reports.command('recluster')
+    @click.option('--shard', 'only', help="Only this database ('default' is the main one)")
+    @click.option('--batch-size', default=500, help='Reports per transaction')
+    def reports_recluster(only, batch_size):
+        """Recompute every report's signature and rebuild the near-duplicate clusters"""
+        from app.services.report_clusters import recluster
+        for name, engine in _databases(only):
+            click.echo(f'{name}:')
+            found = recluster(engine, batch_size=batch_size, log=click.echo)
+            click.echo(f"  {found['reports']} reports in {found['clusters']} clusters")
+
+    @reports.command('move-screenshots')
+    @click.option('--source', default=os.path.join(app.root_path, 'static', 'uploads'),
+                  show_default='app/static/uploads', help='Former upload folder')
+    def reports_move_screenshots(source):
+        """Move screenshots out of a publicly served folder into UPLOAD_FOLDER"""
+        from app.services.screenshot_store import screenshot_store
+        if not os.path.isdir(source):
+            click.echo(f'{source}: nothing to move')
+            return
+        moved, skipped = screenshot_store.move_legacy(source)
+        click.echo(f"{moved} files moved to {app.config['UPLOAD_FOLDER']}")
+        if skipped:
+            click.echo(f'{skipped} already there, left in {source}')
+
+    app.cli.add_command(reports)
+
+    jobs = AppGroup('jobs', help='Background jobs and schedules (see services/jobs.py)')
+
+    @jobs.command('work')
+    @click.option('--concurrency', type=int, help='Jobs run at once (default JOBS_CONCURRENCY)')
+    @click.option('--once', is_flag=True, help='Run the jobs that are due and exit')
+    def jobs_work(concurrency, once):
+        """Run queued and scheduled jobs until interrupted"""
+        from app.services.jobs import job_queue, JobError, CronError
+        try:
+            outcomes = job_queue.run(concurrency=concurrency, once=once, log=click.echo)
+        except (JobError, CronError) as e:
+            raise click.ClickException(str(e))
+        if once:
+            click.echo(', '.join(f'{n} {outcome}' for outcome, n in sorted(outcomes.items())) or 'Nothing was due.')
+
+    @jobs.command('enqueue')
+    @click.argument('name')
+    @click.option('--payload', help='JSON object passed to the job')
+    @click.option('--delay', default=0.0, help='Seconds before it may run')
+    def jobs_enqueue(name, payload, delay):
+        """Queue a run of a job"""
+        import json
+        from app.services.jobs import job_queue, JobError
+        try:
+            job_id = job_queue.enqueue(name, json.loads(payload) if payload else None, delay=delay)
+        except (JobError, ValueError) as e:
+            raise click.ClickException(str(e))
+        click.echo(f'Queued job {job_id}.' if job_id else f'{name} already has a run pending.')
+
+    @jobs.command('status')
+    def jobs_status():
+        """Runs per job and status, and the schedules' next runs"""
+        import sqlalchemy as sa
+        from app import db
+        from app.models import JobSchedule
+        from app.services.jobs import job_queue
+        for name, status, runs, avg_ms, last in job_queue.summary():
+            click.echo(f'{name} [{status}]: {runs} runs' + (f', avg {avg_ms:.0f} ms' if avg_ms is not None else '')
+                       + (f', last finished {last:%Y-%m-%d %H:%M}' if last else ''))
+        table = JobSchedule.__table__
+        with db.engine.connect() as conn:
+            for row in conn.execute(sa.select(table).order_by(table.c.name)):
+                click.echo(f"schedule {row.name} '{row.cron}': next {row.next_run_at:%Y-%m-%d %H:%M} UTC"
+                           + (f', last {row.last_run_at:%Y-%m-%d %H:%M}' if row.last_run_at else ''))
+
+    @jobs.command('list')
+    @click.option('--name', help='Only this job')
+    @click.option('--status', type=click.Choice(['queued', 'running', 'succeeded', 'failed']))
+    @click.option('--limit', default=20, help='Most recent runs shown')
+    def jobs_list(name, status, limit):
+        """Most recent job runs"""
+        from app.services.jobs import job_queue
+        for row in job_queue.recent(limit, name=name, status=status):
+            timing = f", {row['duration_ms']:.0f} ms" if row['duration_ms'] is not None else ''
+            click.echo(f"#{row['job_id']} {row['name']} [{row['status']}] attempt {row['attempts']}/{row['max_attempts']}, "
+                       f"run at {row['run_at']:%Y-%m-%d %H:%M:%S}{timing}"
+                       + (f" - {row['last_error']}" if row['last_error'] else ''))
+
+    @jobs.command('retry')
+    @click.argument('job_id', type=int)
+    def jobs_retry(job_id):
+        """Queue a failed run again"""
+        from app.services.jobs import job_queue
+        if not job_queue.retry(job_id):
+            raise click.ClickException(f'job {job_id} is not failed')
+        click.echo(f'Job {job_id} queued again.')
+
+    app.cli.add_command(jobs)
@@ -1,14 +1,27 @@
-from flask_mail import Mail, Message
 from flask import current_app, render_template_string
 from threading import Thread
+from email.utils import parseaddr
+import base64
 
-mail = Mail()
+# flask_mail is only imported when the first email is sent
+mail = None
+
+def get_mail(app=None):
+    """Return the Mail extension, creating and binding it on first use"""
+    global mail
+    app = app or current_app._get_current_object()
+    if mail is None:
+        from flask_mail import Mail
+        mail = Mail()
+    if 'mail' not in app.extensions:
+        mail.init_app(app)
+    return mail
 
 def send_async_email(app, msg):
     """Send email asynchronously to avoid blocking the main thread"""
     with app.app_context():
         try:
-            mail.send(msg)
+            get_mail(app).send(msg)
         except Exception as e:
             print(f"Failed to send email: {e}")
 
@@ -33,6 +46,7 @@ def send_invite_email(user, org_name, password):
     <p>Stay Safe,<br>Security Team</p>
     """
     
+    from flask_mail import Message
     msg = Message(subject, sender=sender, recipients=[user.email])
     msg.html = html_body
     
@@ -40,14 +54,12 @@ def send_invite_email(user, org_name, password):
     Thread(target=send_async_email, args=(current_app._get_current_object(), msg)).start()
     print(f"Queued invite email for {user.email}")
 
-def send_campaign_email(target_email, campaign_name, phishing_link):
-    """
-    Send a simulated phishing email for a campaign.
-    """
-    subject = "URGENT: Account Action Required"
-    sender = "Security Alert <alert@secure-cloud-portal.com>" # Spoofed sender name
-    
-    html_body = f"""
+CAMPAIGN_SUBJECT = "URGENT: Account Action Required"
+CAMPAIGN_SENDER = "Security Alert <alert@secure-cloud-portal.com>" # Spoofed sender name
+
+def campaign_html(campaign_name, phishing_link, open_pixel=None):
+    pixel = f'<img src="{open_pixel}" width="1" height="1" alt="" style="display: none;">' if open_pixel else ''
+    return f"""
     <div style="font-family: Arial, sans-serif; padding: 20px;">
         <h2 style="color: #d9534f;">Security Alert</h2>
         <p>We detected unusual activity on your account.</p>
@@ -56,11 +68,56 @@ def send_campaign_email(target_email, campaign_name, phishing_link):
             <a href="{phishing_link}" style="background-color: #d9534f; color: white; padding: 10px 20px; text-decoration: none; border-radius: 5px;">Verify Now</a>
         </p>
         <p style="font-size: 0.8rem; color: #777;">Reference: {campaign_name}</p>
+        {pixel}
     </div>
     """
-    
-    msg = Message(subject, sender=current_app.config['MAIL_DEFAULT_SENDER'], recipients=[target_email])
-    msg.html = html_body
-    
+
+def build_campaign_message(target_email, campaign_name, phishing_link):
+    """The simulated phishing email for one campaign target"""
+    from flask_mail import Message
+    msg = Message(CAMPAIGN_SUBJECT, sender=current_app.config.get('MAIL_DEFAULT_SENDER') or CAMPAIGN_SENDER,
+                  recipients=[target_email])
+    msg.html = campaign_html(campaign_name, phishing_link)
+    return msg
+
+class CampaignMessageRenderer:
+    """
+    Raw campaign emails for batch sending. The headers shared by a batch are
+    encoded once; each message only adds its recipient, Message-ID and the
+    base64 body, instead of a full MIME tree per email (which cost ~2 ms).
+    """
+
+    def __init__(self, campaign_name):
+        from email.header import Header
+        from email.utils import formatdate
+        self.campaign_name = campaign_name
+        self.sender = current_app.config.get('MAIL_DEFAULT_SENDER') or CAMPAIGN_SENDER
+        self.envelope_from = parseaddr(self.sender)[1]
+        self.msgid_domain = self.envelope_from.rpartition('@')[2] or 'localhost'  # make_msgid() would look up the FQDN every call
+        self.head = (
+            f'From: {self.sender}\r\n'
+            f"Subject: {CAMPAIGN_SUBJECT if CAMPAIGN_SUBJECT.isascii() else Header(CAMPAIGN_SUBJECT, 'utf-8').encode()}\r\n"
+            f'Date: {formatdate(localtime=True)}\r\n'
+            'MIME-Version: 1.0\r\n'
+            'Content-Type: text/html; charset="utf-8"\r\n'
+            'Content-Transfer-Encoding: base64\r\n'
+        ).encode('ascii')
+
+    def render(self, target_email, phishing_link, open_pixel=None):
+        """(envelope sender, raw message bytes)"""
+        from email.utils import make_msgid
+        body = base64.encodebytes(campaign_html(self.campaign_name, phishing_link, open_pixel).encode('utf-8'))
+        return self.envelope_from, b''.join((
+            self.head,
+            f'To: {target_email}\r\nMessage-ID: {make_msgid(domain=self.msgid_domain)}\r\n\r\n'.encode('utf-8'),
+            body.replace(b'\n', b'\r\n'),
+        ))
+
+def send_campaign_email(target_email, campaign_name, phishing_link):
+    """
+    Send a single simulated phishing email. Campaigns are delivered in
+    throttled batches by services/campaign_scheduler.py instead.
+    """
+    msg = build_campaign_message(target_email, campaign_name, phishing_link)
     Thread(target=send_async_email, args=(current_app._get_current_object(), msg)).start()
     print(f"Queued campaign email for {target_email}")
@@ -1,8 +1,10 @@
-from flask import Blueprint, render_template, request, session, redirect, url_for, jsonify, flash
+from flask import Blueprint, render_template, request, session, redirect, url_for, jsonify, flash, current_app
 from app import db
-from app.models import LearningPath, PathLevel, LearningModule, UserProgress, Category, ContentType, ModuleAttempt, Certificate, Leaderboard, User, MicroLesson, AssignedLesson
+from app.models import LearningPath, PathLevel, LearningModule, UserProgress, Category, ContentType, ModuleAttempt, Certificate, Leaderboard, User
 from app.utils import require_permission, log_audit
-from datetime import datetime
+from app.services.reference_data import reference_data
+from app.services.module_views import module_views
+from app.services.quiz_grading import record_module_attempts
 import json
 
 learning_bp = Blueprint('learning', __name__)
@@ -163,7 +165,7 @@ def view_module(module_id):
     # Check access
     # Logic to verify if user can access this module (level unlocked, etc)
     user = User.query.get(user_id)
-    if not user.is_admin and user.subscription_tier != 'pro':
+    if user.subscription_tier != 'pro' and not user.is_admin():
         if module.level.level_number > 1:
              flash('Upgrade to Pro to access Intermediate, Advanced, and Expert modules.', 'warning')
              return redirect(url_for('payment.upgrade'))
@@ -180,43 +182,19 @@ def track_view(module_id):
         return jsonify({'error': 'Unauthorized'}), 401
     
     user_id = session['user_id']
-    module = LearningModule.query.get_or_404(module_id)
-    
-    # Get or create progress record
-    progress = UserProgress.query.filter_by(user_id=user_id, module_id=module_id).first()
+    LearningModule.query.get_or_404(module_id)
     
-    if not progress:
-        # First time viewing this module
-        progress = UserProgress(
-            user_id=user_id,
-            path_id=module.level.path_id,
-            level_id=module.level_id,
-            module_id=module_id,
-            status='in_progress',
-            first_viewed_at=datetime.utcnow(),
-            last_activity_at=datetime.utcnow(),
-            view_count=1
-        )
-        db.session.add(progress)
-    else:
-        # Subsequent view
-        if progress.first_viewed_at is None:
-            progress.first_viewed_at = datetime.utcnow()
-        
-        progress.last_activity_at = datetime.utcnow()
-        progress.view_count = (progress.view_count or 0) + 1
-        
-        # Update status to in_progress if it was just unlocked
-        if progress.status == 'unlocked':
-            progress.status = 'in_progress'
+    # Counted in this worker's buffer; user_progress is updated within a few seconds (services/module_views.py)
+    module_views.record(session.get('org_id'), user_id, module_id)
     
-    db.session.commit()
-    
-    return jsonify({
-        'success': True,
-        'view_count': progress.view_count,
-        'status': progress.status
-    })
+    return jsonify({'success': True})
+
+def _check_learning_achievements(user_id):
+    from app.services.achievement_service import AchievementService
+    try:
+        AchievementService.check_learning_achievements(user_id)
+    except Exception as e:
+        print(f"Error checking achievements: {e}")
 
 @learning_bp.route('/submit-module/<int:module_id>', methods=['POST'])
 def submit_module(module_id):
@@ -224,109 +202,84 @@ def submit_module(module_id):
         return jsonify({'error': 'Unauthorized'}), 401
         
     user_id = session['user_id']
-    data = request.get_json()
-    score = data.get('score', 0)
-    time_spent = data.get('time_spent', 0)
-    answers = data.get('answers', {})
-    
-    module = LearningModule.query.get_or_404(module_id)
+    data = request.get_json() or {}
     
-    # Record attempt
-    attempt = ModuleAttempt(
-        user_id=user_id,
-        module_id=module_id,
-        score=score,
-        time_spent_seconds=time_spent,
-        answers_json=answers
-    )
-    db.session.add(attempt)
+    # Graded here from the answers (services/quiz_grading.py); a client-sent score is ignored
+    results, recommended = record_module_attempts(db.session, user_id, [{
+        'module_id': module_id,
+        'answers': data.get('answers', {}),
+        'time_spent': data.get('time_spent', 0)
+    }])
+    if 'error' in results[0]:
+        db.session.rollback()
+        return jsonify({'error': results[0]['error']}), 404
     
-    # Update progress
-    progress = UserProgress.query.filter_by(user_id=user_id, module_id=module_id).first()
-    if not progress:
-        progress = UserProgress(
-            user_id=user_id,
-            path_id=module.level.path_id,
-            level_id=module.level_id,
-            module_id=module_id,
-            status='completed',
-            score=score,
-            completed_at=datetime.utcnow(),
-            last_activity_at=datetime.utcnow()
-        )
-        db.session.add(progress)
-        
-        # Add points to user total
-        user = User.query.get(user_id)
-        user.total_score += score
-        
-    else:
-        # Update if better score
-        if score > progress.score:
-            user = User.query.get(user_id)
-            user.total_score += (score - progress.score) # Add difference
-            progress.score = score
-            
-        progress.status = 'completed'
-        progress.completed_at = datetime.utcnow()
-        progress.last_activity_at = datetime.utcnow()
-        
-    # Check for micro-lesson assignment on failure
-    recommended_lesson = None
-    if module.type.type_name == 'practical':
-        # For practical modules, check if answer was incorrect
-        # The frontend sends userAnswer and correctAnswer in answers dict
-        user_answer = answers.get('userAnswer')
-        correct_answer = answers.get('correctAnswer')
-        
-        if user_answer and correct_answer and user_answer != correct_answer:
-            # Find a micro-lesson for this category
-            micro_lesson = MicroLesson.query.filter_by(category_id=module.category_id).first()
-            
-            if micro_lesson:
-                # Check if not already assigned
-                existing = AssignedLesson.query.filter_by(
-                    user_id=user_id,
-                    lesson_id=micro_lesson.lesson_id
-                ).first()
-                
-                if not existing:
-                    assignment = AssignedLesson(
-                        user_id=user_id,
-                        lesson_id=micro_lesson.lesson_id,
-                        status='pending'
-                    )
-                    db.session.add(assignment)
-                    recommended_lesson = {
-                        'lesson_id': micro_lesson.lesson_id,
-                        'title': micro_lesson.title,
-                        'est_time': micro_lesson.est_time_minutes
-                    }
-
-    # Check Learning Achievements
-    from app.services.achievement_service import AchievementService
-    try:
-        AchievementService.check_learning_achievements(user_id)
-    except Exception as e:
-        print(f"Error checking achievements: {e}")
-
+    _check_learning_achievements(user_id)
     db.session.commit()
     
     response_data = {
         'success': True, 
-        'score': score, 
+        'score': results[0]['score'], 
         'new_total': User.query.get(user_id).total_score
     }
     
-    if recommended_lesson:
-        response_data['recommended_lesson'] = recommended_lesson
+    if recommended:
+        response_data['recommended_lesson'] = recommended[0]
         
     return jsonify(response_data)
 
+@learning_bp.route('/submit-modules', methods=['POST'])
+def submit_modules():
+    """
+    Attempts queued by an offline client, in one request:
+    {"attempts": [{"module_id", "answers", "time_spent", "attempted_at"}, ...]}.
+    Each is graded and stored; one result per attempt, in order.
+    """
+    if 'user_id' not in session:
+        return jsonify({'error': 'Unauthorized'}), 401
+    
+    user_id = session['user_id']
+    attempts = (request.get_json(silent=True) or {}).get('attempts')
+    if not isinstance(attempts, list) or not all(isinstance(a, dict) for a in attempts):
+        return jsonify({'error': 'attempts must be a list of objects'}), 400
+    if len(attempts) > current_app.config['QUIZ_BATCH_MAX']:
+        return jsonify({'error': f"at most {current_app.config['QUIZ_BATCH_MAX']} attempts per request"}), 413
+    
+    results, recommended = record_module_attempts(db.session, user_id, attempts)
+    if any('error' not in result for result in results):
+        _check_learning_achievements(user_id)
+    db.session.commit()
+    
+    return jsonify({
+        'success': True,
+        'results': results,
+        'recommended_lessons': recommended,
+        'new_total': User.query.get(user_id).total_score
+    })
+
 @learning_bp.route('/leaderboard/<int:path_id>')
 def path_leaderboard(path_id):
-    # Logic for leaderboard
-    pass
+    """Top 10 of the user's org on a path, from the leaderboards table (rebuilt by the leaderboards.refresh job)"""
+    if 'user_id' not in session:
+        return jsonify({'error': 'Unauthorized'}), 401
+
+    rows = db.session.query(Leaderboard, User.username).join(
+        User, Leaderboard.user_id == User.user_id
+    ).filter(
+        Leaderboard.path_id == path_id, User.org_id == session.get('org_id')
+    ).order_by(Leaderboard.total_score.desc(), Leaderboard.modules_completed.desc()).limit(10).all()
+
+    return jsonify({
+        'path_id': path_id,
+        'updated_at': max((entry.last_updated for entry, _ in rows), default=None),
+        'leaderboard': [{
+            'rank': rank,
+            'username': username,
+            'score': entry.total_score,
+            'modules_completed': entry.modules_completed,
+            'is_current_user': entry.user_id == session['user_id']
+        } for rank, (entry, username) in enumerate(rows, 1)]
+    })
 
 @learning_bp.route('/level/<int:level_id>')
 def view_level(level_id):
@@ -404,7 +357,7 @@ def badges():
     except Exception as e:
         print(f"Error checking achievements on view: {e}")
 
-    definitions = AchievementDefinition.query.order_by(AchievementDefinition.category, AchievementDefinition.name).all()
+    definitions = sorted(reference_data.all(AchievementDefinition), key=lambda d: (d.category or '', d.name))
     user_achievements = Achievement.query.filter_by(user_id=user_id).all()
     user_ach_map = {ua.definition_id: ua for ua in user_achievements}
     
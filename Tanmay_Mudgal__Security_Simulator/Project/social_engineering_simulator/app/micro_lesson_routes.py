@@ -1,7 +1,7 @@
-from flask import Blueprint, render_template, request, session, redirect, url_for, jsonify
+from flask import Blueprint, render_template, request, session, redirect, url_for, jsonify, current_app
 from app import db
 from app.models import MicroLesson, AssignedLesson, User
-from datetime import datetime
+from app.services.quiz_grading import record_lesson_quizzes
 
 micro_lesson_bp = Blueprint('micro_lesson', __name__)
 
@@ -42,74 +42,45 @@ def submit_lesson_quiz(assignment_id):
     if assignment.user_id != session['user_id']:
         return jsonify({'error': 'Unauthorized'}), 403
         
-    data = request.get_json()
-    answers = data.get('answers', {})
+    data = request.get_json() or {}
     
-    lesson = assignment.lesson
-    quiz_data = lesson.quiz_json
-    questions = quiz_data.get('questions', [])
-    
-    correct_count = 0
-    total_questions = len(questions)
-    
-    for i, question in enumerate(questions):
-        question_type = question.get('type', 'mcq')
-        
-        if question_type in ['mcq', 'scenario_mcq']:
-            user_answer = answers.get(f'q{i}')
-            if user_answer == question['correct_answer']:
-                correct_count += 1
-                
-        elif question_type == 'fill_blank':
-            user_answer = answers.get(f'q{i}')
-            if user_answer:
-                # Case-insensitive, whitespace-stripped comparison
-                if user_answer.lower().strip() == question['correct_answer'].lower().strip():
-                    correct_count += 1
-                    
-        elif question_type == 'matching':
-            # Check all pairs
-            all_correct = True
-            pairs = question.get('pairs', {})
-            # Frontend sends keys as "q{question_index}_{pair_index}"
-            # But wait, our seed script doesn't assign indices to pairs.
-            # Frontend iterates pairs.items().
-            # We need to match frontend submission format.
-            # Frontend JS collects: matches[q{i}_{j}] = selected_value
-            
-            # Let's reconstruct logic.
-            # Frontend sends: answers = { 'q{i}_{k}': 'value' } where k is index of pair.
-            # We iterate through the correct pairs (sorted keys maybe?) to match indices.
-            
-            # Better approach: Iterate keys in pairs.
-            # Since frontend iterates pairs.items(), order is preserved (Python 3.7+ dicts are ordered).
-            current_pairs = list(pairs.items())
-            for pair_idx, (key, correct_val) in enumerate(current_pairs):
-                user_val = answers.get(f'q{i}_{pair_idx}')
-                if user_val != correct_val:
-                    all_correct = False
-                    break
-            
-            if all_correct and len(pairs) > 0:
-                correct_count += 1
-        
-    score = int((correct_count / total_questions) * 100) if total_questions > 0 else 0
+    # Graded against the lesson's compiled answer key (services/quiz_grading.py)
+    results, points_earned = record_lesson_quizzes(db.session, session['user_id'], [{
+        'assignment_id': assignment_id,
+        'answers': data.get('answers', {})
+    }])
+    if 'error' in results[0]:
+        return jsonify({'error': results[0]['error']}), 404
+    db.session.commit()
     
-    # Update assignment
-    assignment.status = 'completed'
-    assignment.quiz_score = score
-    assignment.completed_at = datetime.utcnow()
+    return jsonify({
+        'success': True,
+        'score': results[0]['score'],
+        'points_earned': points_earned,
+        'new_total': User.query.get(session['user_id']).total_score
+    })
+
+@micro_lesson_bp.route('/submit-lessons', methods=['POST'])
+def submit_lesson_quizzes():
+    """
+    Lesson quizzes queued by an offline client, in one request:
+    {"submissions": [{"assignment_id", "answers"}, ...]}. One result per submission, in order.
+    """
+    if 'user_id' not in session:
+        return jsonify({'error': 'Unauthorized'}), 401
     
-    # Award points to user (e.g., 50 points for completing a lesson)
-    user = User.query.get(session['user_id'])
-    points_earned = 50
-    user.total_score += points_earned
+    submissions = (request.get_json(silent=True) or {}).get('submissions')
+    if not isinstance(submissions, list) or not all(isinstance(s, dict) for s in submissions):
+        return jsonify({'error': 'submissions must be a list of objects'}), 400
+    if len(submissions) > current_app.config['QUIZ_BATCH_MAX']:
+        return jsonify({'error': f"at most {current_app.config['QUIZ_BATCH_MAX']} submissions per request"}), 413
     
+    results, points_earned = record_lesson_quizzes(db.session, session['user_id'], submissions)
     db.session.commit()
     
     return jsonify({
         'success': True,
-        'score': score,
+        'results': results,
         'points_earned': points_earned,
-        'new_total': user.total_score
+        'new_total': User.query.get(session['user_id']).total_score
     })
@@ -1,15 +1,47 @@
-import numpy as np
-from sklearn.neighbors import KNeighborsClassifier
-from sklearn.cluster import KMeans
 import pickle
 import os
+import time
+from threading import Lock
+from app.services import model_artifacts
+from app.services.request_metrics import metrics
+
+# numpy / sklearn are imported inside the methods that use them, and the saved
+# model is loaded on first use (or by `flask warmup`), so importing the app
+# doesn't pay for the ML stack. It is saved with joblib so its arrays can be
+# memory-mapped and shared between workers (see services/model_artifacts.py).
+# It is retrained by the ml.retrain background job (services/maintenance.py);
+# each worker checks the artifact's mtime every RELOAD_CHECK_SECONDS and
+# loads the new one.
+
+RELOAD_CHECK_SECONDS = 30
 
 class PersonalizationEngine:
     def __init__(self):
-        self.model = KNeighborsClassifier(n_neighbors=3)
+        self.model = None  # KNeighborsClassifier, created by train() or load_model()
         self.is_trained = False
-        self.model_path = 'ml_model.pkl'
+        self.artifact_name = 'ml_model.joblib'
+        self.model_path = 'ml_model.pkl'  # legacy pickle, read only if no artifact exists yet
         self.kmeans = None
+        self._loaded = False
+        self._load_lock = Lock()
+        self._artifact_mtime = None  # of the artifact this process loaded or saved
+        self._next_check = 0.0
+    
+    def ensure_loaded(self):
+        """Load the saved model on first use, and again when a retrained one has been saved since"""
+        if self._loaded and time.monotonic() < self._next_check:
+            return
+        with self._load_lock:
+            if not self._loaded or self._artifact_changed():
+                self.load_model()
+                self._loaded = True
+            self._next_check = time.monotonic() + RELOAD_CHECK_SECONDS
+    
+    def _artifact_changed(self):
+        try:
+            return os.path.getmtime(model_artifacts.artifact_path(self.artifact_name)) != self._artifact_mtime
+        except OSError:
+            return False
         
     def calculate_user_features(self, responses_by_type, impute_missing=False):
         """
@@ -19,6 +51,7 @@ class PersonalizationEngine:
         
         Returns: list of features for ML model
         """
+        import numpy as np
         features = []
         
         # Feature 1-3: Accuracy rates per scenario type
@@ -79,6 +112,7 @@ class PersonalizationEngine:
         Returns:
             'Easy', 'Medium', or 'Hard'
         """
+        import numpy as np
         if len(user_features) < 3:
             return 'Easy'
         
@@ -107,6 +141,7 @@ class PersonalizationEngine:
             X: feature matrix
             y: target labels (scenario type indices)
         """
+        import numpy as np
         X = []
         y = []
         
@@ -122,11 +157,17 @@ class PersonalizationEngine:
         
         return np.array(X), np.array(y)
     
+    @metrics.timed('ml_inference_seconds', model='knn', operation='train')
     def train(self, X, y):
         """Train the KNN model"""
+        from sklearn.neighbors import KNeighborsClassifier
+        from sklearn.cluster import KMeans
+        
         if len(X) >= 3:  # Need at least 3 samples for k=3
+            self.model = KNeighborsClassifier(n_neighbors=3)
             self.model.fit(X, y)
             self.is_trained = True
+            self._loaded = True  # Don't let a later ensure_loaded() replace the fresh model
             
             # Also train clustering model for user segmentation
             if len(X) >= 3:
@@ -137,12 +178,15 @@ class PersonalizationEngine:
             return True
         return False
     
+    @metrics.timed('ml_inference_seconds', model='knn', operation='recommend')
     def recommend_scenario_type(self, user_features):
         """
         Recommend scenario type based on user features
         Returns: 'Phishing', 'Baiting', or 'Pretexting'
         """
+        import numpy as np
         scenario_types = ['Phishing', 'Baiting', 'Pretexting']
+        self.ensure_loaded()
         
         if not self.is_trained or len(user_features) != 7:
             # If not trained, focus on weakest area or random
@@ -160,6 +204,7 @@ class PersonalizationEngine:
             weakest_idx = np.argmin(user_features[:3])
             return scenario_types[weakest_idx]
     
+    @metrics.timed('ml_inference_seconds', model='knn', operation='vulnerability_profile')
     def get_user_vulnerability_profile(self, user_features):
         """
         Analyze user's vulnerability profile
@@ -167,6 +212,7 @@ class PersonalizationEngine:
         Returns:
             dict with vulnerability assessment
         """
+        import numpy as np
         if len(user_features) < 7:
             return {
                 'level': 'Unknown',
@@ -202,32 +248,38 @@ class PersonalizationEngine:
         }
     
     def save_model(self):
-        """Save trained model to disk"""
+        """Save trained model to ML_ARTIFACT_DIR"""
         if self.is_trained:
             model_data = {
                 'model': self.model,
                 'kmeans': self.kmeans,
                 'is_trained': self.is_trained
             }
-            with open(self.model_path, 'wb') as f:
-                pickle.dump(model_data, f)
+            path = model_artifacts.artifact_path(self.artifact_name)
+            model_artifacts.dump(model_data, path)
+            self._artifact_mtime = os.path.getmtime(path)
             return True
         return False
     
     def load_model(self):
-        """Load trained model from disk"""
-        if os.path.exists(self.model_path):
-            try:
+        """Load trained model from disk (arrays memory-mapped read-only)"""
+        path = model_artifacts.artifact_path(self.artifact_name)
+        try:
+            if os.path.exists(path):
+                mtime = os.path.getmtime(path)
+                model_data = model_artifacts.load(path)  # imports sklearn
+                self._artifact_mtime = mtime
+            elif os.path.exists(self.model_path):
                 with open(self.model_path, 'rb') as f:
                     model_data = pickle.load(f)
-                    self.model = model_data.get('model', self.model)
-                    self.kmeans = model_data.get('kmeans', None)
-                    self.is_trained = model_data.get('is_trained', False)
-                return True
-            except:
+            else:
                 return False
-        return False
+            self.model = model_data.get('model', self.model)
+            self.kmeans = model_data.get('kmeans', None)
+            self.is_trained = model_data.get('is_trained', False)
+            return True
+        except:
+            return False
 
-# Global instance
+# Global instance (model loads lazily; see ensure_loaded)
 ml_engine = PersonalizationEngine()
-ml_engine.load_model()
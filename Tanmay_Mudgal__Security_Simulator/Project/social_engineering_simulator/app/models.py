@@ -34,13 +34,19 @@ class User(db.Model):
     # dept = backref from Department  
     # team = backref from Team
     
+    # Composite indexes backing the keyset-paginated admin user directory
+    __table_args__ = (
+        db.Index('idx_users_org_user', 'org_id', 'user_id'),
+        db.Index('idx_users_dept_user', 'dept_id', 'user_id'),
+        db.Index('idx_users_email', 'email'),
+    )
+    
     @property
     def role(self):
-        """Get the user's primary role"""
+        """Get the user's primary role (a cached RoleRef, see services/reference_data.py)"""
         if self.roles and len(self.roles) > 0:
-            # Get the role object from the first UserRole relationship
-            from app.models import Role
-            return Role.query.get(self.roles[0].role_id)
+            from app.services.reference_data import reference_data
+            return reference_data.get(Role, self.roles[0].role_id)
         return None
     
     def has_role(self, role_name):
@@ -53,11 +59,7 @@ class User(db.Model):
         user_role = self.role
         if not user_role:
             return False
-        # Check if any of the role's permissions match
-        for perm in user_role.permissions:
-            if perm.permission_name == permission_name:
-                return True
-        return False
+        return permission_name in user_role.permissions
     
     def is_admin(self):
         """Check if user has admin privileges"""
@@ -119,10 +121,51 @@ class UserResponse(db.Model):
     
     # Relationships
     details = db.relationship('ResponseDetail', backref='response', lazy=True, cascade='all, delete-orphan')
-    
+
+    # Per-user history, accuracy and recent-activity queries (index_advisor.py, migration 0004)
+    __table_args__ = (
+        db.Index('idx_user_responses_user_id_is_correct_timestamp', 'user_id', 'is_correct', 'timestamp'),
+        db.Index('idx_user_responses_user_id_timestamp', 'user_id', 'timestamp'),
+    )
+
     def __repr__(self):
         return f'<Response {self.response_id}>'
 
+class UserStats(db.Model):
+    """Per-user response / achievement totals behind the reporting views (services/summary_tables.py)"""
+    __tablename__ = 'user_stats'
+
+    user_id = db.Column(db.Integer, db.ForeignKey('users.user_id'), primary_key=True, autoincrement=False)
+    total_attempts = db.Column(db.Integer, default=0, nullable=False)
+    correct_attempts = db.Column(db.Integer, default=0, nullable=False)
+    total_response_time = db.Column(db.BigInteger, default=0, nullable=False)
+    timed_attempts = db.Column(db.Integer, default=0, nullable=False)  # responses with a response_time (for AVG)
+    achievements = db.Column(db.Integer, default=0, nullable=False)
+    last_updated = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+    def __repr__(self):
+        return f'<UserStats {self.user_id}>'
+
+class UserCategoryStats(db.Model):
+    """Per-user, per-scenario-type response totals (services/summary_tables.py)"""
+    __tablename__ = 'user_category_stats'
+
+    stat_id = db.Column(db.Integer, primary_key=True, autoincrement=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('users.user_id'), nullable=False)
+    category = db.Column(db.String(50), nullable=False)
+    attempts = db.Column(db.Integer, default=0, nullable=False)
+    correct = db.Column(db.Integer, default=0, nullable=False)
+    total_response_time = db.Column(db.BigInteger, default=0, nullable=False)
+    timed_attempts = db.Column(db.Integer, default=0, nullable=False)
+    last_updated = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+    __table_args__ = (
+        db.UniqueConstraint('user_id', 'category', name='uq_user_category_stats'),
+    )
+
+    def __repr__(self):
+        return f'<UserCategoryStats {self.user_id} {self.category}>'
+
 class LearningProgress(db.Model):
     __tablename__ = 'learning_progress'
     
@@ -131,8 +174,19 @@ class LearningProgress(db.Model):
     phishing_success_rate = db.Column(db.Float, default=0.0)
     baiting_success_rate = db.Column(db.Float, default=0.0)
     pretexting_success_rate = db.Column(db.Float, default=0.0)
+    # Running counters so success rates update in O(1) per response
+    phishing_attempts = db.Column(db.Integer, default=0, nullable=False)
+    phishing_correct = db.Column(db.Integer, default=0, nullable=False)
+    baiting_attempts = db.Column(db.Integer, default=0, nullable=False)
+    baiting_correct = db.Column(db.Integer, default=0, nullable=False)
+    pretexting_attempts = db.Column(db.Integer, default=0, nullable=False)
+    pretexting_correct = db.Column(db.Integer, default=0, nullable=False)
     last_updated = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
     
+    __table_args__ = (
+        db.Index('idx_learning_progress_user', 'user_id'),
+    )
+    
     def __repr__(self):
         return f'<Progress User {self.user_id}>'
 
@@ -300,6 +354,11 @@ class UserRole(db.Model):
     # Relationships
     user = db.relationship('User', foreign_keys=[user_id], back_populates='roles')
     assigner = db.relationship('User', foreign_keys=[assigned_by])
+    # No Role relationship: roles come from the reference-data cache (User.role)
+    
+    __table_args__ = (
+        db.Index('idx_user_roles_role_user', 'role_id', 'user_id'),
+    )
     
     def __repr__(self):
         return f'<UserRole {self.user_id}-{self.role_id}>'
@@ -390,7 +449,7 @@ class Notification(db.Model):
 class AuditLog(db.Model):
     __tablename__ = 'audit_logs'
     
-    audit_id = db.Column(db.BigInteger, primary_key=True, autoincrement=True)
+    audit_id = db.Column(db.BigInteger().with_variant(db.Integer, 'sqlite'), primary_key=True, autoincrement=True)  # SQLite only auto-increments INTEGER PKs
     user_id = db.Column(db.Integer, db.ForeignKey('users.user_id'), nullable=True)
     username = db.Column(db.String(80))
     action_type = db.Column(db.String(100), nullable=False)
@@ -423,10 +482,16 @@ class Campaign(db.Model):
     org_id = db.Column(db.Integer, db.ForeignKey('organizations.org_id'), nullable=False)
     name = db.Column(db.String(100), nullable=False)
     type = db.Column(db.String(50), nullable=False) # Phishing, Baiting
-    status = db.Column(db.String(20), default='Draft') # Draft, Active, Completed
+    status = db.Column(db.String(20), default='Draft') # Draft, Scheduled, Active, Paused, Completed
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     launched_at = db.Column(db.DateTime)
     
+    # Delivery window (UTC), sends spread across it; see services/campaign_scheduler.py
+    send_window_start = db.Column(db.DateTime)
+    send_window_end = db.Column(db.DateTime)
+    send_hours = db.Column(db.String(11))  # '09:00-17:00' in the org's timezone, NULL = around the clock
+    paused_at = db.Column(db.DateTime)
+    
     # Relationships
     targets = db.relationship('CampaignTarget', backref='campaign', lazy=True, cascade='all, delete-orphan')
     
@@ -439,16 +504,61 @@ class CampaignTarget(db.Model):
     target_id = db.Column(db.Integer, primary_key=True, autoincrement=True)
     campaign_id = db.Column(db.Integer, db.ForeignKey('campaigns.campaign_id'), nullable=False)
     user_id = db.Column(db.Integer, db.ForeignKey('users.user_id'), nullable=False)
-    status = db.Column(db.String(20), default='Pending') # Pending, Sent, Opened, Clicked...
+    status = db.Column(db.String(20), default='Pending') # Pending, Queued, Sent, Failed, Opened, Clicked...
     sent_at = db.Column(db.DateTime)
     interacted_at = db.Column(db.DateTime)
     
     # Relationships
     user = db.relationship('User', backref='campaign_targets')
     
+    __table_args__ = (
+        db.Index('idx_campaign_targets_campaign_status', 'campaign_id', 'status', 'target_id'),
+    )
+    
     def __repr__(self):
         return f'<CampaignTarget {self.campaign_id}-{self.user_id}>'
 
+class CampaignEvent(db.Model):
+    """First open / click / report of a campaign email, written in batches by services/tracking_events.py"""
+    __tablename__ = 'campaign_events'
+    
+    event_id = db.Column(db.BigInteger().with_variant(db.Integer, 'sqlite'), primary_key=True, autoincrement=True)
+    campaign_id = db.Column(db.Integer, db.ForeignKey('campaigns.campaign_id'), nullable=False)
+    target_id = db.Column(db.Integer, db.ForeignKey('campaign_targets.target_id'), nullable=False)
+    event_type = db.Column(db.String(10), nullable=False)  # open, click, report
+    occurred_at = db.Column(db.DateTime, nullable=False)
+    ip_address = db.Column(db.String(45))
+    user_agent = db.Column(db.String(255))
+    
+    __table_args__ = (
+        db.UniqueConstraint('target_id', 'event_type', name='uq_campaign_events_target_type'),
+        db.Index('idx_campaign_events_campaign_type', 'campaign_id', 'event_type'),
+    )
+    
+    def __repr__(self):
+        return f'<CampaignEvent {self.event_type} {self.target_id}>'
+
+class CampaignResult(db.Model):
+    """Campaign results cube: targets sent / opened / clicked / reported per department, team and day (services/campaign_results.py)"""
+    __tablename__ = 'campaign_results'
+    
+    result_id = db.Column(db.Integer, primary_key=True, autoincrement=True)
+    campaign_id = db.Column(db.Integer, db.ForeignKey('campaigns.campaign_id'), nullable=False)
+    dept_id = db.Column(db.Integer, nullable=False, default=0)  # 0 = no department
+    team_id = db.Column(db.Integer, nullable=False, default=0)  # 0 = no team
+    day = db.Column(db.Date, nullable=False)  # UTC
+    sent = db.Column(db.Integer, nullable=False, default=0)
+    opened = db.Column(db.Integer, nullable=False, default=0)
+    clicked = db.Column(db.Integer, nullable=False, default=0)
+    reported = db.Column(db.Integer, nullable=False, default=0)
+    
+    __table_args__ = (
+        db.UniqueConstraint('campaign_id', 'dept_id', 'team_id', 'day', name='uq_campaign_results_cell'),
+    )
+    
+    def __repr__(self):
+        return f'<CampaignResult {self.campaign_id} {self.dept_id}/{self.team_id} {self.day}>'
+
 # ==========================================
 # PATH TO MASTERY - NEW MODELS
 # ==========================================
@@ -563,6 +673,11 @@ class UserProgress(db.Model):
     # Relationships
     module = db.relationship('LearningModule')
 
+    # One row per user and module: buffered view counts are upserted on it (services/module_views.py, migration 0010)
+    __table_args__ = (
+        db.Index('unique_user_module', 'user_id', 'module_id', unique=True),
+    )
+
 class ModuleAttempt(db.Model):
     __tablename__ = 'module_attempts'
     
@@ -626,6 +741,10 @@ class AssignedLesson(db.Model):
     
     # Relationships
     lesson = db.relationship('MicroLesson')
+    
+    __table_args__ = (
+        db.Index('idx_assigned_lessons_user_lesson', 'user_id', 'lesson_id'),
+    )
 
 class SuspiciousReport(db.Model):
     __tablename__ = 'suspicious_reports'
@@ -640,10 +759,204 @@ class SuspiciousReport(db.Model):
     admin_notes = db.Column(db.Text)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     
+    # Near-duplicate clustering (services/report_clusters.py)
+    signature = db.Column(db.LargeBinary)  # MinHash of content_text, NULL when there is no text
+    cluster_id = db.Column(db.Integer, db.ForeignKey('report_clusters.cluster_id'))
+    
     # Relationships
     user = db.relationship('User', backref='suspicious_reports')
     organization = db.relationship('Organization', backref='suspicious_reports')
+    cluster = db.relationship('ReportCluster', backref='reports')
+    
+    __table_args__ = (
+        db.Index('idx_suspicious_reports_cluster_status', 'cluster_id', 'status', 'report_id'),
+    )
     
     def __repr__(self):
         return f'<SuspiciousReport {self.report_id} - {self.category}>'
 
+class ReportCluster(db.Model):
+    """Near-duplicate suspicious reports of one org, triaged together (services/report_clusters.py)"""
+    __tablename__ = 'report_clusters'
+    
+    cluster_id = db.Column(db.Integer, primary_key=True, autoincrement=True)
+    org_id = db.Column(db.Integer, db.ForeignKey('organizations.org_id'))
+    representative_id = db.Column(db.Integer)  # first report; new reports are compared with its signature
+    signature = db.Column(db.LargeBinary)
+    category = db.Column(db.String(50), nullable=False)
+    status = db.Column(db.Enum('Pending', 'Approved', 'Rejected', 'Converted'), default='Pending')
+    admin_notes = db.Column(db.Text)
+    report_count = db.Column(db.Integer, nullable=False, default=0)
+    pending_count = db.Column(db.Integer, nullable=False, default=0)
+    first_reported_at = db.Column(db.DateTime)
+    last_reported_at = db.Column(db.DateTime)
+    
+    __table_args__ = (
+        # Triage queue: keyset pages by most recent activity
+        db.Index('idx_report_clusters_status_last', 'status', 'last_reported_at', 'cluster_id'),
+    )
+    
+    def __repr__(self):
+        return f'<ReportCluster {self.cluster_id} ({self.report_count})>'
+
+class ReportClusterBand(db.Model):
+    """LSH bucket of a cluster's signature: reports sharing a bucket are compared with the cluster"""
+    __tablename__ = 'report_cluster_bands'
+    
+    band_id = db.Column(db.BigInteger().with_variant(db.Integer, 'sqlite'), primary_key=True, autoincrement=True)
+    band_hash = db.Column(db.BigInteger, nullable=False)
+    cluster_id = db.Column(db.Integer, db.ForeignKey('report_clusters.cluster_id'), nullable=False)
+    
+    __table_args__ = (
+        db.UniqueConstraint('band_hash', 'cluster_id', name='uq_report_cluster_bands_hash_cluster'),
+    )
+
+
+# ==========================================
+# PLATFORM METRICS CACHE
+# ==========================================
+
+class MetricSnapshot(db.Model):
+    """Cached result of an expensive admin metric, shared by all workers"""
+    __tablename__ = 'metric_snapshots'
+    
+    metric_key = db.Column(db.String(100), primary_key=True)
+    value_json = db.Column(db.JSON)
+    computed_at = db.Column(db.DateTime, default=datetime.utcnow)
+    expires_at = db.Column(db.DateTime, nullable=False)  # Fresh until
+    stale_until = db.Column(db.DateTime, nullable=False)  # Served (while revalidating) until
+    compute_ms = db.Column(db.Float, default=0.0)
+    
+    def __repr__(self):
+        return f'<MetricSnapshot {self.metric_key}>'
+
+
+# ==========================================
+# BACKGROUND JOBS (services/jobs.py)
+# ==========================================
+
+class Job(db.Model):
+    """One run of a background job: queued by enqueue() or a schedule, claimed by `flask jobs work` under a lease"""
+    __tablename__ = 'jobs'
+    
+    job_id = db.Column(db.BigInteger().with_variant(db.Integer, 'sqlite'), primary_key=True, autoincrement=True)
+    name = db.Column(db.String(100), nullable=False)
+    payload = db.Column(db.JSON)
+    status = db.Column(db.Enum('queued', 'running', 'succeeded', 'failed'), nullable=False, default='queued')
+    run_at = db.Column(db.DateTime, nullable=False)  # not claimed before (retries move it forward)
+    attempts = db.Column(db.Integer, nullable=False, default=0)
+    max_attempts = db.Column(db.Integer, nullable=False, default=3)
+    lease_owner = db.Column(db.String(100))  # worker running it
+    lease_expires_at = db.Column(db.DateTime)  # renewed while it runs; reclaimed once past
+    last_error = db.Column(db.Text)
+    schedule = db.Column(db.String(100))  # job_schedules.name when a schedule queued it
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    started_at = db.Column(db.DateTime)
+    finished_at = db.Column(db.DateTime)
+    duration_ms = db.Column(db.Float)
+    
+    __table_args__ = (
+        # Workers claim by (status, run_at); expired leases are found the same way
+        db.Index('idx_jobs_status_run_at', 'status', 'run_at'),
+        db.Index('idx_jobs_name_status', 'name', 'status'),
+    )
+    
+    def __repr__(self):
+        return f'<Job {self.job_id} {self.name} {self.status}>'
+
+
+class JobSchedule(db.Model):
+    """Cron schedule of a job; the worker that moves next_run_at forward queues the run"""
+    __tablename__ = 'job_schedules'
+    
+    name = db.Column(db.String(100), primary_key=True)
+    cron = db.Column(db.String(100), nullable=False)
+    next_run_at = db.Column(db.DateTime, nullable=False)
+    last_run_at = db.Column(db.DateTime)
+    last_job_id = db.Column(db.BigInteger)
+    
+    def __repr__(self):
+        return f'<JobSchedule {self.name} {self.cron}>'
+
+
+# ==========================================
+# SHARED COUNTERS (rate limits, quotas)
+# ==========================================
+
+class RateCounter(db.Model):
+    """Fixed-window counter used by the 'database' counter store backend"""
+    __tablename__ = 'rate_counters'
+    
+    counter_key = db.Column(db.String(255), primary_key=True)
+    hits = db.Column(db.Integer, nullable=False, default=0)
+    expires_at = db.Column(db.Double, nullable=False, index=True)  # Unix time the window ends
+    
+    def __repr__(self):
+        return f'<RateCounter {self.counter_key}={self.hits}>'
+
+
+class ReplicaHeartbeat(db.Model):
+    """Single row bumped on the primary by `flask db-heartbeat`; replicas' copy shows their lag"""
+    __tablename__ = 'replica_heartbeat'
+    
+    beat_id = db.Column(db.Integer, primary_key=True)
+    beat_at = db.Column(db.Double, nullable=False)  # Unix time
+    
+    def __repr__(self):
+        return f'<ReplicaHeartbeat {self.beat_at}>'
+
+
+# ==========================================
+# TENANT SHARDS
+# ==========================================
+
+class OrgShard(db.Model):
+    """Which shard holds an organization's data (catalog only; orgs without a row are on 'default')"""
+    __tablename__ = 'org_shards'
+    
+    org_id = db.Column(db.Integer, primary_key=True, autoincrement=False)
+    shard = db.Column(db.String(50), nullable=False, default='default')
+    status = db.Column(db.Enum('active', 'moving', 'read_only'), nullable=False, default='active')
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    
+    def __repr__(self):
+        return f'<OrgShard {self.org_id}@{self.shard} {self.status}>'
+
+
+# ==========================================
+# SCHEMA MIGRATIONS (services/migration_runner.py)
+# ==========================================
+
+class SchemaMigration(db.Model):
+    """One row per versioned migration applied (or attempted) on this database"""
+    __tablename__ = 'schema_migrations'
+    
+    version = db.Column(db.String(20), primary_key=True)
+    name = db.Column(db.String(200), nullable=False)
+    checksum = db.Column(db.String(64), nullable=False)
+    status = db.Column(db.Enum('running', 'applied', 'failed'), nullable=False)
+    started_at = db.Column(db.DateTime, nullable=False)
+    finished_at = db.Column(db.DateTime)
+    duration_ms = db.Column(db.Float)
+    error = db.Column(db.Text)
+    
+    def __repr__(self):
+        return f'<SchemaMigration {self.version} {self.status}>'
+
+
+class BackfillProgress(db.Model):
+    """Resume point of a chunked backfill: the last primary key committed"""
+    __tablename__ = 'backfill_progress'
+    
+    backfill_key = db.Column(db.String(255), primary_key=True)  # '<version>:<name>'
+    table_name = db.Column(db.String(100), nullable=False)
+    first_pk = db.Column(db.BigInteger, nullable=False)
+    last_pk = db.Column(db.BigInteger, nullable=False)
+    max_pk = db.Column(db.BigInteger, nullable=False)
+    rows_done = db.Column(db.BigInteger, nullable=False, default=0)
+    status = db.Column(db.Enum('running', 'done'), nullable=False, default='running')
+    started_at = db.Column(db.DateTime, nullable=False)
+    updated_at = db.Column(db.DateTime, nullable=False)
+    
+    def __repr__(self):
+        return f'<BackfillProgress {self.backfill_key} {self.last_pk}/{self.max_pk}>'
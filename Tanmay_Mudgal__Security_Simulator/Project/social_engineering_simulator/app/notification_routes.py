@@ -1,5 +1,4 @@
 from flask import Blueprint, request, jsonify, current_app
-import requests
 from datetime import datetime
 import os
 
@@ -63,6 +62,7 @@ def book_meeting():
 
 def send_discord_notification(name, email, message, ip_address, timestamp):
     """Send notification to Discord via webhook"""
+    import requests
     webhook_url = os.getenv('DISCORD_WEBHOOK_URL')
     
     if not webhook_url:
@@ -105,6 +105,7 @@ def send_discord_notification(name, email, message, ip_address, timestamp):
 
 def send_telegram_notification(name, email, message, ip_address, timestamp):
     """Send notification to Telegram via bot"""
+    import requests
     bot_token = os.getenv('TELEGRAM_BOT_TOKEN')
     chat_id = os.getenv('TELEGRAM_CHAT_ID')
     
@@ -1,5 +1,4 @@
 from flask import Blueprint, render_template, redirect, url_for, session, request, jsonify, current_app, flash
-import stripe
 from app.models import User
 from app import db
 import os
@@ -21,6 +20,7 @@ def create_checkout_session():
     if 'user_id' not in session:
         return jsonify({'error': 'Unauthorized'}), 401
 
+    import stripe  # heavy SDK; imported on first checkout rather than at startup
     try:
         stripe.api_key = current_app.config['STRIPE_SECRET_KEY']
         
@@ -73,6 +73,7 @@ def webhook():
     payload = request.get_data(as_text=True)
     sig_header = request.headers.get('Stripe-Signature')
     endpoint_secret = current_app.config['STRIPE_WEBHOOK_SECRET']
+    import stripe
 
     try:
         event = stripe.Webhook.construct_event(
@@ -1,14 +1,23 @@
 from flask import Blueprint, render_template, request, session, redirect, url_for, jsonify, flash, current_app
-from werkzeug.utils import secure_filename
-import os
 from werkzeug.security import generate_password_hash, check_password_hash
 from app import db, limiter
-from app.models import User, Scenario, UserResponse, LearningProgress, Achievement, ResponseDetail, Notification, AuditLog, MicroLesson, AssignedLesson, Category, SuspiciousReport, Role, UserRole, Organization, Department, Team
+from app.models import User, Scenario, UserResponse, LearningProgress, Achievement, ResponseDetail, Notification, AuditLog, MicroLesson, AssignedLesson, Category, SuspiciousReport, Role, UserRole, Organization, Department, Team, CampaignTarget
 from app.utils import log_audit, create_notification, require_permission
 from app.ml_model import ml_engine
+from app.services.micro_lesson_map import MicroLessonMap
+from app.services.scenario_quota import ScenarioQuota
+from app.services.db_routing import read_only
+from app.services.sharding import shard_router, shard_scope, tenant_scope, TenantMoving
+from app.services.jobs import job_queue
+from app.services.summary_tables import record_response
+from app.services.reference_data import reference_data
+from app.services.tracking_events import tracking_log, tokens_in
+from app.services.report_clusters import assign as assign_report_cluster
+from app.services.screenshot_store import screenshot_store, UnsupportedScreenshot
+from sqlalchemy import update
+from threading import Thread
 from datetime import datetime
 import random
-import numpy as np
 import json
 
 main_bp = Blueprint('main', __name__)
@@ -49,6 +58,7 @@ def submit_feedback():
                 f"💬 *Message:*\n{feedback}"
             )
             
+            import requests
             url = f"https://api.telegram.org/bot{bot_token}/sendMessage"
             payload = {
                 'chat_id': chat_id,
@@ -93,8 +103,8 @@ def register():
             flash('Password must be at least 8 characters long and include an uppercase letter, a number, and a special character.', 'error')
             return render_template('register.html')
             
-        # Check if user exists
-        existing_user = User.query.filter_by(username=username).first()
+        # Check if user exists (on any shard)
+        existing_user = shard_router.find_user(username=username)
         if existing_user:
             flash('Username already exists. Please choose another.', 'error')
             return render_template('register.html')
@@ -150,10 +160,10 @@ def register():
             # Security Fix: Only assign ORG_ADMIN if they successfully created a NEW organization.
             # Joining an existing organization defaults to LEARNER.
             if account_type == 'Enterprise' and is_new_org:
-                role = Role.query.filter_by(role_name='ORG_ADMIN').first()
+                role = reference_data.by_key(Role, 'ORG_ADMIN')
                 flash(f'Organization "{organization}" created. You are the Administrator.', 'success')
             else:
-                role = Role.query.filter_by(role_name='LEARNER').first()
+                role = reference_data.by_key(Role, 'LEARNER')
                 if account_type == 'Enterprise' and not is_new_org:
                      flash(f'Joined existing organization "{organization}".', 'info')
             
@@ -185,7 +195,8 @@ def login():
         # organization = request.form.get('organization') # Removed
         # account_type = request.form.get('account_type') # Removed
         
-        user = User.query.filter_by(username=username).first()
+        # Not logged in yet, so the org (and its shard) isn't known
+        user = shard_router.find_user(username=username)
         
         if user and check_password_hash(user.password, password):
             session['user_id'] = user.user_id
@@ -203,9 +214,11 @@ def login():
             # Log successful login
             log_audit(user.user_id, 'login', 'User logged in successfully', status='success')
             
-            # Check Consistency Achievements
-            from app.services.achievement_service import AchievementService
-            AchievementService.check_consistency_achievements(user.user_id)
+            # Consistency achievements (login streak) are checked by the job worker
+            try:
+                job_queue.enqueue('achievements.consistency', {'user_id': user.user_id, 'org_id': user.org_id})
+            except Exception as e:
+                current_app.logger.error(f"Queueing consistency achievements failed: {e}")
             
             flash('Login successful!', 'success')
             return redirect(url_for('main.dashboard'))
@@ -294,26 +307,21 @@ def get_scenario():
     # === FREE TIER LIMIT & RESTRICTION CHECK ===
     user = User.query.get(user_id)
     
-    # Check usage limit (5 per week for Free)
-    if not user.is_admin and user.subscription_tier != 'pro':
-        # Reset counter if new week
-        now = datetime.utcnow()
-        if not user.last_week_reset or (now - user.last_week_reset).days >= 7:
-            user.weekly_scenario_count = 0
-            user.last_week_reset = now
-            db.session.commit()
-            
-        if user.weekly_scenario_count >= 5:
+    # Check usage limit (5 per week for Free); the count lives in the shared counter store
+    is_free = user.subscription_tier != 'pro' and not user.is_admin()
+    if is_free:
+        limit = ScenarioQuota.limit()
+        if ScenarioQuota.used(user_id) >= limit:
             # Render a "limit reached" page or redirect with flash
             # For simplicity, returning a simple limit page or flash + dashboard
             # But let's verify if user specifically requested this to verify logic:
-            flash('Weekly scenario limit reached (5/5). Upgrade to Pro for unlimited training.', 'warning')
+            flash(f'Weekly scenario limit reached ({limit}/{limit}). Upgrade to Pro for unlimited training.', 'warning')
             return redirect(url_for('main.dashboard'))
 
     # Check request type restrictions
     req_type = request.args.get('type')
     
-    if req_type == 'IncidentResponse' and user.subscription_tier != 'pro' and not user.is_admin:
+    if req_type == 'IncidentResponse' and is_free:
         flash('Upgrade to Pro to access Incident Response drills.', 'warning')
         return redirect(url_for('payment.upgrade'))
 
@@ -416,6 +424,7 @@ def submit_response():
         response_time=response_time
     )
     
+    quota_week_ends_at = None
     try:
         db.session.add(new_response)
         db.session.flush()  # Flush to get response_id
@@ -433,111 +442,111 @@ def submit_response():
         )
         db.session.add(detail)
         
-        # Update user score
-        user = User.query.get(user_id)
-        user.total_score += score_gained
+        # Update user score (in SQL, so concurrent submits can't lose points)
+        user = db.session.get(User, user_id)
+        total_score = (user.total_score or 0) + score_gained
+        user.total_score = User.total_score + score_gained
         
-        # Update learning progress
+        # Update learning progress and the reporting summaries (also sets vulnerability_level)
         update_learning_progress(user_id, scenario.scenario_type, is_correct)
-        
-        # Increment weekly usage for Free users
-        if not user.is_admin and user.subscription_tier != 'pro':
-             user.weekly_scenario_count = (user.weekly_scenario_count or 0) + 1
-
-        
-        # Check for achievements
-        check_achievements(user_id)
-        
-        db.session.commit()
-        
-        # Retrain ML model periodically (every 10 responses)
-        total_responses = UserResponse.query.count()
-        if total_responses % 10 == 0:
-            retrain_ml_model()
-        
-        # Check for micro-lesson assignment on failure
+        record_response(user_id, scenario.scenario_type, is_correct, response_time)
+        
+        # Take one scenario from the weekly allowance for Free users (atomic across workers)
+        if user.subscription_tier != 'pro' and not user.is_admin():
+            allowed, used, week_ends_at = ScenarioQuota.consume(user_id)
+            if not allowed:
+                db.session.rollback()
+                return jsonify({'error': 'Weekly scenario limit reached. Upgrade to Pro for unlimited training.'}), 429
+            quota_week_ends_at = week_ends_at
+            # Mirrored on the user row for reporting; the store is authoritative
+            user.weekly_scenario_count = used
+            user.last_week_reset = datetime.utcfromtimestamp(week_ends_at - ScenarioQuota.WINDOW_SECONDS)
+        
+        # Assign a micro-lesson on failure (same transaction)
         recommended_lesson = None
         if not is_correct:
-            # Find category for this scenario type
-            category = Category.query.filter_by(category_name=scenario.scenario_type).first()
+            micro_lesson = MicroLessonMap.get(scenario.scenario_type)
             
-            if category:
-                # Find a micro-lesson for this category
-                micro_lesson = MicroLesson.query.filter_by(category_id=category.category_id).first()
+            if micro_lesson:
+                # Check if not already assigned
+                existing = db.session.query(AssignedLesson.status).filter_by(
+                    user_id=user_id,
+                    lesson_id=micro_lesson['lesson_id']
+                ).first()
                 
-                if micro_lesson:
-                    # Check if not already assigned
-                    existing = AssignedLesson.query.filter_by(
+                if not existing:
+                    db.session.add(AssignedLesson(
                         user_id=user_id,
-                        lesson_id=micro_lesson.lesson_id
-                    ).first()
-                    
-                    if not existing:
-                        assignment = AssignedLesson(
-                            user_id=user_id,
-                            lesson_id=micro_lesson.lesson_id,
-                            scenario_id=scenario_id,
-                            status='pending'
-                        )
-                        db.session.add(assignment)
-                        db.session.commit()
-                        
-                        recommended_lesson = {
-                            'lesson_id': micro_lesson.lesson_id,
-                            'title': micro_lesson.title,
-                            'est_time': micro_lesson.est_time_minutes
-                        }
-                    elif existing.status == 'pending':
-                         recommended_lesson = {
-                            'lesson_id': micro_lesson.lesson_id,
-                            'title': micro_lesson.title,
-                            'est_time': micro_lesson.est_time_minutes
-                        }
+                        lesson_id=micro_lesson['lesson_id'],
+                        scenario_id=scenario_id,
+                        status='pending'
+                    ))
+                    recommended_lesson = micro_lesson
+                elif existing.status == 'pending':
+                    recommended_lesson = micro_lesson
+        
+        db.session.commit()
+        
+        # Achievements and ML retraining don't affect this response; run them after the commit
+        run_after_submit(user_id, new_response.response_id)
 
         response_data = {
             'correct': is_correct,
             'explanation': scenario.explanation,
             'score_gained': score_gained,
-            'total_score': user.total_score
+            'total_score': total_score
         }
         
         if recommended_lesson:
-            response_data['recommended_lesson'] = recommended_lesson
+            response_data['recommended_lesson'] = dict(recommended_lesson)
             
         return jsonify(response_data)
     
+    except TenantMoving:
+        # Org is switching shards for a few seconds: 503 + Retry-After (see sharding.py)
+        db.session.rollback()
+        if quota_week_ends_at is not None:
+            ScenarioQuota.refund(user_id, quota_week_ends_at)
+        raise
     except Exception as e:
         db.session.rollback()
+        if quota_week_ends_at is not None:
+            ScenarioQuota.refund(user_id, quota_week_ends_at)
         return jsonify({'error': str(e)}), 500
 
+# scenario_type -> (attempts, correct, success_rate) columns on learning_progress
+PROGRESS_COLUMNS = {
+    'Phishing': ('phishing_attempts', 'phishing_correct', 'phishing_success_rate'),
+    'Baiting': ('baiting_attempts', 'baiting_correct', 'baiting_success_rate'),
+    'Pretexting': ('pretexting_attempts', 'pretexting_correct', 'pretexting_success_rate')
+}
+
 def update_learning_progress(user_id, scenario_type, is_correct):
-    """Update user's learning progress for specific scenario type"""
-    progress = LearningProgress.query.filter_by(user_id=user_id).first()
+    """Bump the user's counters for a scenario type and recompute its success rate in one UPDATE"""
+    columns = PROGRESS_COLUMNS.get(scenario_type)
+    if not columns:
+        return
+    
+    table = LearningProgress.__table__
+    attempts, correct, rate = (table.c[name] for name in columns)
+    hit = 1 if is_correct else 0
+    
+    # The rate goes first: MySQL evaluates SET left to right using already-updated values
+    result = db.session.execute(
+        update(table).where(table.c.user_id == user_id).ordered_values(
+            (rate, (correct + hit) * 100.0 / (attempts + 1)),
+            (attempts, attempts + 1),
+            (correct, correct + hit),
+            (table.c.last_updated, datetime.utcnow())
+        )
+    )
     
-    if not progress:
+    if result.rowcount == 0:
         progress = LearningProgress(user_id=user_id)
+        setattr(progress, columns[0], 1)
+        setattr(progress, columns[1], hit)
+        setattr(progress, columns[2], hit * 100.0)
         db.session.add(progress)
-    
-    # Get all responses for this scenario type
-    responses = db.session.query(UserResponse, Scenario).join(
-        Scenario, UserResponse.scenario_id == Scenario.scenario_id
-    ).filter(
-        UserResponse.user_id == user_id,
-        Scenario.scenario_type == scenario_type
-    ).all()
-    
-    if responses:
-        correct_count = sum(1 for r, s in responses if r.is_correct)
-        success_rate = (correct_count / len(responses)) * 100
-        
-        if scenario_type == 'Phishing':
-            progress.phishing_success_rate = success_rate
-        elif scenario_type == 'Baiting':
-            progress.baiting_success_rate = success_rate
-        elif scenario_type == 'Pretexting':
-            progress.pretexting_success_rate = success_rate
-        
-        progress.last_updated = datetime.utcnow()
 
 from app.services.achievement_service import AchievementService
 
@@ -548,42 +557,62 @@ def check_achievements(user_id):
     AchievementService.check_behavior_achievements(user_id) # In case report was converted silently or just to sync
     # Note: Learning & Consistency are triggered elsewhere or can be added here
 
+# Retrain roughly every N responses (keyed off the auto-increment id, not a table-wide COUNT)
+RETRAIN_EVERY = 10
 
-def retrain_ml_model():
-    """Retrain ML model with all user data"""
-    try:
-        # Get all users with responses
-        users_with_responses = db.session.query(User.user_id).join(
-            UserResponse
-        ).distinct().all()
-        
-        all_user_data = {}
+def run_after_submit(user_id, response_id):
+    """Post-commit side effects of a submission, in a background thread unless disabled"""
+    app = current_app._get_current_object()
+    # The thread has no request (g / session) to route by: hand it the org this request was routed to
+    org_id = shard_router.current()[1]
+    if app.config.get('DEFER_SIDE_EFFECTS_IN_THREAD', True):
+        Thread(target=_after_submit, args=(app, org_id, user_id, response_id), daemon=True).start()
+    else:
+        _after_submit(app, org_id, user_id, response_id)
+
+def _after_submit(app, org_id, user_id, response_id):
+    with app.app_context(), tenant_scope(org_id):
+        try:
+            check_achievements(user_id)
+        except Exception as e:
+            db.session.rollback()
+            app.logger.error(f"Achievement check failed for user {user_id}: {e}")
         
-        for (user_id,) in users_with_responses:
-            responses = UserResponse.query.filter_by(user_id=user_id).all()
-            
-            responses_by_type = {
+        if response_id % RETRAIN_EVERY == 0:
+            # Retrained by `flask jobs work` (services/maintenance.py); at most one run waits in the queue
+            try:
+                job_queue.enqueue('ml.retrain')
+            except Exception as e:
+                app.logger.error(f"Queueing ML retrain failed: {e}")
+
+def retrain_ml_model():
+    """Retrain ML model with all user data (the ml.retrain job). Returns whether a model was saved"""
+    # One pass per shard over responses joined to their scenario type, in submission order per user.
+    # Only the columns the feature calculation reads are loaded (no ORM objects).
+    all_user_data = {}
+    for name in shard_router.names():
+        with shard_scope(name):
+            rows = db.session.query(
+                UserResponse.user_id, UserResponse.is_correct, UserResponse.response_time, Scenario.scenario_type
+            ).join(
+                Scenario, UserResponse.scenario_id == Scenario.scenario_id
+            ).order_by(UserResponse.user_id, UserResponse.timestamp).all()
+        
+        for row in rows:
+            responses_by_type = all_user_data.setdefault(row.user_id, {
                 'Phishing': [],
                 'Baiting': [],
                 'Pretexting': []
-            }
-            
-            for response in responses:
-                scenario = Scenario.query.get(response.scenario_id)
-                if scenario:
-                    responses_by_type[scenario.scenario_type].append(response)
-            
-            all_user_data[user_id] = responses_by_type
-        
-        # Train model
-        X, y = ml_engine.prepare_training_data(all_user_data)
-        if ml_engine.train(X, y):
-            ml_engine.save_model()
+            })
+            if row.scenario_type in responses_by_type:
+                responses_by_type[row.scenario_type].append(row)
     
-    except Exception as e:
-        print(f"Error retraining ML model: {e}")
+    # Train model; web workers pick up the saved artifact (PersonalizationEngine.ensure_loaded)
+    X, y = ml_engine.prepare_training_data(all_user_data)
+    return ml_engine.train(X, y) and ml_engine.save_model()
 
 @main_bp.route('/progress')
+@read_only
 def progress():
     if 'user_id' not in session:
         return redirect(url_for('main.login'))
@@ -667,6 +696,7 @@ def logout():
     return redirect(url_for('main.login'))
 
 @main_bp.route('/leaderboard')
+@read_only
 def leaderboard():
     """Display top users by score"""
     if 'user_id' not in session:
@@ -702,6 +732,7 @@ def leaderboard():
                          current_rank=current_rank)
 
 @main_bp.route('/analytics')
+@read_only
 def analytics():
     """Display detailed analytics dashboard"""
     if 'user_id' not in session:
@@ -711,7 +742,7 @@ def analytics():
     user = User.query.get(user_id)
     
     # Check subscription for analytics access (Pro only, Admins exempt)
-    if user.subscription_tier != 'pro' and not user.is_admin:
+    if user.subscription_tier != 'pro' and not user.is_admin():
         flash('Advanced analytics are available for Pro users only.', 'info')
         return redirect(url_for('main.dashboard'))
     all_responses = UserResponse.query.filter_by(user_id=user_id).all()
@@ -737,6 +768,7 @@ def analytics():
         if responses:
             correct = sum(1 for r in responses if r.is_correct)
             accuracy = (correct / len(responses)) * 100
+            import numpy as np
             avg_time = np.mean([r.response_time for r in responses if r.response_time])
         else:
             accuracy = 0
@@ -923,16 +955,12 @@ def report_suspicious():
         
         filename = None
         if file and file.filename != '':
-            # Ensure upload folder exists
-            upload_folder = current_app.config['UPLOAD_FOLDER']
-            if not os.path.exists(upload_folder):
-                os.makedirs(upload_folder)
-                
-            original_filename = secure_filename(file.filename)
-            # Prepend timestamp to filename
-            timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-            filename = f"{timestamp}_{original_filename}"
-            file.save(os.path.join(upload_folder, filename))
+            # Stored once per distinct image, named by its hash (see services/screenshot_store.py)
+            try:
+                filename = screenshot_store.save(file)
+            except UnsupportedScreenshot as e:
+                flash(f'Report not submitted: {e}.', 'error')
+                return render_template('report_suspicious.html')
             
         report = SuspiciousReport(
             user_id=user_id,
@@ -943,8 +971,17 @@ def report_suspicious():
         )
         
         db.session.add(report)
+        db.session.flush()
+        assign_report_cluster(db.session, report)
         db.session.commit()
         
+        # Reporting one of our own campaign emails counts as a report in the campaign results
+        target_ids = tokens_in(content_text)
+        if target_ids:
+            for (target_id,) in db.session.query(CampaignTarget.target_id).filter(
+                    CampaignTarget.target_id.in_(target_ids), CampaignTarget.user_id == user_id):
+                tracking_log.record('report', target_id, request.remote_addr, request.headers.get('User-Agent'))
+        
         flash('Report submitted successfully! Security team will review it.', 'success')
         create_notification(user_id, 'report_received', 'Report Received', 'Thanks for reporting. We are investigating.')
         log_audit(user_id, 'report_suspicious', f'User reported {category}', resource_type='suspicious_report', resource_id=report.report_id)
@@ -1,12 +1,14 @@
 from app import db
-from app.models import User, Achievement, AchievementDefinition, UserResponse, UserProgress, SuspiciousReport, AuditLog, Scenario, LearningModule, Topic, DifficultyLevel
+from app.services.summary_tables import record_achievement
+from app.services.reference_data import reference_data
+from app.models import User, Achievement, AchievementDefinition, UserResponse, UserProgress, SuspiciousReport, AuditLog, Scenario, LearningModule, Topic, DifficultyLevel, Category
 from sqlalchemy import func
 from datetime import datetime, timedelta
 
 class AchievementService:
     @staticmethod
     def get_or_create_user_achievement(user_id, slug):
-        definition = AchievementDefinition.query.filter_by(slug=slug).first()
+        definition = reference_data.by_key(AchievementDefinition, slug)
         if not definition:
             return None, None
 
@@ -22,6 +24,7 @@ class AchievementService:
                 current_value=0
             )
             db.session.add(user_ach)
+            record_achievement(user_id)
             # Commit immediately to get ID? No, session management is better
         
         return user_ach, definition
@@ -80,10 +83,13 @@ class AchievementService:
             # Schema has 'categories' (Phishing, etc) and 'learning_modules' linking to them.
             # And 'path_levels' (Fundamentals).
             
+            category = reference_data.by_key(Category, topic_name)
+            if category is None:
+                return False
+
             # Count modules in this category & level
             total_query = db.session.query(func.count(LearningModule.module_id))\
-                .join(Category)\
-                .filter(Category.category_name == topic_name)
+                .filter(LearningModule.category_id == category.category_id)
                 
             # Need to filter by Level 'Fundamentals'. 
             # 'learning_modules' links to 'path_levels' via level_id
@@ -98,7 +104,7 @@ class AchievementService:
                 # New structure uses DifficultyLevel.
                 from app.models import PathLevel
                 total = db.session.query(func.count(LearningModule.module_id))\
-                    .join(Category).filter(Category.category_name == topic_name)\
+                    .filter(LearningModule.category_id == category.category_id)\
                     .join(PathLevel, LearningModule.level_id == PathLevel.level_id).filter(PathLevel.level_name == level_name).scalar()
                 
             if not total: return False # No modules found
@@ -107,11 +113,10 @@ class AchievementService:
             # Join UserProgress
             completed = db.session.query(func.count(UserProgress.progress_id))\
                 .join(LearningModule, UserProgress.module_id == LearningModule.module_id)\
-                .join(Category, LearningModule.category_id == Category.category_id)\
                 .join(PathLevel, LearningModule.level_id == PathLevel.level_id)\
                 .filter(UserProgress.user_id == user_id, 
                         UserProgress.status == 'completed',
-                        Category.category_name == topic_name,
+                        LearningModule.category_id == category.category_id,
                         PathLevel.level_name == level_name).scalar()
                         
             return completed >= total
@@ -121,10 +126,9 @@ class AchievementService:
 
         # 2. Multi-Topic Learner (Fundamentals in 3 topics)
         # Iterate all categories?
-        categories = db.session.query(Category.category_name).all()
         fundamentals_completed = 0
-        for cat in categories:
-            if check_topic_level(cat[0], 'Fundamentals'):
+        for cat in reference_data.all(Category):
+            if check_topic_level(cat.category_name, 'Fundamentals'):
                 fundamentals_completed += 1
         
         AchievementService.award_achievement(user_id, 'multi_topic_learner', fundamentals_completed)
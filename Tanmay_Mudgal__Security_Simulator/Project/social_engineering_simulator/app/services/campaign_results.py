@@ -0,0 +1,150 @@
+"""
+Campaign results cube (campaign_results)
+
+One row per campaign x department x team x day (UTC) with how many targets
+were sent, first opened, first clicked and first reported the email that
+day. Campaign dashboards and exports read a few hundred of these rows
+instead of grouping campaign_targets / campaign_events of every target.
+Users without a department or team are counted under dept_id / team_id 0.
+
+The rows are kept current by delta upserts in the transactions that produce
+the facts, one statement per batch:
+- the dispatcher (services/campaign_scheduler.py) adds each batch's sent
+  targets, on the day they were sent
+- the tracking ingester (services/tracking_events.py) adds each target's
+  first open, click and report, on the day it happened
+
+A count stays with the department / team the user was in at the time.
+`flask campaigns rebuild-results` recounts campaigns from campaign_targets
+and campaign_events (with the users' current department and team) and
+rewrites the ones that differ; run it after the migration that adds the
+table, or after bulk edits. Facts committed while a campaign is recounted
+can show up as a difference: re-run it.
+"""
+from collections import defaultdict
+import sqlalchemy as sa
+
+MEASURES = ('sent', 'opened', 'clicked', 'reported')
+EVENT_MEASURES = {'open': 'opened', 'click': 'clicked', 'report': 'reported'}
+DIMENSIONS = {'dept': 'dept_id', 'team': 'team_id', 'day': 'day'}
+CELL = ('campaign_id', 'dept_id', 'team_id', 'day')
+
+def _tables():
+    from app.models import CampaignResult, CampaignTarget, CampaignEvent, User, Department, Team
+    return (CampaignResult.__table__, CampaignTarget.__table__, CampaignEvent.__table__, User.__table__,
+            Department.__table__, Team.__table__)
+
+def cell(campaign_id, dept_id, team_id, day):
+    """Cube key of a fact; day is a date"""
+    return campaign_id, dept_id or 0, team_id or 0, day
+
+def _upsert(dialect):
+    table = _tables()[0]
+    if dialect == 'mysql':
+        from sqlalchemy.dialects.mysql import insert
+        stmt = insert(table)
+        return stmt.on_duplicate_key_update({m: table.c[m] + stmt.inserted[m] for m in MEASURES})
+    from sqlalchemy.dialects.sqlite import insert
+    stmt = insert(table)
+    return stmt.on_conflict_do_update(index_elements=list(CELL),
+                                      set_={m: table.c[m] + stmt.excluded[m] for m in MEASURES})
+
+def add(conn, counts):
+    """Add {(cell(...), measure): n} (e.g. a Counter) to the cube in the caller's transaction"""
+    cells = defaultdict(dict)
+    for (key, measure), n in counts.items():
+        cells[key][measure] = cells[key].get(measure, 0) + n
+    rows = [dict(zip(CELL, key), **{m: deltas.get(m, 0) for m in MEASURES})
+            for key, deltas in sorted(cells.items()) if any(deltas.values())]
+    if rows:  # sorted: concurrent writers lock the cells in the same order
+        conn.execute(_upsert(conn.dialect.name), rows)
+
+# --- Reading ---
+
+def parse_dimensions(value):
+    """'dept,team,day' -> ('dept', 'team', 'day'); unknown names raise ValueError"""
+    by = tuple(part.strip() for part in (value or '').split(',') if part.strip())
+    unknown = [part for part in by if part not in DIMENSIONS]
+    if unknown:
+        raise ValueError(f"unknown dimension {unknown[0]!r} (use {', '.join(DIMENSIONS)})")
+    return by
+
+def results(session, campaign_id, by=('dept', 'team', 'day')):
+    """
+    The campaign's cube rolled up to the dimensions in `by`, with department
+    and team names; list of dicts ordered by those dimensions. `session` is
+    anything with .execute(): db.session (routed to the campaign's shard) or
+    a connection.
+    """
+    table, _, _, _, departments, teams = _tables()
+    keys = [table.c[DIMENSIONS[name]] for name in by]
+    rows = session.execute(
+        sa.select(*keys, *(sa.func.sum(table.c[m]).label(m) for m in MEASURES))
+        .where(table.c.campaign_id == campaign_id).group_by(*keys).order_by(*keys)).mappings().all()
+
+    names = {'dept': {}, 'team': {}}
+    for name, source, pk in (('dept', departments, 'dept_id'), ('team', teams, 'team_id')):
+        ids = {row[pk] for row in rows if row[pk]} if name in by else None
+        if ids:
+            names[name] = dict(session.execute(sa.select(source.c[pk], source.c.name)
+                                               .where(source.c[pk].in_(ids))).all())
+    out = []
+    for row in rows:
+        item = {}
+        if 'dept' in by:
+            item.update(dept_id=row['dept_id'] or None, department=names['dept'].get(row['dept_id']))
+        if 'team' in by:
+            item.update(team_id=row['team_id'] or None, team=names['team'].get(row['team_id']))
+        if 'day' in by:
+            item['day'] = row['day'].isoformat()
+        item.update({m: int(row[m] or 0) for m in MEASURES})
+        out.append(item)
+    return out
+
+def rates(counts):
+    """Open / click / report rates (percent of sent) of one results row"""
+    sent = counts['sent']
+    return {f'{m}_rate': round(counts[m] * 100.0 / sent, 1) if sent else None for m in MEASURES[1:]}
+
+# --- Recount ---
+
+def recount(conn, campaign_id):
+    """{cell: {measure: n}} of one campaign computed from the raw tables"""
+    _, targets, events, users, _, _ = _tables()
+    counts = defaultdict(dict)
+    sent_day = sa.func.date(targets.c.sent_at, type_=sa.Date)
+    for dept_id, team_id, day, n in conn.execute(
+            sa.select(users.c.dept_id, users.c.team_id, sent_day, sa.func.count())
+            .join(users, users.c.user_id == targets.c.user_id)
+            .where(targets.c.campaign_id == campaign_id, targets.c.sent_at.isnot(None))
+            .group_by(users.c.dept_id, users.c.team_id, sent_day)):
+        counts[cell(campaign_id, dept_id, team_id, day)]['sent'] = int(n)
+
+    event_day = sa.func.date(events.c.occurred_at, type_=sa.Date)
+    for dept_id, team_id, day, event_type, n in conn.execute(
+            sa.select(users.c.dept_id, users.c.team_id, event_day, events.c.event_type, sa.func.count())
+            .join(targets, targets.c.target_id == events.c.target_id)
+            .join(users, users.c.user_id == targets.c.user_id)
+            .where(events.c.campaign_id == campaign_id)
+            .group_by(users.c.dept_id, users.c.team_id, event_day, events.c.event_type)):
+        if event_type in EVENT_MEASURES:
+            counts[cell(campaign_id, dept_id, team_id, day)][EVENT_MEASURES[event_type]] = int(n)
+    return counts
+
+def rebuild(engine, campaign_id):
+    """Recount one campaign and rewrite its rows if they differ; returns the number of cells that differed"""
+    table = _tables()[0]
+    with engine.begin() as conn:
+        expected = {key: tuple(values.get(m, 0) for m in MEASURES) for key, values in recount(conn, campaign_id).items()}
+        actual = {tuple(row[:4]): tuple(row[4:]) for row in conn.execute(
+            sa.select(*(table.c[c] for c in CELL), *(table.c[m] for m in MEASURES))
+            .where(table.c.campaign_id == campaign_id))}
+        zero = (0,) * len(MEASURES)
+        differing = sum(1 for key in expected.keys() | actual.keys()
+                        if expected.get(key, zero) != actual.get(key, zero))
+        if differing:
+            conn.execute(table.delete().where(table.c.campaign_id == campaign_id))
+            rows = [dict(zip(CELL, key), **dict(zip(MEASURES, values))) for key, values in sorted(expected.items())]
+            if rows:
+                conn.execute(table.insert(), rows)
+    return differing
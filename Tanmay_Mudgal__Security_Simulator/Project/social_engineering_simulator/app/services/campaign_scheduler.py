@@ -0,0 +1,372 @@
+"""
+Campaign delivery (`flask campaigns dispatch`)
+
+A campaign is scheduled with a delivery window (send_window_start/end, UTC)
+and optionally daily send hours in its org's timezone ('09:00-17:00'). The
+dispatcher paces each campaign so the share of its targets sent tracks the
+share of the window's open time that has passed: half-way through the
+window's business hours, half of the targets have been sent. Nothing is
+sent outside the send hours; a campaign without a window end is sent as
+fast as the rate limits allow.
+
+Each tick, per campaign with targets due:
+- take up to CAMPAIGN_BATCH_SIZE sends from the per-org and the global
+  per-minute budgets (CAMPAIGN_RATE_PER_ORG / CAMPAIGN_RATE_GLOBAL, fixed
+  windows in the shared counter store, so several dispatchers share them)
+- claim that many Pending targets (status -> 'Queued') in one UPDATE
+- send them over one SMTP connection (headers rendered once per batch)
+- mark them 'Sent' (with sent_at) or 'Failed' with one UPDATE per outcome,
+  and add the sent ones to the results cube (services/campaign_results.py)
+
+Targets still 'Queued' when a dispatcher starts were claimed by one that
+died mid-batch and are put back to Pending, so delivery is at-least-once.
+Run one dispatcher per database.
+
+Pausing stops the dispatcher from claiming more targets; resuming shifts the
+window by the time spent paused, so the campaign continues at the pace it
+had. Campaigns and targets are tenant tables: every shard is dispatched.
+
+Campaigns launched before the scheduler ('Active' with no window) are never
+picked up on their own: `flask campaigns schedule --reschedule-legacy` gives
+them CAMPAIGN_DEFAULT_WINDOW_HOURS and CAMPAIGN_DEFAULT_SEND_HOURS, like
+Quick Launch.
+
+Config:
+    CAMPAIGN_BATCH_SIZE          targets claimed and sent per batch
+    CAMPAIGN_RATE_PER_ORG        sends per minute for one org
+    CAMPAIGN_RATE_GLOBAL         sends per minute for the whole deployment
+    CAMPAIGN_DISPATCH_INTERVAL   seconds the dispatcher sleeps when nothing was due
+    CAMPAIGN_LINK_URL            phishing link, formatted with token (signed target id) / campaign_id
+    CAMPAIGN_OPEN_URL            tracking pixel, formatted the same way
+"""
+import math
+import smtplib
+import time
+from collections import Counter
+from datetime import datetime, timedelta, timezone as dt_timezone
+from zoneinfo import ZoneInfo, ZoneInfoNotFoundError
+import sqlalchemy as sa
+from flask import current_app
+from app.services.counter_store import counter_store
+from app.services.campaign_results import cell, add as add_results
+
+RATE_WINDOW = 60
+SENDING = ('Scheduled', 'Active')
+
+class CampaignError(Exception):
+    pass
+
+def _tables():
+    from app.models import Campaign, CampaignTarget, User, Organization
+    return Campaign.__table__, CampaignTarget.__table__, User.__table__, Organization.__table__
+
+def parse_send_hours(value):
+    """'09:00-17:00' -> (time(9, 0), time(17, 0)); None / '' -> None"""
+    if not value:
+        return None
+    try:
+        start, end = (datetime.strptime(part.strip(), '%H:%M').time() for part in value.split('-'))
+    except ValueError:
+        raise CampaignError(f'send hours {value!r} are not HH:MM-HH:MM') from None
+    if start >= end:
+        raise CampaignError(f'send hours {value!r} end before they start')
+    return start, end
+
+def org_timezone(name):
+    try:
+        return ZoneInfo(name) if name else dt_timezone.utc
+    except (ZoneInfoNotFoundError, ValueError):
+        return dt_timezone.utc
+
+def _aware(value):
+    return value.replace(tzinfo=dt_timezone.utc)
+
+def open_seconds(start, end, tz, hours):
+    """Seconds of [start, end) (naive UTC) that fall within the daily send hours in tz"""
+    if end <= start:
+        return 0.0
+    if hours is None:
+        return (end - start).total_seconds()
+    local_start, local_end = _aware(start).astimezone(tz), _aware(end).astimezone(tz)
+    total, day = 0.0, local_start.date()
+    while day <= local_end.date():
+        opens = datetime.combine(day, hours[0], tzinfo=tz)
+        closes = datetime.combine(day, hours[1], tzinfo=tz)
+        # timestamps, not aware-datetime subtraction, so DST days have their real length
+        lo, hi = max(opens, local_start).timestamp(), min(closes, local_end).timestamp()
+        if hi > lo:
+            total += hi - lo
+        day += timedelta(days=1)
+    return total
+
+def is_open(now, tz, hours):
+    if hours is None:
+        return True
+    local = _aware(now).astimezone(tz).time()
+    return hours[0] <= local < hours[1]
+
+def due_fraction(campaign, tz, hours, now):
+    """Share of the campaign's targets that should have been sent by now"""
+    start, end = campaign['send_window_start'], campaign['send_window_end']
+    if start is None or now < start:
+        return 0.0
+    if end is None or now >= end:
+        return 1.0
+    window = open_seconds(start, end, tz, hours)
+    if window <= 0:
+        return 1.0  # no send hours inside the window: go at the rate limits once it starts
+    return min(1.0, open_seconds(start, now, tz, hours) / window)
+
+class CampaignScheduler:
+    def init_app(self, app):
+        app.config.setdefault('CAMPAIGN_BATCH_SIZE', 200)
+        app.config.setdefault('CAMPAIGN_RATE_PER_ORG', 1200)
+        app.config.setdefault('CAMPAIGN_RATE_GLOBAL', 6000)
+        app.config.setdefault('CAMPAIGN_DISPATCH_INTERVAL', 1.0)
+        app.config.setdefault('CAMPAIGN_LINK_URL', 'http://127.0.0.1:5000/c/{token}')
+        app.config.setdefault('CAMPAIGN_OPEN_URL', 'http://127.0.0.1:5000/c/{token}/o.gif')
+
+    # --- Campaign state ---
+
+    def _locate(self, campaign_id):
+        """(engine, campaign row) from whichever shard holds the campaign"""
+        from app.services.sharding import shard_router
+        campaigns = _tables()[0]
+        for name in shard_router.names():
+            engine = shard_router.engine(name)
+            with engine.connect() as conn:
+                row = conn.execute(sa.select(campaigns).where(campaigns.c.campaign_id == campaign_id)).mappings().first()
+            if row is not None:
+                return engine, row
+        raise CampaignError(f'campaign {campaign_id} not found')
+
+    def schedule(self, campaign_id, start=None, window_hours=None, send_hours=None):
+        """Set a campaign's delivery window and hand it to the dispatcher"""
+        parse_send_hours(send_hours)
+        engine, row = self._locate(campaign_id)
+        if row['status'] == 'Completed':
+            raise CampaignError(f'campaign {campaign_id} is already completed')
+        start = start or datetime.utcnow()
+        end = start + timedelta(hours=window_hours) if window_hours else None
+        campaigns = _tables()[0]
+        with engine.begin() as conn:
+            conn.execute(sa.update(campaigns).where(campaigns.c.campaign_id == campaign_id).values(
+                status='Scheduled', send_window_start=start, send_window_end=end,
+                send_hours=send_hours or None, paused_at=None))
+        return start, end
+
+    def reschedule_legacy(self, start=None):
+        """
+        Schedule the campaigns launched before the scheduler existed ('Active'
+        with no window) over CAMPAIGN_DEFAULT_WINDOW_HOURS and
+        CAMPAIGN_DEFAULT_SEND_HOURS, as Quick Launch does; returns how many
+        """
+        from app.services.sharding import shard_router
+        config = current_app.config
+        campaigns = _tables()[0]
+        start = start or datetime.utcnow()
+        end = start + timedelta(hours=config['CAMPAIGN_DEFAULT_WINDOW_HOURS'])
+        send_hours = config['CAMPAIGN_DEFAULT_SEND_HOURS'] or None
+        parse_send_hours(send_hours)
+        scheduled = 0
+        for name in shard_router.names():
+            with shard_router.engine(name).begin() as conn:
+                scheduled += conn.execute(sa.update(campaigns).where(
+                    campaigns.c.status == 'Active', campaigns.c.send_window_start.is_(None)
+                ).values(status='Scheduled', send_window_start=start, send_window_end=end,
+                         send_hours=send_hours, paused_at=None)).rowcount
+        return scheduled
+
+    def pause(self, campaign_id):
+        engine, row = self._locate(campaign_id)
+        if row['status'] not in SENDING:
+            raise CampaignError(f"campaign {campaign_id} is {row['status']}, not sending")
+        campaigns = _tables()[0]
+        with engine.begin() as conn:
+            conn.execute(sa.update(campaigns).where(campaigns.c.campaign_id == campaign_id)
+                         .values(status='Paused', paused_at=datetime.utcnow()))
+
+    def resume(self, campaign_id):
+        """Continue a paused campaign, moving its window by the time it was paused"""
+        engine, row = self._locate(campaign_id)
+        if row['status'] != 'Paused':
+            raise CampaignError(f"campaign {campaign_id} is {row['status']}, not paused")
+        paused_for = datetime.utcnow() - (row['paused_at'] or datetime.utcnow())
+        campaigns = _tables()[0]
+
+        def shift(value):
+            return value + paused_for if value is not None else None
+        with engine.begin() as conn:
+            conn.execute(sa.update(campaigns).where(campaigns.c.campaign_id == campaign_id).values(
+                status='Active' if row['launched_at'] else 'Scheduled', paused_at=None,
+                send_window_start=shift(row['send_window_start']), send_window_end=shift(row['send_window_end'])))
+
+    def progress(self, engine, campaign_id):
+        """{status: target count} for one campaign"""
+        targets = _tables()[1]
+        with engine.connect() as conn:
+            return dict(conn.execute(
+                sa.select(targets.c.status, sa.func.count()).where(targets.c.campaign_id == campaign_id)
+                .group_by(targets.c.status)).all())
+
+    # --- Dispatching ---
+
+    def requeue_claimed(self):
+        """Put targets a dead dispatcher had claimed back to Pending; returns how many"""
+        from app.services.sharding import shard_router
+        targets = _tables()[1]
+        requeued = 0
+        for name in shard_router.names():
+            with shard_router.engine(name).begin() as conn:
+                requeued += conn.execute(sa.update(targets).where(targets.c.status == 'Queued')
+                                         .values(status='Pending')).rowcount
+        return requeued
+
+    def run(self, once=False, log=print):
+        """Dispatch until interrupted; back-to-back while anything is due, else every CAMPAIGN_DISPATCH_INTERVAL"""
+        requeued = self.requeue_claimed()
+        if requeued:
+            log(f'{requeued} targets claimed by a previous dispatcher put back to Pending')
+        while True:
+            sent = self.dispatch_once(log=log)
+            if once:
+                return sent
+            if not sent:
+                time.sleep(current_app.config['CAMPAIGN_DISPATCH_INTERVAL'])
+
+    def dispatch_once(self, now=None, log=print):
+        """One pass over every sending campaign on every shard; returns emails sent"""
+        from app import db
+        from app.services.sharding import shard_router
+        campaigns, _, _, organizations = _tables()
+        now = now or datetime.utcnow()
+        sent = 0
+        for name in shard_router.names():
+            engine = shard_router.engine(name)
+            with engine.connect() as conn:
+                rows = conn.execute(sa.select(campaigns).where(
+                    campaigns.c.status.in_(SENDING),
+                    campaigns.c.send_window_start <= now).order_by(campaigns.c.campaign_id)).mappings().all()
+            if not rows:
+                continue
+            with db.engine.connect() as conn:  # organizations live on the catalog
+                zones = dict(conn.execute(sa.select(organizations.c.org_id, organizations.c.timezone).where(
+                    organizations.c.org_id.in_({row['org_id'] for row in rows}))).all())
+            for row in rows:
+                sent += self._dispatch_campaign(engine, row, org_timezone(zones.get(row['org_id'])), now, log)
+        return sent
+
+    def _dispatch_campaign(self, engine, campaign, tz, now, log):
+        campaigns, targets, users, _ = _tables()
+        campaign_id = campaign['campaign_id']
+        counts = self.progress(engine, campaign_id)
+        pending = counts.get('Pending', 0)
+        if not pending:
+            if not counts.get('Queued'):
+                with engine.begin() as conn:
+                    conn.execute(sa.update(campaigns).where(campaigns.c.campaign_id == campaign_id)
+                                 .values(status='Completed'))
+                log(f'campaign {campaign_id}: completed ({counts.get("Sent", 0)} sent, {counts.get("Failed", 0)} failed)')
+            return 0
+
+        hours = parse_send_hours(campaign['send_hours'])
+        if not is_open(now, tz, hours):
+            return 0
+        total = sum(counts.values())
+        due = math.ceil(total * due_fraction(campaign, tz, hours, now)) - (total - pending)
+        wanted = min(due, pending, current_app.config['CAMPAIGN_BATCH_SIZE'])
+        if wanted <= 0:
+            return 0
+        granted = self._take_budget(campaign['org_id'], wanted)
+        if not granted:
+            return 0
+
+        with engine.begin() as conn:
+            claimed = conn.execute(
+                sa.select(targets.c.target_id, users.c.email, users.c.dept_id, users.c.team_id)
+                .join(users, users.c.user_id == targets.c.user_id)
+                .where(targets.c.campaign_id == campaign_id, targets.c.status == 'Pending')
+                .order_by(targets.c.target_id).limit(granted)).all()
+            if claimed:
+                conn.execute(sa.update(targets).where(targets.c.target_id.in_([t for t, *_ in claimed]))
+                             .values(status='Queued'))
+            if campaign['status'] == 'Scheduled':
+                conn.execute(sa.update(campaigns).where(campaigns.c.campaign_id == campaign_id)
+                             .values(status='Active', launched_at=campaign['launched_at'] or now))
+        if len(claimed) < granted:
+            self._refund_budget(campaign['org_id'], granted - len(claimed))
+
+        sent_ids, failed_ids = self._send(campaign, claimed)
+        done = set(sent_ids) | set(failed_ids)
+        unsent = [t for t, *_ in claimed if t not in done]
+        sent_at = datetime.utcnow()
+        with engine.begin() as conn:
+            if sent_ids:
+                # an open / click ingested meanwhile keeps its status (it can only be ahead of 'Sent')
+                conn.execute(sa.update(targets).where(targets.c.target_id.in_(sent_ids)).values(
+                    status=sa.case((targets.c.status == 'Queued', 'Sent'), else_=targets.c.status), sent_at=sent_at))
+                cells = {target_id: cell(campaign_id, dept_id, team_id, sent_at.date())
+                         for target_id, _, dept_id, team_id in claimed}
+                add_results(conn, Counter((cells[target_id], 'sent') for target_id in sent_ids))
+            for ids, values in ((failed_ids, {'status': 'Failed'}), (unsent, {'status': 'Pending'})):
+                if ids:
+                    conn.execute(sa.update(targets).where(targets.c.target_id.in_(ids), targets.c.status == 'Queued')
+                                 .values(**values))
+        if unsent:
+            self._refund_budget(campaign['org_id'], len(unsent))
+        return len(sent_ids)
+
+    def _send(self, campaign, claimed):
+        """Send over one SMTP connection; returns (sent ids, failed ids). A dropped connection leaves the rest unsent."""
+        from app.email_service import get_mail, CampaignMessageRenderer
+        from app.services.tracking_events import make_token
+        link, pixel = current_app.config['CAMPAIGN_LINK_URL'], current_app.config['CAMPAIGN_OPEN_URL']
+        renderer = CampaignMessageRenderer(campaign['name'])
+        sent, failed = [], []
+        try:
+            with get_mail().connect() as connection:
+                for target_id, email, *_ in claimed:
+                    fields = {'token': make_token(target_id), 'campaign_id': campaign['campaign_id']}
+                    sender, message = renderer.render(email, link.format(**fields), pixel.format(**fields))
+                    try:
+                        if connection.host:  # None when MAIL_SUPPRESS_SEND (testing)
+                            connection.host.sendmail(sender, [email], message)
+                    except (smtplib.SMTPRecipientsRefused, smtplib.SMTPDataError, smtplib.SMTPSenderRefused) as e:
+                        current_app.logger.warning('campaign %s target %s: %s', campaign['campaign_id'], target_id, e)
+                        failed.append(target_id)
+                    else:
+                        sent.append(target_id)
+        except (smtplib.SMTPException, OSError) as e:
+            current_app.logger.error('campaign %s: SMTP connection failed after %d sends: %s',
+                                     campaign['campaign_id'], len(sent), e)
+        return sent, failed
+
+    # --- Rate limits ---
+
+    @staticmethod
+    def _budgets(org_id):
+        config = current_app.config
+        return (('campaign_send/global', config['CAMPAIGN_RATE_GLOBAL']),
+                (f'campaign_send/org/{org_id}', config['CAMPAIGN_RATE_PER_ORG']))
+
+    def _take_budget(self, org_id, wanted):
+        """Up to `wanted` sends from both per-minute budgets (0 when either is spent)"""
+        granted = wanted
+        for key, limit in self._budgets(org_id):
+            granted = min(granted, limit - counter_store.get(key))
+        if granted <= 0:
+            return 0
+        taken = []
+        for key, limit in self._budgets(org_id):
+            if not counter_store.acquire_fixed(key, limit, RATE_WINDOW, granted)[0]:
+                for earlier in taken:  # another dispatcher got there first
+                    counter_store.incr(earlier, RATE_WINDOW, -granted)
+                return 0
+            taken.append(key)
+        return granted
+
+    def _refund_budget(self, org_id, amount):
+        for key, _ in self._budgets(org_id):
+            counter_store.incr(key, RATE_WINDOW, -amount)
+
+campaign_scheduler = CampaignScheduler()
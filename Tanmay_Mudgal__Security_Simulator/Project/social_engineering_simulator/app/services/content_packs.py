@@ -0,0 +1,274 @@
+"""
+Versioned content packs (`flask content ...`)
+
+A pack is a gzip-compressed JSON-lines file (*.jsonl.gz):
+- line 1, the manifest: pack name and version, creation time, and per kind
+  the record count and a digest over the record hashes in file order
+- every other line, one record: {"kind", "key", "hash", "data"}. data holds
+  the row's columns with database ids replaced by natural keys (category
+  name, content type name, [topic_number, level_number], ...), and hash is
+  the SHA-256 of its canonical JSON
+
+Kinds, applied in this order so references resolve: categories, scenarios,
+micro_lessons, learning_modules. Natural keys follow the old seed scripts:
+a scenario is its description, a micro-lesson its category and title.
+Content types, topics/difficulty levels and learning paths aren't part of a
+pack; a record pointing at one the database doesn't have fails the load.
+
+The loader reads every existing row of a kind once, turns it into a record
+the same way and compares hashes by natural key, then inserts new records
+and updates changed ones with executemany batches, all in one transaction.
+Unchanged rows aren't written, so re-loading a pack is a no-op. Rows that
+are in the database but not in the pack are only reported (scenarios and
+lessons are referenced by responses and assignments).
+
+Content lives in the catalog database: run `flask shards sync-catalog`
+after loading when tenant shards are configured.
+"""
+import gzip
+import hashlib
+import json
+from datetime import datetime
+import sqlalchemy as sa
+from app.models import Category, Scenario, MicroLesson, LearningModule, ContentType, DifficultyLevel, Topic, PathLevel, LearningPath
+
+FORMAT_VERSION = 1
+
+class ContentPackError(Exception):
+    pass
+
+def record_hash(data):
+    canonical = json.dumps(data, sort_keys=True, separators=(',', ':'), ensure_ascii=False, default=str)
+    return hashlib.sha256(canonical.encode('utf-8')).hexdigest()
+
+def _freeze(value):
+    """JSON key parts (lists) -> hashable tuples"""
+    if isinstance(value, list):
+        return tuple(_freeze(v) for v in value)
+    return value
+
+class Kind:
+    """
+    One content table: natural key fields, and the foreign-key columns that
+    become natural references in a record ({column: reference name})
+    """
+
+    def __init__(self, name, model, key, refs=None, skip=()):
+        self.name = name
+        self.table = model.__table__
+        self.pk = list(self.table.primary_key.columns)[0]
+        self.key = key
+        self.refs = refs or {}
+        self.columns = [c for c in self.table.columns if c is not self.pk and c.name not in skip]
+
+    def key_of(self, data):
+        return tuple(_freeze(data.get(field)) for field in self.key)
+
+    def to_record(self, row, refs):
+        data = {}
+        for column in self.columns:
+            value = row[column.name]
+            if column.name in self.refs:
+                name = self.refs[column.name]
+                data[name] = None if value is None else refs.natural(name, value)
+            else:
+                data[column.name] = value
+        return data
+
+    def to_row(self, data, refs):
+        row = {}
+        for column in self.columns:
+            if column.name in self.refs:
+                name = self.refs[column.name]
+                row[column.name] = None if data.get(name) is None else refs.resolve(name, data[name])
+            else:
+                row[column.name] = data.get(column.name)
+        return row
+
+KINDS = [
+    Kind('categories', Category, key=('category_name',)),
+    Kind('scenarios', Scenario, key=('scenario_description',)),
+    Kind('micro_lessons', MicroLesson, key=('category', 'title'), refs={'category_id': 'category'},
+         skip=('created_at',)),
+    Kind('learning_modules', LearningModule, key=('category', 'difficulty_level', 'path_level', 'title'),
+         refs={'category_id': 'category', 'type_id': 'content_type',
+               'difficulty_level_id': 'difficulty_level', 'level_id': 'path_level'}),
+]
+KINDS_BY_NAME = {kind.name: kind for kind in KINDS}
+
+class References:
+    """id <-> natural key maps for the tables content rows point at"""
+
+    def __init__(self, conn):
+        self.conn = conn
+        self.reload()
+
+    def reload(self):
+        c, t, d, tp, p, lp = (Category.__table__, ContentType.__table__, DifficultyLevel.__table__,
+                              Topic.__table__, PathLevel.__table__, LearningPath.__table__)
+        self.maps = {
+            'category': dict(self.conn.execute(sa.select(c.c.category_id, c.c.category_name)).all()),
+            'content_type': dict(self.conn.execute(sa.select(t.c.type_id, t.c.type_name)).all()),
+            'difficulty_level': {row[0]: [row[1], row[2]] for row in self.conn.execute(
+                sa.select(d.c.difficulty_level_id, tp.c.topic_number, d.c.level_number)
+                .join(tp, tp.c.topic_id == d.c.topic_id))},
+            'path_level': {row[0]: [row[1], row[2]] for row in self.conn.execute(
+                sa.select(p.c.level_id, lp.c.path_name, p.c.level_number).join(lp, lp.c.path_id == p.c.path_id))},
+        }
+        self.inverse = {name: {_freeze(v): k for k, v in sorted(m.items(), reverse=True)}
+                        for name, m in self.maps.items()}
+
+    def natural(self, name, id_):
+        return self.maps[name].get(id_)
+
+    def resolve(self, name, value):
+        try:
+            return self.inverse[name][_freeze(value)]
+        except KeyError:
+            raise ContentPackError(f'{name} {value!r} does not exist in the database') from None
+
+# --- Pack files ---
+
+def write_pack(path, records_by_kind, name, version):
+    """Write {kind: [data, ...]} as a pack; returns the manifest"""
+    lines, kinds = [], {}
+    for kind in KINDS:
+        if kind.name not in records_by_kind:
+            continue
+        records = records_by_kind[kind.name]
+        digest = hashlib.sha256()
+        for data in records:
+            h = record_hash(data)
+            digest.update(h.encode())
+            lines.append({'kind': kind.name, 'key': list(kind.key_of(data)), 'hash': h, 'data': data})
+        kinds[kind.name] = {'count': len(records), 'digest': digest.hexdigest()}
+    manifest = {
+        'content_pack': FORMAT_VERSION, 'name': name, 'version': version,
+        'created_at': datetime.utcnow().isoformat(timespec='seconds'), 'kinds': kinds
+    }
+    with gzip.open(path, 'wt', encoding='utf-8') as f:
+        f.write(json.dumps(manifest, ensure_ascii=False) + '\n')
+        for line in lines:
+            f.write(json.dumps(line, ensure_ascii=False, default=str) + '\n')
+    return manifest
+
+def read_manifest(path):
+    with gzip.open(path, 'rt', encoding='utf-8') as f:
+        manifest = json.loads(f.readline())
+    if manifest.get('content_pack') != FORMAT_VERSION:
+        raise ContentPackError(f'{path}: not a version {FORMAT_VERSION} content pack')
+    return manifest
+
+def read_pack(path):
+    """(manifest, {kind: [data, ...]}), checking every record hash and each kind's digest"""
+    manifest = read_manifest(path)
+    records = {name: [] for name in manifest['kinds'] if name in KINDS_BY_NAME}
+    digests = {name: hashlib.sha256() for name in records}
+    with gzip.open(path, 'rt', encoding='utf-8') as f:
+        f.readline()
+        for number, line in enumerate(f, start=2):
+            item = json.loads(line)
+            if item['kind'] not in records:
+                raise ContentPackError(f'line {number}: kind {item["kind"]!r} is not in the manifest')
+            if record_hash(item['data']) != item['hash']:
+                raise ContentPackError(f'line {number}: content hash mismatch ({item["kind"]} {item["key"]})')
+            records[item['kind']].append(item['data'])
+            digests[item['kind']].update(item['hash'].encode())
+    for name, expected in manifest['kinds'].items():
+        if name not in records:
+            raise ContentPackError(f'unknown kind {name!r} in the manifest')
+        if len(records[name]) != expected['count'] or digests[name].hexdigest() != expected['digest']:
+            raise ContentPackError(f'{name}: records do not match the manifest (truncated or edited pack?)')
+    return manifest, records
+
+# --- Database side ---
+
+def export_pack(engine, path, name, version, kinds=None):
+    """Write the database's current content as a pack"""
+    with engine.connect() as conn:
+        refs = References(conn)
+        records = {}
+        for kind in KINDS:
+            if kinds and kind.name not in kinds:
+                continue
+            rows = conn.execute(sa.select(kind.table).order_by(kind.pk)).mappings()
+            records[kind.name] = [kind.to_record(row, refs) for row in rows]
+    return write_pack(path, records, name, version)
+
+class ContentLoader:
+    def __init__(self, engine, batch_size=500, log=print):
+        self.engine = engine
+        self.batch_size = batch_size
+        self.log = log
+
+    def load(self, path, dry_run=False):
+        """Diff a pack against the database and apply it; returns {kind: counts}"""
+        manifest, records = read_pack(path)
+        self.log(f"Pack {manifest['name']} {manifest['version']} ({manifest['created_at']})")
+        summary = {}
+        with self.engine.begin() as conn:
+            refs = References(conn)
+            for kind in KINDS:
+                if kind.name not in records:
+                    continue
+                plan = self._diff(conn, kind, records[kind.name], refs)
+                summary[kind.name] = {k: len(v) if isinstance(v, list) else v for k, v in plan.items()}
+                self.log(f"  {kind.name}: {len(plan['insert'])} new, {len(plan['update'])} changed, "
+                         f"{plan['unchanged']} unchanged, {plan['only_in_db']} only in the database"
+                         + (f", {plan['duplicates']} duplicate keys in the database" if plan['duplicates'] else ''))
+                if not dry_run:
+                    self._apply(conn, kind, plan, refs)
+                    if kind.name == 'categories' and (plan['insert'] or plan['update']):
+                        refs.reload()  # later kinds reference the new categories
+        if not dry_run:
+            self._invalidate_caches(summary)
+        return summary
+
+    def _diff(self, conn, kind, records, refs):
+        existing, duplicates = {}, 0
+        for row in conn.execute(sa.select(kind.table).order_by(kind.pk)).mappings():
+            data = kind.to_record(row, refs)
+            key = kind.key_of(data)
+            if key in existing:
+                duplicates += 1  # the lowest id wins, as the seed scripts' .first() did
+                continue
+            existing[key] = (row[kind.pk.name], record_hash(data))
+
+        plan = {'insert': [], 'update': [], 'unchanged': 0, 'only_in_db': 0, 'duplicates': duplicates}
+        seen = set()
+        for data in records:
+            key = kind.key_of(data)
+            if key in seen:
+                raise ContentPackError(f'{kind.name}: key {key} appears twice in the pack')
+            seen.add(key)
+            current = existing.get(key)
+            if current is None:
+                plan['insert'].append(data)
+            elif current[1] != record_hash(data):
+                plan['update'].append((current[0], data))
+            else:
+                plan['unchanged'] += 1
+        plan['only_in_db'] = len(existing.keys() - seen)
+        return plan
+
+    def _apply(self, conn, kind, plan, refs):
+        # executemany: one statement per batch, the SET list comes from the row keys
+        inserts = [kind.to_row(data, refs) for data in plan['insert']]
+        updates = [dict(kind.to_row(data, refs), _pk=pk) for pk, data in plan['update']]
+        update = sa.update(kind.table).where(kind.pk == sa.bindparam('_pk'))
+        for statement, rows in ((kind.table.insert(), inserts), (update, updates)):
+            for start in range(0, len(rows), self.batch_size):
+                conn.execute(statement, rows[start:start + self.batch_size])
+
+    def _invalidate_caches(self, summary):
+        def changed(name):
+            return name in summary and (summary[name]['insert'] or summary[name]['update'])
+        if changed('categories'):
+            from app.services.reference_data import reference_data
+            reference_data.bump()
+        if changed('micro_lessons') or changed('categories'):
+            from app.services.micro_lesson_map import MicroLessonMap
+            MicroLessonMap.invalidate()
+        if changed('micro_lessons') or changed('learning_modules'):
+            from app.services.quiz_grading import quiz_keys
+            quiz_keys.bump()
@@ -0,0 +1,410 @@
+import os
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+from math import floor
+from flask import current_app, has_app_context
+from limits.storage import Storage, SlidingWindowCounterSupport
+from limits.storage.base import TimestampedSlidingWindow
+from sqlalchemy.exc import SQLAlchemyError
+
+# Counters shared by every worker process: Flask-Limiter's storage and the
+# free-tier weekly scenario quota both go through one store, so a limit of
+# "5 per minute" means 5 across all workers rather than 5 per worker.
+#
+# COUNTER_STORE_URL selects the backend:
+#     memory://                      this process only (tests, single worker)
+#     sqlite:////path/counters.db    a local SQLite file shared by the workers on one host
+#     database                       the app's own database (rate_counters table), shared by all hosts
+#
+# A counter is (hits, expires_at). incr() starts a new window on the first hit
+# after the previous one expired, which is the fixed-window semantics both
+# Flask-Limiter and the "5 scenarios per week since the last reset" quota use.
+# Conditional operations (acquire_fixed / acquire_sliding) run in a single
+# transaction, so concurrent requests can't both take the last slot.
+
+class CounterStore:
+    """Base class: subclasses provide _transaction() yielding an object with add() / read()"""
+
+    def incr(self, key, expiry, amount=1):
+        """Add amount to key (restarting its window if expired) and return the new count"""
+        with self._transaction() as tx:
+            return tx.add(key, expiry, amount, time.time())[0]
+
+    def get(self, key):
+        with self._transaction(write=False) as tx:
+            return tx.read(key, time.time())[0]
+
+    def get_expiry(self, key):
+        """Unix time the key's window ends (now if it doesn't exist)"""
+        now = time.time()
+        with self._transaction(write=False) as tx:
+            expires_at = tx.read(key, now)[1]
+        return expires_at or now
+
+    def acquire_fixed(self, key, limit, expiry, amount=1):
+        """
+        Take amount from a fixed window of `limit` only if it fits.
+        Returns (allowed, count, expires_at).
+        """
+        now = time.time()
+        with self._transaction() as tx:
+            count, expires_at = tx.add(key, expiry, 0, now)  # locks the row, resets it if expired
+            if count + amount > limit:
+                return False, count, expires_at
+            count, expires_at = tx.add(key, expiry, amount, now)
+            return True, count, expires_at
+
+    def release_fixed(self, key, expires_at, amount=1):
+        """
+        Give back amount taken by acquire_fixed from the window ending at
+        expires_at, never below zero. Once that window is over nothing is given
+        back: the next window starts from zero. Returns whether it was released.
+        """
+        now = time.time()
+        with self._transaction() as tx:
+            if tx.read(key, now)[1] != expires_at:
+                return False
+            count, current_expires_at = tx.add(key, expires_at - now, 0, now)  # locks the row
+            if current_expires_at != expires_at or count <= 0:
+                return False
+            tx.add(key, expires_at - now, -min(amount, count), now)
+            return True
+
+    def seed_fixed(self, key, count, expires_at):
+        """
+        Start a fixed window ending at expires_at with count already taken,
+        unless the key has a live window (the store's count wins). For carrying
+        counts over from elsewhere; returns whether it was seeded.
+        """
+        now = time.time()
+        if expires_at <= now or count <= 0:
+            return False
+        with self._transaction() as tx:
+            current, current_expires_at = tx.add(key, expires_at - now, 0, now)  # locks the row, creates it if expired
+            if current or current_expires_at != now + (expires_at - now):
+                return False
+            tx.add(key, expires_at - now, count, now)
+            return True
+
+    def acquire_sliding(self, key, limit, expiry, amount=1):
+        """Sliding window counter: previous window weighted by how much of it still overlaps"""
+        if amount > limit:
+            return False
+        now = time.time()
+        previous_key, current_key = TimestampedSlidingWindow.sliding_window_keys(key, expiry, now)
+        with self._transaction() as tx:
+            current_count = tx.add(current_key, 2 * expiry, 0, now)[0]  # locks the current window
+            previous_count, previous_ttl = self._previous_window(tx, previous_key, expiry, now)
+            if floor(previous_count * previous_ttl / expiry + current_count) + amount > limit:
+                return False
+            tx.add(current_key, 2 * expiry, amount, now)
+            return True
+
+    def sliding_window(self, key, expiry):
+        """(previous count, previous ttl, current count, current ttl), as limits expects"""
+        now = time.time()
+        previous_key, current_key = TimestampedSlidingWindow.sliding_window_keys(key, expiry, now)
+        with self._transaction(write=False) as tx:
+            return self._sliding_info(tx, previous_key, current_key, expiry, now)
+
+    def clear_sliding(self, key, expiry):
+        for window_key in TimestampedSlidingWindow.sliding_window_keys(key, expiry, time.time()):
+            self.clear(window_key)
+
+    @staticmethod
+    def _previous_window(tx, previous_key, expiry, now):
+        """(count, seconds of the previous window still overlapping the sliding one)"""
+        previous_count = tx.read(previous_key, now)[0]
+        previous_ttl = (1 - (((now - expiry) / expiry) % 1)) * expiry if previous_count else 0.0
+        return previous_count, previous_ttl
+
+    @classmethod
+    def _sliding_info(cls, tx, previous_key, current_key, expiry, now):
+        previous_count, previous_ttl = cls._previous_window(tx, previous_key, expiry, now)
+        current_count = tx.read(current_key, now)[0]
+        current_ttl = (1 - ((now / expiry) % 1)) * expiry + expiry
+        return previous_count, previous_ttl, current_count, current_ttl
+
+    def clear(self, key):
+        raise NotImplementedError
+
+    def reset(self):
+        raise NotImplementedError
+
+    def prune(self):
+        """Drop expired counters now instead of waiting for the next sweep; returns how many"""
+        return 0
+
+    def check(self):
+        return True
+
+    @contextmanager
+    def _transaction(self, write=True):
+        raise NotImplementedError
+        yield
+
+class MemoryCounterStore(CounterStore):
+    """Process-local counters (one lock; expired keys swept every SWEEP_EVERY writes)"""
+    SWEEP_EVERY = 1000
+
+    def __init__(self):
+        self._counters = {}
+        self._lock = threading.Lock()
+        self._writes = 0
+
+    @contextmanager
+    def _transaction(self, write=True):
+        with self._lock:
+            yield self
+            if write:
+                self._writes += 1
+                if self._writes % self.SWEEP_EVERY == 0:
+                    self._sweep()
+
+    def _sweep(self):
+        now = time.time()
+        expired = [k for k, (_, exp) in self._counters.items() if exp <= now]
+        for key in expired:
+            del self._counters[key]
+        return len(expired)
+
+    def add(self, key, expiry, amount, now):
+        count, expires_at = self._counters.get(key, (0, 0.0))
+        if expires_at <= now:
+            count, expires_at = 0, now + expiry
+        count += amount
+        self._counters[key] = (count, expires_at)
+        return count, expires_at
+
+    def read(self, key, now):
+        count, expires_at = self._counters.get(key, (0, 0.0))
+        return (count, expires_at) if expires_at > now else (0, None)
+
+    def clear(self, key):
+        with self._lock:
+            self._counters.pop(key, None)
+
+    def reset(self):
+        with self._lock:
+            count = len(self._counters)
+            self._counters.clear()
+        return count
+
+    def prune(self):
+        with self._lock:
+            return self._sweep()
+
+class _SQLTransaction:
+    """add() / read() on one connection inside an open transaction"""
+
+    def __init__(self, conn, upsert, select, returning):
+        self.conn = conn
+        self._upsert = upsert
+        self._select = select
+        self._returning = returning
+
+    def add(self, key, expiry, amount, now):
+        result = self.conn.execute(self._upsert, {'key': key, 'amount': amount, 'expires_at': now + expiry, 'now': now})
+        if self._returning:
+            row = result.first()
+            return row.hits, row.expires_at
+        return self.read(key, now)
+
+    def read(self, key, now):
+        row = self.conn.execute(self._select, {'key': key}).first()
+        if row is None or row.expires_at <= now:
+            return 0, None
+        return row.hits, row.expires_at
+
+class SQLCounterStore(CounterStore):
+    """
+    Counters in a rate_counters table. The increment is a single upsert that
+    restarts expired windows, so it holds the row lock (MySQL) or the write
+    lock (SQLite, BEGIN IMMEDIATE) until the transaction ends.
+    """
+    PRUNE_EVERY = 1000
+    TABLE = 'rate_counters'
+
+    def __init__(self, engine_factory):
+        self._engine_factory = engine_factory
+        self._statements = {}
+        self._writes = 0
+
+    @property
+    def engine(self):
+        return self._engine_factory()
+
+    def _sql(self, dialect):
+        if dialect not in self._statements:
+            from sqlalchemy import text
+            if dialect == 'mysql':
+                # SET runs left to right: hits is computed against the old expires_at
+                upsert = (f"INSERT INTO {self.TABLE} (counter_key, hits, expires_at) VALUES (:key, :amount, :expires_at) "
+                          "ON DUPLICATE KEY UPDATE "
+                          "hits = IF(expires_at <= :now, VALUES(hits), hits + VALUES(hits)), "
+                          "expires_at = IF(expires_at <= :now, VALUES(expires_at), expires_at)")
+                returning = False
+            else:
+                upsert = (f"INSERT INTO {self.TABLE} (counter_key, hits, expires_at) VALUES (:key, :amount, :expires_at) "
+                          "ON CONFLICT (counter_key) DO UPDATE SET "
+                          f"hits = CASE WHEN {self.TABLE}.expires_at <= :now THEN excluded.hits ELSE {self.TABLE}.hits + excluded.hits END, "
+                          f"expires_at = CASE WHEN {self.TABLE}.expires_at <= :now THEN excluded.expires_at ELSE {self.TABLE}.expires_at END")
+                # SQLite >= 3.35 and PostgreSQL hand the row back without a second query
+                returning = dialect != 'sqlite' or sqlite3.sqlite_version_info >= (3, 35)
+                if returning:
+                    upsert += " RETURNING hits, expires_at"
+            self._statements[dialect] = (
+                text(upsert),
+                text(f"SELECT hits, expires_at FROM {self.TABLE} WHERE counter_key = :key"),
+                returning
+            )
+        return self._statements[dialect]
+
+    @contextmanager
+    def _transaction(self, write=True):
+        engine = self.engine
+        statements = self._sql(engine.dialect.name)
+        if write:
+            with engine.begin() as conn:
+                yield _SQLTransaction(conn, *statements)
+            self._writes += 1
+            if self._writes % self.PRUNE_EVERY == 0:
+                self._prune(engine)
+        else:
+            with engine.connect() as conn:
+                yield _SQLTransaction(conn, *statements)
+
+    def _prune(self, engine):
+        from sqlalchemy import text
+        with engine.begin() as conn:
+            return conn.execute(text(f"DELETE FROM {self.TABLE} WHERE expires_at < :now"), {'now': time.time()}).rowcount
+
+    def prune(self):
+        return self._prune(self.engine)
+
+    def clear(self, key):
+        from sqlalchemy import text
+        with self.engine.begin() as conn:
+            conn.execute(text(f"DELETE FROM {self.TABLE} WHERE counter_key = :key"), {'key': key})
+
+    def reset(self):
+        from sqlalchemy import text
+        with self.engine.begin() as conn:
+            return conn.execute(text(f"DELETE FROM {self.TABLE}")).rowcount
+
+    def check(self):
+        from sqlalchemy import text
+        try:
+            with self.engine.connect() as conn:
+                conn.execute(text('SELECT 1'))
+            return True
+        except SQLAlchemyError:
+            return False
+
+def _sqlite_file_engine(path):
+    """Engine on a local SQLite file: WAL, BEGIN IMMEDIATE, reopened after fork"""
+    from sqlalchemy import create_engine, event, text
+
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    engine = create_engine(f'sqlite:///{path}', connect_args={'timeout': 5, 'check_same_thread': False})
+
+    @event.listens_for(engine, 'connect')
+    def _on_connect(dbapi_conn, _record):
+        dbapi_conn.isolation_level = None  # we issue BEGIN ourselves
+        dbapi_conn.execute('PRAGMA journal_mode=WAL')
+        dbapi_conn.execute('PRAGMA synchronous=NORMAL')
+
+    @event.listens_for(engine, 'begin')
+    def _on_begin(conn):
+        # Take the write lock up front so read-then-write can't interleave
+        conn.exec_driver_sql('BEGIN IMMEDIATE')
+
+    with engine.begin() as conn:
+        conn.execute(text(
+            f"CREATE TABLE IF NOT EXISTS {SQLCounterStore.TABLE} ("
+            "counter_key VARCHAR(255) PRIMARY KEY, hits INTEGER NOT NULL, expires_at DOUBLE NOT NULL)"
+        ))
+    if hasattr(os, 'register_at_fork'):
+        os.register_at_fork(after_in_child=lambda: engine.dispose(close=False))
+    return engine
+
+def create_store(url):
+    if url == 'memory://':
+        return MemoryCounterStore()
+    if url == 'database':
+        from app import db
+        return SQLCounterStore(lambda: db.engine)
+    if url.startswith('sqlite:///'):
+        engine = _sqlite_file_engine(url[len('sqlite:///'):])
+        return SQLCounterStore(lambda: engine)
+    raise ValueError(f'Unsupported COUNTER_STORE_URL: {url}')
+
+class CounterStoreExtension:
+    """Per-app counter store; the module-level instance proxies to the current app's store"""
+
+    def __init__(self, app=None):
+        self._default = None
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.config.setdefault('COUNTER_STORE_URL', 'memory://')
+        store = create_store(app.config['COUNTER_STORE_URL'])
+        app.extensions['counter_store'] = store
+        self._default = store
+
+    @property
+    def store(self):
+        if has_app_context() and 'counter_store' in current_app.extensions:
+            return current_app.extensions['counter_store']
+        if self._default is None:
+            self._default = MemoryCounterStore()
+        return self._default
+
+    def __getattr__(self, name):
+        return getattr(self.store, name)
+
+counter_store = CounterStoreExtension()
+
+class CounterStoreStorage(Storage, SlidingWindowCounterSupport):
+    """
+    Flask-Limiter / limits storage backed by the app's counter store.
+    Selected with RATELIMIT_STORAGE_URI = 'counterstore://'.
+    """
+    STORAGE_SCHEME = ['counterstore']
+
+    def __init__(self, uri=None, wrap_exceptions=False, **options):
+        super().__init__(uri, wrap_exceptions=wrap_exceptions, **options)
+
+    @property
+    def base_exceptions(self):
+        return SQLAlchemyError
+
+    def incr(self, key, expiry, amount=1, elastic_expiry=False):
+        return counter_store.incr(key, expiry, amount)
+
+    def get(self, key):
+        return counter_store.get(key)
+
+    def get_expiry(self, key):
+        return counter_store.get_expiry(key)
+
+    def check(self):
+        return counter_store.check()
+
+    def reset(self):
+        return counter_store.reset()
+
+    def clear(self, key):
+        counter_store.clear(key)
+
+    def acquire_sliding_window_entry(self, key, limit, expiry, amount=1):
+        return counter_store.acquire_sliding(key, limit, expiry, amount)
+
+    def get_sliding_window(self, key, expiry):
+        return counter_store.sliding_window(key, expiry)
+
+    def clear_sliding_window(self, key, expiry):
+        counter_store.clear_sliding(key, expiry)
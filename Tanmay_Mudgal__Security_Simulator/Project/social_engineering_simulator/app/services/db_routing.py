@@ -0,0 +1,317 @@
+"""
+Connection pool tuning and read-replica routing
+- Pool size / overflow / timeout / recycle / pre-ping for every engine (DB_POOL_*)
+- Replicas from DB_REPLICA_URIS become binds replica_0..n
+- Views marked @read_only (or code inside `with replica_reads():`) send their
+  SELECTs to a replica; flushes, INSERT/UPDATE/DELETE and anything after a
+  write in the same session stay on the primary
+- Each worker re-checks replica lag every REPLICA_CHECK_INTERVAL seconds and
+  skips replicas that are behind by more than REPLICA_MAX_LAG_SECONDS, that
+  can't report their lag, or whose last query failed; with none usable, reads
+  go to the primary
+- A session keeps the replica it picked; if a SELECT on it fails (connection
+  lost, OperationalError) the replica is dropped for the rest of the session
+  and the SELECT is run again, once, on the primary
+- After a logged-in user writes, their reads are pinned to the primary for
+  REPLICA_MAX_LAG_SECONDS so they see their own changes
+
+Lag comes from SHOW REPLICA STATUS on MySQL replicas, otherwise from the
+replica_heartbeat row that `flask db-heartbeat` keeps updating on the primary
+(which is also how two plain SQLite files or MySQL servers can be tested).
+
+Config:
+    DB_POOL_SIZE, DB_MAX_OVERFLOW, DB_POOL_TIMEOUT, DB_POOL_RECYCLE, DB_POOL_PRE_PING
+    DB_REPLICA_URIS            list of replica database URIs
+    REPLICA_MAX_LAG_SECONDS    lag above which a replica is skipped
+    REPLICA_CHECK_INTERVAL     seconds between lag checks per worker
+    REPLICA_LAG_SOURCE         auto | mysql | heartbeat | none (trust replicas)
+"""
+import random
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from functools import wraps
+from threading import Lock
+import sqlalchemy as sa
+from flask import current_app, has_app_context, has_request_context, session as flask_session
+from flask_sqlalchemy.session import Session
+from app.services.request_metrics import metrics
+from app.services.sharding import shard_router
+
+_read_only = ContextVar('db_read_only', default=False)
+
+POOL_OPTIONS = {
+    'DB_POOL_SIZE': 'pool_size',
+    'DB_MAX_OVERFLOW': 'max_overflow',
+    'DB_POOL_TIMEOUT': 'pool_timeout',
+    'DB_POOL_RECYCLE': 'pool_recycle',
+    'DB_POOL_PRE_PING': 'pool_pre_ping',
+}
+
+PIN_SESSION_KEY = '_db_primary_until'
+
+def read_only(fn):
+    """View decorator: this route only reads, so its queries may go to a replica"""
+    @wraps(fn)
+    def wrapper(*args, **kwargs):
+        token = _read_only.set(True)
+        try:
+            return fn(*args, **kwargs)
+        finally:
+            _read_only.reset(token)
+    return wrapper
+
+@contextmanager
+def replica_reads():
+    """Route the SELECTs in this block to a replica (same rules as @read_only)"""
+    token = _read_only.set(True)
+    try:
+        yield
+    finally:
+        _read_only.reset(token)
+
+def _shares_session_connection(engine):
+    # In-memory SQLite (StaticPool): the engine's one connection is the one db.session is using
+    return isinstance(engine.pool, (sa.pool.StaticPool, sa.pool.SingletonThreadPool))
+
+@contextmanager
+def primary_reads():
+    """
+    Connection for a cache loader reading the primary (catalog) outside any
+    replica routing. Normally its own pooled connection, so it reads committed
+    rows and leaves the request's transaction alone. When the engine has a
+    single connection shared with db.session (in-memory SQLite: StaticPool),
+    closing a second checkout of it would roll back the request's pending
+    writes, so the read goes through the session's connection instead.
+    """
+    from app import db
+    engine = db.engine
+    if _shares_session_connection(engine):
+        yield db.session.connection(bind_arguments={'bind': engine})
+    else:
+        with engine.connect() as conn:
+            yield conn
+
+@contextmanager
+def primary_transaction():
+    """
+    Its own transaction on the primary, committed on exit, for bookkeeping
+    writes (cache rows) that must neither commit nor wait for the request's
+    transaction. On a connection shared with db.session (see primary_reads)
+    the writes join the request's transaction instead.
+    """
+    from app import db
+    engine = db.engine
+    if _shares_session_connection(engine):
+        yield db.session.connection(bind_arguments={'bind': engine})
+    else:
+        with engine.begin() as conn:
+            yield conn
+
+def _is_in_memory_sqlite(uri):
+    uri = str(uri or '')
+    return uri.startswith('sqlite') and (':memory:' in uri or uri.rstrip('/') == 'sqlite:')
+
+class RoutingSession(Session):
+    """db.session class: tenant tables go to their org's shard, reads in a read-only scope to a replica"""
+
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        if bind is None:
+            is_write = self._flushing or isinstance(clause, sa.sql.dml.UpdateBase)
+            if is_write:
+                self._mark_write()
+            shard = shard_router.engine_for(mapper, clause, is_write)
+            if shard is not None:
+                return shard
+            if (not is_write and _read_only.get() and isinstance(clause, sa.sql.Select)
+                    and not self.info.get('db_wrote')):
+                engine = self._replica_engine()
+                if engine is not None:
+                    return engine
+        return super().get_bind(mapper=mapper, clause=clause, bind=bind, **kwargs)
+
+    def _replica_engine(self):
+        # One replica per session (i.e. per request) so its reads are consistent
+        if 'db_replica' not in self.info:
+            name = None
+            if not _pinned_to_primary():
+                name = replica_router.choose()
+            self.info['db_replica'] = name
+            metrics.inc('db_read_route', target=name or 'primary')
+        name = self.info['db_replica']
+        if name:
+            self.info['db_replica_routed'] = True
+        return self._db.engines[name] if name else None
+
+    def _mark_write(self):
+        if self.info.get('db_wrote'):
+            return
+        self.info['db_wrote'] = True
+        if has_request_context() and replica_router.enabled() and 'user_id' in flask_session:
+            flask_session[PIN_SESSION_KEY] = time.time() + current_app.config['REPLICA_MAX_LAG_SECONDS']
+
+def _retry_on_primary(orm_execute_state):
+    """do_orm_execute: run a SELECT that failed on this session's replica again on the primary"""
+    session = orm_execute_state.session
+    if not _read_only.get() or ('db_replica' in session.info and not session.info['db_replica']):
+        return None
+    session.info['db_replica_routed'] = False
+    try:
+        return orm_execute_state.invoke_statement()
+    except sa.exc.DBAPIError as e:
+        if not (session.info.pop('db_replica_routed', False)
+                and (isinstance(e, sa.exc.OperationalError) or e.connection_invalidated)):
+            raise
+        name = session.info['db_replica']
+        session.info['db_replica'] = None  # the handle_error listener took it out of rotation
+        current_app.logger.warning(f'Read on {name} failed, retrying on the primary: {e.orig}')
+        metrics.inc('db_read_route', target='primary', reason='replica_failed')
+        return orm_execute_state.invoke_statement()
+
+def _pinned_to_primary():
+    return has_request_context() and flask_session.get(PIN_SESSION_KEY, 0) > time.time()
+
+class ReplicaRouter:
+    """Builds the pool/replica engine config and tracks replica health per app"""
+
+    def configure_engines(self, app):
+        """Pool options for the primary and replica binds. Must run before db.init_app()."""
+        app.config.setdefault('DB_REPLICA_URIS', [])
+        app.config.setdefault('REPLICA_MAX_LAG_SECONDS', 5)
+        app.config.setdefault('REPLICA_CHECK_INTERVAL', 5)
+        app.config.setdefault('REPLICA_LAG_SOURCE', 'auto')
+
+        options = dict(app.config.get('SQLALCHEMY_ENGINE_OPTIONS') or {})
+        pool_options = {option: app.config[key] for key, option in POOL_OPTIONS.items()
+                        if app.config.get(key) is not None}
+        if not _is_in_memory_sqlite(app.config.get('SQLALCHEMY_DATABASE_URI')):
+            for option, value in pool_options.items():
+                options.setdefault(option, value)
+            app.config['SQLALCHEMY_ENGINE_OPTIONS'] = options
+
+        binds = dict(app.config.get('SQLALCHEMY_BINDS') or {})
+        names = []
+        for i, uri in enumerate(app.config['DB_REPLICA_URIS']):
+            name = f'replica_{i}'
+            bind = {'url': uri, **pool_options}
+            if 'poolclass' in options:
+                bind['poolclass'] = options['poolclass']
+            if str(uri).startswith('mysql'):
+                bind['connect_args'] = {'connect_timeout': 2}  # a dead replica shouldn't stall requests
+            binds[name] = bind
+            names.append(name)
+        app.config['SQLALCHEMY_BINDS'] = binds
+        app.extensions['replica_router'] = {
+            'names': names,
+            'state': {name: {'usable': False, 'lag': None, 'error': 'not checked', 'checked_at': 0.0} for name in names},
+            'lock': Lock(),
+            'listening': False
+        }
+
+    def init_app(self, app):
+        if not sa.event.contains(RoutingSession, 'do_orm_execute', _retry_on_primary):
+            sa.event.listen(RoutingSession, 'do_orm_execute', _retry_on_primary)
+
+        @metrics.gauge('db_replica_lag_seconds', 'Replica lag seen by this worker\'s last check')
+        def _replica_lag():
+            router = app.extensions.get('replica_router') or {}
+            return {(('replica', name),): state['lag'] for name, state in router.get('state', {}).items()
+                    if state['lag'] is not None}
+
+    @staticmethod
+    def _router():
+        return current_app.extensions.get('replica_router') if has_app_context() else None
+
+    def enabled(self):
+        router = self._router()
+        return bool(router and router['names'])
+
+    def choose(self):
+        """Name of a usable replica bind, or None to read from the primary"""
+        router = self._router()
+        if not router or not router['names']:
+            return None
+        self._listen_for_errors(router)
+        interval = current_app.config['REPLICA_CHECK_INTERVAL']
+        now = time.monotonic()
+        if any(now - state['checked_at'] >= interval for state in router['state'].values()):
+            # One thread refreshes; the others use the last known state
+            if router['lock'].acquire(blocking=False):
+                try:
+                    for name in router['names']:
+                        if now - router['state'][name]['checked_at'] >= interval:
+                            self._check(name, router['state'][name])
+                finally:
+                    router['lock'].release()
+        usable = [name for name in router['names'] if router['state'][name]['usable']]
+        return random.choice(usable) if usable else None
+
+    def status(self):
+        router = self._router()
+        if not router:
+            return []
+        return [{'name': name, **{k: v for k, v in router['state'][name].items() if k != 'checked_at'}}
+                for name in router['names']]
+
+    def _check(self, name, state):
+        from app import db
+        max_lag = current_app.config['REPLICA_MAX_LAG_SECONDS']
+        try:
+            lag = self.measure_lag(db.engines[name], current_app.config['REPLICA_LAG_SOURCE'])
+            state['lag'] = lag
+            if lag is None:
+                state['usable'], state['error'] = False, 'lag unknown'
+            elif lag > max_lag:
+                state['usable'], state['error'] = False, f'lag {lag:.1f}s > {max_lag}s'
+            else:
+                state['usable'], state['error'] = True, None
+        except sa.exc.SQLAlchemyError as e:
+            state['usable'], state['lag'], state['error'] = False, None, str(e.orig if hasattr(e, 'orig') else e)[:200]
+        state['checked_at'] = time.monotonic()
+
+    @staticmethod
+    def measure_lag(engine, source='auto'):
+        """Seconds the replica is behind, or None if it can't tell"""
+        if source == 'none':
+            return 0.0
+        with engine.connect() as conn:
+            if source in ('auto', 'mysql') and engine.dialect.name == 'mysql':
+                for statement, column in (('SHOW REPLICA STATUS', 'Seconds_Behind_Source'),
+                                          ('SHOW SLAVE STATUS', 'Seconds_Behind_Master')):
+                    try:
+                        row = conn.exec_driver_sql(statement).mappings().first()
+                    except sa.exc.SQLAlchemyError:
+                        conn.rollback()
+                        continue
+                    if row is not None:
+                        lag = row.get(column)
+                        return float(lag) if lag is not None else None  # NULL: replication stopped
+                    break  # not a replica: fall through to the heartbeat
+                if source == 'mysql':
+                    return None
+            beat_at = conn.execute(sa.text('SELECT MAX(beat_at) FROM replica_heartbeat')).scalar()
+        return max(0.0, time.time() - beat_at) if beat_at is not None else None
+
+    def _listen_for_errors(self, router):
+        """Take a replica out of rotation as soon as a query on it fails to connect"""
+        if router['listening']:
+            return
+        from app import db
+        for name in router['names']:
+            def _on_error(context, name=name):
+                if context.is_disconnect or isinstance(context.original_exception, sa.exc.OperationalError):
+                    state = router['state'][name]
+                    state['usable'], state['error'], state['checked_at'] = False, 'query failed', time.monotonic()
+            sa.event.listen(db.engines[name], 'handle_error', _on_error)
+        router['listening'] = True
+
+    @staticmethod
+    def beat(engine):
+        """Write the heartbeat row on the primary (`flask db-heartbeat`)"""
+        with engine.begin() as conn:
+            if conn.execute(sa.text('UPDATE replica_heartbeat SET beat_at = :now WHERE beat_id = 1'),
+                            {'now': time.time()}).rowcount == 0:
+                conn.execute(sa.text('INSERT INTO replica_heartbeat (beat_id, beat_at) VALUES (1, :now)'),
+                             {'now': time.time()})
+
+replica_router = ReplicaRouter()
@@ -0,0 +1,460 @@
+"""
+Background jobs (`flask jobs work`)
+
+Work that shouldn't run inside a request (retraining the recommender,
+maintenance sweeps) is a job: a function registered with @job under a name,
+run by a worker process with the app context pushed. Runs are rows of the
+`jobs` table on the main database, so queueing one is a single INSERT and no
+broker is needed:
+- job_queue.enqueue(name, payload) queues a run (payload: JSON-able dict);
+  a job registered with unique=True isn't queued again while a run is
+  queued or running
+- a registered schedule (5-field cron, UTC) queues a run when it is due.
+  Schedules are rows of job_schedules; a worker queues a run by moving
+  next_run_at forward with a compare-and-set UPDATE, so with several workers
+  each due time is queued once. Runs missed while no worker was up are
+  queued once, not once per missed time.
+- a worker claims due runs (status 'queued', run_at <= now) with one UPDATE,
+  taking a lease of JOBS_LEASE_SECONDS, and runs at most JOBS_CONCURRENCY at
+  once in a thread pool. It renews the leases of the runs it holds every
+  third of the lease. A run whose lease expired (its worker died) is queued
+  again, or failed if it has no attempts left: delivery is at-least-once, so
+  jobs must be safe to run twice.
+- a run that raises is retried after JOBS_RETRY_BACKOFF seconds, doubled
+  per attempt (at most JOBS_RETRY_BACKOFF_MAX), until max_attempts
+- each finished run records duration_ms, and the worker reports
+  job_duration_seconds (histogram) and jobs_total (counter) by job and
+  outcome to /metrics
+
+The built-in jobs are in services/maintenance.py. Run one worker or several
+(`flask jobs work`); `flask jobs work --once` runs whatever is due and exits,
+which is also how to test a job locally against a SQLite database.
+
+Config:
+    JOBS_CONCURRENCY         runs a worker executes at once
+    JOBS_POLL_INTERVAL       seconds a worker waits when nothing was due
+    JOBS_LEASE_SECONDS       lease on a claimed run; renewed while it runs
+    JOBS_RETRY_BACKOFF       seconds before the first retry of a failed run
+    JOBS_RETRY_BACKOFF_MAX   longest retry delay
+    JOBS_KEEP_DAYS           finished runs older than this are deleted (jobs.purge)
+    JOB_SCHEDULES            {job name: cron expression or None} overriding the
+                             registered schedules (None turns one off)
+"""
+import os
+import signal
+import socket
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from dataclasses import dataclass
+from datetime import datetime, time as dtime, timedelta
+import sqlalchemy as sa
+from flask import current_app
+from app.services.request_metrics import metrics
+
+PENDING = ('queued', 'running')
+
+class JobError(Exception):
+    pass
+
+class CronError(ValueError):
+    pass
+
+def _tables():
+    from app.models import Job, JobSchedule
+    return Job.__table__, JobSchedule.__table__
+
+# --- Registry ---
+
+@dataclass(frozen=True)
+class JobSpec:
+    name: str
+    fn: object
+    schedule: str = None  # cron expression, None for on-demand jobs
+    max_attempts: int = 3
+    unique: bool = False
+
+_registry = {}
+
+def job(name, schedule=None, max_attempts=3, unique=False):
+    """Register fn(payload) as the job `name`"""
+    if schedule is not None:
+        Cron(schedule)  # fail at import, not in the worker
+    def decorator(fn):
+        _registry[name] = JobSpec(name, fn, schedule, max_attempts, unique)
+        return fn
+    return decorator
+
+def registry():
+    """{name: JobSpec} of every registered job"""
+    import app.services.maintenance  # noqa: F401  registers the built-in jobs
+    return _registry
+
+# --- Cron ---
+
+ALIASES = {'@hourly': '0 * * * *', '@daily': '0 0 * * *', '@weekly': '0 0 * * 0', '@monthly': '0 0 1 * *'}
+FIELDS = (('minute', 0, 59), ('hour', 0, 23), ('day of month', 1, 31), ('month', 1, 12), ('day of week', 0, 7))
+
+def _cron_field(text, name, lo, hi):
+    values = set()
+    for part in text.split(','):
+        part, stepped, step = part.partition('/')
+        try:
+            step = int(step) if step else 1
+            if part == '*':
+                start, end = lo, hi
+            elif '-' in part:
+                start, end = (int(v) for v in part.split('-', 1))
+            else:
+                start = int(part)
+                end = hi if stepped else start  # '5/15' = from 5, every 15
+        except ValueError:
+            raise CronError(f'bad {name} field {text!r}') from None
+        if step < 1:
+            raise CronError(f'{name} field {text!r} has a step below 1')
+        if not lo <= start <= end <= hi:
+            raise CronError(f'{name} field {text!r} is outside {lo}-{hi}')
+        values.update(range(start, end + 1, step))
+    return values
+
+class Cron:
+    """5-field cron expression (minute hour day-of-month month day-of-week, 0 = Sunday), in UTC"""
+
+    def __init__(self, expr):
+        self.expr = expr
+        parts = ALIASES.get(expr.strip(), expr).split()
+        if len(parts) != 5:
+            raise CronError(f'{expr!r} needs 5 fields: minute hour day-of-month month day-of-week')
+        fields = [_cron_field(part, *spec) for part, spec in zip(parts, FIELDS)]
+        self.minutes, self.hours = sorted(fields[0]), sorted(fields[1])
+        self.days, self.months = fields[2], fields[3]
+        self.weekdays = {day % 7 for day in fields[4]}  # 7 is Sunday too
+        self._any_day, self._any_weekday = parts[2] == '*', parts[4] == '*'
+
+    def _day_matches(self, day):
+        in_days, in_weekdays = day.day in self.days, (day.weekday() + 1) % 7 in self.weekdays
+        if self._any_day or self._any_weekday:
+            return in_days and in_weekdays
+        return in_days or in_weekdays  # both restricted: either one, as in cron
+
+    def next_after(self, after):
+        """First time the expression matches strictly after `after` (naive UTC)"""
+        start = after.replace(second=0, microsecond=0) + timedelta(minutes=1)
+        day = start.date()
+        for _ in range(5 * 366):  # '0 0 29 2 *' can be almost 4 years away
+            if day.month in self.months and self._day_matches(day):
+                for hour in self.hours:
+                    for minute in self.minutes:
+                        candidate = datetime.combine(day, dtime(hour, minute))
+                        if candidate >= start:
+                            return candidate
+            day += timedelta(days=1)
+        raise CronError(f'{self.expr!r} never matches')
+
+# --- Queue ---
+
+class JobQueue:
+    def init_app(self, app):
+        app.config.setdefault('JOBS_CONCURRENCY', 4)
+        app.config.setdefault('JOBS_POLL_INTERVAL', 1.0)
+        app.config.setdefault('JOBS_LEASE_SECONDS', 60)
+        app.config.setdefault('JOBS_RETRY_BACKOFF', 30)
+        app.config.setdefault('JOBS_RETRY_BACKOFF_MAX', 3600)
+        app.config.setdefault('JOBS_KEEP_DAYS', 14)
+        app.config.setdefault('JOB_SCHEDULES', {})
+        # Built-in maintenance jobs (services/maintenance.py)
+        app.config.setdefault('AUDIT_RETENTION_DAYS', 365)
+        app.config.setdefault('MAINTENANCE_DELETE_BATCH', 5000)
+
+    @staticmethod
+    def _engine():
+        from app import db
+        return db.engine  # jobs live on the main database only
+
+    @staticmethod
+    def _spec(name):
+        spec = registry().get(name)
+        if spec is None:
+            raise JobError(f'unknown job {name!r}')
+        return spec
+
+    def enqueue(self, name, payload=None, delay=0, run_at=None):
+        """Queue a run of job `name`; returns its job_id, or None for a unique job that is already pending"""
+        spec = self._spec(name)
+        if payload is not None and not isinstance(payload, dict):
+            raise JobError('a job payload must be a JSON object')
+        run_at = run_at or datetime.utcnow() + timedelta(seconds=delay)
+        with self._engine().begin() as conn:
+            return self._insert(conn, spec, payload, run_at)
+
+    @staticmethod
+    def _insert(conn, spec, payload, run_at, schedule=None):
+        jobs = _tables()[0]
+        if spec.unique and conn.execute(sa.select(jobs.c.job_id).where(
+                jobs.c.name == spec.name, jobs.c.status.in_(PENDING)).limit(1)).first():
+            return None
+        return conn.execute(sa.insert(jobs).values(
+            name=spec.name, payload=payload, status='queued', run_at=run_at, attempts=0,
+            max_attempts=spec.max_attempts, schedule=schedule, created_at=datetime.utcnow())).inserted_primary_key[0]
+
+    # --- Schedules ---
+
+    def schedules(self):
+        """{job name: Cron}: the registered schedules with JOB_SCHEDULES applied"""
+        crons = {name: spec.schedule for name, spec in registry().items() if spec.schedule}
+        for name, expr in current_app.config['JOB_SCHEDULES'].items():
+            self._spec(name)
+            crons[name] = expr
+        return {name: Cron(expr) for name, expr in crons.items() if expr}
+
+    def sync_schedules(self, now=None):
+        """Make job_schedules match schedules(); returns {name: next run}"""
+        schedules = _tables()[1]
+        now = now or datetime.utcnow()
+        wanted = self.schedules()
+        engine = self._engine()
+        with engine.begin() as conn:
+            rows = {row.name: row for row in conn.execute(sa.select(schedules))}
+            stale = [name for name in rows if name not in wanted]
+            if stale:
+                conn.execute(sa.delete(schedules).where(schedules.c.name.in_(stale)))
+        for name, cron in wanted.items():
+            row = rows.get(name)
+            if row is not None and row.cron == cron.expr:
+                continue
+            try:
+                with engine.begin() as conn:
+                    if row is None:
+                        conn.execute(sa.insert(schedules).values(name=name, cron=cron.expr, next_run_at=cron.next_after(now)))
+                    else:
+                        conn.execute(sa.update(schedules).where(schedules.c.name == name)
+                                     .values(cron=cron.expr, next_run_at=cron.next_after(now)))
+            except sa.exc.IntegrityError:
+                pass  # another worker starting at the same time added it
+        with engine.connect() as conn:
+            return dict(conn.execute(sa.select(schedules.c.name, schedules.c.next_run_at)).all())
+
+    def enqueue_due(self, now=None, log=print):
+        """Queue a run of every schedule that is due; returns how many were queued"""
+        schedules = _tables()[1]
+        now = now or datetime.utcnow()
+        engine = self._engine()
+        with engine.connect() as conn:
+            due = conn.execute(sa.select(schedules).where(schedules.c.next_run_at <= now)).all()
+        queued = 0
+        for row in due:
+            spec = registry().get(row.name)
+            if spec is None:
+                continue  # removed from the code; the next sync drops the row
+            next_run = Cron(row.cron).next_after(now)
+            with engine.begin() as conn:
+                claimed = conn.execute(sa.update(schedules).where(
+                    schedules.c.name == row.name, schedules.c.next_run_at == row.next_run_at
+                ).values(next_run_at=next_run, last_run_at=now)).rowcount
+                if not claimed:
+                    continue  # another worker queued this one
+                # A scheduled run isn't queued while the previous one is still pending
+                job_id = self._insert(conn, JobSpec(spec.name, spec.fn, spec.schedule, spec.max_attempts, unique=True),
+                                      None, now, schedule=row.name)
+                if job_id is not None:
+                    conn.execute(sa.update(schedules).where(schedules.c.name == row.name).values(last_job_id=job_id))
+            if job_id is not None:
+                queued += 1
+            else:
+                log(f'{row.name}: previous run still pending, skipped')
+        return queued
+
+    # --- Claiming ---
+
+    def claim(self, owner, limit, now=None):
+        """Lease up to `limit` due runs to `owner`; returns their rows"""
+        jobs = _tables()[0]
+        now = now or datetime.utcnow()
+        lease_until = now + timedelta(seconds=current_app.config['JOBS_LEASE_SECONDS'])
+        with self._engine().begin() as conn:
+            ids = conn.execute(sa.select(jobs.c.job_id).where(jobs.c.status == 'queued', jobs.c.run_at <= now)
+                               .order_by(jobs.c.run_at, jobs.c.job_id).limit(limit)).scalars().all()
+            if not ids:
+                return []
+            # status = 'queued' again: a run another worker claimed in between isn't taken twice
+            conn.execute(sa.update(jobs).where(jobs.c.job_id.in_(ids), jobs.c.status == 'queued').values(
+                status='running', lease_owner=owner, lease_expires_at=lease_until,
+                attempts=jobs.c.attempts + 1, started_at=now, finished_at=None))
+            return conn.execute(sa.select(jobs).where(
+                jobs.c.job_id.in_(ids), jobs.c.lease_owner == owner, jobs.c.status == 'running'
+            ).order_by(jobs.c.run_at, jobs.c.job_id)).mappings().all()
+
+    def renew(self, owner, job_ids, now=None):
+        """Extend the leases `owner` holds on job_ids"""
+        if not job_ids:
+            return 0
+        jobs = _tables()[0]
+        now = now or datetime.utcnow()
+        with self._engine().begin() as conn:
+            return conn.execute(sa.update(jobs).where(
+                jobs.c.job_id.in_(job_ids), jobs.c.lease_owner == owner, jobs.c.status == 'running'
+            ).values(lease_expires_at=now + timedelta(seconds=current_app.config['JOBS_LEASE_SECONDS']))).rowcount
+
+    def reclaim_expired(self, now=None):
+        """Runs whose worker stopped renewing their lease: (queued again, failed)"""
+        jobs = _tables()[0]
+        now = now or datetime.utcnow()
+        expired = sa.and_(jobs.c.status == 'running', jobs.c.lease_expires_at < now)
+        reset = {'lease_owner': None, 'lease_expires_at': None, 'last_error': 'lease expired (worker stopped)'}
+        with self._engine().begin() as conn:
+            failed = conn.execute(sa.update(jobs).where(expired, jobs.c.attempts >= jobs.c.max_attempts)
+                                  .values(status='failed', finished_at=now, **reset)).rowcount
+            requeued = conn.execute(sa.update(jobs).where(expired).values(status='queued', run_at=now, **reset)).rowcount
+        return requeued, failed
+
+    # --- Running ---
+
+    def _execute(self, app, owner, row, log):
+        """Run one claimed job in this thread; returns its outcome"""
+        name = row['name']
+        spec = registry().get(name)
+        error = None
+        started = time.perf_counter()
+        with app.app_context():
+            try:
+                if spec is None:
+                    raise JobError(f'no job registered as {name!r}')
+                result = spec.fn(row['payload'] or {})
+            except Exception as e:
+                error = f'{type(e).__name__}: {e}'
+                app.logger.exception('Job %s (%s) failed', row['job_id'], name)
+            seconds = time.perf_counter() - started
+            outcome = self._finish(owner, row, seconds, error)
+        metrics.observe('job_duration_seconds', seconds, job=name, status=outcome)
+        metrics.inc('jobs', job=name, status=outcome)
+        detail = f': {error}' if error else (f': {result}' if result is not None else '')
+        log(f"job {row['job_id']} {name}: {outcome} in {seconds * 1000:.0f} ms{detail}")
+        return outcome
+
+    def _finish(self, owner, row, seconds, error):
+        jobs = _tables()[0]
+        config = current_app.config
+        now = datetime.utcnow()
+        values = {'lease_owner': None, 'lease_expires_at': None, 'duration_ms': seconds * 1000, 'last_error': error}
+        if error is None:
+            outcome = 'succeeded'
+            values.update(status='succeeded', finished_at=now)
+        elif row['attempts'] < row['max_attempts']:
+            outcome = 'retrying'
+            delay = min(config['JOBS_RETRY_BACKOFF'] * 2 ** (row['attempts'] - 1), config['JOBS_RETRY_BACKOFF_MAX'])
+            values.update(status='queued', run_at=now + timedelta(seconds=delay))
+        else:
+            outcome = 'failed'
+            values.update(status='failed', finished_at=now)
+        with self._engine().begin() as conn:
+            # Only while we still hold the lease: an expired one may have been handed to another worker
+            written = conn.execute(sa.update(jobs).where(
+                jobs.c.job_id == row['job_id'], jobs.c.lease_owner == owner, jobs.c.status == 'running'
+            ).values(**values)).rowcount
+        return outcome if written else 'lease_lost'
+
+    def run(self, concurrency=None, once=False, log=print):
+        """
+        Work until interrupted (SIGTERM / Ctrl-C lets the running jobs finish).
+        once: run everything due now (and due as a result) and return {outcome: count}.
+        """
+        from collections import Counter
+        app = current_app._get_current_object()
+        config = app.config
+        concurrency = concurrency or config['JOBS_CONCURRENCY']
+        owner = f'{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:6]}'
+        renew_every = config['JOBS_LEASE_SECONDS'] / 3
+        stop = threading.Event()
+        if threading.current_thread() is threading.main_thread():
+            signal.signal(signal.SIGTERM, lambda *_: stop.set())
+
+        for name, next_run in sorted(self.sync_schedules().items()):
+            log(f'schedule {name}: next run {next_run:%Y-%m-%d %H:%M} UTC')
+        outcomes = Counter()
+        running = {}  # job_id -> future
+        last_renew = last_flush = time.monotonic()
+        pool = ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix='job')
+        try:
+            while not stop.is_set():
+                now = datetime.utcnow()
+                self.enqueue_due(now, log=log)
+                requeued, failed = self.reclaim_expired(now)
+                if requeued or failed:
+                    log(f'expired leases: {requeued} runs queued again, {failed} failed')
+                for job_id in [job_id for job_id, future in running.items() if future.done()]:
+                    outcomes[running.pop(job_id).result()] += 1
+
+                claimed = self.claim(owner, concurrency - len(running), now) if len(running) < concurrency else []
+                for row in claimed:
+                    running[row['job_id']] = pool.submit(self._execute, app, owner, row, log)
+                if time.monotonic() - last_renew >= renew_every:
+                    self.renew(owner, list(running))
+                    last_renew = time.monotonic()
+                if time.monotonic() - last_flush >= metrics.flush_interval:
+                    metrics.flush()  # the worker serves no requests, which is when web workers flush
+                    last_flush = time.monotonic()
+
+                if once and not running and not claimed:
+                    break
+                if claimed and len(running) < concurrency:
+                    continue  # more may be due
+                timeout = min(renew_every, config['JOBS_POLL_INTERVAL'])
+                if running:
+                    wait(list(running.values()), timeout=timeout, return_when=FIRST_COMPLETED)
+                else:
+                    stop.wait(timeout)
+        except KeyboardInterrupt:
+            pass
+        finally:
+            if running:
+                log(f'waiting for {len(running)} running jobs')
+            pool.shutdown(wait=True)
+            for future in running.values():
+                outcomes[future.result()] += 1
+            metrics.flush()
+        return dict(outcomes)
+
+    # --- Inspection / housekeeping ---
+
+    def summary(self):
+        """Rows of (name, status, runs, average ms, last finished) over the jobs table"""
+        jobs = _tables()[0]
+        with self._engine().connect() as conn:
+            return conn.execute(sa.select(
+                jobs.c.name, jobs.c.status, sa.func.count(), sa.func.avg(jobs.c.duration_ms), sa.func.max(jobs.c.finished_at)
+            ).group_by(jobs.c.name, jobs.c.status).order_by(jobs.c.name, jobs.c.status)).all()
+
+    def recent(self, limit=20, name=None, status=None):
+        jobs = _tables()[0]
+        query = sa.select(jobs).order_by(jobs.c.job_id.desc()).limit(limit)
+        if name:
+            query = query.where(jobs.c.name == name)
+        if status:
+            query = query.where(jobs.c.status == status)
+        with self._engine().connect() as conn:
+            return conn.execute(query).mappings().all()
+
+    def retry(self, job_id):
+        """Queue a failed run again with fresh attempts; False if it isn't failed"""
+        jobs = _tables()[0]
+        with self._engine().begin() as conn:
+            return bool(conn.execute(sa.update(jobs).where(jobs.c.job_id == job_id, jobs.c.status == 'failed').values(
+                status='queued', run_at=datetime.utcnow(), attempts=0, finished_at=None)).rowcount)
+
+    def purge(self, older_than, batch_size=5000):
+        """Delete finished runs that finished before `older_than`, in batches; returns how many"""
+        jobs = _tables()[0]
+        deleted = 0
+        while True:
+            with self._engine().begin() as conn:
+                ids = conn.execute(sa.select(jobs.c.job_id).where(
+                    jobs.c.status.in_(('succeeded', 'failed')), jobs.c.finished_at < older_than
+                ).order_by(jobs.c.job_id).limit(batch_size)).scalars().all()
+                if ids:
+                    conn.execute(sa.delete(jobs).where(jobs.c.job_id.in_(ids)))
+            deleted += len(ids)
+            if len(ids) < batch_size:
+                return deleted
+
+job_queue = JobQueue()
@@ -0,0 +1,106 @@
+"""
+Built-in background jobs (run by `flask jobs work`; see services/jobs.py)
+
+    ml.retrain                 on demand      retrain the scenario recommender on every shard's
+                                              responses; queued every RETRAIN_EVERY submissions
+    achievements.consistency   on demand      login streak / monthly commitment achievements of
+                                              one user; queued at login
+    leaderboards.refresh       */10 * * * *   rebuild leaderboards (per user and path) from user_progress
+    notifications.expire       */5 * * * *    archive notifications past their expires_at
+    counters.prune             */15 * * * *   drop expired rate-limit / weekly-quota counters
+    audit.retention            30 3 * * *     delete audit_logs older than AUDIT_RETENTION_DAYS
+    jobs.purge                 0 4 * * *      delete finished job runs older than JOBS_KEEP_DAYS
+
+Tenant tables are swept shard by shard. Deletes go in batches of
+MAINTENANCE_DELETE_BATCH rows, one short transaction each. Every job is safe
+to run twice, since a run whose worker dies is run again.
+
+Config:
+    AUDIT_RETENTION_DAYS       audit log entries kept (keep at least 7: the login streak reads them)
+    MAINTENANCE_DELETE_BATCH   rows per delete transaction
+"""
+from datetime import datetime, timedelta
+import sqlalchemy as sa
+from flask import current_app
+from app.services.jobs import job, job_queue
+
+def _shards():
+    """(name, engine) of the main database and every tenant shard"""
+    from app.services.sharding import shard_router
+    return [(name, shard_router.engine(name)) for name in shard_router.names()]
+
+def _delete_batches(engine, table, pk, where):
+    batch_size = current_app.config['MAINTENANCE_DELETE_BATCH']
+    deleted = 0
+    while True:
+        with engine.begin() as conn:
+            ids = conn.execute(sa.select(pk).where(where).order_by(pk).limit(batch_size)).scalars().all()
+            if ids:
+                conn.execute(sa.delete(table).where(pk.in_(ids)))
+        deleted += len(ids)
+        if len(ids) < batch_size:
+            return deleted
+
+@job('ml.retrain', unique=True)
+def retrain_model(payload):
+    from app.routes import retrain_ml_model
+    return 'model saved' if retrain_ml_model() else 'too few responses to train'
+
+@job('achievements.consistency')
+def consistency_achievements(payload):
+    from app.services.achievement_service import AchievementService
+    from app.services.sharding import tenant_scope
+    with tenant_scope(payload.get('org_id')):
+        AchievementService.check_consistency_achievements(payload['user_id'])
+
+@job('leaderboards.refresh', schedule='*/10 * * * *')
+def refresh_leaderboards(payload):
+    from app.models import Leaderboard, UserProgress
+    leaderboards, progress = Leaderboard.__table__, UserProgress.__table__
+    now = datetime.utcnow()
+    totals = sa.select(
+        progress.c.user_id, progress.c.path_id,
+        sa.func.coalesce(sa.func.sum(progress.c.score), 0),
+        sa.func.sum(sa.case((progress.c.status == 'completed', 1), else_=0)),
+        sa.literal(now, sa.DateTime)
+    ).where(progress.c.path_id.isnot(None)).group_by(progress.c.user_id, progress.c.path_id)
+    rows = 0
+    for _, engine in _shards():
+        # Rebuilt whole in one transaction: readers see the old or the new board, never a mix
+        with engine.begin() as conn:
+            conn.execute(sa.delete(leaderboards))
+            rows += conn.execute(sa.insert(leaderboards).from_select(
+                ['user_id', 'path_id', 'total_score', 'modules_completed', 'last_updated'], totals)).rowcount
+    return f'{rows} rows'
+
+@job('notifications.expire', schedule='*/5 * * * *')
+def expire_notifications(payload):
+    from app.models import Notification
+    notifications = Notification.__table__
+    now = datetime.utcnow()
+    archived = 0
+    for _, engine in _shards():
+        with engine.begin() as conn:
+            archived += conn.execute(sa.update(notifications).where(
+                notifications.c.expires_at < now, notifications.c.status != 'archived'
+            ).values(status='archived')).rowcount
+    return f'{archived} archived'
+
+@job('counters.prune', schedule='*/15 * * * *')
+def prune_counters(payload):
+    from app.services.counter_store import counter_store
+    return f'{counter_store.prune()} expired counters'
+
+@job('audit.retention', schedule='30 3 * * *')
+def audit_retention(payload):
+    from app.models import AuditLog
+    audit_logs = AuditLog.__table__
+    cutoff = datetime.utcnow() - timedelta(days=current_app.config['AUDIT_RETENTION_DAYS'])
+    deleted = sum(_delete_batches(engine, audit_logs, audit_logs.c.audit_id, audit_logs.c.timestamp < cutoff)
+                  for _, engine in _shards())
+    return f'{deleted} entries before {cutoff:%Y-%m-%d} deleted'
+
+@job('jobs.purge', schedule='0 4 * * *')
+def purge_jobs(payload):
+    cutoff = datetime.utcnow() - timedelta(days=current_app.config['JOBS_KEEP_DAYS'])
+    return f"{job_queue.purge(cutoff, current_app.config['MAINTENANCE_DELETE_BATCH'])} runs deleted"
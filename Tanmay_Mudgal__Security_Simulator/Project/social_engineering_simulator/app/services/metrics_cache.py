@@ -0,0 +1,162 @@
+from app import db
+from app.models import MetricSnapshot
+from app.services.counter_store import counter_store
+from app.services.db_routing import primary_transaction
+from flask import current_app
+from threading import Thread, Lock
+from datetime import datetime, timedelta
+import time
+
+class MetricsCache:
+    """
+    TTL cache for expensive admin metrics, stored in the metric_snapshots table
+    so every worker process shares the same values.
+
+    - Fresh (now < expires_at): served straight from the table.
+    - Stale (expires_at <= now < stale_until): the old value is served and one
+      worker refreshes it in the background (stale-while-revalidate).
+    - Missing / past stale_until: computed inline.
+
+    Snapshots are upserted in their own transaction and the refresh lease is
+    taken in the counter store, so reading a metric never commits (or rolls
+    back) the request's own work.
+    """
+    _metrics = {}  # key -> (compute_fn, ttl_seconds, stale_seconds)
+    _local_refreshing = set()
+    _lock = Lock()
+
+    # How long a worker holds the refresh claim on a stale row
+    REFRESH_LEASE_SECONDS = 30
+
+    @classmethod
+    def metric(cls, key, ttl=300, stale=3600):
+        """Decorator registering a compute function under a metric key"""
+        def decorator(fn):
+            cls._metrics[key] = (fn, ttl, stale)
+            return fn
+        return decorator
+
+    @classmethod
+    def get(cls, key):
+        """Return the cached value for a metric, computing it if needed"""
+        now = datetime.utcnow()
+        snapshot = db.session.get(MetricSnapshot, key)
+
+        if snapshot and snapshot.expires_at > now:
+            return snapshot.value_json
+
+        if snapshot and snapshot.stale_until > now:
+            value = snapshot.value_json
+            if cls._claim_refresh(key, snapshot.expires_at):
+                cls._refresh_in_background(key)
+            return value
+
+        return cls.refresh(key)
+
+    @classmethod
+    def get_many(cls, *keys):
+        return {key: cls.get(key) for key in keys}
+
+    @classmethod
+    def refresh(cls, key):
+        """Recompute a metric now and store it with a new TTL window"""
+        fn, ttl, stale = cls._metrics[key]
+
+        started = time.perf_counter()
+        value = fn()
+        compute_ms = (time.perf_counter() - started) * 1000
+
+        now = datetime.utcnow()
+        row = dict(
+            metric_key=key,
+            value_json=value,
+            computed_at=now,
+            expires_at=now + timedelta(seconds=ttl),
+            stale_until=now + timedelta(seconds=ttl + stale),
+            compute_ms=round(compute_ms, 2)
+        )
+        try:
+            with primary_transaction() as conn:
+                conn.execute(_upsert(conn.dialect.name, row))
+        except Exception as e:
+            current_app.logger.warning(f"Metric {key} snapshot not stored: {e}")
+
+        return value
+
+    @classmethod
+    def refresh_all(cls):
+        """Recompute every registered metric. Returns {key: compute_ms}"""
+        timings = {}
+        for key in cls._metrics:
+            started = time.perf_counter()
+            cls.refresh(key)
+            timings[key] = round((time.perf_counter() - started) * 1000, 2)
+        return timings
+
+    @classmethod
+    def timings(cls):
+        """Last compute time and age of every cached metric"""
+        snapshots = MetricSnapshot.query.filter(MetricSnapshot.metric_key.in_(list(cls._metrics))).all()
+        return {
+            s.metric_key: {
+                'compute_ms': s.compute_ms,
+                'computed_at': s.computed_at.isoformat() if s.computed_at else None,
+                'expires_at': s.expires_at.isoformat() if s.expires_at else None
+            } for s in snapshots
+        }
+
+    @classmethod
+    def _claim_refresh(cls, key, seen_expires_at):
+        """
+        Take a short lease on refreshing this stale snapshot in the counter
+        store, which every worker shares. Only one worker gets it, so a stale
+        metric is recomputed once across all processes rather than once per
+        request; a worker that dies holding it is replaced once it expires.
+        """
+        with cls._lock:
+            if key in cls._local_refreshing:
+                return False
+
+        try:
+            claimed, _, _ = counter_store.acquire_fixed(
+                f'metrics_refresh/{key}/{seen_expires_at.isoformat()}', 1, cls.REFRESH_LEASE_SECONDS)
+        except Exception:
+            return False
+        return claimed
+
+    @classmethod
+    def _refresh_in_background(cls, key):
+        with cls._lock:
+            if key in cls._local_refreshing:
+                return
+            cls._local_refreshing.add(key)
+
+        app = current_app._get_current_object()
+        Thread(target=cls._background_refresh, args=(app, key), daemon=True).start()
+
+    @classmethod
+    def _background_refresh(cls, app, key):
+        with app.app_context():
+            try:
+                cls.refresh(key)
+                db.session.commit()  # this thread's own session: holds the write on a shared connection
+            except Exception as e:
+                app.logger.error(f"Background refresh of metric {key} failed: {e}")
+            finally:
+                with cls._lock:
+                    cls._local_refreshing.discard(key)
+
+def _upsert(dialect, row):
+    table = MetricSnapshot.__table__
+    if dialect == 'mysql':
+        from sqlalchemy.dialects.mysql import insert
+        stmt = insert(table).values(**row)
+        new = stmt.inserted
+    else:
+        from sqlalchemy.dialects.sqlite import insert
+        stmt = insert(table).values(**row)
+        new = stmt.excluded
+    updates = {column: new[column] for column in row if column != 'metric_key'}
+    if dialect == 'mysql':
+        return stmt.on_duplicate_key_update(updates)
+    return stmt.on_conflict_do_update(index_elements=['metric_key'], set_=updates)
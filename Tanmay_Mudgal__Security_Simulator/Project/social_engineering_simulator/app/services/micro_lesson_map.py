@@ -0,0 +1,51 @@
+from app import db
+from app.models import Category, MicroLesson
+from threading import Lock
+import time
+
+class MicroLessonMap:
+    """
+    Process-local map of scenario type -> remedial micro-lesson.
+    Scenario types share their names with lesson categories, so one join
+    replaces the per-failure Category + MicroLesson lookups. Lessons only
+    change through seed scripts, so a short TTL is enough to pick them up.
+    """
+    TTL_SECONDS = 300
+
+    _map = None
+    _loaded_at = 0.0
+    _lock = Lock()
+
+    @classmethod
+    def get(cls, scenario_type):
+        """{'lesson_id', 'title', 'est_time'} for a scenario type, or None"""
+        lesson_map = cls._map
+        if lesson_map is None or time.monotonic() - cls._loaded_at > cls.TTL_SECONDS:
+            lesson_map = cls._load()
+        return lesson_map.get(scenario_type)
+
+    @classmethod
+    def invalidate(cls):
+        with cls._lock:
+            cls._map = None
+
+    @classmethod
+    def _load(cls):
+        rows = db.session.query(
+            Category.category_name, MicroLesson.lesson_id, MicroLesson.title, MicroLesson.est_time_minutes
+        ).join(MicroLesson, MicroLesson.category_id == Category.category_id)\
+         .order_by(MicroLesson.lesson_id).all()
+
+        lesson_map = {}
+        for category_name, lesson_id, title, est_time in rows:
+            # First lesson per category, matching the old .first() lookup
+            lesson_map.setdefault(category_name, {
+                'lesson_id': lesson_id,
+                'title': title,
+                'est_time': est_time
+            })
+
+        with cls._lock:
+            cls._map = lesson_map
+            cls._loaded_at = time.monotonic()
+        return lesson_map
@@ -0,0 +1,355 @@
+"""
+Versioned schema migrations (`flask migrations ...`)
+
+Migrations live in migrations/versions/ as NNNN_name.sql or NNNN_name.py and
+are applied in version order. A letter suffix (NNNNa_name) slots a migration
+in between existing versions; databases past it still run it, since every
+version not yet applied is pending. Each database (the main one and every tenant
+shard) records what it has applied in schema_migrations, and the progress of
+every backfill in backfill_progress. The runner creates both tables itself.
+
+- .sql files: statements separated by ';' (USE lines are skipped)
+- .py files: define upgrade(op); `op` is a MigrationContext
+
+Migrations must be safe to re-run: a failed one is marked 'failed' and the
+next `upgrade` runs it again. The op helpers skip columns / indexes that
+already exist, and op.backfill() resumes after the last committed batch.
+
+Backfills never UPDATE a whole table at once. They walk the primary key in
+ranges, one short transaction per range (the progress row is written in the
+same transaction, so a resume neither skips nor repeats a batch), sleep
+between batches, shrink the range when a batch is slower than the target,
+and wait while any read replica lags. Rows inserted after a backfill starts
+are above its recorded max_pk and are expected to be written correctly by
+the new code.
+
+DDL on MySQL asks for ALGORITHM=INSTANT / INPLACE, LOCK=NONE and uses a short
+lock_wait_timeout, retrying, so a long transaction holding the table's
+metadata lock fails the ALTER instead of queueing every query behind it.
+"""
+import hashlib
+import importlib.util
+import os
+import re
+import time
+from contextlib import contextmanager
+from datetime import datetime
+import sqlalchemy as sa
+from flask import current_app
+
+VERSIONS_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))),
+                            'migrations', 'versions')
+
+FILENAME = re.compile(r'^(\d{4}[a-z]?)_(\w+)\.(sql|py)$')
+
+class MigrationError(Exception):
+    pass
+
+class Migration:
+    def __init__(self, path):
+        match = FILENAME.match(os.path.basename(path))
+        self.version, self.name, self.kind = match.groups()
+        self.path = path
+        with open(path, 'rb') as f:
+            self.checksum = hashlib.sha256(f.read()).hexdigest()[:16]
+
+    def __repr__(self):
+        return f'<Migration {self.version}_{self.name}>'
+
+    def apply(self, op):
+        if self.kind == 'sql':
+            with open(self.path) as f:
+                source = re.sub(r'--[^\n]*', '', f.read())
+            for statement in source.split(';'):
+                statement = statement.strip()
+                if statement and not statement.upper().startswith('USE '):
+                    op.execute(statement)
+        else:
+            spec = importlib.util.spec_from_file_location(f'migration_{self.version}', self.path)
+            module = importlib.util.module_from_spec(spec)
+            spec.loader.exec_module(module)
+            module.upgrade(op)
+
+def discover(directory=VERSIONS_DIR):
+    """Migrations in version order"""
+    migrations = [Migration(os.path.join(directory, filename))
+                  for filename in sorted(os.listdir(directory)) if FILENAME.match(filename)]
+    versions = [m.version for m in migrations]
+    duplicates = {v for v in versions if versions.count(v) > 1}
+    if duplicates:
+        raise MigrationError(f"Duplicate migration versions: {', '.join(sorted(duplicates))}")
+    return migrations
+
+class MigrationContext:
+    """The `op` a migration's upgrade() receives: DDL helpers and throttled backfills for one database"""
+
+    def __init__(self, engine, migration, log=print, batch_size=1000, pause=0.05,
+                 target_seconds=0.5, max_replica_lag=None, lock_wait_timeout=5, ddl_retries=5):
+        self.engine = engine
+        self.dialect = engine.dialect.name
+        self.migration = migration
+        self.log = log
+        self.batch_size = batch_size
+        self.pause = pause
+        self.target_seconds = target_seconds
+        self.max_replica_lag = max_replica_lag
+        self.lock_wait_timeout = lock_wait_timeout
+        self.ddl_retries = ddl_retries
+
+    # --- Introspection ---
+
+    def has_table(self, table):
+        return sa.inspect(self.engine).has_table(table)
+
+    def has_column(self, table, column):
+        return any(c['name'] == column for c in sa.inspect(self.engine).get_columns(table))
+
+    def has_index(self, table, name):
+        return any(i['name'] == name for i in sa.inspect(self.engine).get_indexes(table))
+
+    # --- Statements ---
+
+    def execute(self, statement, params=None):
+        """Run one statement in its own transaction; DDL gets the lock-wait retry"""
+        if re.match(r'\s*(ALTER|CREATE|DROP|RENAME)\b', statement, re.I):
+            return self._ddl(statement)
+        with self.engine.begin() as conn:
+            return conn.execute(sa.text(statement), params or {}).rowcount
+
+    def add_column(self, table, column, definition):
+        """ALTER TABLE ... ADD COLUMN unless it exists; online on MySQL"""
+        if self.has_column(table, column):
+            self.log(f'  {table}.{column} already exists')
+            return
+        self._ddl(f'ALTER TABLE {table} ADD COLUMN {column} {definition}',
+                  online=(', ALGORITHM=INSTANT', ', ALGORITHM=INPLACE, LOCK=NONE'))
+        self.log(f'  added {table}.{column}')
+
+    def create_index(self, table, name, columns, unique=False):
+        """CREATE INDEX unless it exists; built without blocking writes on MySQL"""
+        if self.has_index(table, name):
+            self.log(f'  index {name} already exists')
+            return
+        self._ddl(f"CREATE {'UNIQUE ' if unique else ''}INDEX {name} ON {table} ({', '.join(columns)})",
+                  online=(' ALGORITHM=INPLACE LOCK=NONE',))
+        self.log(f'  created index {name} on {table}')
+
+    def _ddl(self, statement, online=()):
+        variants = [statement + suffix for suffix in online] + [statement] if self.dialect == 'mysql' else [statement]
+        for attempt in range(1, self.ddl_retries + 1):
+            for i, sql in enumerate(variants):
+                try:
+                    with self.engine.begin() as conn:
+                        if self.dialect == 'mysql':
+                            conn.exec_driver_sql(f'SET SESSION lock_wait_timeout = {int(self.lock_wait_timeout)}')
+                        conn.exec_driver_sql(sql)
+                    return
+                except sa.exc.DBAPIError as e:
+                    code = e.orig.args[0] if getattr(e.orig, 'args', None) else None
+                    if code == 1205:  # metadata lock wait timeout: back off and retry the same form
+                        break
+                    # ALGORITHM/LOCK not supported for this change (or by this server version)
+                    if code in (1064, 1845, 1846) and i < len(variants) - 1:
+                        continue
+                    raise
+            self.log(f'  waiting for a metadata lock (attempt {attempt}/{self.ddl_retries})')
+            time.sleep(min(2 ** attempt, 30))
+        raise MigrationError(f'Could not get a metadata lock for: {statement}')
+
+    # --- Backfills ---
+
+    def backfill(self, name, table, assignments=None, where=None, params=None, batch_size=None, statements=None):
+        """
+        UPDATE table SET <assignments> [WHERE <where>] in primary-key ranges.
+        `statements` replaces the UPDATE with SQL of your own (e.g. DELETE +
+        INSERT ... SELECT into a summary table), run in order in each range's
+        transaction with :_lo < pk <= :_hi bound; the last one's rowcount is
+        the progress.
+        Resumes from backfill_progress; logs progress with rows/s and an ETA.
+        """
+        key = f'{self.migration.version}:{name}'
+        progress = _progress_table()
+        with self.engine.connect() as conn:
+            state = conn.execute(sa.select(progress).where(progress.c.backfill_key == key)).mappings().first()
+        if state and state['status'] == 'done':
+            self.log(f'  {name}: already done ({state["rows_done"]} rows)')
+            return
+
+        pk = self._single_pk(table)
+        if state:
+            first_pk, last_pk, max_pk, rows_done = state['first_pk'], state['last_pk'], state['max_pk'], state['rows_done']
+            self.log(f'  {name}: resuming after {pk}={last_pk} ({rows_done} rows done)')
+        else:
+            with self.engine.connect() as conn:
+                low, max_pk = conn.execute(sa.text(f'SELECT MIN({pk}), MAX({pk}) FROM {table}')).one()
+            first_pk = last_pk = low - 1 if low is not None else 0
+            rows_done = 0
+            with self.engine.begin() as conn:
+                conn.execute(progress.insert().values(
+                    backfill_key=key, table_name=table, first_pk=first_pk, last_pk=last_pk, max_pk=max_pk or 0,
+                    rows_done=0, status='running', started_at=datetime.utcnow(), updated_at=datetime.utcnow()))
+        max_pk = max_pk or 0
+
+        if statements is None:
+            statements = [f'UPDATE {table} SET {assignments} WHERE {pk} > :_lo AND {pk} <= :_hi'
+                          + (f' AND ({where})' if where else '')]
+        statements = [sa.text(statement) for statement in statements]
+        step = batch_size or self.batch_size
+        resumed_at, started, reported = last_pk, time.monotonic(), time.monotonic()
+        session_rows = 0
+        while last_pk < max_pk:
+            self._wait_for_replicas()
+            hi = min(last_pk + step, max_pk)
+            batch_started = time.monotonic()
+            with self.engine.begin() as conn:
+                for statement in statements:
+                    rows = conn.execute(statement, {**(params or {}), '_lo': last_pk, '_hi': hi}).rowcount
+                rows_done += rows
+                conn.execute(progress.update().where(progress.c.backfill_key == key).values(
+                    last_pk=hi, rows_done=rows_done, updated_at=datetime.utcnow()))
+            last_pk, session_rows = hi, session_rows + rows
+            took = time.monotonic() - batch_started
+
+            # Keep each transaction (and the row locks it holds) short
+            if took > self.target_seconds * 2 and step > 10:
+                step //= 2
+            elif took < self.target_seconds / 2:
+                step = min(step * 2, (batch_size or self.batch_size) * 16)
+
+            now = time.monotonic()
+            if now - reported >= 5 or last_pk >= max_pk:
+                elapsed = now - started
+                done = (last_pk - resumed_at) / max(max_pk - resumed_at, 1)
+                eta = elapsed / done - elapsed if done else 0
+                self.log(f'  {name}: {100 * (last_pk - first_pk) / max(max_pk - first_pk, 1):.1f}% '
+                         f'({rows_done} rows, {session_rows / max(elapsed, 1e-6):.0f} rows/s, eta {eta:.0f}s)')
+                reported = now
+            if self.pause:
+                time.sleep(self.pause)
+
+        with self.engine.begin() as conn:
+            conn.execute(progress.update().where(progress.c.backfill_key == key).values(
+                status='done', updated_at=datetime.utcnow()))
+        self.log(f'  {name}: done, {rows_done} rows in {time.monotonic() - started:.1f}s')
+
+    def _single_pk(self, table):
+        columns = sa.inspect(self.engine).get_pk_constraint(table)['constrained_columns']
+        if len(columns) != 1:
+            raise MigrationError(f'{table}: backfill needs a single-column integer primary key')
+        return columns[0]
+
+    def _wait_for_replicas(self):
+        """Pause while any read replica is further behind than max_replica_lag"""
+        if self.max_replica_lag is None:
+            return
+        from app import db
+        from app.services.db_routing import replica_router
+        names = (current_app.extensions.get('replica_router') or {}).get('names', [])
+        while names:
+            lags = []
+            for name in names:
+                try:
+                    lags.append(replica_router.measure_lag(db.engines[name], current_app.config['REPLICA_LAG_SOURCE']))
+                except sa.exc.SQLAlchemyError:
+                    lags.append(None)  # an unreachable replica doesn't hold the backfill up
+            worst = max((lag for lag in lags if lag is not None), default=0.0)
+            if worst <= self.max_replica_lag:
+                return
+            self.log(f'  replicas {worst:.1f}s behind, pausing')
+            time.sleep(1)
+
+def _history_table():
+    from app.models import SchemaMigration
+    return SchemaMigration.__table__
+
+def _progress_table():
+    from app.models import BackfillProgress
+    return BackfillProgress.__table__
+
+class MigrationRunner:
+    """Applies pending migrations to one database and records them"""
+
+    def __init__(self, engine, directory=VERSIONS_DIR, log=print, **op_options):
+        self.engine = engine
+        self.directory = directory
+        self.log = log
+        self.op_options = op_options
+        _history_table().create(engine, checkfirst=True)
+        _progress_table().create(engine, checkfirst=True)
+
+    def history(self):
+        """{version: schema_migrations row}"""
+        history = _history_table()
+        with self.engine.connect() as conn:
+            return {row['version']: row for row in conn.execute(sa.select(history)).mappings()}
+
+    def status(self):
+        """[(migration, history row or None, file changed since applied)]"""
+        history = self.history()
+        return [(m, history.get(m.version), bool(history.get(m.version))
+                 and history[m.version]['checksum'] != m.checksum) for m in discover(self.directory)]
+
+    def pending(self, target=None):
+        history = self.history()
+        return [m for m in discover(self.directory)
+                if (target is None or m.version <= target)
+                and (m.version not in history or history[m.version]['status'] != 'applied')]
+
+    def upgrade(self, target=None):
+        """Apply pending migrations up to target (inclusive); returns how many ran"""
+        with self._lock():
+            pending = self.pending(target)
+            for migration in pending:
+                self._run(migration)
+        return len(pending)
+
+    def stamp(self, target):
+        """Record migrations up to target as applied without running them (databases built by create-schema)"""
+        stamped = 0
+        for migration in self.pending(target):
+            self._record(migration, 'applied', datetime.utcnow(), 0.0, None)
+            stamped += 1
+        return stamped
+
+    def _run(self, migration):
+        self.log(f'{migration.version}_{migration.name} ({migration.kind})')
+        started_at, started = datetime.utcnow(), time.monotonic()
+        self._record(migration, 'running', started_at, None, None)
+        try:
+            migration.apply(MigrationContext(self.engine, migration, log=self.log, **self.op_options))
+        except BaseException as e:
+            self._record(migration, 'failed', started_at, (time.monotonic() - started) * 1000, str(e)[:2000])
+            raise
+        duration_ms = (time.monotonic() - started) * 1000
+        self._record(migration, 'applied', started_at, duration_ms, None)
+        self.log(f'  applied in {duration_ms / 1000:.1f}s')
+
+    def _record(self, migration, status, started_at, duration_ms, error):
+        history = _history_table()
+        values = {
+            'name': migration.name,
+            'checksum': migration.checksum,
+            'status': status,
+            'started_at': started_at,
+            'finished_at': None if status == 'running' else datetime.utcnow(),
+            'duration_ms': duration_ms,
+            'error': error
+        }
+        with self.engine.begin() as conn:
+            if conn.execute(history.update().where(history.c.version == migration.version)
+                            .values(**values)).rowcount == 0:
+                conn.execute(history.insert().values(version=migration.version, **values))
+
+    @contextmanager
+    def _lock(self):
+        """One runner per database at a time (MySQL named lock; other backends run unguarded)"""
+        if self.engine.dialect.name != 'mysql':
+            yield
+            return
+        with self.engine.connect() as conn:
+            if not conn.execute(sa.text("SELECT GET_LOCK('schema_migrations', 0)")).scalar():
+                raise MigrationError('Another migration runner is active on this database')
+            try:
+                yield
+            finally:
+                conn.execute(sa.text("SELECT RELEASE_LOCK('schema_migrations')"))
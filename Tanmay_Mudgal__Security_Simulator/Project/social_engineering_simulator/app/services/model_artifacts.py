@@ -0,0 +1,69 @@
+import os
+import tempfile
+from flask import current_app, has_app_context
+
+# ML/NLP artifacts are stored with joblib, uncompressed, so their numpy arrays
+# (KNN training matrix, KMeans centroids, TF-IDF idf vector and sparse matrix)
+# can be loaded with mmap_mode='r'. Every worker then maps the same file pages
+# read-only from the page cache instead of holding its own unpickled copy.
+# The same holds when the master loads them before forking (preload_app in
+# gunicorn.conf.py): the mapped pages stay shared after fork.
+
+DEFAULT_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))), 'instance', 'ml')
+
+def artifact_path(filename):
+    """Path of an artifact under ML_ARTIFACT_DIR (or the default outside an app context)"""
+    directory = DEFAULT_DIR
+    if has_app_context():
+        directory = current_app.config.get('ML_ARTIFACT_DIR') or DEFAULT_DIR
+    return os.path.join(directory, filename)
+
+def mmap_enabled():
+    if has_app_context():
+        return current_app.config.get('ML_MMAP_ARTIFACTS', True)
+    return True
+
+def dump(obj, path):
+    """Write atomically: workers mapping the old file keep a valid mapping until they reload"""
+    import joblib
+    directory = os.path.dirname(path)
+    os.makedirs(directory, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=directory, suffix='.tmp')
+    os.close(fd)
+    try:
+        joblib.dump(obj, tmp_path)  # compress=0 is required for mmap loading
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+def load(path):
+    """Load an artifact, memory-mapping its arrays read-only unless ML_MMAP_ARTIFACTS is off"""
+    import joblib
+    return joblib.load(path, mmap_mode='r' if mmap_enabled() else None)
+
+def process_memory(pid='self'):
+    """
+    Resident memory of a process in bytes: {'rss', 'pss', 'uss'}.
+    PSS splits shared pages between the processes mapping them and USS counts
+    only private pages, so they show what a worker really costs; RSS counts
+    shared pages in full for every worker. PSS/USS need Linux smaps_rollup.
+    """
+    fields = {}
+    try:
+        with open(f'/proc/{pid}/smaps_rollup') as f:
+            for line in f:
+                parts = line.split()
+                if len(parts) >= 3 and parts[2] == 'kB':
+                    fields[parts[0].rstrip(':')] = int(parts[1]) * 1024
+    except OSError:
+        import resource
+        # ru_maxrss is a peak, in KiB on Linux and bytes on macOS
+        rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return {'rss': rss * 1024 if os.uname().sysname == 'Linux' else rss, 'pss': None, 'uss': None}
+    return {
+        'rss': fields.get('Rss'),
+        'pss': fields.get('Pss'),
+        'uss': fields.get('Private_Clean', 0) + fields.get('Private_Dirty', 0)
+    }
@@ -0,0 +1,185 @@
+"""
+Buffered learning-module view tracking
+
+The module player pings /track-view on every open, which used to read,
+update and commit a user_progress row per ping. Views are now coalesced in
+a per-process buffer keyed by (org, user, module): a count, the first and
+the latest view time. A background thread writes the buffer every
+MODULE_VIEW_FLUSH_INTERVAL seconds, or as soon as MODULE_VIEW_FLUSH_EVENTS
+views are waiting, as one multi-row upsert per shard on the
+(user_id, module_id) unique key (migration 0010):
+- no row yet: inserted as in_progress with first_viewed_at = the first
+  buffered view
+- existing row: view_count += count, first_viewed_at kept (or set if it was
+  empty), last_activity_at moved forward, unlocked -> in_progress (locked
+  and completed rows keep their status)
+
+So a view shows up in user_progress up to a flush interval late, and the
+views buffered when a worker is killed (not stopped) are lost; a clean
+shutdown flushes what is left. Views of an org that is being moved between
+shards wait in the buffer until the move is done.
+
+Config:
+    MODULE_VIEW_FLUSH_INTERVAL   seconds between flushes
+    MODULE_VIEW_FLUSH_EVENTS     buffered views that trigger an early flush
+"""
+import atexit
+import os
+from datetime import datetime
+from threading import Event, Lock, Thread
+import sqlalchemy as sa
+from flask import current_app
+
+def _tables():
+    from app.models import UserProgress, LearningModule, PathLevel
+    return UserProgress.__table__, LearningModule.__table__, PathLevel.__table__
+
+def _upsert(dialect):
+    table = _tables()[0]
+    if dialect == 'mysql':
+        from sqlalchemy.dialects.mysql import insert
+        stmt = insert(table)
+        new = stmt.inserted
+    else:
+        from sqlalchemy.dialects.sqlite import insert
+        stmt = insert(table)
+        new = stmt.excluded
+    updates = {
+        'view_count': sa.func.coalesce(table.c.view_count, 0) + new.view_count,
+        'first_viewed_at': sa.func.coalesce(table.c.first_viewed_at, new.first_viewed_at),
+        'last_activity_at': sa.case((sa.or_(table.c.last_activity_at.is_(None),
+                                            table.c.last_activity_at < new.last_activity_at), new.last_activity_at),
+                                    else_=table.c.last_activity_at),
+        'status': sa.case((table.c.status == 'unlocked', 'in_progress'), else_=table.c.status),
+    }
+    if dialect == 'mysql':
+        return stmt.on_duplicate_key_update(updates)
+    return stmt.on_conflict_do_update(index_elements=['user_id', 'module_id'], set_=updates)
+
+class ModuleViewBuffer:
+    def __init__(self):
+        self._lock = Lock()
+        self._entries = {}  # (org_id, user_id, module_id) -> [views, first_at, last_at]
+        self._waiting = 0  # views recorded since the last flush
+        self._wake = Event()
+        self._app = None
+        self._pid = None
+
+    def init_app(self, app):
+        app.config.setdefault('MODULE_VIEW_FLUSH_INTERVAL', 5.0)
+        app.config.setdefault('MODULE_VIEW_FLUSH_EVENTS', 1000)
+
+    # --- Request side ---
+
+    def record(self, org_id, user_id, module_id, at=None):
+        """Count one view of a module (validated by the caller) by a user"""
+        at = at or datetime.utcnow()
+        with self._lock:
+            if self._pid != os.getpid():
+                self._start(current_app._get_current_object())
+            entry = self._entries.get((org_id, user_id, module_id))
+            if entry is None:
+                self._entries[(org_id, user_id, module_id)] = [1, at, at]
+            else:
+                entry[0] += 1
+                entry[1], entry[2] = min(entry[1], at), max(entry[2], at)
+            self._waiting += 1
+            if self._waiting >= self._app.config['MODULE_VIEW_FLUSH_EVENTS']:
+                self._wake.set()
+
+    def _start(self, app):
+        # First view in this process; after a fork the parent's buffer and thread aren't ours
+        if self._pid is None:
+            atexit.register(self.flush)
+        self._app, self._pid = app, os.getpid()
+        self._entries, self._waiting = {}, 0
+        self._wake = Event()
+        Thread(target=self._run, args=(self._wake,), name='module-views', daemon=True).start()
+
+    def _run(self, wake):
+        while True:
+            wake.wait(self._app.config['MODULE_VIEW_FLUSH_INTERVAL'])
+            wake.clear()
+            try:
+                self.flush()
+            except Exception:
+                self._app.logger.exception('Flushing module views failed; retrying next interval')
+
+    # --- Flushing ---
+
+    def flush(self):
+        """Write the buffered views; returns the number of (user, module) rows upserted"""
+        with self._lock:
+            if self._pid != os.getpid() or not self._entries:
+                return 0
+            entries, self._entries, self._waiting = self._entries, {}, 0
+        try:
+            with self._app.app_context():
+                written, held = self._write(entries)
+        except Exception:
+            self._restore(entries)
+            raise
+        if held:
+            self._restore(held)
+        return written
+
+    def _restore(self, entries):
+        """Merge views that couldn't be written back into the buffer"""
+        with self._lock:
+            for key, (views, first_at, last_at) in entries.items():
+                entry = self._entries.get(key)
+                if entry is None:
+                    self._entries[key] = [views, first_at, last_at]
+                else:
+                    entry[0] += views
+                    entry[1], entry[2] = min(entry[1], first_at), max(entry[2], last_at)
+
+    def _write(self, entries):
+        from app.services.sharding import shard_router, DEFAULT_SHARD
+        _, modules, levels = _tables()
+        module_ids = sorted({module_id for _, _, module_id in entries})
+        with shard_router.engine(DEFAULT_SHARD).connect() as conn:
+            placement = {module_id: (level_id, path_id) for module_id, level_id, path_id in conn.execute(
+                sa.select(modules.c.module_id, modules.c.level_id, levels.c.path_id)
+                .outerjoin(levels, levels.c.level_id == modules.c.level_id)
+                .where(modules.c.module_id.in_(module_ids)))}
+
+        by_shard, held = {}, {}
+        for key, (views, first_at, last_at) in entries.items():
+            org_id, user_id, module_id = key
+            if module_id not in placement:
+                continue  # module deleted since the view
+            shard, status = shard_router.locate_org(org_id)
+            if status == 'read_only':
+                held[key] = entries[key]  # org being moved: write after the move
+                continue
+            level_id, path_id = placement[module_id]
+            by_shard.setdefault(shard, []).append((key, {
+                'user_id': user_id, 'module_id': module_id, 'level_id': level_id, 'path_id': path_id,
+                'status': 'in_progress', 'score': 0, 'view_count': views,
+                'first_viewed_at': first_at, 'last_activity_at': last_at}))
+
+        written = 0
+        for shard, items in by_shard.items():
+            items.sort(key=lambda item: item[0][1:])  # same lock order in every worker
+            engine = shard_router.engine(shard)
+            try:
+                with engine.begin() as conn:
+                    conn.execute(_upsert(conn.dialect.name), [row for _, row in items])
+                written += len(items)
+            except sa.exc.IntegrityError:
+                # e.g. a user deleted since the view: write the rest one by one
+                for _, row in items:
+                    try:
+                        with engine.begin() as conn:
+                            conn.execute(_upsert(conn.dialect.name), [row])
+                        written += 1
+                    except sa.exc.IntegrityError:
+                        current_app.logger.warning('Dropped %s views of module %s by user %s',
+                                                   row['view_count'], row['module_id'], row['user_id'])
+            except sa.exc.DBAPIError:
+                current_app.logger.warning('Module views for shard %s kept for the next flush', shard, exc_info=True)
+                held.update((key, entries[key]) for key, _ in items)
+        return written, held
+
+module_views = ModuleViewBuffer()
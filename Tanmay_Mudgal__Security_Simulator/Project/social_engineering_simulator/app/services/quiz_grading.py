@@ -0,0 +1,351 @@
+"""
+Quiz grading with compiled answer keys
+
+Micro-lesson quizzes (micro_lessons.quiz_json) and learning modules
+(learning_modules.content_json) are compiled into an AnswerKey once per
+worker: per question, the answer fields it reads and the expected values,
+already normalised (fill-in-the-blank answers case-folded and stripped,
+matching pairs flattened in the order the player shows them). Grading a
+submission is a pass over those tuples, with no JSON handling, and a batch
+(an offline client syncing its queued attempts) loads the keys it is missing
+in one query.
+
+Scores are computed here rather than taken from the client:
+- lesson quiz: percent of the questions answered right
+- module quiz: points_value * right / questions, rounded down
+- practical module: points_value when the scenario is answered right, half
+  of it otherwise
+- theory (or any other) module: points_value for completing it
+
+Keys are cached by (kind, id) and invalidated by version, the same way as
+services/reference_data.py: a commit that changes a lesson or module through
+the ORM, and `flask content load`, bump 'quiz_keys/version' in the shared
+counter store, and each worker drops its keys when it sees the version move
+(checked every QUIZ_KEY_CHECK_INTERVAL seconds). Edits made with raw SQL are
+picked up after QUIZ_KEY_MAX_AGE seconds.
+
+record_module_attempts() and record_lesson_quizzes() grade and store a
+batch for one user in the caller's transaction: one INSERT for the attempts
+and one query per table they touch, however many submissions there are.
+"""
+import time
+from dataclasses import dataclass
+from datetime import datetime, timezone
+from threading import Lock
+import sqlalchemy as sa
+from sqlalchemy import event
+from flask import current_app
+from app.services.counter_store import counter_store
+
+VERSION_KEY = 'quiz_keys/version'
+VERSION_EXPIRY = 10 * 365 * 24 * 3600
+LESSON_POINTS = 50  # for completing a micro-lesson, once
+
+@dataclass(frozen=True)
+class AnswerKey:
+    kind: str         # 'lesson' or 'module'
+    item_id: int
+    mode: str         # 'lesson', 'quiz', 'practical' or 'completion'
+    points: int       # a module's points_value
+    checks: tuple     # per question: (answer fields, expected values, fold case); no fields = never right
+    category_id: int = None
+    level_id: int = None
+    path_id: int = None
+
+@dataclass(frozen=True)
+class Grade:
+    correct: int
+    total: int
+    score: int
+    missed: bool = False  # practical scenario answered, and answered wrong
+
+# --- Compiling ---
+
+_NEVER = ((), (), False)
+
+def _exact(field, expected):
+    return ((field,), (expected,), False) if expected is not None else _NEVER
+
+def compile_lesson(lesson_id, quiz_json):
+    """AnswerKey for a micro-lesson quiz (question types as in micro_lesson_player.html)"""
+    checks = []
+    for i, question in enumerate((quiz_json or {}).get('questions') or []):
+        question_type = question.get('type') or 'mcq'
+        expected = question.get('correct_answer')
+        if question_type in ('mcq', 'scenario_mcq'):
+            checks.append(_exact(f'q{i}', expected))
+        elif question_type == 'fill_blank':
+            checks.append(((f'q{i}',), (expected.lower().strip(),), True) if isinstance(expected, str) else _NEVER)
+        elif question_type == 'matching':
+            # The player numbers the pairs in the order it iterates them: q{i}_{pair index}
+            values = tuple((question.get('pairs') or {}).values())
+            checks.append((tuple(f'q{i}_{j}' for j in range(len(values))), values, False))
+        else:
+            checks.append(_NEVER)
+    return AnswerKey('lesson', lesson_id, 'lesson', 100, tuple(checks))
+
+def compile_module(module_id, type_name, content_json, points_value, category_id=None, level_id=None, path_id=None):
+    """AnswerKey for a learning module (module_player.html)"""
+    content = content_json or {}
+    if type_name == 'quiz':
+        mode = 'quiz'
+        checks = tuple(_exact(f'q{i}', question.get('correct_answer'))
+                       for i, question in enumerate(content.get('questions') or []))
+    elif type_name == 'practical':
+        mode = 'practical'
+        checks = (_exact('userAnswer', (content.get('scenario') or {}).get('correct_answer')),)
+    else:
+        mode, checks = 'completion', ()
+    return AnswerKey('module', module_id, mode, points_value or 0, checks, category_id, level_id, path_id)
+
+# --- Grading ---
+
+def _right(check, answers):
+    fields, expected, fold = check
+    if not fields:
+        return False
+    for field, value in zip(fields, expected):
+        answer = answers.get(field)
+        if fold:
+            if not isinstance(answer, str) or answer.lower().strip() != value:
+                return False
+        elif answer != value:
+            return False
+    return True
+
+def grade(key, answers):
+    """Grade one submission's answers ({field: value}) against a key"""
+    answers = answers if isinstance(answers, dict) else {}
+    total = len(key.checks)
+    correct = sum(1 for check in key.checks if _right(check, answers))
+    if key.mode == 'lesson':
+        return Grade(correct, total, int(correct * 100 / total) if total else 0)
+    if key.mode == 'quiz':
+        return Grade(correct, total, key.points * correct // total if total else 0)
+    if key.mode == 'practical':
+        right = correct == total
+        return Grade(correct, total, key.points if right else key.points // 2,
+                     missed=not right and bool(answers.get('userAnswer')))
+    return Grade(0, 0, key.points)
+
+# --- Cache ---
+
+class QuizKeys:
+    def init_app(self, app):
+        app.config.setdefault('QUIZ_KEY_CHECK_INTERVAL', 2)
+        app.config.setdefault('QUIZ_KEY_MAX_AGE', 300)
+        app.config.setdefault('QUIZ_BATCH_MAX', 500)
+        app.extensions['quiz_keys'] = {'keys': {}, 'version': None, 'loaded_at': time.monotonic(),
+                                       'checked_at': 0.0, 'lock': Lock()}
+
+        from app.services.db_routing import RoutingSession
+        if not event.contains(RoutingSession, 'after_flush', _note_changes):
+            event.listen(RoutingSession, 'after_flush', _note_changes)
+            event.listen(RoutingSession, 'after_commit', _bump_if_changed)
+            event.listen(RoutingSession, 'after_rollback', _forget_changes)
+
+    def lessons(self, lesson_ids):
+        """{lesson_id: AnswerKey} for the lessons that exist"""
+        return self._get('lesson', lesson_ids)
+
+    def modules(self, module_ids):
+        """{module_id: AnswerKey} for the modules that exist"""
+        return self._get('module', module_ids)
+
+    def bump(self):
+        """Make every worker recompile its keys (this one right away)"""
+        counter_store.incr(VERSION_KEY, VERSION_EXPIRY)
+        self._clear(current_app.extensions['quiz_keys'], counter_store.get(VERSION_KEY))
+
+    @staticmethod
+    def _clear(state, version):
+        with state['lock']:
+            state['keys'], state['version'], state['loaded_at'] = {}, version, time.monotonic()
+
+    def _get(self, kind, ids):
+        from app import db
+        state = current_app.extensions['quiz_keys']
+        config = current_app.config
+        now = time.monotonic()
+        if now - state['checked_at'] >= config['QUIZ_KEY_CHECK_INTERVAL']:
+            version = counter_store.get(VERSION_KEY)
+            state['checked_at'] = now
+            if version != state['version'] or now - state['loaded_at'] >= config['QUIZ_KEY_MAX_AGE']:
+                self._clear(state, version)
+
+        keys = state['keys']
+        found = {item_id: keys[(kind, item_id)] for item_id in ids if (kind, item_id) in keys}
+        missing = sorted(set(ids) - found.keys())
+        if missing:
+            loaded = self._load(kind, missing)
+            with state['lock']:
+                # Not cleared while loading (these may predate the new version), and not read past this
+                # request's own uncommitted quiz edits (the load may have seen them)
+                if state['keys'] is keys and not db.session.info.get('quiz_keys_changed'):
+                    keys.update(((kind, item_id), key) for item_id, key in loaded.items())
+            found.update(loaded)
+        return found
+
+    @staticmethod
+    def _load(kind, ids):
+        from app.services.db_routing import primary_reads
+        from app.models import MicroLesson, LearningModule, ContentType, PathLevel
+        # From the primary / catalog, like reference_data: a lagging replica would cache stale keys
+        with primary_reads() as conn:
+            if kind == 'lesson':
+                lessons = MicroLesson.__table__
+                return {lesson_id: compile_lesson(lesson_id, quiz_json) for lesson_id, quiz_json in conn.execute(
+                    sa.select(lessons.c.lesson_id, lessons.c.quiz_json).where(lessons.c.lesson_id.in_(ids)))}
+            modules, types, levels = LearningModule.__table__, ContentType.__table__, PathLevel.__table__
+            rows = conn.execute(
+                sa.select(modules.c.module_id, types.c.type_name, modules.c.content_json, modules.c.points_value,
+                          modules.c.category_id, modules.c.level_id, levels.c.path_id)
+                .outerjoin(types, types.c.type_id == modules.c.type_id)
+                .outerjoin(levels, levels.c.level_id == modules.c.level_id)
+                .where(modules.c.module_id.in_(ids)))
+            return {row[0]: compile_module(*row) for row in rows}
+
+def _note_changes(session, flush_context):
+    from app.models import MicroLesson, LearningModule
+    if any(isinstance(obj, (MicroLesson, LearningModule)) for obj in (*session.new, *session.dirty, *session.deleted)):
+        session.info['quiz_keys_changed'] = True
+
+def _bump_if_changed(session):
+    if session.info.pop('quiz_keys_changed', False):
+        quiz_keys.bump()
+
+def _forget_changes(session):
+    session.info.pop('quiz_keys_changed', None)
+
+quiz_keys = QuizKeys()
+
+# --- Recording ---
+
+def _attempted_at(value, now):
+    """When an offline client says the attempt happened (ISO 8601; naive means UTC), never in the future"""
+    if value is None:
+        return now
+    attempted_at = datetime.fromisoformat(str(value))
+    if attempted_at.tzinfo is not None:
+        attempted_at = attempted_at.astimezone(timezone.utc).replace(tzinfo=None)
+    return min(attempted_at, now)
+
+def record_module_attempts(session, user_id, submissions):
+    """
+    Grade and store a user's module attempts, each {'module_id', 'answers',
+    'time_spent', 'attempted_at' (optional)}, in the caller's transaction:
+    module_attempts rows, user_progress (completed, best score), the user's
+    total_score (the improvement on each module's best) and remedial
+    micro-lessons for practical scenarios answered wrong.
+
+    Returns (results, recommended): per submission {'module_id', 'score',
+    'correct', 'total'} or {'module_id', 'error'}, and the lessons newly
+    assigned ({'lesson_id', 'title', 'est_time'}).
+    """
+    from app.models import ModuleAttempt, UserProgress, User, MicroLesson, AssignedLesson
+    now = datetime.utcnow()
+    keys = quiz_keys.modules({s.get('module_id') for s in submissions if isinstance(s.get('module_id'), int)})
+
+    results, attempts, best, missed = [], [], {}, set()
+    for submission in submissions:
+        module_id = submission.get('module_id')
+        key = keys.get(module_id)
+        if key is None:
+            results.append({'module_id': module_id, 'error': 'unknown module'})
+            continue
+        try:
+            attempted_at = _attempted_at(submission.get('attempted_at'), now)
+            time_spent = max(int(submission.get('time_spent') or 0), 0)
+        except (TypeError, ValueError):
+            results.append({'module_id': module_id, 'error': 'invalid attempted_at or time_spent'})
+            continue
+        answers = submission.get('answers') if isinstance(submission.get('answers'), dict) else {}
+        result = grade(key, answers)
+        results.append({'module_id': module_id, 'score': result.score, 'correct': result.correct,
+                        'total': result.total})
+        attempts.append({'user_id': user_id, 'module_id': module_id, 'score': result.score,
+                         'time_spent_seconds': time_spent, 'answers_json': answers, 'attempt_date': attempted_at})
+        score, last = best.get(module_id, (None, None))
+        best[module_id] = (result.score if score is None else max(score, result.score),
+                           attempted_at if last is None else max(last, attempted_at))
+        if result.missed:
+            missed.add(key.category_id)
+    if not attempts:
+        return results, []
+
+    session.execute(sa.insert(ModuleAttempt.__table__), attempts)
+
+    gained = 0
+    progress = {row.module_id: row for row in session.query(UserProgress).filter(
+        UserProgress.user_id == user_id, UserProgress.module_id.in_(best))}
+    for module_id, (score, completed_at) in best.items():
+        row = progress.get(module_id)
+        if row is None:
+            key = keys[module_id]
+            session.add(UserProgress(user_id=user_id, path_id=key.path_id, level_id=key.level_id,
+                                     module_id=module_id, status='completed', score=score,
+                                     completed_at=completed_at, last_activity_at=completed_at))
+            gained += score
+            continue
+        if score > (row.score or 0):
+            gained += score - (row.score or 0)
+            row.score = score
+        row.status = 'completed'
+        row.completed_at = completed_at
+        row.last_activity_at = max(row.last_activity_at or completed_at, completed_at)
+    if gained:
+        users = User.__table__
+        session.execute(sa.update(users).where(users.c.user_id == user_id)
+                        .values(total_score=sa.func.coalesce(users.c.total_score, 0) + gained))
+
+    recommended = []
+    missed.discard(None)
+    if missed:
+        lessons = {}
+        for lesson in session.query(MicroLesson).filter(MicroLesson.category_id.in_(missed)).order_by(MicroLesson.lesson_id):
+            lessons.setdefault(lesson.category_id, lesson)  # first lesson of the category
+        assigned = {lesson_id for (lesson_id,) in session.query(AssignedLesson.lesson_id).filter(
+            AssignedLesson.user_id == user_id, AssignedLesson.lesson_id.in_([l.lesson_id for l in lessons.values()]))}
+        for lesson in lessons.values():
+            if lesson.lesson_id not in assigned:
+                session.add(AssignedLesson(user_id=user_id, lesson_id=lesson.lesson_id, status='pending'))
+                recommended.append({'lesson_id': lesson.lesson_id, 'title': lesson.title,
+                                    'est_time': lesson.est_time_minutes})
+    return results, recommended
+
+def record_lesson_quizzes(session, user_id, submissions):
+    """
+    Grade a user's micro-lesson quizzes, each {'assignment_id', 'answers'}, in
+    the caller's transaction: the assignment is completed with the quiz
+    score, and the first completion of each earns LESSON_POINTS.
+
+    Returns (results, points): per submission {'assignment_id', 'score',
+    'correct', 'total'} or {'assignment_id', 'error'}, and the points earned.
+    """
+    from app.models import AssignedLesson, User
+    now = datetime.utcnow()
+    ids = {s.get('assignment_id') for s in submissions if isinstance(s.get('assignment_id'), int)}
+    assignments = {a.assignment_id: a for a in session.query(AssignedLesson).filter(
+        AssignedLesson.assignment_id.in_(ids), AssignedLesson.user_id == user_id)} if ids else {}
+    keys = quiz_keys.lessons({a.lesson_id for a in assignments.values()})
+
+    results, points = [], 0
+    for submission in submissions:
+        assignment = assignments.get(submission.get('assignment_id'))
+        key = keys.get(assignment.lesson_id) if assignment is not None else None
+        if key is None:
+            results.append({'assignment_id': submission.get('assignment_id'), 'error': 'unknown assignment'})
+            continue
+        result = grade(key, submission.get('answers'))
+        if assignment.status != 'completed':
+            points += LESSON_POINTS
+        assignment.status = 'completed'
+        assignment.quiz_score = result.score
+        assignment.completed_at = now
+        results.append({'assignment_id': assignment.assignment_id, 'score': result.score,
+                        'correct': result.correct, 'total': result.total})
+    if points:
+        users = User.__table__
+        session.execute(sa.update(users).where(users.c.user_id == user_id)
+                        .values(total_score=sa.func.coalesce(users.c.total_score, 0) + points))
+    return results, points
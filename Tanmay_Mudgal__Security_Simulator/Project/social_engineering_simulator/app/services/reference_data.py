@@ -0,0 +1,196 @@
+"""
+Process-local cache of the small reference tables hot paths look up by name:
+roles (with their permission names), permissions, notification types,
+achievement definitions, categories and content types.
+
+Rows are loaded once per process into frozen records (RoleRef, ...) with the
+model's column names, so code and templates read them like the ORM objects
+but they are safe to share between requests and threads. Look them up by
+primary key or natural key:
+
+    reference_data.get(Role, role_id)
+    reference_data.by_key(Role, 'LEARNER')
+    reference_data.all(AchievementDefinition)
+
+Invalidation is by version counter: a commit that inserted, changed or
+deleted a reference row through the ORM bumps 'reference_data/version' in
+the shared counter store (services/counter_store.py). Each worker compares
+its snapshot's version at most every REFERENCE_DATA_CHECK_INTERVAL seconds
+and reloads when it moved; changes made with raw SQL are picked up after
+REFERENCE_DATA_MAX_AGE seconds, or at once with `flask refdata bump`.
+"""
+import time
+from dataclasses import dataclass, fields
+from threading import Lock
+import sqlalchemy as sa
+from sqlalchemy import event
+from flask import current_app
+from app.models import Role, Permission, RolePermission, NotificationType, AchievementDefinition, Category, ContentType
+from app.services.counter_store import counter_store
+
+VERSION_KEY = 'reference_data/version'
+VERSION_EXPIRY = 10 * 365 * 24 * 3600
+
+@dataclass(frozen=True)
+class RoleRef:
+    role_id: int
+    role_name: str
+    description: str
+    is_system_role: bool
+    permissions: frozenset  # permission names granted to the role
+
+@dataclass(frozen=True)
+class PermissionRef:
+    permission_id: int
+    permission_name: str
+    resource: str
+    action: str
+    description: str
+
+@dataclass(frozen=True)
+class NotificationTypeRef:
+    type_id: int
+    type_name: str
+    description: str
+    default_template: str
+    is_active: bool
+
+@dataclass(frozen=True)
+class AchievementDefinitionRef:
+    definition_id: int
+    slug: str
+    name: str
+    description: str
+    category: str
+    tier: str
+    icon: str
+    condition_description: str
+    target_value: int
+    is_org_only: bool
+
+@dataclass(frozen=True)
+class CategoryRef:
+    category_id: int
+    category_name: str
+    icon: str
+    color_code: str
+    description: str
+
+@dataclass(frozen=True)
+class ContentTypeRef:
+    type_id: int
+    type_name: str
+    difficulty_multiplier: float
+
+# model -> (record type, natural key column)
+TABLES = {
+    Role: (RoleRef, 'role_name'),
+    Permission: (PermissionRef, 'permission_name'),
+    NotificationType: (NotificationTypeRef, 'type_name'),
+    AchievementDefinition: (AchievementDefinitionRef, 'slug'),
+    Category: (CategoryRef, 'category_name'),
+    ContentType: (ContentTypeRef, 'type_name'),
+}
+
+# Writes to these invalidate the cache (role_permissions feeds RoleRef.permissions)
+WATCHED = tuple(TABLES) + (RolePermission,)
+
+class _Snapshot:
+    def __init__(self, version, by_id, by_key):
+        self.version = version
+        self.loaded_at = time.monotonic()
+        self.by_id = by_id    # model -> {pk: record}
+        self.by_key = by_key  # model -> {natural key: record}
+
+class ReferenceData:
+    def init_app(self, app):
+        app.config.setdefault('REFERENCE_DATA_CHECK_INTERVAL', 2)
+        app.config.setdefault('REFERENCE_DATA_MAX_AGE', 300)
+        app.extensions['reference_data'] = {'snapshot': None, 'checked_at': 0.0, 'lock': Lock()}
+
+        from app.services.db_routing import RoutingSession
+        if not event.contains(RoutingSession, 'after_flush', _note_changes):
+            event.listen(RoutingSession, 'after_flush', _note_changes)
+            event.listen(RoutingSession, 'after_commit', _bump_if_changed)
+            event.listen(RoutingSession, 'after_rollback', _forget_changes)
+
+    # --- Lookups ---
+
+    def get(self, model, pk):
+        """Record for a primary key, or None"""
+        return self._snapshot().by_id[model].get(pk)
+
+    def by_key(self, model, key):
+        """Record for a natural key (role_name, slug, type_name, ...), or None"""
+        return self._snapshot().by_key[model].get(key)
+
+    def all(self, model):
+        """Every record, in primary-key order"""
+        return list(self._snapshot().by_id[model].values())
+
+    # --- Invalidation ---
+
+    def bump(self):
+        """Make every worker reload on its next version check (this one reloads right away)"""
+        counter_store.incr(VERSION_KEY, VERSION_EXPIRY)
+        current_app.extensions['reference_data']['snapshot'] = None
+
+    def _snapshot(self):
+        from app import db
+        state = current_app.extensions['reference_data']
+        snapshot = state['snapshot']
+        now = time.monotonic()
+        if snapshot is not None and now - state['checked_at'] < current_app.config['REFERENCE_DATA_CHECK_INTERVAL']:
+            return snapshot
+
+        version = counter_store.get(VERSION_KEY)
+        state['checked_at'] = now
+        if (snapshot is None or snapshot.version != version
+                or now - snapshot.loaded_at >= current_app.config['REFERENCE_DATA_MAX_AGE']):
+            with state['lock']:
+                if state['snapshot'] is snapshot:
+                    loaded = self._load(version)
+                    if db.session.info.get('reference_data_changed'):
+                        # This request has uncommitted catalog changes the load may have seen: don't share them
+                        return loaded
+                    state['snapshot'] = loaded
+                snapshot = state['snapshot']
+        return snapshot
+
+    def _load(self, version):
+        from app.services.db_routing import primary_reads
+        by_id, by_key = {}, {}
+        # Always from the primary / catalog: a lagging replica would pin stale rows to the new version
+        with primary_reads() as conn:
+            grants = {}
+            for role_id, permission_name in conn.execute(
+                    sa.select(RolePermission.role_id, Permission.permission_name)
+                    .join(Permission, Permission.permission_id == RolePermission.permission_id)):
+                grants.setdefault(role_id, set()).add(permission_name)
+
+            for model, (record_type, key) in TABLES.items():
+                table = model.__table__
+                pk = list(table.primary_key.columns)[0]
+                columns = [f.name for f in fields(record_type) if f.name in table.c]
+                records = {}
+                for row in conn.execute(sa.select(*(table.c[c] for c in columns)).order_by(pk)).mappings():
+                    values = dict(row)
+                    if model is Role:
+                        values['permissions'] = frozenset(grants.get(row['role_id'], ()))
+                    records[row[pk.name]] = record_type(**values)
+                by_id[model] = records
+                by_key[model] = {getattr(r, key): r for r in records.values()}
+        return _Snapshot(version, by_id, by_key)
+
+def _note_changes(session, flush_context):
+    if any(isinstance(obj, WATCHED) for obj in (*session.new, *session.dirty, *session.deleted)):
+        session.info['reference_data_changed'] = True
+
+def _bump_if_changed(session):
+    if session.info.pop('reference_data_changed', False):
+        reference_data.bump()
+
+def _forget_changes(session):
+    session.info.pop('reference_data_changed', None)
+
+reference_data = ReferenceData()
@@ -0,0 +1,191 @@
+"""
+Near-duplicate clustering of suspicious reports
+
+During a phishing wave hundreds of employees report the same email, each
+with their own greeting, links and tracking ids. Every report gets a MinHash
+signature of its content_text when it is submitted, and joins the cluster of
+its org whose first report it most resembles (estimated Jaccard similarity
+of the texts' word 3-grams >= REPORT_CLUSTER_SIMILARITY), or starts a new
+one. Admins triage clusters: one decision approves, rejects or converts
+every pending report in it.
+
+Candidates are found with LSH instead of comparing against every cluster:
+the signature is cut into BANDS bands, each hashed (with the org) into a
+bucket stored in report_cluster_bands, and only clusters sharing a bucket
+with the new report are compared. Each report costs one indexed lookup of
+BANDS keys and a handful of signature comparisons, however many reports and
+clusters there are.
+
+Texts are normalised before shingling: lowercase words only, and any word
+containing a digit becomes '#', so per-recipient ids, tokens and dates don't
+split a wave. Reports without text are clusters of their own.
+
+A report joining a cluster that was already triaged gets the cluster's
+decision. `flask reports recluster` recomputes every signature and cluster
+of one database (after the migration that adds them, or after changing the
+parameters); triage decisions are kept per report.
+"""
+import hashlib
+import re
+from datetime import datetime
+import sqlalchemy as sa
+from flask import current_app
+
+NUM_PERM = 128
+BANDS = 32  # 4 rows each: ~99% of pairs at similarity 0.6 share a bucket, ~23% at 0.3
+ROWS = NUM_PERM // BANDS
+SHINGLE = 3
+DECISIONS = ('Approved', 'Rejected', 'Converted')
+
+_WORD = re.compile(r'[a-z0-9]+')
+_permutations = None
+
+def _tables():
+    from app.models import SuspiciousReport, ReportCluster, ReportClusterBand
+    return SuspiciousReport.__table__, ReportCluster.__table__, ReportClusterBand.__table__
+
+def shingles(text):
+    """Set of normalised word 3-grams (the words themselves for shorter texts)"""
+    words = ['#' if any(c.isdigit() for c in word) else word for word in _WORD.findall((text or '').lower())]
+    if len(words) < SHINGLE:
+        return {' '.join(words)} if words else set()
+    return {' '.join(words[i:i + SHINGLE]) for i in range(len(words) - SHINGLE + 1)}
+
+def _hash64(value):
+    return int.from_bytes(hashlib.blake2b(value.encode('utf-8'), digest_size=8).digest(), 'little')
+
+def _perm():
+    """NUM_PERM multiply-shift hash functions: h(x) = ((a * x + b) mod 2**64) >> 32, a odd"""
+    global _permutations
+    if _permutations is None:
+        import numpy as np
+        rng = np.random.default_rng(20240511)  # fixed: stored signatures must stay comparable
+        a = rng.integers(1, 2 ** 63, size=NUM_PERM, dtype=np.uint64) * np.uint64(2) + np.uint64(1)
+        b = rng.integers(0, 2 ** 63, size=NUM_PERM, dtype=np.uint64)
+        _permutations = (a, b)
+    return _permutations
+
+def signature(text):
+    """MinHash signature (NUM_PERM uint32s as bytes) of text, None when it has no words"""
+    import numpy as np
+    grams = shingles(text)
+    if not grams:
+        return None
+    a, b = _perm()
+    values = np.fromiter((_hash64(g) for g in grams), dtype=np.uint64, count=len(grams))
+    with np.errstate(over='ignore'):  # wrapping mod 2**64 is the hash
+        hashed = (np.outer(a, values) + b[:, None]) >> np.uint64(32)
+    return hashed.min(axis=1).astype('<u4').tobytes()
+
+def similarity(sig_a, sig_b):
+    """Estimated Jaccard similarity of the texts behind two signatures"""
+    import numpy as np
+    return float(np.mean(np.frombuffer(sig_a, dtype='<u4') == np.frombuffer(sig_b, dtype='<u4')))
+
+def band_keys(org_id, sig):
+    """One signed 64-bit bucket key per band, scoped to the org"""
+    keys = []
+    for band in range(BANDS):
+        chunk = sig[band * ROWS * 4:(band + 1) * ROWS * 4]
+        digest = hashlib.blake2b(f'{org_id or 0}:{band}:'.encode() + chunk, digest_size=8).digest()
+        keys.append(int.from_bytes(digest, 'little', signed=True))
+    return keys
+
+# --- Ingestion ---
+
+def _find_cluster(session, org_id, sig):
+    """Row of the most similar cluster sharing a bucket with sig, if similar enough"""
+    _, clusters, bands = _tables()
+    candidates = session.execute(
+        sa.select(clusters.c.cluster_id, clusters.c.signature, clusters.c.status, clusters.c.admin_notes)
+        .where(clusters.c.cluster_id.in_(sa.select(bands.c.cluster_id)
+                                         .where(bands.c.band_hash.in_(band_keys(org_id, sig)))),
+               clusters.c.org_id.is_not_distinct_from(org_id))).all()
+    best, best_score = None, current_app.config['REPORT_CLUSTER_SIMILARITY']
+    for row in candidates:
+        score = similarity(sig, row.signature)
+        if score >= best_score:
+            best, best_score = row, score
+    return best
+
+def assign(session, report):
+    """
+    Sign a new (flushed) report and put it in its cluster, in the session's
+    transaction. Returns the cluster id.
+    """
+    _, clusters, bands = _tables()
+    report.signature = signature(report.content_text)
+    reported_at = report.created_at or datetime.utcnow()
+    match = _find_cluster(session, report.org_id, report.signature) if report.signature is not None else None
+
+    if match is None:
+        pending = report.status in (None, 'Pending')
+        cluster_id = session.execute(sa.insert(clusters).values(
+            org_id=report.org_id, representative_id=report.report_id, signature=report.signature,
+            category=report.category, status='Pending' if pending else report.status,
+            report_count=1, pending_count=int(pending),
+            first_reported_at=reported_at, last_reported_at=reported_at)).inserted_primary_key[0]
+        if report.signature is not None:
+            session.execute(sa.insert(bands), [{'band_hash': key, 'cluster_id': cluster_id}
+                                               for key in sorted(set(band_keys(report.org_id, report.signature)))])
+    else:
+        cluster_id = match.cluster_id
+        if match.status in DECISIONS and report.status in (None, 'Pending'):
+            report.status, report.admin_notes = match.status, match.admin_notes
+        session.execute(sa.update(clusters).where(clusters.c.cluster_id == cluster_id).values(
+            report_count=clusters.c.report_count + 1,
+            pending_count=clusters.c.pending_count + int(report.status in (None, 'Pending')),
+            last_reported_at=sa.case((clusters.c.last_reported_at < reported_at, reported_at),
+                                     else_=clusters.c.last_reported_at)))
+    report.cluster_id = cluster_id
+    return cluster_id
+
+# --- Triage ---
+
+def decide(session, cluster_id, status, notes=None):
+    """Give every pending report of a cluster (and reports that join it later) the decision; returns reports changed"""
+    if status not in DECISIONS:
+        raise ValueError(f'unknown decision {status!r}')
+    reports, clusters, _ = _tables()
+    changed = session.execute(
+        sa.update(reports).where(reports.c.cluster_id == cluster_id, reports.c.status == 'Pending')
+        .values(status=status, admin_notes=notes)).rowcount
+    session.execute(sa.update(clusters).where(clusters.c.cluster_id == cluster_id).values(
+        status=status, admin_notes=notes, pending_count=0))
+    return changed
+
+def decide_report(session, report, status, notes=None):
+    """Decide a single report, keeping its cluster's pending count right"""
+    _, clusters, _ = _tables()
+    if report.status == 'Pending' and status != 'Pending' and report.cluster_id is not None:
+        session.execute(sa.update(clusters).where(clusters.c.cluster_id == report.cluster_id)
+                        .values(pending_count=clusters.c.pending_count - 1))
+    report.status, report.admin_notes = status, notes
+
+def recluster(engine, batch_size=500, log=print):
+    """Rebuild every signature and cluster of one database from its reports; returns {'reports', 'clusters'}"""
+    from sqlalchemy.orm import Session
+    from app.models import SuspiciousReport
+    reports, clusters, bands = _tables()
+    with engine.begin() as conn:
+        conn.execute(sa.update(reports).values(cluster_id=None))
+        conn.execute(bands.delete())
+        conn.execute(clusters.delete())
+
+    done, last = 0, 0
+    while True:
+        with Session(engine) as session:
+            batch = session.scalars(sa.select(SuspiciousReport).where(SuspiciousReport.report_id > last)
+                                    .order_by(SuspiciousReport.report_id).limit(batch_size)).all()
+            if not batch:
+                break
+            for report in batch:
+                assign(session, report)
+                session.flush()  # the next report of the batch may join this one's cluster
+            last = batch[-1].report_id
+            session.commit()
+        done += len(batch)
+        log(f'  {done} reports')
+    with engine.connect() as conn:
+        count = conn.execute(sa.select(sa.func.count()).select_from(clusters)).scalar()
+    return {'reports': done, 'clusters': count}
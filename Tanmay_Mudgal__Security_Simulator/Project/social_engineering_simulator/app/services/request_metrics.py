@@ -0,0 +1,438 @@
+"""
+Process-wide metrics registry with Prometheus text exposition
+- Log-linear (HDR-style) latency histograms per endpoint and status code
+- DB pool checkout wait, audit write and ML inference timings
+- Scrape-time gauges (e.g. notification queue depth)
+
+Each worker keeps its own in-memory registry and periodically writes it to
+METRICS_DIR/metrics-<pid>.json. A scrape of /metrics merges every worker's
+file, so counts and histograms aggregate correctly across processes.
+
+A worker that exits adds its totals to METRICS_DIR/metrics-base.json and
+removes its own file; the file of one that died without exiting cleanly is
+folded in the same way by the next scrape that finds its pid gone (or by a
+new worker reusing the pid, before overwriting it). Counters therefore never
+go backwards while workers come and go. Pids are checked on the local host,
+so METRICS_DIR must not be shared between machines.
+"""
+from flask import request, g, abort, Response, current_app
+from sqlalchemy.pool import QueuePool
+from threading import Lock
+from functools import wraps
+from contextlib import contextmanager
+import bisect
+import atexit
+import json
+import glob
+import re
+import time
+import os
+import uuid
+
+try:
+    import fcntl
+except ImportError:  # Windows: no folding lock (single-process dev server)
+    fcntl = None
+
+def _log_linear_bounds(low_exp=-5, high_exp=2, steps=(1, 1.25, 1.5, 2, 2.5, 3, 4, 5, 6, 8)):
+    """Bucket upper bounds: a few linear steps inside each power of ten (10us .. 100s)"""
+    bounds = []
+    for exp in range(low_exp, high_exp + 1):
+        for step in steps:
+            bounds.append(round(step * (10 ** exp), 9))
+    return bounds
+
+LATENCY_BUCKETS = _log_linear_bounds()
+BASE_FILE = 'metrics-base.json'
+WORKER_FILE = re.compile(r'^metrics-(\d+)\.json$')
+FOLDED_TOKENS_KEPT = 1000  # snapshot tokens remembered in the base file, so a retried fold isn't counted twice
+
+def _label_key(labels):
+    return json.dumps(sorted(labels.items()))
+
+class Histogram:
+    """Fixed log-linear buckets; mergeable by summing bucket counts"""
+    __slots__ = ('counts', 'sum', 'count')
+
+    def __init__(self):
+        self.counts = [0] * (len(LATENCY_BUCKETS) + 1)  # last slot is +Inf
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(LATENCY_BUCKETS, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def merge(self, data):
+        for i, c in enumerate(data['counts']):
+            self.counts[i] += c
+        self.sum += data['sum']
+        self.count += data['count']
+
+    def quantile(self, q):
+        """Upper bound of the bucket holding the q-th observation"""
+        if not self.count:
+            return 0.0
+        rank = q * self.count
+        seen = 0
+        for i, c in enumerate(self.counts):
+            seen += c
+            if seen >= rank:
+                return LATENCY_BUCKETS[i] if i < len(LATENCY_BUCKETS) else float('inf')
+        return float('inf')
+
+    def to_dict(self):
+        return {'counts': self.counts, 'sum': self.sum, 'count': self.count}
+
+class MetricsRegistry:
+    """
+    Flask extension holding counters and histograms for this process.
+
+    Config:
+        METRICS_ENABLED         master switch
+        METRICS_DIR             directory shared by all workers for snapshots
+        METRICS_FLUSH_INTERVAL  seconds between snapshot writes per worker
+        METRICS_ALLOW_REMOTE    serve /metrics to non-loopback clients
+    """
+    HELP = {
+        'http_request_duration_seconds': 'Request latency by endpoint, method and status',
+        'db_pool_checkout_wait_seconds': 'Time spent waiting for a pooled DB connection',
+        'audit_log_write_seconds': 'Time to persist one audit log entry',
+        'ml_inference_seconds': 'ML / NLP model inference time',
+        'job_duration_seconds': 'Background job run time by job and outcome',
+        'jobs': 'Background job runs by job and outcome',
+        'db_read_route': 'Sessions whose reads went to each replica or the primary',
+    }
+
+    def __init__(self):
+        self._lock = Lock()
+        self._histograms = {}  # name -> {label_key: Histogram}
+        self._counters = {}  # name -> {label_key: float}
+        self._gauges = {}  # name -> (help, fn returning {label_key: value} or a number)
+        self._last_flush = 0.0
+        self._token = None  # identifies this process's snapshots
+        self._token_pid = None
+        self.metrics_dir = None
+        self.flush_interval = 10
+        self.allow_remote = False
+
+    # ------------------------------------------------------------------
+    # Setup
+    # ------------------------------------------------------------------
+
+    def init_app(self, app):
+        app.config.setdefault('METRICS_ENABLED', True)
+        app.config.setdefault('METRICS_DIR', os.path.join(app.instance_path, 'metrics'))
+        app.config.setdefault('METRICS_FLUSH_INTERVAL', 10)
+        app.config.setdefault('METRICS_ALLOW_REMOTE', False)
+
+        if not app.config['METRICS_ENABLED']:
+            return
+
+        self.metrics_dir = app.config['METRICS_DIR']
+        self.flush_interval = app.config['METRICS_FLUSH_INTERVAL']
+        self.allow_remote = app.config['METRICS_ALLOW_REMOTE']
+        os.makedirs(self.metrics_dir, exist_ok=True)
+
+        app.before_request(self._start_timer)
+        app.after_request(self._record_request)
+        app.add_url_rule('/metrics', 'metrics', self._metrics_view)
+        app.extensions['request_metrics'] = self
+        atexit.register(self.retire)
+
+        @self.gauge('db_pool_checked_out', 'Connections currently checked out of the primary pool')
+        def _pool_checked_out():
+            pool = app.extensions['sqlalchemy'].engine.pool
+            return pool.checkedout() if hasattr(pool, 'checkedout') else 0
+
+    @staticmethod
+    def configure_engine(app):
+        """
+        Use the instrumented queue pool so checkout waits are measured.
+        Must run before db.init_app(). In-memory SQLite keeps its StaticPool.
+        """
+        uri = app.config.get('SQLALCHEMY_DATABASE_URI') or ''
+        if uri.startswith('sqlite') and (':memory:' in uri or uri.rstrip('/') == 'sqlite:'):
+            return
+        options = dict(app.config.get('SQLALCHEMY_ENGINE_OPTIONS') or {})
+        options.setdefault('poolclass', InstrumentedQueuePool)
+        app.config['SQLALCHEMY_ENGINE_OPTIONS'] = options
+
+    # ------------------------------------------------------------------
+    # Recording
+    # ------------------------------------------------------------------
+
+    def observe(self, name, value, **labels):
+        key = _label_key(labels)
+        with self._lock:
+            series = self._histograms.setdefault(name, {})
+            hist = series.get(key)
+            if hist is None:
+                hist = series[key] = Histogram()
+            hist.observe(value)
+
+    def inc(self, name, amount=1, **labels):
+        """Add to a counter; name it without the _total suffix, which render_prometheus() appends"""
+        key = _label_key(labels)
+        with self._lock:
+            series = self._counters.setdefault(name, {})
+            series[key] = series.get(key, 0) + amount
+
+    def gauge(self, name, help_text=''):
+        """Decorator registering a scrape-time gauge callback"""
+        def decorator(fn):
+            self._gauges[name] = (help_text, fn)
+            return fn
+        return decorator
+
+    @contextmanager
+    def time(self, name, **labels):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - started, **labels)
+
+    def timed(self, name, **labels):
+        """Decorator form of time()"""
+        def decorator(fn):
+            @wraps(fn)
+            def wrapper(*args, **kwargs):
+                with self.time(name, **labels):
+                    return fn(*args, **kwargs)
+            return wrapper
+        return decorator
+
+    def _start_timer(self):
+        g.metrics_started = time.perf_counter()
+
+    def _record_request(self, response):
+        started = g.pop('metrics_started', None)
+        if started is None or request.endpoint == 'metrics':
+            return response
+
+        endpoint = request.endpoint or 'unmatched'
+        self.observe('http_request_duration_seconds', time.perf_counter() - started,
+                     endpoint=endpoint,
+                     blueprint=request.blueprint or '',
+                     method=request.method,
+                     status=str(response.status_code))
+
+        if time.monotonic() - self._last_flush >= self.flush_interval:
+            self.flush()
+        return response
+
+    # ------------------------------------------------------------------
+    # Multi-process snapshots
+    # ------------------------------------------------------------------
+
+    def _snapshot(self):
+        with self._lock:
+            return {
+                'histograms': {n: {k: h.to_dict() for k, h in s.items()} for n, s in self._histograms.items()},
+                'counters': {n: dict(s) for n, s in self._counters.items()}
+            }
+
+    def flush(self):
+        """Write this worker's registry to its snapshot file (atomic replace)"""
+        if not self.metrics_dir:
+            return
+        self._last_flush = time.monotonic()
+        path = self._worker_path()
+        if self._token_pid != os.getpid():
+            # First write of this process: a file under our pid was left by a dead worker that had it before
+            if os.path.exists(path):
+                self._fold(path)
+            self._token, self._token_pid = uuid.uuid4().hex, os.getpid()
+        tmp_path = path + '.tmp'
+        try:
+            with open(tmp_path, 'w') as f:
+                json.dump(dict(self._snapshot(), token=self._token), f)
+            os.replace(tmp_path, path)
+        except OSError as e:
+            print(f"Failed to write metrics snapshot: {e}")
+
+    def retire(self):
+        """At worker exit: add this worker's totals to the base file and remove its snapshot"""
+        if not self.metrics_dir:
+            return
+        self.flush()
+        self._fold(self._worker_path())
+
+    def collect(self):
+        """Merge the base file and every live worker's snapshot, folding in those of dead workers first"""
+        self.flush()
+        histograms, counters = {}, {}
+        with self._folding_lock():
+            for path in glob.glob(os.path.join(self.metrics_dir, 'metrics-*.json')):
+                match = WORKER_FILE.match(os.path.basename(path))
+                if match and not _pid_alive(int(match.group(1))):
+                    self._fold(path, locked=True)
+            for path in glob.glob(os.path.join(self.metrics_dir, 'metrics-*.json')):
+                data = _read_snapshot(path)
+                if data is not None:
+                    _merge(histograms, counters, data)
+        return histograms, counters
+
+    def _worker_path(self):
+        return os.path.join(self.metrics_dir, f'metrics-{os.getpid()}.json')
+
+    @contextmanager
+    def _folding_lock(self):
+        with open(os.path.join(self.metrics_dir, 'metrics.lock'), 'a') as f:
+            if fcntl is not None:
+                fcntl.flock(f, fcntl.LOCK_EX)
+            yield
+
+    def _fold(self, path, locked=False):
+        """Add a finished worker's snapshot to the base file, then remove it"""
+        if not locked:
+            with self._folding_lock():
+                return self._fold(path, locked=True)
+        data = _read_snapshot(path)
+        if data is None:
+            return  # already folded by another process (or unreadable: left for the merge to skip)
+        base_path = os.path.join(self.metrics_dir, BASE_FILE)
+        base = _read_snapshot(base_path) or {}
+        folded = base.get('folded', [])
+        token = data.get('token')
+        if token is None or token not in folded:
+            histograms, counters = {}, {}
+            _merge(histograms, counters, base)
+            _merge(histograms, counters, data)
+            base = {
+                'histograms': {n: {k: h.to_dict() for k, h in s.items()} for n, s in histograms.items()},
+                'counters': counters,
+                'folded': (folded + [token] if token else folded)[-FOLDED_TOKENS_KEPT:],
+            }
+            tmp_path = base_path + '.tmp'
+            try:
+                with open(tmp_path, 'w') as f:
+                    json.dump(base, f)
+                os.replace(tmp_path, base_path)
+            except OSError as e:
+                print(f"Failed to write metrics base: {e}")
+                return
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+
+    def percentiles(self, name='http_request_duration_seconds'):
+        """p50/p90/p99 per label set for a histogram, merged across workers"""
+        histograms, _ = self.collect()
+        rows = []
+        for key, hist in histograms.get(name, {}).items():
+            row = dict(json.loads(key))
+            row.update({
+                'count': hist.count,
+                'p50_ms': round(hist.quantile(0.50) * 1000, 2),
+                'p90_ms': round(hist.quantile(0.90) * 1000, 2),
+                'p99_ms': round(hist.quantile(0.99) * 1000, 2)
+            })
+            rows.append(row)
+        rows.sort(key=lambda r: r['p99_ms'], reverse=True)
+        return rows
+
+    # ------------------------------------------------------------------
+    # Exposition
+    # ------------------------------------------------------------------
+
+    def render_prometheus(self):
+        histograms, counters = self.collect()
+        lines = []
+
+        for name, series in sorted(histograms.items()):
+            lines.append(f'# HELP {name} {self.HELP.get(name, name)}')
+            lines.append(f'# TYPE {name} histogram')
+            for key, hist in sorted(series.items()):
+                labels = json.loads(key)
+                cumulative = 0
+                for bound, c in zip(LATENCY_BUCKETS + [float('inf')], hist.counts):
+                    cumulative += c
+                    le = '+Inf' if bound == float('inf') else repr(bound)
+                    lines.append(f'{name}_bucket{_format_labels(labels, le=le)} {cumulative}')
+                lines.append(f'{name}_sum{_format_labels(labels)} {hist.sum}')
+                lines.append(f'{name}_count{_format_labels(labels)} {hist.count}')
+
+        for name, series in sorted(counters.items()):
+            # Counters are recorded without a suffix and exposed as <name>_total
+            lines.append(f'# HELP {name}_total {self.HELP.get(name, name)}')
+            lines.append(f'# TYPE {name}_total counter')
+            for key, value in sorted(series.items()):
+                lines.append(f'{name}_total{_format_labels(json.loads(key))} {value}')
+
+        for name, (help_text, fn) in sorted(self._gauges.items()):
+            try:
+                value = fn()
+            except Exception as e:
+                current_app.logger.warning(f"Gauge {name} failed: {e}")
+                continue
+            lines.append(f'# HELP {name} {help_text or name}')
+            lines.append(f'# TYPE {name} gauge')
+            if isinstance(value, dict):
+                for label_values, v in value.items():
+                    lines.append(f'{name}{_format_labels(dict(label_values))} {v}')
+            else:
+                lines.append(f'{name} {value}')
+
+        return '\n'.join(lines) + '\n'
+
+    def _metrics_view(self):
+        if not self.allow_remote and request.remote_addr not in ('127.0.0.1', '::1', None):
+            abort(404)
+        return Response(self.render_prometheus(), mimetype='text/plain; version=0.0.4')
+
+def _read_snapshot(path):
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+def _merge(histograms, counters, data):
+    """Add one snapshot's series to {name: {label_key: Histogram}} / {name: {label_key: value}}"""
+    for name, series in data.get('histograms', {}).items():
+        merged = histograms.setdefault(name, {})
+        for key, hist_data in series.items():
+            merged.setdefault(key, Histogram()).merge(hist_data)
+    for name, series in data.get('counters', {}).items():
+        merged = counters.setdefault(name.removesuffix('_total'), {})  # snapshots from when call sites added it
+        for key, value in series.items():
+            merged[key] = merged.get(key, 0) + value
+
+def _pid_alive(pid):
+    if pid == os.getpid() or os.name != 'posix':
+        return True  # os.kill(pid, 0) would terminate the process on Windows
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except OSError:  # e.g. PermissionError: alive, owned by another user
+        return True
+    return True
+
+def _escape_label(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+def _format_labels(labels, **extra):
+    """labels may be a dict or the [[k, v], ...] list stored in snapshot keys"""
+    items = list(labels) if isinstance(labels, list) else list(labels.items())
+    items += list(extra.items())
+    if not items:
+        return ''
+    return '{' + ','.join(f'{k}="{_escape_label(v)}"' for k, v in items) + '}'
+
+class InstrumentedQueuePool(QueuePool):
+    """QueuePool that records how long each checkout waited for a connection"""
+
+    def _do_get(self):
+        started = time.perf_counter()
+        try:
+            return super()._do_get()
+        finally:
+            metrics.observe('db_pool_checkout_wait_seconds', time.perf_counter() - started)
+
+# Global instance
+metrics = MetricsRegistry()
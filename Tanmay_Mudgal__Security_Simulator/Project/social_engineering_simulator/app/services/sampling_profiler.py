@@ -0,0 +1,187 @@
+"""
+Opt-in statistical sampling profiler for single admin requests
+A GLOBAL_ADMIN adds ?_profile=1 (or the X-Profile: 1 header) to a request.
+A background thread samples the request thread's stack every few
+milliseconds and the result is stored as collapsed stacks
+(flamegraph.pl "folded" format) under PROFILER_DIR/<request_id>.folded.
+"""
+from flask import request, session, g
+from threading import Thread, Lock, Event
+from collections import Counter
+from datetime import datetime
+import threading
+import uuid
+import sys
+import os
+import re
+
+_PROFILE_ID = re.compile(r'^[0-9a-f]{32}$')
+
+class _StackSampler:
+    """Samples one thread's Python stack at a fixed interval until stopped"""
+
+    def __init__(self, thread_id, interval, max_seconds):
+        self.thread_id = thread_id
+        self.interval = interval
+        self.max_samples = int(max_seconds / interval)
+        self.stacks = Counter()
+        self.samples = 0
+        self._stop = Event()
+        self._thread = Thread(target=self._run, daemon=True)
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+
+    def _run(self):
+        while not self._stop.wait(self.interval) and self.samples < self.max_samples:
+            frame = sys._current_frames().get(self.thread_id)
+            if frame is None:
+                continue
+            self.stacks[_collapse(frame)] += 1
+            self.samples += 1
+
+def _collapse(frame):
+    """Render a frame chain root-first as 'module:function;module:function'"""
+    parts = []
+    while frame is not None:
+        code = frame.f_code
+        module = os.path.splitext(os.path.basename(code.co_filename))[0]
+        parts.append(f'{module}:{code.co_name}')
+        frame = frame.f_back
+    parts.reverse()
+    return ';'.join(parts)
+
+class SamplingProfiler:
+    """
+    Flask extension. Only one request per process is profiled at a time;
+    a second profiling request while one is running is served unprofiled.
+
+    Config:
+        PROFILER_ENABLED         master switch
+        PROFILER_DIR             where .folded files are written
+        PROFILER_INTERVAL        seconds between stack samples
+        PROFILER_MAX_SECONDS     sampling stops after this long
+        PROFILER_KEEP            newest N profiles kept on disk
+    """
+
+    def __init__(self):
+        self._busy = Lock()
+        self.profile_dir = None
+
+    def init_app(self, app):
+        app.config.setdefault('PROFILER_ENABLED', True)
+        app.config.setdefault('PROFILER_DIR', os.path.join(app.instance_path, 'profiles'))
+        app.config.setdefault('PROFILER_INTERVAL', 0.005)
+        app.config.setdefault('PROFILER_MAX_SECONDS', 30)
+        app.config.setdefault('PROFILER_KEEP', 50)
+
+        if not app.config['PROFILER_ENABLED']:
+            return
+
+        self.profile_dir = app.config['PROFILER_DIR']
+        self.interval = app.config['PROFILER_INTERVAL']
+        self.max_seconds = app.config['PROFILER_MAX_SECONDS']
+        self.keep = app.config['PROFILER_KEEP']
+        os.makedirs(self.profile_dir, exist_ok=True)
+
+        app.before_request(self._maybe_start)
+        app.after_request(self._maybe_stop)
+        app.teardown_request(self._release)
+        app.extensions['sampling_profiler'] = self
+
+    def _requested(self):
+        return request.args.get('_profile') == '1' or request.headers.get('X-Profile') == '1'
+
+    def _is_global_admin(self):
+        if 'user_id' not in session:
+            return False
+        from app.models import User
+        user = User.query.get(session['user_id'])
+        return bool(user and user.is_global_admin())
+
+    def _maybe_start(self):
+        if not self._requested() or not self._is_global_admin():
+            return
+        if not self._busy.acquire(blocking=False):
+            return
+
+        sampler = _StackSampler(threading.get_ident(), self.interval, self.max_seconds)
+        g.profile_id = uuid.uuid4().hex
+        g.profile_sampler = sampler
+        g.profile_started_at = datetime.utcnow()
+        sampler.start()
+
+    def _maybe_stop(self, response):
+        sampler = g.pop('profile_sampler', None)
+        if sampler is None:
+            return response
+
+        sampler.stop()
+        profile_id = g.pop('profile_id')
+        self._write(profile_id, sampler, response.status_code)
+        response.headers['X-Profile-Id'] = profile_id
+        return response
+
+    def _release(self, exc=None):
+        # teardown always runs, so an exception mid-request can't leave the lock held
+        sampler = g.pop('profile_sampler', None)
+        if sampler is not None:
+            sampler.stop()
+        if self._busy.locked() and g.pop('profile_started_at', None) is not None:
+            self._busy.release()
+
+    def _write(self, profile_id, sampler, status_code):
+        header = (
+            f"# path={request.path} method={request.method} status={status_code} "
+            f"samples={sampler.samples} interval_ms={self.interval * 1000:g} "
+            f"started_at={g.get('profile_started_at').isoformat()}\n"
+        )
+        body = ''.join(f'{stack} {count}\n' for stack, count in sampler.stacks.most_common())
+        path = os.path.join(self.profile_dir, f'{profile_id}.folded')
+        with open(path, 'w') as f:
+            f.write(header + body)
+        self._prune()
+
+    def _prune(self):
+        files = sorted(
+            (os.path.join(self.profile_dir, name) for name in os.listdir(self.profile_dir) if name.endswith('.folded')),
+            key=os.path.getmtime, reverse=True
+        )
+        for stale in files[self.keep:]:
+            try:
+                os.remove(stale)
+            except OSError:
+                pass
+
+    # ------------------------------------------------------------------
+    # Reading profiles back (admin views)
+    # ------------------------------------------------------------------
+
+    def path_for(self, profile_id):
+        if not self.profile_dir or not _PROFILE_ID.match(profile_id or ''):
+            return None
+        path = os.path.join(self.profile_dir, f'{profile_id}.folded')
+        return path if os.path.exists(path) else None
+
+    def list_profiles(self):
+        if not self.profile_dir or not os.path.isdir(self.profile_dir):
+            return []
+        profiles = []
+        for name in os.listdir(self.profile_dir):
+            if not name.endswith('.folded'):
+                continue
+            path = os.path.join(self.profile_dir, name)
+            with open(path) as f:
+                header = f.readline()
+            meta = dict(part.split('=', 1) for part in header.lstrip('# ').split() if '=' in part)
+            meta['profile_id'] = name[:-len('.folded')]
+            profiles.append(meta)
+        profiles.sort(key=lambda p: p.get('started_at', ''), reverse=True)
+        return profiles
+
+# Global instance
+sampling_profiler = SamplingProfiler()
@@ -0,0 +1,49 @@
+from datetime import timezone
+from flask import current_app
+from app.services.counter_store import counter_store
+
+class ScenarioQuota:
+    """
+    Free-tier weekly scenario allowance, kept in the shared counter store so
+    every worker sees the same count. The week starts at the first scenario
+    after the previous week ran out, like the old last_week_reset column.
+    Counts kept only on the user row (before the store, or in a store that
+    was wiped) are carried over by `flask quota seed`.
+    """
+    WINDOW_SECONDS = 7 * 24 * 3600
+
+    @staticmethod
+    def _key(user_id):
+        return f'quota/weekly_scenarios/{user_id}'
+
+    @classmethod
+    def limit(cls):
+        return current_app.config.get('FREE_WEEKLY_SCENARIO_LIMIT', 5)
+
+    @classmethod
+    def used(cls, user_id):
+        return counter_store.get(cls._key(user_id))
+
+    @classmethod
+    def consume(cls, user_id):
+        """Take one scenario from this week's allowance. Returns (allowed, used, week_ends_at)"""
+        return counter_store.acquire_fixed(cls._key(user_id), cls.limit(), cls.WINDOW_SECONDS)
+
+    @classmethod
+    def refund(cls, user_id, week_ends_at):
+        """
+        Give back a consumed scenario whose submission didn't commit. Only to
+        the week it was taken from (week_ends_at, as consume returned it): a
+        week that has rolled over in between already starts from zero.
+        """
+        counter_store.release_fixed(cls._key(user_id), week_ends_at)
+
+    @classmethod
+    def carry_over(cls, user_id, count, week_started_at):
+        """
+        Seed a user's counter from the users.weekly_scenario_count /
+        last_week_reset columns (naive UTC) unless the store already has this
+        week. Returns whether it was seeded.
+        """
+        week_ends_at = week_started_at.replace(tzinfo=timezone.utc).timestamp() + cls.WINDOW_SECONDS
+        return counter_store.seed_fixed(cls._key(user_id), count, week_ends_at)
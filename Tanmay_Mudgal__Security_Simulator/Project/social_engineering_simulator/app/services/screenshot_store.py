@@ -0,0 +1,233 @@
+"""
+Content-addressed storage for suspicious-report screenshots
+
+An upload is copied in SCREENSHOT_CHUNK_BYTES chunks to a temporary file in
+UPLOAD_FOLDER while it is hashed, then renamed to `<hh>/<sha256>.<ext>` (the
+extension comes from the image's magic bytes, never from the client's file
+name). When that name already exists the copy is dropped: a phishing
+screenshot reported by hundreds of employees is stored once, and every
+report's screenshot_path points at it. Anything that isn't a PNG, JPEG, GIF
+or WebP image is refused.
+
+Thumbnails (JPEG, at most SCREENSHOT_THUMBNAIL_SIZE px on the long side,
+under `thumbs/`) are made by a pool of SCREENSHOT_THUMBNAIL_WORKERS threads
+after the upload is stored, so the report form doesn't wait for Pillow. A
+thumbnail that isn't ready (or can't be made: Pillow not installed, an image
+Pillow can't read) is served as the full image until it is.
+
+UPLOAD_FOLDER is outside app/static, so there is no public URL for any of
+it: both are served to admins by admin_routes.screenshot with the content
+hash as a strong ETag and a year-long `immutable` Cache-Control (a name's
+content never changes). Screenshots stored before this (`<timestamp>_<name>`
+at the top of the folder) are served as they are, with a short cache
+lifetime; `flask reports move-screenshots` moves those still under
+app/static/uploads, where anyone could fetch them, into UPLOAD_FOLDER.
+
+Config:
+    SCREENSHOT_CHUNK_BYTES         copy / hash chunk size
+    SCREENSHOT_THUMBNAIL_SIZE      thumbnail bounding box (px)
+    SCREENSHOT_THUMBNAIL_WORKERS   thumbnailing threads per worker process
+"""
+import hashlib
+import os
+import re
+import shutil
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+from threading import Lock
+from flask import current_app, send_file
+from werkzeug.utils import secure_filename
+
+SIGNATURES = (
+    (b'\x89PNG\r\n\x1a\n', 'png'),
+    (b'\xff\xd8\xff', 'jpg'),
+    (b'GIF87a', 'gif'),
+    (b'GIF89a', 'gif'),
+)
+MIMETYPES = {'png': 'image/png', 'jpg': 'image/jpeg', 'gif': 'image/gif', 'webp': 'image/webp'}
+STORED_NAME = re.compile(r'^([0-9a-f]{2})/([0-9a-f]{64})\.(png|jpg|gif|webp)$')
+CACHE_SECONDS = 365 * 24 * 3600
+LEGACY_CACHE_SECONDS = 3600
+
+class UnsupportedScreenshot(ValueError):
+    """The upload isn't an image type we store"""
+
+def image_type(head):
+    """Extension for the image whose first bytes are `head`, None for anything else"""
+    for magic, ext in SIGNATURES:
+        if head.startswith(magic):
+            return ext
+    if head[:4] == b'RIFF' and head[8:12] == b'WEBP':
+        return 'webp'
+    return None
+
+class ScreenshotStore:
+    def __init__(self):
+        self._lock = Lock()
+        self._pool = None
+        self._pool_pid = None
+        self._pending = set()  # thumbnails queued or being made in this process
+
+    def init_app(self, app):
+        app.config.setdefault('SCREENSHOT_CHUNK_BYTES', 64 * 1024)
+        app.config.setdefault('SCREENSHOT_THUMBNAIL_SIZE', 320)
+        app.config.setdefault('SCREENSHOT_THUMBNAIL_WORKERS', 2)
+
+    # --- Upload ---
+
+    def save(self, file_storage):
+        """
+        Store an uploaded file (werkzeug FileStorage) by content; returns its
+        name relative to UPLOAD_FOLDER. Raises UnsupportedScreenshot for
+        anything that isn't an image we accept.
+        """
+        config = current_app.config
+        folder = config['UPLOAD_FOLDER']
+        chunk_bytes = config['SCREENSHOT_CHUNK_BYTES']
+        os.makedirs(folder, exist_ok=True)
+
+        digest = hashlib.sha256()
+        fd, tmp_path = tempfile.mkstemp(prefix='.upload-', dir=folder)
+        try:
+            with os.fdopen(fd, 'wb') as out:
+                head = file_storage.stream.read(chunk_bytes)
+                ext = image_type(head)
+                if ext is None:
+                    raise UnsupportedScreenshot('screenshots must be PNG, JPEG, GIF or WebP images')
+                chunk = head
+                while chunk:
+                    digest.update(chunk)
+                    out.write(chunk)
+                    chunk = file_storage.stream.read(chunk_bytes)
+
+            sha = digest.hexdigest()
+            name = f'{sha[:2]}/{sha}.{ext}'
+            path = os.path.join(folder, name)
+            if os.path.exists(path):
+                os.unlink(tmp_path)  # already stored
+            else:
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+                os.chmod(tmp_path, 0o644)
+                os.replace(tmp_path, path)  # atomic: readers never see a partial file
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.unlink(tmp_path)
+            raise
+
+        if not os.path.exists(self._thumbnail_path(folder, name)):
+            self._queue_thumbnail(current_app._get_current_object(), name)
+        return name
+
+    # --- Thumbnails ---
+
+    @staticmethod
+    def _thumbnail_path(folder, name):
+        size = current_app.config['SCREENSHOT_THUMBNAIL_SIZE']
+        sha = STORED_NAME.match(name).group(2)
+        return os.path.join(folder, 'thumbs', sha[:2], f'{sha}-{size}.jpg')
+
+    def _queue_thumbnail(self, app, name):
+        with self._lock:
+            if name in self._pending:
+                return
+            if self._pool is None or self._pool_pid != os.getpid():
+                # Started on first use, and again in a forked worker: the parent's threads don't survive a fork
+                self._pool = ThreadPoolExecutor(max_workers=app.config['SCREENSHOT_THUMBNAIL_WORKERS'],
+                                                thread_name_prefix='thumbnail')
+                self._pool_pid = os.getpid()
+                self._pending = set()
+            self._pending.add(name)
+            self._pool.submit(self._make_thumbnail, app, name)
+
+    def _make_thumbnail(self, app, name):
+        try:
+            with app.app_context():
+                folder = app.config['UPLOAD_FOLDER']
+                target = self._thumbnail_path(folder, name)
+                try:
+                    from PIL import Image
+                except ImportError:
+                    return  # served full size
+                tmp_path = None
+                try:
+                    with Image.open(os.path.join(folder, name)) as image:
+                        image.thumbnail((app.config['SCREENSHOT_THUMBNAIL_SIZE'],) * 2)
+                        os.makedirs(os.path.dirname(target), exist_ok=True)
+                        fd, tmp_path = tempfile.mkstemp(prefix='.thumb-', dir=os.path.dirname(target))
+                        with os.fdopen(fd, 'wb') as out:
+                            image.convert('RGB').save(out, 'JPEG', quality=80, optimize=True)
+                    os.chmod(tmp_path, 0o644)
+                    os.replace(tmp_path, target)
+                except Exception:
+                    app.logger.warning('Thumbnail for screenshot %s failed', name, exc_info=True)
+                    if tmp_path and os.path.exists(tmp_path):
+                        os.unlink(tmp_path)
+        finally:
+            with self._lock:
+                self._pending.discard(name)
+
+    def wait(self):
+        """Block until this process's queued thumbnails are made (scripts and checks)"""
+        with self._lock:
+            pool, self._pool = self._pool, None
+        if pool is not None:
+            pool.shutdown(wait=True)
+
+    def move_legacy(self, source):
+        """
+        Move the files of a former upload folder (e.g. app/static/uploads) into
+        UPLOAD_FOLDER, keeping their names (report rows point at them). A name
+        that already exists there is left in `source`. Returns (moved, skipped).
+        """
+        folder = current_app.config['UPLOAD_FOLDER']
+        moved = skipped = 0
+        for root, _, files in os.walk(source):
+            for file_name in files:
+                path = os.path.join(root, file_name)
+                target = os.path.join(folder, os.path.relpath(path, source))
+                if os.path.exists(target):
+                    skipped += 1
+                    continue
+                os.makedirs(os.path.dirname(target), exist_ok=True)
+                shutil.move(path, target)
+                moved += 1
+        return moved, skipped
+
+    # --- Serving ---
+
+    def response(self, name, thumbnail=False):
+        """Response for a stored screenshot (or its thumbnail), None when there is no such file"""
+        folder = current_app.config['UPLOAD_FOLDER']
+        stored = STORED_NAME.match(name)
+        if stored is None:
+            # Uploads from before content addressing: flat, timestamped names
+            if secure_filename(name) != name or not os.path.isfile(os.path.join(folder, name)):
+                return None
+            return self._cached(send_file(os.path.join(folder, name), max_age=LEGACY_CACHE_SECONDS, conditional=True))
+
+        path = os.path.join(folder, name)
+        if not os.path.isfile(path):
+            return None
+        sha, ext = stored.group(2), stored.group(3)
+        etag, mimetype = sha, MIMETYPES[ext]
+        if thumbnail:
+            thumb = self._thumbnail_path(folder, name)
+            if os.path.isfile(thumb):
+                path, etag, mimetype = thumb, f"{sha}-{current_app.config['SCREENSHOT_THUMBNAIL_SIZE']}", 'image/jpeg'
+            else:
+                self._queue_thumbnail(current_app._get_current_object(), name)  # e.g. a worker restarted mid-queue
+                return self._cached(send_file(path, mimetype=mimetype, etag=False, max_age=0, conditional=True))
+
+        response = send_file(path, mimetype=mimetype, etag=etag, max_age=CACHE_SECONDS, conditional=True)
+        response = self._cached(response)
+        response.cache_control.immutable = True
+        return response
+
+    @staticmethod
+    def _cached(response):
+        # Reports are for admins only: browsers may cache them, shared proxies may not
+        response.cache_control.public = False
+        response.cache_control.private = True
+        return response
+
+screenshot_store = ScreenshotStore()
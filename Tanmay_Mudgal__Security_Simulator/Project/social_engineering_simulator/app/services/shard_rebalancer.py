@@ -0,0 +1,193 @@
+"""
+Online move of one organization to another shard (`flask shards move-org`)
+
+1. Clear any leftovers of the org on the target and refuse to continue if a
+   primary key it needs is already taken there
+2. status 'moving': copy every tenant table in primary-key batches (pausing
+   between batches so the source isn't saturated); the org keeps working
+3. catch-up pass: copy what changed during the bulk copy
+4. status 'read_only' and wait SHARD_DIRECTORY_TTL so every worker has seen it;
+   tenant writes for the org now get a 503 for a few seconds
+5. final pass: insert/replace rows that differ, delete rows gone from the source
+6. point the directory at the target (status 'active')
+7. wait SHARD_DIRECTORY_TTL again, then delete the org's rows on the source
+
+The target must already have the schema and the catalog copy
+(`flask shards init` and `flask shards sync-catalog`). On failure before
+step 6 the org stays on the source and its partial copy is removed.
+"""
+import time
+import sqlalchemy as sa
+from flask import current_app
+from app.services.sharding import shard_router, org_filter, tenant_tables, DEFAULT_SHARD
+
+class ShardMoveError(Exception):
+    pass
+
+def _pk(table):
+    columns = list(table.primary_key.columns)
+    if len(columns) != 1:
+        raise ShardMoveError(f'{table.name}: batched copy needs a single-column primary key')
+    return columns[0]
+
+def _without_fk_checks(conn):
+    # Rows are copied table by table and users <-> teams reference each other
+    if conn.dialect.name == 'mysql':
+        conn.exec_driver_sql('SET FOREIGN_KEY_CHECKS = 0')
+
+class OrgMover:
+    def __init__(self, org_id, target, batch_size=1000, pause=0.0, keep_source=False, log=print):
+        from app import db
+        self.org_id = org_id
+        self.target = target
+        self.batch_size = batch_size
+        self.pause = pause
+        self.keep_source = keep_source
+        self.log = log
+        self.tables = tenant_tables(db.metadata)
+        self.source = None
+
+    def run(self):
+        from app.models import Organization
+        if self.target not in shard_router.names():
+            raise ShardMoveError(f'Unknown shard {self.target!r}; configured: {", ".join(shard_router.names())}')
+        self.source, status = shard_router.locate_org(self.org_id)
+        if status != 'active':
+            raise ShardMoveError(f'Org {self.org_id} is already {status} (another move running or one failed midway)')
+        if self.source == self.target:
+            raise ShardMoveError(f'Org {self.org_id} is already on {self.target}')
+        src, dst = shard_router.engine(self.source), shard_router.engine(self.target)
+        ttl = current_app.config['SHARD_DIRECTORY_TTL']
+        started = time.monotonic()
+
+        self.log(f'Moving org {self.org_id}: {self.source} -> {self.target}')
+        self._delete_org(dst)
+        self._copy_rows(src, dst, Organization.__table__, Organization.__table__.c.org_id == self.org_id)
+        flipped = False
+        try:
+            shard_router.assign(self.org_id, self.source, 'moving')
+            for table in self.tables:
+                copied = self._copy_rows(src, dst, table, org_filter(table, self.org_id), check_collisions=True)
+                self.log(f'  copied {table.name}: {copied}')
+            changed = self._sync(src, dst)
+            self.log(f'  catch-up: {changed} rows')
+
+            shard_router.assign(self.org_id, self.source, 'read_only')
+            time.sleep(ttl + 1)
+            frozen = time.monotonic()
+            changed = self._sync(src, dst)
+            self.log(f'  final sync: {changed} rows')
+            shard_router.assign(self.org_id, self.target, 'active')
+            flipped = True
+            self.log(f'  writes blocked for {time.monotonic() - frozen + ttl + 1:.1f}s (incl. directory TTL)')
+        except BaseException:
+            if not flipped:
+                shard_router.assign(self.org_id, self.source, 'active')
+                self._delete_org(dst)
+            raise
+
+        if not self.keep_source:
+            time.sleep(ttl + 1)  # workers still reading from the source finish first
+            self._delete_org(src)
+            self.log(f'  removed the org from {self.source}')
+        self.log(f'Done in {time.monotonic() - started:.1f}s')
+
+    def _batches(self, conn, table, where, columns=None):
+        """Rows (or the given columns) matching `where`, in primary-key batches"""
+        pk = _pk(table)
+        last = None
+        while True:
+            query = sa.select(*(columns or table.columns)).where(where)
+            if last is not None:
+                query = query.where(pk > last)
+            rows = conn.execute(query.order_by(pk).limit(self.batch_size)).mappings().all()
+            if not rows:
+                return
+            yield rows
+            last = rows[-1][pk.name]
+            if self.pause:
+                time.sleep(self.pause)
+
+    def _copy_rows(self, src, dst, table, where, check_collisions=False):
+        pk = _pk(table)
+        copied = 0
+        with src.connect() as src_conn:
+            for rows in self._batches(src_conn, table, where):
+                ids = [r[pk.name] for r in rows]
+                with dst.begin() as dst_conn:
+                    _without_fk_checks(dst_conn)
+                    taken = dst_conn.execute(sa.select(pk).where(pk.in_(ids))).scalars().all()
+                    if taken and check_collisions:
+                        raise ShardMoveError(f'{table.name}: ids {taken[:5]} already used on {self.target}; '
+                                             f'give each shard its own auto-increment offset')
+                    if taken:
+                        dst_conn.execute(table.delete().where(pk.in_(taken)))
+                    dst_conn.execute(table.insert(), [dict(r) for r in rows])
+                copied += len(rows)
+        return copied
+
+    def _sync(self, src, dst):
+        """Make the target's copy equal to the source; returns rows written or deleted"""
+        changed = 0
+        # Deletes children first, while their parents still identify them as the org's
+        for table in reversed(self.tables):
+            pk = _pk(table)
+            where = org_filter(table, self.org_id)
+            with src.connect() as src_conn, dst.connect() as dst_conn:
+                source_ids = {r[pk.name] for rows in self._batches(src_conn, table, where, [pk]) for r in rows}
+                gone = [r[pk.name] for rows in self._batches(dst_conn, table, where, [pk])
+                        for r in rows if r[pk.name] not in source_ids]
+            for i in range(0, len(gone), self.batch_size):
+                with dst.begin() as dst_conn:
+                    dst_conn.execute(table.delete().where(pk.in_(gone[i:i + self.batch_size])))
+            changed += len(gone)
+
+        for table in self.tables:
+            pk = _pk(table)
+            with src.connect() as src_conn:
+                for rows in self._batches(src_conn, table, org_filter(table, self.org_id)):
+                    ids = [r[pk.name] for r in rows]
+                    with dst.begin() as dst_conn:
+                        _without_fk_checks(dst_conn)
+                        current = {r[pk.name]: dict(r) for r in
+                                   dst_conn.execute(sa.select(table).where(pk.in_(ids))).mappings()}
+                        stale = [dict(r) for r in rows if current.get(r[pk.name]) != dict(r)]
+                        if stale:
+                            dst_conn.execute(table.delete().where(pk.in_([r[pk.name] for r in stale])))
+                            dst_conn.execute(table.insert(), stale)
+                    changed += len(stale)
+        return changed
+
+    def _delete_org(self, engine):
+        for table in reversed(self.tables):
+            pk = _pk(table)
+            with engine.connect() as conn:
+                ids = [r[pk.name] for rows in self._batches(conn, table, org_filter(table, self.org_id), [pk])
+                       for r in rows]
+            for i in range(0, len(ids), self.batch_size):
+                with engine.begin() as conn:
+                    _without_fk_checks(conn)
+                    conn.execute(table.delete().where(pk.in_(ids[i:i + self.batch_size])))
+
+def sync_catalog(name, batch_size=1000, log=print):
+    """Replace a shard's copy of the global tables with the catalog's"""
+    from app import db
+    from app.services.sharding import catalog_tables
+    if name == DEFAULT_SHARD:
+        raise ShardMoveError('The default shard is the catalog')
+    src, dst = shard_router.engine(DEFAULT_SHARD), shard_router.engine(name)
+    tables = catalog_tables(db.metadata)
+    with src.connect() as src_conn, dst.begin() as dst_conn:
+        _without_fk_checks(dst_conn)
+        for table in reversed(tables):
+            dst_conn.execute(table.delete())
+        for table in tables:
+            result = src_conn.execute(sa.select(table)).mappings()
+            copied = 0
+            while True:
+                rows = result.fetchmany(batch_size)
+                if not rows:
+                    break
+                dst_conn.execute(table.insert(), [dict(r) for r in rows])
+                copied += len(rows)
+            log(f'  {table.name}: {copied}')
@@ -0,0 +1,273 @@
+"""
+Tenant sharding by org_id
+- Shards from DB_SHARD_URIS become binds shard_<name>; the main database is
+  both the shared catalog and the 'default' shard
+- org_shards (on the catalog) maps an org to its shard; orgs without a row,
+  and users without an org, live on the default shard
+- Statements touching a tenant table (TENANT_TABLES) go to the shard of the
+  org in scope: the logged-in user's session['org_id'], or an explicit
+  `with tenant_scope(org_id):` / `with shard_scope(name):` block
+- Everything else (scenarios, topics, roles, achievement definitions,
+  organizations, ...) stays on the catalog. Shards hold a read-only copy of
+  those tables (`flask shards sync-catalog`) so tenant queries can join them
+- While an org is being moved its directory status is 'read_only' for a few
+  seconds and tenant writes for it raise TenantMoving (served as a 503)
+
+The directory is cached per worker for SHARD_DIRECTORY_TTL seconds; the
+rebalancer (services/shard_rebalancer.py) waits that long between steps so
+every worker has seen each status change. With DB_SHARD_URIS empty all of
+this is a no-op.
+
+Raw sa.text() statements aren't inspected and always run on the catalog.
+Primary keys must not collide across shards: give each MySQL shard its own
+auto_increment_offset (see migrations/versions/0001e_org_shards.py).
+
+Config:
+    DB_SHARD_URIS          {name: uri} of the extra shards
+    SHARD_DIRECTORY_TTL    seconds a worker caches org_shards
+"""
+import time
+import warnings
+from contextlib import contextmanager
+from contextvars import ContextVar
+from functools import wraps
+from threading import Lock
+import sqlalchemy as sa
+from sqlalchemy.sql.util import find_tables
+from flask import current_app, g, has_app_context, has_request_context, request, session as flask_session
+
+DEFAULT_SHARD = 'default'
+
+# Tables holding one organization's rows: table -> (column, parent table).
+# A parent of None means the column is the org_id itself; otherwise the row
+# belongs to the org its parent row (by primary key) belongs to.
+TENANT_TABLES = {
+    'users': ('org_id', None),
+    'departments': ('org_id', None),
+    'campaigns': ('org_id', None),
+    'teams': ('dept_id', 'departments'),
+    'campaign_targets': ('campaign_id', 'campaigns'),
+    'campaign_events': ('campaign_id', 'campaigns'),
+    'campaign_results': ('campaign_id', 'campaigns'),
+    'user_responses': ('user_id', 'users'),
+    'response_details': ('response_id', 'user_responses'),
+    'learning_progress': ('user_id', 'users'),
+    'achievements': ('user_id', 'users'),
+    'user_roles': ('user_id', 'users'),
+    'scenario_progress': ('user_id', 'users'),
+    'notifications': ('user_id', 'users'),
+    'audit_logs': ('user_id', 'users'),
+    'user_progress': ('user_id', 'users'),
+    'module_attempts': ('user_id', 'users'),
+    'certificates': ('user_id', 'users'),
+    'leaderboards': ('user_id', 'users'),
+    'assigned_lessons': ('user_id', 'users'),
+    'suspicious_reports': ('user_id', 'users'),
+    'report_clusters': ('org_id', None),
+    'report_cluster_bands': ('cluster_id', 'report_clusters'),
+    'user_stats': ('user_id', 'users'),
+    'user_category_stats': ('user_id', 'users'),
+}
+
+# Per-database operational state: never copied to or from a shard
+LOCAL_TABLES = {'org_shards', 'metric_snapshots', 'rate_counters', 'replica_heartbeat',
+                'schema_migrations', 'backfill_progress', 'jobs', 'job_schedules'}
+
+_scope = ContextVar('shard_scope', default=None)  # ('org', org_id) or ('shard', name)
+
+class TenantMoving(Exception):
+    """A write for an org whose data is being copied to another shard"""
+
+    def __init__(self, org_id):
+        super().__init__(f'Organization {org_id} is being moved to another shard')
+        self.org_id = org_id
+
+@contextmanager
+def tenant_scope(org_id):
+    """Route tenant queries in this block to org_id's shard"""
+    token = _scope.set(('org', org_id))
+    try:
+        yield
+    finally:
+        _scope.reset(token)
+
+@contextmanager
+def shard_scope(name):
+    """Route tenant queries in this block to the named shard"""
+    token = _scope.set(('shard', name))
+    try:
+        yield
+    finally:
+        _scope.reset(token)
+
+def org_scoped(arg='org_id'):
+    """View decorator: tenant queries go to the shard of the org in the URL (put it under the auth decorator)"""
+    def decorator(fn):
+        @wraps(fn)
+        def wrapper(*args, **kwargs):
+            with tenant_scope(kwargs.get(arg)):
+                return fn(*args, **kwargs)
+        return wrapper
+    return decorator
+
+def org_filter(table, org_id):
+    """WHERE clause selecting the rows of a tenant table that belong to org_id"""
+    column, parent = TENANT_TABLES[table.name]
+    if parent is None:
+        return table.c[column] == org_id
+    parent_table = table.metadata.tables[parent]
+    parent_pk = list(parent_table.primary_key.columns)[0]
+    return table.c[column].in_(sa.select(parent_pk).where(org_filter(parent_table, org_id)))
+
+def _sorted_tables(metadata):
+    # users <-> teams reference each other; copies run without FK checks, so the
+    # order only has to be right for the other tables
+    with warnings.catch_warnings():
+        warnings.simplefilter('ignore', sa.exc.SAWarning)
+        return metadata.sorted_tables
+
+def tenant_tables(metadata):
+    """Tenant tables in dependency order (parents first)"""
+    return [t for t in _sorted_tables(metadata) if t.name in TENANT_TABLES]
+
+def catalog_tables(metadata):
+    """Global tables copied to every shard, in dependency order"""
+    return [t for t in _sorted_tables(metadata) if t.name not in TENANT_TABLES and t.name not in LOCAL_TABLES]
+
+class ShardRouter:
+    """Shard binds, the cached org -> shard directory and per-statement routing"""
+
+    def configure_engines(self, app):
+        """Binds for the shards. Must run before db.init_app()."""
+        from app.services.db_routing import POOL_OPTIONS
+        app.config.setdefault('DB_SHARD_URIS', {})
+        app.config.setdefault('SHARD_DIRECTORY_TTL', 5)
+
+        binds = dict(app.config.get('SQLALCHEMY_BINDS') or {})
+        pool_options = {option: app.config[key] for key, option in POOL_OPTIONS.items()
+                        if app.config.get(key) is not None}
+        names = []
+        for name, uri in app.config['DB_SHARD_URIS'].items():
+            if name == DEFAULT_SHARD:
+                raise ValueError(f"'{DEFAULT_SHARD}' is the catalog database; pick another shard name")
+            binds[f'shard_{name}'] = {'url': uri, **({} if str(uri).startswith('sqlite') else pool_options)}
+            names.append(name)
+        app.config['SQLALCHEMY_BINDS'] = binds
+        app.extensions['shard_router'] = {
+            'names': names,
+            'directory': {},
+            'loaded_at': None,
+            'lock': Lock()
+        }
+
+    def init_app(self, app):
+        @app.errorhandler(TenantMoving)
+        def _tenant_moving(e):
+            retry_after = str(int(app.config['SHARD_DIRECTORY_TTL']) * 2 or 1)
+            message = 'Your organization is being moved to a new server. Please retry in a few seconds.'
+            if request.is_json or request.accept_mimetypes.best == 'application/json':
+                return {'success': False, 'message': message}, 503, {'Retry-After': retry_after}
+            return message, 503, {'Retry-After': retry_after}
+
+        @app.before_request
+        def _locate_tenant():
+            # Sessions from before sharding have no org_id: find the user's shard once
+            if self.enabled() and 'user_id' in flask_session and 'org_id' not in flask_session:
+                user = self.find_user(user_id=flask_session['user_id'])
+                flask_session['org_id'] = user.org_id if user else None
+
+    @staticmethod
+    def _state():
+        return current_app.extensions.get('shard_router') if has_app_context() else None
+
+    def enabled(self):
+        state = self._state()
+        return bool(state and state['names'])
+
+    def names(self):
+        state = self._state()
+        return [DEFAULT_SHARD] + (state['names'] if state else [])
+
+    def engine(self, name):
+        from app import db
+        return db.engines[None if name == DEFAULT_SHARD else f'shard_{name}']
+
+    def directory(self, refresh=False):
+        """{org_id: (shard, status)}, reloaded from org_shards every SHARD_DIRECTORY_TTL seconds"""
+        state = self._state()
+        now = time.monotonic()
+        loaded_at = state['loaded_at']
+        if refresh or loaded_at is None or now - loaded_at >= current_app.config['SHARD_DIRECTORY_TTL']:
+            with state['lock']:
+                if refresh or state['loaded_at'] == loaded_at:
+                    from app.models import OrgShard
+                    table = OrgShard.__table__
+                    with self.engine(DEFAULT_SHARD).connect() as conn:
+                        rows = conn.execute(sa.select(table.c.org_id, table.c.shard, table.c.status)).all()
+                    state['directory'] = {org_id: (shard, status) for org_id, shard, status in rows}
+                    state['loaded_at'] = time.monotonic()
+        return state['directory']
+
+    def locate_org(self, org_id):
+        """(shard name, status) of an org"""
+        if org_id is None or not self.enabled():
+            return DEFAULT_SHARD, 'active'
+        return self.directory().get(org_id, (DEFAULT_SHARD, 'active'))
+
+    def current(self):
+        """(shard, org_id, status) for the statement being routed"""
+        scope = _scope.get()
+        if scope is None and has_request_context():
+            org_id = g.get('shard_org', flask_session.get('org_id'))
+            scope = ('org', org_id) if org_id is not None else None
+        if scope is None:
+            return DEFAULT_SHARD, None, 'active'
+        if scope[0] == 'shard':
+            return scope[1], None, 'active'
+        shard, status = self.locate_org(scope[1])
+        return shard, scope[1], status
+
+    def engine_for(self, mapper, clause, is_write):
+        """Shard engine for a statement on tenant tables, or None for the catalog / default shard"""
+        if not self.enabled():
+            return None
+        tables = find_tables(clause, include_joins=True, include_aliases=True, include_crud=True) \
+            if clause is not None else []
+        if mapper is not None:
+            tables.append(mapper.local_table)
+        if not any(getattr(t, 'name', None) in TENANT_TABLES for t in tables):
+            return None
+        shard, org_id, status = self.current()
+        if is_write and status == 'read_only':
+            raise TenantMoving(org_id)
+        return None if shard == DEFAULT_SHARD else self.engine(shard)
+
+    def find_user(self, **filters):
+        """
+        First user matching filter_by(**filters) on any shard (default first).
+        Used before the org is known (login, registration checks); in a
+        request the rest of it is then routed to that user's shard.
+        """
+        from app.models import User
+        if not self.enabled():
+            return User.query.filter_by(**filters).first()
+        for name in self.names():
+            with shard_scope(name):
+                user = User.query.filter_by(**filters).first()
+            if user is not None:
+                if has_request_context():
+                    g.shard_org = user.org_id
+                return user
+        return None
+
+    def assign(self, org_id, shard, status='active'):
+        """Write an org's directory entry (on the catalog) and drop this worker's cache"""
+        from app.models import OrgShard
+        table = OrgShard.__table__
+        values = {'shard': shard, 'status': status, 'updated_at': sa.func.now()}
+        with self.engine(DEFAULT_SHARD).begin() as conn:
+            if conn.execute(table.update().where(table.c.org_id == org_id).values(**values)).rowcount == 0:
+                conn.execute(table.insert().values(org_id=org_id, **values))
+        self._state()['loaded_at'] = None
+
+shard_router = ShardRouter()
@@ -0,0 +1,209 @@
+"""
+Per-request SQL profiler
+Counts queries, SQL time and repeated statement shapes for a sample of
+requests, and flags shapes executed more than N times as suspected N+1 loops.
+"""
+from flask import g, request, has_request_context
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from collections import deque, Counter
+from threading import Lock
+from datetime import datetime
+import random
+import time
+import re
+
+_WHITESPACE = re.compile(r'\s+')
+_NUMBER = re.compile(r'\b\d+\b')
+_STRING = re.compile(r"'(?:[^']|'')*'")
+_PLACEHOLDER_LIST = re.compile(r'\((?:\s*(?:\?|%s|%\(\w+\)s|:\w+)\s*,)+\s*(?:\?|%s|%\(\w+\)s|:\w+)\s*\)')
+
+def normalize_statement(statement):
+    """Reduce a SQL statement to its shape: literals -> ?, IN-lists -> (?...)"""
+    shape = _WHITESPACE.sub(' ', statement).strip()
+    shape = _STRING.sub('?', shape)
+    shape = _NUMBER.sub('?', shape)
+    shape = _PLACEHOLDER_LIST.sub('(?...)', shape)
+    return shape
+
+class RequestProfile:
+    """SQL activity collected while serving one request"""
+    __slots__ = ('endpoint', 'method', 'path', 'started_at', 'query_count', 'sql_ms', 'shapes', 'shape_ms')
+
+    def __init__(self, endpoint, method, path):
+        self.endpoint = endpoint
+        self.method = method
+        self.path = path
+        self.started_at = datetime.utcnow()
+        self.query_count = 0
+        self.sql_ms = 0.0
+        self.shapes = Counter()
+        self.shape_ms = Counter()
+
+    def record(self, statement, elapsed_ms):
+        shape = normalize_statement(statement)
+        self.query_count += 1
+        self.sql_ms += elapsed_ms
+        self.shapes[shape] += 1
+        self.shape_ms[shape] += elapsed_ms
+
+    def suspects(self, threshold):
+        """Statement shapes executed more than `threshold` times"""
+        return [
+            {'shape': shape, 'count': count, 'total_ms': round(self.shape_ms[shape], 2)}
+            for shape, count in self.shapes.most_common()
+            if count > threshold
+        ]
+
+    def to_dict(self, threshold, status_code=None, request_ms=None):
+        return {
+            'endpoint': self.endpoint,
+            'method': self.method,
+            'path': self.path,
+            'status': status_code,
+            'started_at': self.started_at.isoformat(),
+            'request_ms': round(request_ms, 2) if request_ms is not None else None,
+            'query_count': self.query_count,
+            'sql_ms': round(self.sql_ms, 2),
+            'distinct_shapes': len(self.shapes),
+            'n_plus_one': self.suspects(threshold)
+        }
+
+class SQLProfiler:
+    """
+    Flask extension. Listens to SQLAlchemy cursor events on every engine and
+    attributes them to the current request when that request was sampled.
+
+    Config:
+        SQL_PROFILER_ENABLED               master switch
+        SQL_PROFILER_SAMPLE_RATE           fraction of requests profiled (0-1)
+        SQL_PROFILER_N_PLUS_ONE_THRESHOLD  repeats of one shape that flag N+1
+        SQL_PROFILER_BUFFER_SIZE           profiles kept for /admin/perf
+        SQL_PROFILER_HEADERS               add X-SQL-* response headers
+    """
+    _listeners_installed = False
+
+    def __init__(self, app=None):
+        self.buffer = deque(maxlen=200)
+        self._lock = Lock()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.config.setdefault('SQL_PROFILER_ENABLED', True)
+        app.config.setdefault('SQL_PROFILER_SAMPLE_RATE', 0.05)
+        app.config.setdefault('SQL_PROFILER_N_PLUS_ONE_THRESHOLD', 10)
+        app.config.setdefault('SQL_PROFILER_BUFFER_SIZE', 200)
+        app.config.setdefault('SQL_PROFILER_HEADERS', False)
+
+        if not app.config['SQL_PROFILER_ENABLED']:
+            return
+
+        self.buffer = deque(maxlen=app.config['SQL_PROFILER_BUFFER_SIZE'])
+        self.threshold = app.config['SQL_PROFILER_N_PLUS_ONE_THRESHOLD']
+        self.sample_rate = app.config['SQL_PROFILER_SAMPLE_RATE']
+        self.emit_headers = app.config['SQL_PROFILER_HEADERS']
+
+        self._install_listeners()
+        app.before_request(self._start_request)
+        app.after_request(self._finish_request)
+        app.extensions['sql_profiler'] = self
+
+    @classmethod
+    def _install_listeners(cls):
+        # Listen on the Engine class so replica/shard engines are covered too
+        if cls._listeners_installed:
+            return
+        event.listen(Engine, 'before_cursor_execute', _before_cursor_execute)
+        event.listen(Engine, 'after_cursor_execute', _after_cursor_execute)
+        event.listen(Engine, 'handle_error', _handle_error)
+        cls._listeners_installed = True
+
+    def _start_request(self):
+        if self.sample_rate < 1.0 and random.random() >= self.sample_rate:
+            return
+        g.sql_profile = RequestProfile(request.endpoint, request.method, request.path)
+        g.sql_profile_started = time.perf_counter()
+
+    def _finish_request(self, response):
+        profile = g.pop('sql_profile', None)
+        if profile is None:
+            return response
+
+        request_ms = (time.perf_counter() - g.pop('sql_profile_started')) * 1000
+        entry = profile.to_dict(self.threshold, response.status_code, request_ms)
+        with self._lock:
+            self.buffer.append(entry)
+
+        if self.emit_headers:
+            response.headers['X-SQL-Query-Count'] = str(entry['query_count'])
+            response.headers['X-SQL-Time-Ms'] = f"{entry['sql_ms']:.2f}"
+            if entry['n_plus_one']:
+                worst = entry['n_plus_one'][0]
+                response.headers['X-SQL-N-Plus-One'] = f"{worst['count']}x {worst['shape'][:200]}"
+        return response
+
+    def recent(self, limit=None):
+        """Most recent profiles first"""
+        with self._lock:
+            entries = list(self.buffer)
+        entries.reverse()
+        return entries[:limit] if limit else entries
+
+    def summary(self):
+        """Per-endpoint aggregates over the ring buffer"""
+        by_endpoint = {}
+        for entry in self.recent():
+            agg = by_endpoint.setdefault(entry['endpoint'], {
+                'endpoint': entry['endpoint'], 'requests': 0, 'queries': 0,
+                'sql_ms': 0.0, 'max_queries': 0, 'n_plus_one_hits': 0
+            })
+            agg['requests'] += 1
+            agg['queries'] += entry['query_count']
+            agg['sql_ms'] += entry['sql_ms']
+            agg['max_queries'] = max(agg['max_queries'], entry['query_count'])
+            if entry['n_plus_one']:
+                agg['n_plus_one_hits'] += 1
+
+        rows = []
+        for agg in by_endpoint.values():
+            agg['avg_queries'] = round(agg['queries'] / agg['requests'], 1)
+            agg['avg_sql_ms'] = round(agg['sql_ms'] / agg['requests'], 2)
+            rows.append(agg)
+        rows.sort(key=lambda a: a['avg_sql_ms'], reverse=True)
+        return rows
+
+    def clear(self):
+        with self._lock:
+            self.buffer.clear()
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    if has_request_context() and 'sql_profile' in g:
+        conn.info.setdefault('sql_profiler_start', []).append(time.perf_counter())
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    if not has_request_context():
+        return
+    profile = g.get('sql_profile')
+    if profile is None:
+        return
+    starts = conn.info.get('sql_profiler_start')
+    if not starts:
+        return
+    profile.record(statement, (time.perf_counter() - starts.pop()) * 1000)
+
+def _handle_error(context):
+    # A statement that raised gets no after_cursor_execute: drop its start time (and count it)
+    # so later statements on this connection aren't timed against it
+    if context.connection is None or context.execution_context is None:
+        return  # failed before the statement was set up for execution: nothing was pushed
+    starts = context.connection.info.get('sql_profiler_start')
+    if not starts:
+        return
+    started = starts.pop()
+    profile = g.get('sql_profile') if has_request_context() else None
+    if profile is not None:
+        profile.record(context.statement, (time.perf_counter() - started) * 1000)
+
+# Global instance
+sql_profiler = SQLProfiler()
@@ -0,0 +1,191 @@
+"""
+Summary tables behind the reporting views (advanced_sql_features.sql)
+- user_stats: per-user attempts, correct answers, response-time total and
+  achievement count
+- user_category_stats: the same response totals per (user, scenario type)
+
+The write path keeps them current with delta updates: record_response() and
+record_achievement() upsert one row each in the caller's transaction,
+instead of the calculate_user_accuracy trigger's COUNT/SUM over all of the
+user's responses on every insert.
+record_response() also sets users.vulnerability_level from the new counters,
+which is what that trigger was for. user_performance_summary,
+global_leaderboard and user_category_performance are thin views over these
+tables (migrations/versions/0005_summary_tables.py).
+
+Rows written around that path (bulk loads, manual SQL, a response saved by a
+worker still running older code) aren't counted. `flask summaries verify`
+recomputes the totals from the raw tables, user-id range by range, and
+reports rows that differ; `--repair` rewrites them. Responses committed
+while a range is being checked can show up as a difference: re-run verify.
+"""
+from datetime import datetime
+import sqlalchemy as sa
+from app import db
+
+def vulnerability_level(correct, attempts):
+    """'Low' / 'Medium' / 'High' from a user's accuracy (same thresholds as the old trigger)"""
+    accuracy = correct * 100.0 / attempts if attempts else 0.0
+    if accuracy >= 80:
+        return 'Low'
+    if accuracy >= 50:
+        return 'Medium'
+    return 'High'
+
+def _tables():
+    from app.models import User, UserResponse, Achievement, Scenario, UserStats, UserCategoryStats
+    return (User.__table__, UserResponse.__table__, Achievement.__table__, Scenario.__table__,
+            UserStats.__table__, UserCategoryStats.__table__)
+
+def _bump(table, key, deltas):
+    """
+    Add deltas to the row identified by key, inserting it if it doesn't exist
+    yet, in one upsert: two first responses at once can't both insert
+    """
+    now = datetime.utcnow()
+    stmt = sa.insert(table)
+    dialect = db.session.get_bind(clause=stmt).dialect.name
+    if dialect == 'mysql':
+        from sqlalchemy.dialects.mysql import insert
+    else:
+        from sqlalchemy.dialects.sqlite import insert
+    stmt = insert(table).values(**key, **deltas, last_updated=now)
+    updates = {column: table.c[column] + delta for column, delta in deltas.items()}
+    updates['last_updated'] = now
+    if dialect == 'mysql':
+        stmt = stmt.on_duplicate_key_update(updates)
+    else:
+        stmt = stmt.on_conflict_do_update(index_elements=list(key), set_=updates)
+    db.session.execute(stmt)
+
+def record_response(user_id, category, is_correct, response_time):
+    """Count one scenario response; call in the transaction that inserts it"""
+    users, _, _, _, user_stats, category_stats = _tables()
+    deltas = {'correct': 1 if is_correct else 0}
+    if response_time is not None:
+        deltas.update(total_response_time=int(response_time), timed_attempts=1)
+
+    _bump(category_stats, {'user_id': user_id, 'category': category}, dict(attempts=1, **deltas))
+    deltas['correct_attempts'] = deltas.pop('correct')
+    _bump(user_stats, {'user_id': user_id}, dict(total_attempts=1, **deltas))
+
+    attempts, correct = db.session.execute(
+        sa.select(user_stats.c.total_attempts, user_stats.c.correct_attempts).where(user_stats.c.user_id == user_id)
+    ).one()
+    db.session.execute(sa.update(users).where(users.c.user_id == user_id).values(
+        vulnerability_level=vulnerability_level(correct, attempts)))
+
+def record_achievement(user_id):
+    """Count one new achievements row for the user"""
+    user_stats = _tables()[4]
+    _bump(user_stats, {'user_id': user_id}, {'achievements': 1})
+
+# --- Verification against a full recomputation ---
+
+USER_COLUMNS = ('total_attempts', 'correct_attempts', 'total_response_time', 'timed_attempts', 'achievements')
+CATEGORY_COLUMNS = ('attempts', 'correct', 'total_response_time', 'timed_attempts')
+
+def _response_totals(responses):
+    return (
+        sa.func.count(responses.c.response_id),
+        sa.func.coalesce(sa.func.sum(sa.case((responses.c.is_correct == sa.true(), 1), else_=0)), 0),
+        sa.func.coalesce(sa.func.sum(responses.c.response_time), 0),
+        sa.func.count(responses.c.response_time),
+    )
+
+def _expected(conn, lo, hi):
+    """Recomputed ({user_id: user_stats values}, {(user_id, category): values}, {user_id: level}) for lo < user_id <= hi"""
+    users, responses, achievements, scenarios, _, _ = _tables()
+    expected_users, expected_categories = {}, {}
+
+    in_range = sa.and_(responses.c.user_id > lo, responses.c.user_id <= hi)
+    for user_id, *totals in conn.execute(
+            sa.select(responses.c.user_id, *_response_totals(responses)).where(in_range)
+            .group_by(responses.c.user_id)):
+        expected_users[user_id] = tuple(int(v) for v in totals) + (0,)
+    for user_id, count in conn.execute(
+            sa.select(achievements.c.user_id, sa.func.count(achievements.c.achievement_id))
+            .where(achievements.c.user_id > lo, achievements.c.user_id <= hi).group_by(achievements.c.user_id)):
+        expected_users[user_id] = expected_users.get(user_id, (0, 0, 0, 0, 0))[:4] + (int(count),)
+    for user_id, category, *totals in conn.execute(
+            sa.select(responses.c.user_id, scenarios.c.scenario_type, *_response_totals(responses))
+            .join(scenarios, scenarios.c.scenario_id == responses.c.scenario_id).where(in_range)
+            .group_by(responses.c.user_id, scenarios.c.scenario_type)):
+        expected_categories[(user_id, category)] = tuple(int(v) for v in totals)
+
+    levels = {user_id: vulnerability_level(values[1], values[0])
+              for user_id, values in expected_users.items() if values[0]}
+    return expected_users, expected_categories, levels
+
+def _actual(conn, lo, hi):
+    users, _, _, _, user_stats, category_stats = _tables()
+    actual_users = {row[0]: tuple(row[1:]) for row in conn.execute(
+        sa.select(user_stats.c.user_id, *(user_stats.c[c] for c in USER_COLUMNS))
+        .where(user_stats.c.user_id > lo, user_stats.c.user_id <= hi))}
+    actual_categories = {(row[0], row[1]): tuple(row[2:]) for row in conn.execute(
+        sa.select(category_stats.c.user_id, category_stats.c.category, *(category_stats.c[c] for c in CATEGORY_COLUMNS))
+        .where(category_stats.c.user_id > lo, category_stats.c.user_id <= hi))}
+    levels = dict(conn.execute(
+        sa.select(users.c.user_id, users.c.vulnerability_level).where(users.c.user_id > lo, users.c.user_id <= hi)).all())
+    return actual_users, actual_categories, levels
+
+def _differences(expected, actual, columns):
+    """Keys whose values differ; a missing row equals an all-zero one"""
+    zero = (0,) * len(columns)
+    return sorted(key for key in expected.keys() | actual.keys()
+                  if expected.get(key, zero) != actual.get(key, zero))
+
+def verify(engine, batch_size=1000, repair=False, log=print):
+    """
+    Diff user_stats, user_category_stats and users.vulnerability_level against
+    the raw tables; with repair=True rewrite the rows that differ. Returns
+    {'users': checked, 'user_stats': n, 'user_category_stats': n, 'vulnerability_level': n}.
+    """
+    users, _, _, _, user_stats, category_stats = _tables()
+    with engine.connect() as conn:
+        max_id = conn.execute(sa.select(sa.func.max(users.c.user_id))).scalar() or 0
+    found = {'users': 0, 'user_stats': 0, 'user_category_stats': 0, 'vulnerability_level': 0}
+    examples = []
+
+    for lo in range(0, max_id, batch_size):
+        hi = lo + batch_size
+        with engine.begin() as conn:
+            expected_users, expected_categories, expected_levels = _expected(conn, lo, hi)
+            actual_users, actual_categories, actual_levels = _actual(conn, lo, hi)
+            found['users'] += len(actual_levels)
+
+            bad_users = _differences(expected_users, actual_users, USER_COLUMNS)
+            bad_categories = _differences(expected_categories, actual_categories, CATEGORY_COLUMNS)
+            bad_levels = sorted(user_id for user_id, level in expected_levels.items()
+                                if actual_levels.get(user_id) != level)
+            found['user_stats'] += len(bad_users)
+            found['user_category_stats'] += len(bad_categories)
+            found['vulnerability_level'] += len(bad_levels)
+            for user_id in bad_users[:5 - len(examples)]:
+                examples.append(f'user {user_id}: user_stats {actual_users.get(user_id)} '
+                                f'!= recomputed {expected_users.get(user_id)}')
+            if not repair:
+                continue
+
+            if bad_users:
+                conn.execute(user_stats.delete().where(user_stats.c.user_id.in_(bad_users)))
+                rows = [dict(zip(USER_COLUMNS, expected_users[u]), user_id=u, last_updated=datetime.utcnow())
+                        for u in bad_users if u in expected_users]
+                if rows:
+                    conn.execute(user_stats.insert(), rows)
+            category_users = sorted({user_id for user_id, _ in bad_categories})
+            if category_users:
+                conn.execute(category_stats.delete().where(category_stats.c.user_id.in_(category_users)))
+                rows = [dict(zip(CATEGORY_COLUMNS, values), user_id=u, category=c, last_updated=datetime.utcnow())
+                        for (u, c), values in expected_categories.items() if u in category_users]
+                if rows:
+                    conn.execute(category_stats.insert(), rows)
+            if bad_levels:
+                conn.execute(
+                    sa.update(users).where(users.c.user_id == sa.bindparam('uid'))
+                    .values(vulnerability_level=sa.bindparam('level')),
+                    [{'uid': u, 'level': expected_levels[u]} for u in bad_levels])
+
+    for line in examples:
+        log(f'  {line}')
+    return found
@@ -0,0 +1,244 @@
+"""
+Campaign email tracking (opens, clicks and reports)
+
+The tracking endpoints (app/tracking_routes.py) don't touch the database: a
+hit is one line appended to a local log segment, so a burst when a campaign
+lands costs each request a signature check and a write() call.
+
+Segments are per worker process and per TRACKING_SEGMENT_SECONDS time slot
+(`<slot>-<pid>.log` in TRACKING_LOG_DIR). A slot after the one a segment
+belongs to, no worker writes to it again, so `flask campaigns ingest` can read and then
+delete them without coordinating with the workers. Per batch of up to
+TRACKING_INGEST_BATCH lines the ingester:
+- keeps each target's first open, click and report (repeats are dropped,
+  also against events already in campaign_events)
+- finds the shard each target lives on and inserts the new events there with
+  executemany
+- rolls them into campaign_targets with one set-based UPDATE: Sent -> Opened
+  -> Clicked (never backwards), interacted_at = the target's first event
+- adds them to the results cube (services/campaign_results.py) per the
+  target user's department / team and the day of the event
+
+Reports come from the report endpoint a mail client's "report phishing"
+button calls, and from campaign links pasted into the report form; they
+don't change the target's status.
+
+Re-ingesting a segment (the ingester died before deleting it) is harmless:
+the unique (target_id, event_type) key drops what was already written.
+Tokens in the links are the target id with an HMAC of it (SECRET_KEY), so
+ids can't be enumerated to fake clicks.
+
+Config:
+    TRACKING_LOG_DIR          where workers append hits (must be local to the host)
+    TRACKING_SEGMENT_SECONDS  length of a segment's time slot
+    TRACKING_INGEST_BATCH     hits per database batch
+    TRACKING_INGEST_INTERVAL  seconds the ingester sleeps between passes
+"""
+import hashlib
+import hmac
+import os
+import re
+import time
+from collections import Counter
+from datetime import datetime
+from threading import Lock
+import sqlalchemy as sa
+from flask import current_app
+from app.services.campaign_results import cell, add as add_results, EVENT_MEASURES
+
+EVENT_TYPES = ('open', 'click', 'report')
+TRACKED_STATUSES = ('Opened', 'Clicked')  # statuses a tracking event moves a target to
+
+TOKEN_PATTERN = re.compile(r'/c/(\d+-[0-9a-f]{16})')
+
+def _tables():
+    from app.models import CampaignTarget, CampaignEvent, User
+    return CampaignTarget.__table__, CampaignEvent.__table__, User.__table__
+
+def _signature(target_id):
+    key = current_app.config['SECRET_KEY'].encode()
+    return hmac.new(key, str(target_id).encode(), hashlib.sha256).hexdigest()[:16]
+
+def make_token(target_id):
+    return f'{target_id}-{_signature(target_id)}'
+
+def parse_token(token):
+    """target_id of a valid token, else None"""
+    target_id, _, signature = token.partition('-')
+    if not target_id.isdigit() or not hmac.compare_digest(signature, _signature(int(target_id))):
+        return None
+    return int(target_id)
+
+def tokens_in(text):
+    """Valid campaign tokens in links found in text (e.g. a forwarded email)"""
+    return {target_id for target_id in map(parse_token, TOKEN_PATTERN.findall(text or '')) if target_id is not None}
+
+def _clean(value, limit):
+    return (value or '').replace('\t', ' ').replace('\n', ' ').replace('\r', ' ')[:limit]
+
+class TrackingLog:
+    def __init__(self):
+        self._lock = Lock()
+        self._fd = None
+        self._segment = None  # (directory, slot, pid) the open fd belongs to
+
+    def init_app(self, app):
+        app.config.setdefault('TRACKING_LOG_DIR', os.path.join(app.instance_path, 'tracking'))
+        app.config.setdefault('TRACKING_SEGMENT_SECONDS', 5)
+        app.config.setdefault('TRACKING_INGEST_BATCH', 5000)
+        app.config.setdefault('TRACKING_INGEST_INTERVAL', 2.0)
+
+    # --- Request side ---
+
+    def record(self, event_type, target_id, ip_address=None, user_agent=None):
+        """Append one hit to this process's current segment"""
+        now = time.time()
+        line = (f'{event_type}\t{target_id}\t{now:.3f}\t{_clean(ip_address, 45)}\t'
+                f'{_clean(user_agent, 255)}\n').encode('utf-8', 'replace')
+        config = current_app.config
+        segment = (config['TRACKING_LOG_DIR'], int(now // config['TRACKING_SEGMENT_SECONDS']), os.getpid())
+        with self._lock:
+            if segment != self._segment:
+                self._open(segment)
+            os.write(self._fd, line)  # one O_APPEND write per line: lines from threads never interleave
+
+    def _open(self, segment):
+        directory, slot, pid = segment
+        if self._fd is not None and self._segment[2] == pid:
+            os.close(self._fd)  # after a fork the fd is the parent's: leave it to the parent
+        os.makedirs(directory, exist_ok=True)
+        self._fd = os.open(os.path.join(directory, f'{slot}-{pid}.log'), os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+        self._segment = segment
+
+    # --- Ingestion ---
+
+    def closed_segments(self):
+        """Segment paths whose time slot ended at least one slot ago (no write can still be in flight), oldest first"""
+        config = current_app.config
+        directory = config['TRACKING_LOG_DIR']
+        if not os.path.isdir(directory):
+            return []
+        current = int(time.time() // config['TRACKING_SEGMENT_SECONDS'])
+        ready = []
+        for name in os.listdir(directory):
+            slot = name.split('-', 1)[0]
+            if name.endswith('.log') and slot.isdigit() and int(slot) < current - 1:
+                ready.append((int(slot), os.path.join(directory, name)))
+        return [path for _, path in sorted(ready)]
+
+    def run(self, once=False, log=print):
+        while True:
+            totals = self.ingest(log=log)
+            if once:
+                return totals
+            if not totals['lines']:
+                time.sleep(current_app.config['TRACKING_INGEST_INTERVAL'])
+
+    def ingest(self, log=print):
+        """Load every closed segment; returns {'lines', 'inserted', 'duplicates', 'unknown', 'updated'}"""
+        totals = {'lines': 0, 'inserted': 0, 'duplicates': 0, 'unknown': 0, 'updated': 0}
+        paths = self.closed_segments()
+        batch_size = current_app.config['TRACKING_INGEST_BATCH']
+        batch, done = [], []
+        for path in paths:
+            with open(path, 'rb') as f:
+                for raw in f:
+                    event = self._parse(raw)
+                    if event is not None:
+                        batch.append(event)
+            done.append(path)
+            if len(batch) >= batch_size:
+                self._flush(batch, totals)
+                self._remove(done)
+                batch, done = [], []
+        if batch:
+            self._flush(batch, totals)
+        self._remove(done)
+        if totals['lines']:
+            log(f"ingested {totals['lines']} hits: {totals['inserted']} new events, {totals['duplicates']} repeats, "
+                f"{totals['unknown']} unknown targets, {totals['updated']} targets updated")
+        return totals
+
+    @staticmethod
+    def _parse(raw):
+        parts = raw.decode('utf-8', 'replace').rstrip('\n').split('\t')
+        if len(parts) != 5 or parts[0] not in EVENT_TYPES or not parts[1].isdigit():
+            return None  # torn or foreign line
+        try:
+            occurred_at = datetime.utcfromtimestamp(float(parts[2]))
+        except ValueError:
+            return None
+        return parts[0], int(parts[1]), occurred_at, parts[3] or None, parts[4] or None
+
+    @staticmethod
+    def _remove(paths):
+        for path in paths:
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+
+    def _flush(self, events, totals):
+        totals['lines'] += len(events)
+        first = {}
+        for event in events:
+            key = (event[1], event[0])
+            if key not in first or event[2] < first[key][2]:
+                first[key] = event
+        totals['duplicates'] += len(events) - len(first)
+
+        from app.services.sharding import shard_router
+        remaining = {target_id for target_id, _ in first}
+        for name in shard_router.names():
+            if not remaining:
+                break
+            engine = shard_router.engine(name)
+            with engine.begin() as conn:
+                inserted, updated, found = self._apply(conn, first, remaining)
+            remaining -= found
+            totals['inserted'] += inserted
+            totals['duplicates'] += sum(1 for target_id, _ in first if target_id in found) - inserted
+            totals['updated'] += updated
+        totals['unknown'] += sum(1 for target_id, _ in first if target_id in remaining)
+
+    @staticmethod
+    def _apply(conn, first, remaining):
+        """Write the events of the targets this database holds; returns (inserted, updated, target ids found)"""
+        targets, events, users = _tables()
+        # target_id -> (campaign_id, dept_id, team_id) for the results cube
+        campaigns = {target_id: tuple(rest) for target_id, *rest in conn.execute(
+            sa.select(targets.c.target_id, targets.c.campaign_id, users.c.dept_id, users.c.team_id)
+            .join(users, users.c.user_id == targets.c.user_id).where(targets.c.target_id.in_(remaining)))}
+        if not campaigns:
+            return 0, 0, set()
+        existing = set(conn.execute(sa.select(events.c.target_id, events.c.event_type)
+                                    .where(events.c.target_id.in_(campaigns))).all())
+        rows = [{'campaign_id': campaigns[target_id][0], 'target_id': target_id, 'event_type': event_type,
+                 'occurred_at': occurred_at, 'ip_address': ip, 'user_agent': agent}
+                for (target_id, _), (event_type, _, occurred_at, ip, agent) in first.items()
+                if target_id in campaigns and (target_id, event_type) not in existing]
+        if not rows:
+            return 0, 0, set(campaigns)
+        conn.execute(events.insert(), rows)
+        add_results(conn, Counter((cell(*campaigns[row['target_id']], row['occurred_at'].date()),
+                                   EVENT_MEASURES[row['event_type']]) for row in rows))
+
+        touched = sorted({row['target_id'] for row in rows if row['event_type'] != 'report'})
+        if not touched:
+            return len(rows), 0, set(campaigns)
+        clicked = sorted({row['target_id'] for row in rows if row['event_type'] == 'click'})
+        first_event = (sa.select(sa.func.min(events.c.occurred_at))
+                       .where(events.c.target_id == targets.c.target_id, events.c.event_type != 'report')
+                       .scalar_subquery())
+        is_click = targets.c.target_id.in_(clicked) if clicked else sa.false()
+        updated = conn.execute(
+            sa.update(targets)
+            .where(targets.c.target_id.in_(touched),
+                   sa.or_(targets.c.status.notin_(TRACKED_STATUSES),
+                          sa.and_(targets.c.status == 'Opened', is_click)))
+            .values(status=sa.case((is_click, 'Clicked'), else_='Opened'),
+                    interacted_at=sa.func.coalesce(targets.c.interacted_at, first_event))
+        ).rowcount
+        return len(rows), updated, set(campaigns)
+
+tracking_log = TrackingLog()
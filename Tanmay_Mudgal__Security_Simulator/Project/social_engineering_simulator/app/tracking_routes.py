@@ -0,0 +1,43 @@
+from flask import Blueprint, request, render_template, make_response, jsonify
+from app import limiter, csrf
+from app.services.tracking_events import tracking_log, parse_token
+
+tracking_bp = Blueprint('tracking', __name__)
+
+# 1x1 transparent GIF
+PIXEL = (b'GIF89a\x01\x00\x01\x00\x80\x00\x00\x00\x00\x00\xff\xff\xff!\xf9\x04\x01\x00\x00\x00\x00'
+         b',\x00\x00\x00\x00\x01\x00\x01\x00\x00\x02\x02D\x01\x00;')
+
+def _record(event_type, token):
+    # Appended to the local tracking log only; `flask campaigns ingest` writes it to the database
+    target_id = parse_token(token)
+    if target_id is not None:
+        tracking_log.record(event_type, target_id, request.remote_addr, request.headers.get('User-Agent'))
+
+@tracking_bp.route('/c/<token>')
+@limiter.exempt
+def campaign_click(token):
+    """Phishing link of a campaign email: count the click, show what gave it away"""
+    _record('click', token)
+    response = make_response(render_template('campaign_landing.html'))
+    response.headers['Cache-Control'] = 'no-store'
+    return response
+
+@tracking_bp.route('/c/<token>/o.gif')
+@limiter.exempt
+def campaign_open(token):
+    """Tracking pixel of a campaign email"""
+    _record('open', token)
+    response = make_response(PIXEL)
+    response.headers['Content-Type'] = 'image/gif'
+    response.headers['Cache-Control'] = 'no-store, max-age=0'
+    return response
+
+
+@tracking_bp.route('/c/<token>/report', methods=['POST'])
+@limiter.exempt
+@csrf.exempt
+def campaign_report(token):
+    """Called by a mail client's "report phishing" button with the token from the email's links"""
+    _record('report', token)
+    return jsonify({'success': True})
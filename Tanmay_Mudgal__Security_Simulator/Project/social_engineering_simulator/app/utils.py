@@ -2,6 +2,8 @@ from functools import wraps
 from flask import session, request, flash, redirect, url_for, current_app
 from app import db
 from app.models import User, Role, Permission, UserRole, RolePermission, AuditLog, Notification, NotificationType
+from app.services.request_metrics import metrics
+from app.services.reference_data import reference_data
 from datetime import datetime
 import json
 
@@ -21,16 +23,9 @@ def user_has_permission(user_id, permission_name):
         if not role_ids:
             return False
             
-        # Get permissions for these roles
-        # Join RolePermission and Permission tables
-        permissions = db.session.query(Permission).join(
-            RolePermission, RolePermission.permission_id == Permission.permission_id
-        ).filter(
-            RolePermission.role_id.in_(role_ids),
-            Permission.permission_name == permission_name
-        ).first()
-        
-        return permissions is not None
+        # Role -> permission grants come from the reference cache
+        return any(role and permission_name in role.permissions
+                   for role in (reference_data.get(Role, role_id) for role_id in role_ids))
         
     except Exception as e:
         current_app.logger.error(f"Error checking permission {permission_name} for user {user_id}: {str(e)}")
@@ -76,6 +71,7 @@ def require_permission(permission_name):
 # AUDIT LOGGING UTILITIES
 # ==========================================
 
+@metrics.timed('audit_log_write_seconds')
 def log_audit(user_id, action_type, action_description, resource_type=None, resource_id=None, 
               status='success', severity='medium', error_message=None, old_value=None, new_value=None):
     """
@@ -125,13 +121,17 @@ def log_audit(user_id, action_type, action_description, resource_type=None, reso
 # NOTIFICATION UTILITIES
 # ==========================================
 
+@metrics.gauge('notification_queue_depth', 'Notifications still pending delivery/read')
+def notification_queue_depth():
+    return Notification.query.filter_by(status='pending').count()
+
 def create_notification(user_id, type_name, title, message, priority='medium', action_url=None, metadata=None):
     """
     Create a new notification for a user.
     """
     try:
         # Find notification type
-        notif_type = NotificationType.query.filter_by(type_name=type_name).first()
+        notif_type = reference_data.by_key(NotificationType, type_name)
         
         if not notif_type:
             # Create default type if not exists (fallback)
@@ -58,8 +58,8 @@ try:
         
         conn.commit()
         print("\n✅ Advanced SQL features applied successfully!")
-        print("   - 4 Triggers created")
-        print("   - 6 Views created")
+        print("   - 3 Triggers created")
+        print("   - 3 Views created")
         
 except Exception as e:
     print(f"❌ Error: {e}")
@@ -1,34 +1,18 @@
+"""
+Adds scenarios.steps_json and user_responses.response_json.
+Now versioned migration 0002 (migrations/versions/); this runs the pending
+migrations up to it and records them. Prefer `flask --app run migrations upgrade`.
+"""
 from app import create_app, db
-from sqlalchemy import text
+from app.services.migration_runner import MigrationRunner
 
 app = create_app()
 
 def migrate():
     with app.app_context():
         print("Starting migration...")
-        try:
-            # Using raw connection for DDL
-            with db.engine.connect() as conn:
-                # Add steps_json to scenarios
-                try:
-                    print("Adding steps_json to scenarios...")
-                    conn.execute(text("ALTER TABLE scenarios ADD COLUMN steps_json TEXT"))
-                    print("Success.")
-                except Exception as e:
-                    print(f"scenarios error (maybe exists): {e}")
-
-                # Add response_json to user_responses
-                try:
-                    print("Adding response_json to user_responses...")
-                    conn.execute(text("ALTER TABLE user_responses ADD COLUMN response_json TEXT"))
-                    print("Success.")
-                except Exception as e:
-                    print(f"user_responses error (maybe exists): {e}")
-                
-                conn.commit()
-            print("Migration process completed.")
-        except Exception as e:
-            print(f"Migration critical failure: {e}")
+        MigrationRunner(db.engine).upgrade('0002')
+        print("Migration process completed.")
 
 if __name__ == "__main__":
     migrate()
@@ -0,0 +1,177 @@
+"""
+Campaign delivery benchmark
+Creates an org with N users and one campaign targeting all of them in a
+temporary SQLite database, then runs the campaign dispatcher
+(services/campaign_scheduler.py) against a local SMTP sink that accepts and
+counts every message. Reports sends per second, checks that every target was
+sent exactly once, and pauses / resumes the campaign half-way.
+
+A second, smaller campaign is then dispatched on a simulated clock over a
+two-day window with 09:00-17:00 send hours in the org's timezone, to show the
+pacing: nothing goes out at night and about half is sent by the middle of the
+window's open time.
+
+Usage:
+    python benchmark_campaign_send.py
+    python benchmark_campaign_send.py --targets 100000 --batch-size 500 --json campaign.json
+"""
+import argparse
+import json
+import os
+import socketserver
+import tempfile
+import threading
+import time
+from collections import Counter
+from datetime import datetime, timedelta, timezone
+
+class SMTPSink(socketserver.ThreadingTCPServer):
+    """Just enough SMTP for smtplib: accepts every message and counts recipients"""
+    allow_reuse_address = True
+    daemon_threads = True
+
+    def __init__(self):
+        super().__init__(('127.0.0.1', 0), _SMTPHandler)
+        self.lock = threading.Lock()
+        self.recipients = Counter()
+        self.messages = 0
+
+class _SMTPHandler(socketserver.StreamRequestHandler):
+    def handle(self):
+        reply = self.wfile.write
+        reply(b'220 sink ESMTP\r\n')
+        recipients = []
+        while True:
+            line = self.rfile.readline()
+            if not line:
+                return
+            command = line[:4].upper()
+            if command == b'EHLO':
+                reply(b'250-sink\r\n250 8BITMIME\r\n')
+            elif command == b'RCPT':
+                recipients.append(line.split(b':', 1)[1].strip().strip(b'<>').decode())
+                reply(b'250 OK\r\n')
+            elif command == b'DATA':
+                reply(b'354 End data with <CR><LF>.<CR><LF>\r\n')
+                while self.rfile.readline() not in (b'.\r\n', b''):
+                    pass
+                with self.server.lock:
+                    self.server.messages += 1
+                    self.server.recipients.update(recipients)
+                recipients = []
+                reply(b'250 OK\r\n')
+            elif command == b'QUIT':
+                reply(b'221 Bye\r\n')
+                return
+            else:  # HELO, MAIL, RSET, NOOP
+                if command == b'RSET':
+                    recipients = []
+                reply(b'250 OK\r\n')
+
+def create_campaign(db, org_id, name, count, first_user):
+    """Users first_user.. and a Draft campaign targeting them; returns campaign_id"""
+    from app.models import User, Campaign, CampaignTarget
+    db.session.execute(User.__table__.insert(), [{
+        'user_id': first_user + i, 'username': f'bench{first_user + i}', 'email': f'bench{first_user + i}@example.com',
+        'password': 'x', 'org_id': org_id, 'account_type': 'Individual'
+    } for i in range(count)])
+    campaign = Campaign(org_id=org_id, name=name, type='Phishing', status='Draft')
+    db.session.add(campaign)
+    db.session.flush()
+    db.session.execute(CampaignTarget.__table__.insert(), [
+        {'campaign_id': campaign.campaign_id, 'user_id': first_user + i, 'status': 'Pending'} for i in range(count)])
+    db.session.commit()
+    return campaign.campaign_id
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--targets', type=int, default=50000)
+    parser.add_argument('--batch-size', type=int, default=500)
+    parser.add_argument('--pacing-targets', type=int, default=2000)
+    parser.add_argument('--timezone', default='Asia/Kolkata')
+    parser.add_argument('--json', help='Also write the results here')
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix='campaign_bench_')
+    os.environ['TEST_DATABASE_URL'] = 'sqlite:///' + os.path.join(workdir, 'bench.db')  # read when config is imported
+    from app import create_app, db
+    from app.models import Organization, Campaign
+    from app.services.campaign_scheduler import campaign_scheduler, org_timezone
+
+    sink = SMTPSink()
+    threading.Thread(target=sink.serve_forever, daemon=True).start()
+
+    app = create_app('testing')
+    app.config.update(
+        MAIL_SERVER='127.0.0.1', MAIL_PORT=sink.server_address[1], MAIL_SUPPRESS_SEND=False,
+        MAIL_DEFAULT_SENDER='alerts@example.com', CAMPAIGN_BATCH_SIZE=args.batch_size,
+        CAMPAIGN_RATE_PER_ORG=10 ** 9, CAMPAIGN_RATE_GLOBAL=10 ** 9)
+    results = {'targets': args.targets, 'batch_size': args.batch_size}
+    quiet = lambda *a: None
+
+    with app.app_context():
+        db.create_all()
+        org = Organization(name='Benchmark Org', timezone=args.timezone)
+        db.session.add(org)
+        db.session.commit()
+
+        # --- Throughput: as fast as the rate limits allow, paused half-way ---
+        campaign_id = create_campaign(db, org.org_id, 'Throughput', args.targets, 1)
+        campaign_scheduler.schedule(campaign_id)
+        engine = db.engine
+        started = time.perf_counter()
+        paused = False
+        while True:
+            sent = campaign_scheduler.dispatch_once(log=quiet)
+            done = campaign_scheduler.progress(engine, campaign_id).get('Sent', 0)
+            if not paused and done >= args.targets // 2:
+                campaign_scheduler.pause(campaign_id)
+                assert campaign_scheduler.dispatch_once(log=quiet) == 0, 'paused campaign was dispatched'
+                campaign_scheduler.resume(campaign_id)
+                paused = True
+            if not sent:
+                break
+        elapsed = time.perf_counter() - started
+        campaign_scheduler.dispatch_once(log=quiet)  # marks it Completed
+
+        counts = campaign_scheduler.progress(engine, campaign_id)
+        status = db.session.get(Campaign, campaign_id).status
+        results.update(seconds=round(elapsed, 2), per_second=round(args.targets / elapsed),
+                       sink_messages=sink.messages, duplicates=sum(1 for n in sink.recipients.values() if n > 1),
+                       statuses=counts, campaign_status=status)
+        print(f'{args.targets} targets in {elapsed:.1f}s ({args.targets / elapsed:.0f}/s), '
+              f'batch {args.batch_size}; sink got {sink.messages}, '
+              f"{results['duplicates']} duplicates; targets {counts}; campaign {status}")
+        assert sink.messages == args.targets and not results['duplicates'] and counts == {'Sent': args.targets}
+
+        # --- Pacing: two-day window, 09:00-17:00 local, simulated clock ---
+        pacing_id = create_campaign(db, org.org_id, 'Pacing', args.pacing_targets, args.targets + 1)
+        start = datetime.utcnow().replace(minute=0, second=0, microsecond=0)
+        campaign_scheduler.schedule(pacing_id, start=start, window_hours=48, send_hours='09:00-17:00')
+        tz = org_timezone(args.timezone)
+        night_sends, curve = 0, []
+        clock = start
+        while clock <= start + timedelta(hours=49):
+            before = campaign_scheduler.progress(engine, pacing_id).get('Sent', 0)
+            while campaign_scheduler.dispatch_once(now=clock, log=quiet):
+                pass
+            after = campaign_scheduler.progress(engine, pacing_id).get('Sent', 0)
+            local = clock.replace(tzinfo=timezone.utc).astimezone(tz)
+            if after > before and not 9 <= local.hour < 17:
+                night_sends += after - before
+            curve.append((clock.isoformat(timespec='minutes'), local.strftime('%a %H:%M'), after))
+            clock += timedelta(minutes=30)
+        results['pacing'] = {'night_sends': night_sends, 'curve': curve}
+        print(f'pacing: {args.pacing_targets} targets over 48h at 09:00-17:00 {args.timezone}; '
+              f'{night_sends} sent outside send hours')
+        for utc, local, sent in curve[::4]:
+            print(f'  {utc} UTC ({local} local): {sent:>6} sent')
+        assert night_sends == 0 and curve[-1][2] == args.pacing_targets
+
+    sink.shutdown()
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(results, f, indent=2)
+
+if __name__ == '__main__':
+    main()
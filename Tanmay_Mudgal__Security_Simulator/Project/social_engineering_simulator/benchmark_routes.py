@@ -0,0 +1,244 @@
+"""
+Route-level benchmark harness
+Drives the hot routes (dashboard, get_scenario, submit_response, leaderboard,
+org_dashboard, view_path) through the Flask test client and reports
+throughput and latency percentiles per route.
+
+Usage:
+    # TestingConfig (in-memory SQLite), generating a tenant first
+    python benchmark_routes.py --users 5000 --responses 200000
+
+    # Local MySQL already loaded with generate_tenant_data.py
+    python benchmark_routes.py --config development --tag bench1a2b3c
+
+    # Regression gate: fail if any route's p99 grew more than 20%
+    python benchmark_routes.py --json current.json --baseline previous.json --max-regression 0.2
+"""
+import argparse
+import json
+import os
+import random
+import sys
+import threading
+import time
+from datetime import datetime
+
+ROUTES = ['dashboard', 'get_scenario', 'submit_response', 'leaderboard', 'org_dashboard', 'view_path']
+
+def percentile(sorted_values, q):
+    """Nearest-rank percentile of an already sorted list"""
+    if not sorted_values:
+        return 0.0
+    rank = max(1, int(round(q * len(sorted_values) + 0.5)))
+    return sorted_values[min(rank, len(sorted_values)) - 1]
+
+class RouteBenchmark:
+    """Issues requests for one route as randomly chosen users and records latencies"""
+
+    def __init__(self, app, tenant, seed=0):
+        self.app = app
+        self.tenant = tenant
+        self.rng = random.Random(seed)
+
+    def _request(self, client, route):
+        """Return (user_id, callable issuing the request) for one iteration"""
+        t = self.tenant
+        rng = self.rng
+        if route == 'dashboard':
+            return rng.choice(t['learner_ids']), lambda: client.get('/dashboard')
+        if route == 'get_scenario':
+            # Pro users skip the weekly quota, so every call does the full recommendation
+            return rng.choice(t['pro_learner_ids'] or t['learner_ids']), lambda: client.get('/get-scenario')
+        if route == 'submit_response':
+            scenario_id, _, correct_answer = rng.choice(t['scenarios'])
+            payload = {
+                'scenario_id': scenario_id,
+                'response': correct_answer if rng.random() < 0.6 else 'wrong answer',
+                'response_time': rng.randint(5, 120)
+            }
+            return rng.choice(t['learner_ids']), lambda: client.post('/submit-response', json=payload)
+        if route == 'leaderboard':
+            return rng.choice(t['learner_ids']), lambda: client.get('/leaderboard')
+        if route == 'org_dashboard':
+            return t['largest_org_admin_id'], lambda: client.get('/admin/org')
+        if route == 'view_path':
+            return rng.choice(t['learner_ids']), lambda: client.get(f"/learning-path/{t['path_id']}")
+        raise ValueError(f'Unknown route: {route}')
+
+    def _run_worker(self, route, iterations, latencies, statuses):
+        client = self.app.test_client()
+        for _ in range(iterations):
+            user_id, issue = self._request(client, route)
+            with client.session_transaction() as sess:
+                sess['user_id'] = user_id
+            started = time.perf_counter()
+            response = issue()
+            latencies.append(time.perf_counter() - started)
+            statuses[response.status_code] = statuses.get(response.status_code, 0) + 1
+
+    def run(self, route, requests, warmup=5, concurrency=1):
+        # Warm caches / lazy imports outside the measured window
+        self._run_worker(route, warmup, [], {})
+
+        latencies, statuses = [], {}
+        per_worker = max(1, requests // concurrency)
+        started = time.perf_counter()
+        if concurrency == 1:
+            self._run_worker(route, per_worker, latencies, statuses)
+        else:
+            workers = [threading.Thread(target=self._run_worker, args=(route, per_worker, latencies, statuses))
+                       for _ in range(concurrency)]
+            for w in workers:
+                w.start()
+            for w in workers:
+                w.join()
+        wall = time.perf_counter() - started
+
+        latencies.sort()
+        errors = sum(count for status, count in statuses.items() if status >= 400)
+        return {
+            'route': route,
+            'requests': len(latencies),
+            'errors': errors,
+            'statuses': {str(k): v for k, v in sorted(statuses.items())},
+            'throughput_rps': round(len(latencies) / wall, 1) if wall else 0.0,
+            'mean_ms': round(sum(latencies) / len(latencies) * 1000, 2) if latencies else 0.0,
+            'p50_ms': round(percentile(latencies, 0.50) * 1000, 2),
+            'p90_ms': round(percentile(latencies, 0.90) * 1000, 2),
+            'p99_ms': round(percentile(latencies, 0.99) * 1000, 2),
+            'max_ms': round(latencies[-1] * 1000, 2) if latencies else 0.0
+        }
+
+def load_tenant(tag):
+    """Rebuild the ids the benchmark needs from an existing generated tenant"""
+    from app.models import User, Scenario, LearningPath, Organization
+    from generate_tenant_data import SCENARIO_TYPES
+
+    users = User.query.filter(User.username.like(f'{tag}\\_u%', escape='\\')).order_by(User.user_id).all()
+    if not users:
+        raise SystemExit(f"No users found for tag '{tag}'. Run generate_tenant_data.py first.")
+    org_count = Organization.query.filter(Organization.name.like(f'{tag} Org %')).count()
+    org_admins, learners = users[:org_count], users[org_count:]
+    path = LearningPath.query.first()
+    return {
+        'tag': tag,
+        'counts': {},
+        'org_admin_ids': [u.user_id for u in org_admins],
+        'largest_org_admin_id': org_admins[0].user_id if org_admins else None,
+        'learner_ids': [u.user_id for u in learners],
+        'pro_learner_ids': [u.user_id for u in learners if u.subscription_tier == 'pro'],
+        'scenarios': [(s.scenario_id, s.scenario_type, s.correct_answer)
+                      for s in Scenario.query.filter(Scenario.scenario_type.in_(SCENARIO_TYPES)).all()],
+        'path_id': path.path_id if path else None
+    }
+
+def compare(results, baseline_path, max_regression):
+    """Print p99 deltas against a previous --json run; return routes that regressed"""
+    with open(baseline_path) as f:
+        baseline = {r['route']: r for r in json.load(f)['results']}
+
+    regressed = []
+    print(f"\nComparison with {baseline_path} (p99, allowed +{max_regression * 100:.0f}%)")
+    for r in results:
+        before = baseline.get(r['route'])
+        if not before or not before['p99_ms']:
+            continue
+        change = (r['p99_ms'] - before['p99_ms']) / before['p99_ms']
+        flag = 'REGRESSION' if change > max_regression else ''
+        print(f"  {r['route']:<16} {before['p99_ms']:>9.2f} -> {r['p99_ms']:>9.2f} ms  ({change * 100:+.1f}%) {flag}")
+        if flag:
+            regressed.append(r['route'])
+    return regressed
+
+def print_table(results):
+    print(f"\n{'route':<16} {'reqs':>6} {'err':>5} {'req/s':>8} {'mean':>9} {'p50':>9} {'p90':>9} {'p99':>9} {'max':>9}")
+    for r in results:
+        print(f"{r['route']:<16} {r['requests']:>6} {r['errors']:>5} {r['throughput_rps']:>8} "
+              f"{r['mean_ms']:>9} {r['p50_ms']:>9} {r['p90_ms']:>9} {r['p99_ms']:>9} {r['max_ms']:>9}")
+    print("(latencies in ms)")
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark hot routes against a generated tenant')
+    parser.add_argument('--config', default='testing', help='Config name; testing = in-memory SQLite')
+    parser.add_argument('--database-url', help='Override TestingConfig database (e.g. sqlite:////tmp/bench.db)')
+    parser.add_argument('--tag', help='Benchmark an existing generated tenant instead of generating one')
+    parser.add_argument('--routes', default=','.join(ROUTES), help='Comma-separated subset of: ' + ', '.join(ROUTES))
+    parser.add_argument('--requests', type=int, default=200, help='Measured requests per route')
+    parser.add_argument('--warmup', type=int, default=5)
+    parser.add_argument('--concurrency', type=int, default=1, help='Client threads (forced to 1 on in-memory SQLite)')
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--json', dest='json_out', help='Write results to this file')
+    parser.add_argument('--baseline', help='Previous --json output to compare p99 against')
+    parser.add_argument('--max-regression', type=float, default=0.2)
+    # Generator sizing (ignored with --tag)
+    parser.add_argument('--orgs', type=int, default=5)
+    parser.add_argument('--users', type=int, default=2000)
+    parser.add_argument('--responses', type=int, default=50000)
+    parser.add_argument('--audit-rows', type=int, default=20000)
+    parser.add_argument('--notifications', type=int, default=10000)
+    args = parser.parse_args()
+
+    if args.database_url:
+        os.environ['TEST_DATABASE_URL'] = args.database_url
+    # Keep profiling overhead out of the measurements
+    os.environ.setdefault('SQL_PROFILER_SAMPLE_RATE', '0')
+
+    from app import create_app, db
+    from generate_tenant_data import generate
+
+    app = create_app(args.config)
+    app.config['WTF_CSRF_ENABLED'] = False
+    app.config['RATELIMIT_ENABLED'] = False
+
+    routes = [r.strip() for r in args.routes.split(',') if r.strip()]
+    unknown = set(routes) - set(ROUTES)
+    if unknown:
+        parser.error(f"Unknown routes: {', '.join(sorted(unknown))}")
+
+    with app.app_context():
+        db.engine.echo = False
+        db.create_all()  # create_app no longer does this; a fresh in-memory DB needs it
+        in_memory = db.engine.url.get_backend_name() == 'sqlite' and db.engine.url.database in (None, '', ':memory:')
+        concurrency = 1 if in_memory else args.concurrency
+
+        if args.tag:
+            tenant = load_tenant(args.tag)
+        else:
+            started = time.perf_counter()
+            tenant = generate(orgs=args.orgs, users=args.users, responses=args.responses,
+                              audit_rows=args.audit_rows, notifications=args.notifications, seed=args.seed)
+            print(f"Generated tenant '{tenant['tag']}' in {time.perf_counter() - started:.1f}s: "
+                  + ', '.join(f'{k}={v:,}' for k, v in tenant['counts'].items()))
+
+        # Requests get their own app context from the test client; release this one's connection
+        db.session.remove()
+
+    bench = RouteBenchmark(app, tenant, seed=args.seed)
+    results = []
+    for route in routes:
+        result = bench.run(route, args.requests, warmup=args.warmup, concurrency=concurrency)
+        results.append(result)
+        print(f"  {route:<16} done ({result['throughput_rps']} req/s, p99 {result['p99_ms']} ms)")
+
+    print_table(results)
+
+    if args.json_out:
+        with open(args.json_out, 'w') as f:
+            json.dump({
+                'run_at': datetime.utcnow().isoformat(),
+                'config': args.config,
+                'database': str(app.config['SQLALCHEMY_DATABASE_URI']).split('@')[-1],
+                'concurrency': concurrency,
+                'tenant': {'tag': tenant['tag'], 'counts': tenant['counts']},
+                'results': results
+            }, f, indent=2)
+        print(f"\nResults written to {args.json_out}")
+
+    if args.baseline:
+        regressed = compare(results, args.baseline, args.max_regression)
+        if regressed:
+            print(f"\np99 regression in: {', '.join(regressed)}")
+            sys.exit(1)
+
+if __name__ == '__main__':
+    main()
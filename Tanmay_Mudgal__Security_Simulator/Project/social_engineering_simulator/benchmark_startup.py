@@ -0,0 +1,136 @@
+"""
+Startup-time benchmark
+Measures, in fresh interpreter processes, how long it takes to import the
+app package, run create_app(), and warm up the lazily loaded ML/NLP
+artifacts. Also lists the slowest imports (python -X importtime).
+
+Usage:
+    python benchmark_startup.py                     # 5 runs, TestingConfig
+    python benchmark_startup.py --runs 10 --json startup.json
+    python benchmark_startup.py --baseline startup.json --max-regression 0.2
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+PROJECT_DIR = os.path.dirname(os.path.abspath(__file__))
+
+CHILD = r'''
+import json, sys, time
+started = time.perf_counter()
+import app
+imported = time.perf_counter()
+from app import create_app
+flask_app = create_app(sys.argv[1])
+created = time.perf_counter()
+from app.cli import warm_up
+warm = warm_up(flask_app)
+warmed = time.perf_counter()
+heavy = [m for m in ('sklearn', 'numpy', 'flask_mail', 'stripe', 'requests') if m in sys.modules]
+print(json.dumps({
+    'import_app': imported - started,
+    'create_app': created - imported,
+    'warmup': warmed - created,
+    'warmup_ml_model': warm['ml_model'],
+    'warmup_chatbot_index': warm['chatbot_index'],
+    'heavy_modules_after_warmup': heavy
+}))
+'''
+
+# Which heavy modules are loaded once create_app() returns (should be none)
+CHILD_LOADED = r'''
+import json, sys
+from app import create_app
+create_app(sys.argv[1])
+print(json.dumps([m for m in ('sklearn', 'numpy', 'flask_mail', 'stripe', 'requests') if m in sys.modules]))
+'''
+
+PHASES = ['import_app', 'create_app', 'warmup']
+
+def _run_child(code, config_name, extra_args=()):
+    env = dict(os.environ)
+    env.setdefault('WARMUP_ON_STARTUP', 'False')  # measure warmup separately
+    return subprocess.run(
+        [sys.executable, *extra_args, '-c', code, config_name],
+        cwd=PROJECT_DIR, env=env, capture_output=True, text=True, check=True
+    )
+
+def slowest_imports(config_name, top):
+    """Top-N modules by cumulative import time during import + create_app"""
+    proc = _run_child(CHILD_LOADED, config_name, extra_args=('-X', 'importtime'))
+    rows = []
+    for line in proc.stderr.splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        _, cumulative_us, name = line[len('import time:'):].split('|')
+        name = name[1:]  # nested imports are indented further
+        if not name.startswith(' '):
+            rows.append((int(cumulative_us), name))
+    rows.sort(reverse=True)
+    return rows[:top]
+
+def main():
+    parser = argparse.ArgumentParser(description='Measure app import / create_app / warmup time')
+    parser.add_argument('--config', default='testing')
+    parser.add_argument('--runs', type=int, default=5)
+    parser.add_argument('--top-imports', type=int, default=10)
+    parser.add_argument('--json', dest='json_out')
+    parser.add_argument('--baseline', help='Previous --json output to compare medians against')
+    parser.add_argument('--max-regression', type=float, default=0.2)
+    args = parser.parse_args()
+
+    samples = {phase: [] for phase in PHASES}
+    for i in range(args.runs):
+        result = json.loads(_run_child(CHILD, args.config).stdout.strip().splitlines()[-1])
+        for phase in PHASES:
+            samples[phase].append(result[phase])
+        print(f"  run {i + 1}: " + ', '.join(f'{p}={result[p] * 1000:.0f}ms' for p in PHASES))
+
+    loaded = json.loads(_run_child(CHILD_LOADED, args.config).stdout.strip().splitlines()[-1])
+
+    summary = {
+        phase: {
+            'median_ms': round(statistics.median(values) * 1000, 1),
+            'min_ms': round(min(values) * 1000, 1),
+            'max_ms': round(max(values) * 1000, 1)
+        } for phase, values in samples.items()
+    }
+
+    print(f"\n{'phase':<12} {'median':>9} {'min':>9} {'max':>9}")
+    for phase, s in summary.items():
+        print(f"{phase:<12} {s['median_ms']:>9} {s['min_ms']:>9} {s['max_ms']:>9}")
+    print("(ms)")
+    print(f"\nHeavy modules loaded by create_app(): {', '.join(loaded) or 'none'}")
+
+    print(f"\nSlowest top-level imports during create_app (cumulative):")
+    for cumulative_us, name in slowest_imports(args.config, args.top_imports):
+        print(f"  {name:<28} {cumulative_us / 1000:>8.1f} ms")
+
+    if args.json_out:
+        with open(args.json_out, 'w') as f:
+            json.dump({'config': args.config, 'runs': args.runs, 'phases': summary,
+                       'heavy_modules_loaded': loaded}, f, indent=2)
+        print(f"\nResults written to {args.json_out}")
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)['phases']
+        regressed = []
+        print(f"\nComparison with {args.baseline} (median, allowed +{args.max_regression * 100:.0f}%)")
+        for phase, s in summary.items():
+            before = baseline.get(phase, {}).get('median_ms')
+            if not before:
+                continue
+            change = (s['median_ms'] - before) / before
+            flag = 'REGRESSION' if change > args.max_regression else ''
+            print(f"  {phase:<12} {before:>9.1f} -> {s['median_ms']:>9.1f} ms  ({change * 100:+.1f}%) {flag}")
+            if flag:
+                regressed.append(phase)
+        if regressed:
+            sys.exit(1)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,192 @@
+"""
+Campaign tracking load test
+Creates a campaign with N sent targets in a temporary SQLite database, then
+hammers the open-pixel and click endpoints (app/tracking_routes.py) from
+several threads for a while, with repeated opens and clicks the way mail
+clients and impatient users produce them. The ingester
+(services/tracking_events.py) runs alongside, as `flask campaigns ingest`
+would. Reports sustained hits per second at the endpoints and events per
+second through the ingester, then checks campaign_events, the target
+statuses and the results cube against what was sent.
+
+Hits go through the WSGI app in-process (no HTTP server), so the rate is what
+the Python side of one process can sustain; --url sends them to a running
+deployment instead (e.g. gunicorn with several workers) and skips the checks.
+
+Usage:
+    python benchmark_tracking_events.py
+    python benchmark_tracking_events.py --targets 20000 --threads 16 --seconds 20
+    python benchmark_tracking_events.py --url http://127.0.0.1:8000 --tokens tokens.txt
+"""
+import argparse
+import http.client
+import json
+import os
+import random
+import tempfile
+import threading
+import time
+from urllib.parse import urlsplit
+
+def hit_paths(tokens, rng, click_rate):
+    """Endless stream of tracking paths: every target opens, some click, both repeat"""
+    while True:
+        token = rng.choice(tokens)
+        yield f'/c/{token}/o.gif'
+        if rng.random() < click_rate:
+            yield f'/c/{token}'
+
+def worker(send, tokens, seed, click_rate, stop, counts, index):
+    rng = random.Random(seed)
+    n = 0
+    for path in hit_paths(tokens, rng, click_rate):
+        if stop.is_set():
+            break
+        send(path)
+        n += 1
+    counts[index] = n
+
+def run_load(make_sender, tokens, threads, seconds, click_rate):
+    stop = threading.Event()
+    counts = [0] * threads
+    pool = [threading.Thread(target=worker, args=(make_sender(), tokens, i, click_rate, stop, counts, i))
+            for i in range(threads)]
+    started = time.perf_counter()
+    for t in pool:
+        t.start()
+    time.sleep(seconds)
+    stop.set()
+    for t in pool:
+        t.join()
+    return sum(counts), time.perf_counter() - started
+
+def http_sender(url):
+    parts = urlsplit(url)
+
+    def make():
+        conn = http.client.HTTPConnection(parts.hostname, parts.port or 80)
+
+        def send(path):
+            conn.request('GET', parts.path.rstrip('/') + path)
+            conn.getresponse().read()
+        return send
+    return make
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--targets', type=int, default=10000)
+    parser.add_argument('--threads', type=int, default=8)
+    parser.add_argument('--seconds', type=float, default=10)
+    parser.add_argument('--click-rate', type=float, default=0.3, help='Clicks per open')
+    parser.add_argument('--url', help='Send hits to this running server instead of in-process')
+    parser.add_argument('--tokens', help='With --url: file of target tokens, one per line')
+    parser.add_argument('--json', help='Also write the results here')
+    args = parser.parse_args()
+
+    if args.url:
+        with open(args.tokens) as f:
+            tokens = [line.strip() for line in f if line.strip()]
+        hits, elapsed = run_load(http_sender(args.url), tokens, args.threads, args.seconds, args.click_rate)
+        print(f'{hits} hits in {elapsed:.1f}s: {hits / elapsed:.0f} hits/s against {args.url}')
+        return
+
+    workdir = tempfile.mkdtemp(prefix='tracking_bench_')
+    os.environ['TEST_DATABASE_URL'] = 'sqlite:///' + os.path.join(workdir, 'bench.db')  # read when config is imported
+    import sqlalchemy as sa
+    from app import create_app, db
+    from app.models import Organization, User, Campaign, CampaignTarget, CampaignEvent
+    from app.services.tracking_events import tracking_log, make_token
+    from app.services import campaign_results as cr
+
+    app = create_app('testing')
+    app.config.update(TRACKING_LOG_DIR=os.path.join(workdir, 'tracking'), TRACKING_SEGMENT_SECONDS=1,
+                      TRACKING_INGEST_INTERVAL=0.2, SQL_PROFILER_ENABLED=False)
+    quiet = lambda *a: None
+
+    with app.app_context():
+        db.create_all()
+        org = Organization(name='Benchmark Org')
+        db.session.add(org)
+        db.session.flush()
+        db.session.execute(User.__table__.insert(), [{
+            'user_id': i, 'username': f'bench{i}', 'email': f'bench{i}@example.com', 'password': 'x',
+            'org_id': org.org_id, 'account_type': 'Individual'} for i in range(1, args.targets + 1)])
+        campaign = Campaign(org_id=org.org_id, name='Tracking', type='Phishing', status='Active')
+        db.session.add(campaign)
+        db.session.flush()
+        db.session.execute(CampaignTarget.__table__.insert(), [{
+            'target_id': i, 'campaign_id': campaign.campaign_id, 'user_id': i, 'status': 'Sent'}
+            for i in range(1, args.targets + 1)])
+        db.session.commit()
+        tokens = [make_token(i) for i in range(1, args.targets + 1)]
+        campaign_id = campaign.campaign_id
+
+    # Ingester in the background, like `flask campaigns ingest`
+    ingested = {'lines': 0, 'inserted': 0, 'seconds': 0.0}
+    ingesting = threading.Event()
+    ingesting.set()
+
+    def ingest_loop():
+        with app.app_context():
+            while ingesting.is_set():
+                started = time.perf_counter()
+                totals = tracking_log.ingest(log=quiet)
+                if totals['lines']:
+                    ingested['seconds'] += time.perf_counter() - started
+                    ingested['lines'] += totals['lines']
+                    ingested['inserted'] += totals['inserted']
+                else:
+                    time.sleep(0.2)
+    ingester = threading.Thread(target=ingest_loop)
+    ingester.start()
+
+    def in_process():
+        client = app.test_client()
+
+        def send(path):
+            response = client.get(path)
+            assert response.status_code == 200, (path, response.status_code)
+        return send
+    hits, elapsed = run_load(in_process, tokens, args.threads, args.seconds, args.click_rate)
+
+    time.sleep(2.5)  # let the last segments close
+    ingesting.clear()
+    ingester.join()
+    with app.app_context():
+        started = time.perf_counter()
+        totals = tracking_log.ingest(log=quiet)
+        ingested['seconds'] += time.perf_counter() - started
+        ingested['lines'] += totals['lines']
+        ingested['inserted'] += totals['inserted']
+
+        with db.engine.connect() as conn:
+            events = dict(conn.execute(sa.select(CampaignEvent.event_type, sa.func.count())
+                                       .group_by(CampaignEvent.event_type)).all())
+            statuses = dict(conn.execute(sa.select(CampaignTarget.status, sa.func.count())
+                                         .group_by(CampaignTarget.status)).all())
+            cube = cr.results(conn, campaign_id, by=())
+            missing_time = conn.execute(sa.select(sa.func.count()).select_from(CampaignTarget).where(
+                CampaignTarget.status != 'Sent', CampaignTarget.interacted_at.is_(None))).scalar()
+
+    results = {
+        'targets': args.targets, 'threads': args.threads, 'hits': hits, 'seconds': round(elapsed, 2),
+        'hits_per_second': round(hits / elapsed), 'ingested_lines': ingested['lines'],
+        'ingest_seconds': round(ingested['seconds'], 2),
+        'ingest_per_second': round(ingested['lines'] / ingested['seconds']) if ingested['seconds'] else None,
+        'events': events, 'statuses': statuses, 'results': cube,
+    }
+    print(f"{hits} hits in {elapsed:.1f}s from {args.threads} threads: {results['hits_per_second']} hits/s")
+    print(f"ingested {ingested['lines']} hits in {ingested['seconds']:.2f}s of ingest time "
+          f"({results['ingest_per_second']}/s): events {events}, targets {statuses}")
+    assert ingested['lines'] == hits, 'hits lost between the endpoint and the database'
+    assert events.get('open', 0) == statuses.get('Opened', 0) + statuses.get('Clicked', 0)
+    assert events.get('click', 0) == statuses.get('Clicked', 0)
+    assert not missing_time, 'interacted_at not set'
+    assert cube and (cube[0]['opened'], cube[0]['clicked']) == (events.get('open', 0), events.get('click', 0)), \
+        'results cube differs from campaign_events'
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(results, f, indent=2)
+
+if __name__ == '__main__':
+    main()
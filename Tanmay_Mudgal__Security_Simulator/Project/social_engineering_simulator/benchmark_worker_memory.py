@@ -0,0 +1,191 @@
+"""
+Per-worker memory benchmark
+Builds a synthetic ML model and chatbot knowledge base, then for each loading
+mode forks N workers the way gunicorn does, has each one load and use the
+artifacts, and reports per-worker RSS / PSS / USS before and after loading.
+
+Modes:
+    per-worker     every worker unpickles its own copy (the old behaviour)
+    preload        master loads before forking, arrays not memory-mapped
+    mmap           every worker loads, arrays memory-mapped read-only
+    preload+mmap   master loads memory-mapped arrays before forking (gunicorn.conf.py)
+
+RSS counts shared pages in full for every worker; PSS splits them between the
+processes sharing them, so the sum of PSS is the real footprint. Linux only.
+
+Usage:
+    python benchmark_worker_memory.py
+    python benchmark_worker_memory.py --workers 8 --samples 1000000 --json memory.json
+"""
+import argparse
+import json
+import os
+import random
+import subprocess
+import sys
+import tempfile
+
+MODES = {
+    'per-worker': {'preload': False, 'mmap': False},
+    'preload': {'preload': True, 'mmap': False},
+    'mmap': {'preload': False, 'mmap': True},
+    'preload+mmap': {'preload': True, 'mmap': True},
+}
+
+WORDS = ('phishing email link attachment password account bank invoice urgent verify login '
+         'usb drive reward gift card caller support ticket manager wire transfer badge door '
+         'tailgating vendor refund delivery parcel update security alert reset token prize').split()
+
+def _mb(value):
+    return round(value / (1024 * 1024), 1) if value is not None else None
+
+def build_artifacts(directory, samples, kb_entries, seed):
+    """Train the KNN/KMeans model and the TF-IDF index once and save them as artifacts"""
+    rng = random.Random(seed)
+    kb_path = os.path.join(directory, 'knowledge.json')
+    with open(kb_path, 'w') as f:
+        json.dump([{
+            'question': ' '.join(rng.choice(WORDS) for _ in range(8)) + f' q{i}',
+            'answer': f'Answer {i}'
+        } for i in range(kb_entries)], f)
+
+    os.environ['CHATBOT_KNOWLEDGE_PATH'] = kb_path  # read when config is imported
+    import numpy as np
+    from app import create_app
+    from app.ml_model import ml_engine
+    from app.ai_service import AIService
+
+    app = create_app('testing')
+    with app.app_context():
+        X = np.random.default_rng(seed).random((samples, 7))
+        ml_engine.train(X, np.argmin(X[:, :3], axis=1))
+        ml_engine.save_model()
+        AIService()  # writes chatbot_index.joblib
+    return kb_path
+
+def run_child(mode, workers):
+    """Runs in a fresh interpreter: optionally load in the master, fork, measure each worker"""
+    import multiprocessing
+    from app import create_app
+    from app.cli import warm_up
+    from app.services.model_artifacts import process_memory
+
+    app = create_app('testing')
+    master_before = process_memory()
+    if MODES[mode]['preload']:
+        warm_up(app)
+    master_after = process_memory()
+
+    ctx = multiprocessing.get_context('fork')
+    loaded = ctx.Barrier(workers + 1)
+    measured = ctx.Barrier(workers + 1)
+    results = ctx.Queue()
+
+    def worker(index):
+        from app.ml_model import ml_engine
+        from app.ai_service import AIService
+        before = process_memory()
+        warm_up(app)  # no-op when the master already loaded
+        with app.app_context():
+            # Touch the artifacts the way requests do
+            for _ in range(20):
+                ml_engine.recommend_scenario_type([random.random() for _ in range(7)])
+                AIService.get_instance().get_response('verify the urgent invoice link', {})
+            if ml_engine.model is not None:
+                ml_engine.model.predict(ml_engine.model._fit_X[:2000])
+        loaded.wait()
+        # PSS depends on how many processes map a page, so measure while all are alive
+        results.put({'worker': index, 'before': before, 'after': process_memory()})
+        measured.wait()
+
+    procs = [ctx.Process(target=worker, args=(i,)) for i in range(workers)]
+    for p in procs:
+        p.start()
+    loaded.wait()
+    rows = [results.get() for _ in range(workers)]
+    master_final = process_memory()
+    measured.wait()
+    for p in procs:
+        p.join()
+
+    print(json.dumps({
+        'mode': mode,
+        'master': {'before': master_before, 'after_load': master_after, 'with_workers': master_final},
+        'workers': sorted(rows, key=lambda r: r['worker'])
+    }))
+
+def summarise(result):
+    workers = result['workers']
+    n = len(workers)
+    def mean(stage, key):
+        values = [w[stage][key] for w in workers if w[stage][key] is not None]
+        return sum(values) / len(values) if values else None
+    total_pss = sum(w['after']['pss'] or 0 for w in workers) + (result['master']['with_workers']['pss'] or 0)
+    return {
+        'mode': result['mode'],
+        'workers': n,
+        'rss_before_mb': _mb(mean('before', 'rss')),
+        'rss_after_mb': _mb(mean('after', 'rss')),
+        'pss_after_mb': _mb(mean('after', 'pss')),
+        'uss_after_mb': _mb(mean('after', 'uss')),
+        'master_rss_mb': _mb(result['master']['with_workers']['rss']),
+        'total_pss_mb': _mb(total_pss)
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description='Per-worker memory for each artifact loading mode')
+    parser.add_argument('--workers', type=int, default=4)
+    parser.add_argument('--samples', type=int, default=500000, help='KNN training rows')
+    parser.add_argument('--kb-entries', type=int, default=20000, help='Chatbot knowledge pairs')
+    parser.add_argument('--modes', default=','.join(MODES), help='Comma-separated subset of: ' + ', '.join(MODES))
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--json', dest='json_out')
+    parser.add_argument('--child', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        run_child(args.child, args.workers)
+        return
+
+    if not os.path.exists('/proc/self/smaps_rollup'):
+        sys.exit('PSS/USS need /proc/<pid>/smaps_rollup (Linux 4.14+)')
+    modes = [m.strip() for m in args.modes.split(',') if m.strip()]
+    unknown = set(modes) - set(MODES)
+    if unknown:
+        parser.error(f"Unknown modes: {', '.join(sorted(unknown))}")
+
+    with tempfile.TemporaryDirectory() as directory:
+        os.environ['ML_ARTIFACT_DIR'] = directory
+        os.environ.setdefault('SQL_PROFILER_SAMPLE_RATE', '0')
+        os.environ['METRICS_ENABLED'] = 'False'
+        kb_path = build_artifacts(directory, args.samples, args.kb_entries, args.seed)
+        sizes = {name: _mb(os.path.getsize(os.path.join(directory, name)))
+                 for name in ('ml_model.joblib', 'chatbot_index.joblib')}
+        print('Artifacts: ' + ', '.join(f'{k} {v} MB' for k, v in sizes.items()))
+
+        summaries = []
+        for mode in modes:
+            env = dict(os.environ, CHATBOT_KNOWLEDGE_PATH=kb_path, WARMUP_ON_STARTUP='False',
+                       ML_MMAP_ARTIFACTS=str(MODES[mode]['mmap']))
+            proc = subprocess.run(
+                [sys.executable, os.path.abspath(__file__), '--child', mode, '--workers', str(args.workers)],
+                cwd=os.path.dirname(os.path.abspath(__file__)), env=env, capture_output=True, text=True, check=True
+            )
+            summaries.append(summarise(json.loads(proc.stdout.strip().splitlines()[-1])))
+            print(f'  {mode:<14} done')
+
+    print(f"\n{'mode':<14} {'rss before':>11} {'rss after':>10} {'pss after':>10} {'uss after':>10} "
+          f"{'master rss':>11} {'total pss':>10}")
+    for s in summaries:
+        print(f"{s['mode']:<14} {s['rss_before_mb']:>11} {s['rss_after_mb']:>10} {s['pss_after_mb']:>10} "
+              f"{s['uss_after_mb']:>10} {s['master_rss_mb']:>11} {s['total_pss_mb']:>10}")
+    print(f"(MB; per-worker means over {args.workers} workers, total pss = all workers + master)")
+
+    if args.json_out:
+        with open(args.json_out, 'w') as f:
+            json.dump({'workers': args.workers, 'samples': args.samples, 'kb_entries': args.kb_entries,
+                       'artifact_mb': sizes, 'modes': summaries}, f, indent=2)
+        print(f"\nResults written to {args.json_out}")
+
+if __name__ == '__main__':
+    main()
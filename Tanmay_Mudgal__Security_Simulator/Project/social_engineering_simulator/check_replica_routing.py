@@ -0,0 +1,141 @@
+"""
+Read-replica routing check
+Runs the read-only routes against a primary and a replica and counts which
+engine served each statement, then repeats with the replica lagging and with
+it unreachable to show the fallback to the primary.
+
+By default both databases are SQLite files: the primary is populated with a
+small generated tenant and copied to the replica file ("replication"). With
+--primary / --replica pointing at two MySQL servers, the replica must already
+hold the same data (a real replica, or a restored dump).
+
+Usage:
+    python check_replica_routing.py
+    python check_replica_routing.py --primary mysql+pymysql://u:p@db1/social_engineering_db \\
+                                    --replica mysql+pymysql://u:p@db2/social_engineering_db --tag bench1a2b3c
+"""
+import argparse
+import os
+import shutil
+import sys
+import tempfile
+import time
+from collections import Counter
+
+READ_ROUTES = ['/leaderboard', '/progress', '/analytics', '/admin/org']
+
+def count_statements(engines):
+    """Attach listeners counting statements per bind name; returns the shared Counter"""
+    from sqlalchemy import event
+    counts = Counter()
+    for name, engine in engines.items():
+        def _count(conn, cursor, statement, parameters, context, executemany, name=name or 'primary'):
+            verb = statement.lstrip().split(None, 1)[0].upper()
+            counts[(name, 'read' if verb in ('SELECT', 'SHOW') else 'write')] += 1
+        event.listen(engine, 'before_cursor_execute', _count)
+    return counts
+
+def run_routes(app, counts, user_id, admin_id):
+    client = app.test_client()
+    counts.clear()
+    statuses = []
+    for path in READ_ROUTES:
+        with client.session_transaction() as sess:
+            sess['user_id'] = admin_id if path.startswith('/admin') else user_id
+        statuses.append(client.get(path).status_code)
+    return statuses, dict(counts)
+
+def report(title, statuses, counts, replicas):
+    print(f"\n{title}")
+    print(f"  statuses: {dict(zip(READ_ROUTES, statuses))}")
+    for (name, kind), n in sorted(counts.items()):
+        print(f"  {name:<10} {kind:<5} {n}")
+    for r in replicas:
+        print(f"  {r['name']}: {'in rotation' if r['usable'] else 'skipped'}"
+              f"{'' if r['error'] is None else ' (' + r['error'] + ')'}")
+
+def main():
+    parser = argparse.ArgumentParser(description='Check read-replica routing and fallback')
+    parser.add_argument('--primary', help='Primary database URI (default: temp SQLite file)')
+    parser.add_argument('--replica', help='Replica database URI (default: copy of the primary file)')
+    parser.add_argument('--tag', help='Existing generated tenant to use (default: generate one)')
+    parser.add_argument('--users', type=int, default=300)
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix='replica_check_')
+    primary = args.primary or f"sqlite:///{os.path.join(workdir, 'primary.db')}"
+    replica = args.replica or f"sqlite:///{os.path.join(workdir, 'replica.db')}"
+    os.environ.update({
+        'TEST_DATABASE_URL': primary,
+        'DB_REPLICA_URIS': replica,
+        'REPLICA_LAG_SOURCE': 'heartbeat',
+        'REPLICA_CHECK_INTERVAL': '0',  # re-check on every request so each phase takes effect
+        'REPLICA_MAX_LAG_SECONDS': '5',
+        'SQL_PROFILER_SAMPLE_RATE': '0',
+    })
+
+    from app import create_app, db
+    from app.services.db_routing import replica_router
+    from generate_tenant_data import generate
+    from benchmark_routes import load_tenant
+
+    app = create_app('testing')
+    app.config['WTF_CSRF_ENABLED'] = False
+    app.config['RATELIMIT_ENABLED'] = False
+
+    try:
+        with app.app_context():
+            if args.tag:
+                tenant = load_tenant(args.tag)
+            else:
+                db.create_all()
+                tenant = generate(orgs=2, users=args.users, responses=args.users * 10,
+                                  audit_rows=100, notifications=100, seed=1)
+            replica_router.beat(db.engine)
+            db.session.remove()
+            if not args.replica:
+                for engine in db.engines.values():
+                    engine.dispose()
+                shutil.copyfile(os.path.join(workdir, 'primary.db'), os.path.join(workdir, 'replica.db'))
+            counts = count_statements(db.engines)
+
+        user_id, admin_id = tenant['learner_ids'][0], tenant['largest_org_admin_id']
+
+        # Requests must not share an outer app context: each one gets its own session
+        def status():
+            with app.app_context():
+                return replica_router.status()
+
+        statuses, result = run_routes(app, counts, user_id, admin_id)
+        report('1. Replica healthy: reads go to the replica', statuses, result, status())
+
+        # A write pins this user's reads to the primary for REPLICA_MAX_LAG_SECONDS
+        client = app.test_client()
+        with client.session_transaction() as sess:
+            sess['user_id'] = user_id
+        scenario_id, _, answer = tenant['scenarios'][0]
+        client.post('/submit-response', json={'scenario_id': scenario_id, 'response': answer, 'response_time': 5})
+        counts.clear()
+        pinned_status = client.get('/leaderboard').status_code
+        report('2. Right after the user wrote: their reads stay on the primary', [pinned_status], dict(counts), status())
+
+        # No heartbeat for longer than the allowed lag
+        app.config['REPLICA_MAX_LAG_SECONDS'] = 1
+        time.sleep(1.5)
+        statuses, result = run_routes(app, counts, user_id, admin_id)
+        report('3. Replica lagging (> 1s behind): reads fall back to the primary', statuses, result, status())
+        app.config['REPLICA_MAX_LAG_SECONDS'] = 5
+
+        # Replica down
+        if not args.replica:
+            with app.app_context():
+                db.engines['replica_0'].dispose()
+            os.remove(os.path.join(workdir, 'replica.db'))
+            os.makedirs(os.path.join(workdir, 'replica.db'))  # a directory: SQLite can't open it
+            statuses, result = run_routes(app, counts, user_id, admin_id)
+            report('4. Replica unreachable: reads fall back to the primary', statuses, result, status())
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -23,8 +23,28 @@ class Config:
     SQLALCHEMY_TRACK_MODIFICATIONS = False
     SQLALCHEMY_ECHO = False  # Set to True to see SQL queries in console
 
+    # Connection pool (per worker, per engine). Recycle below MySQL's wait_timeout
+    # and most proxies' idle cutoffs; pre-ping drops connections the server closed.
+    DB_POOL_SIZE = int(os.environ.get('DB_POOL_SIZE') or 10)
+    DB_MAX_OVERFLOW = int(os.environ.get('DB_MAX_OVERFLOW') or 20)
+    DB_POOL_TIMEOUT = int(os.environ.get('DB_POOL_TIMEOUT') or 10)
+    DB_POOL_RECYCLE = int(os.environ.get('DB_POOL_RECYCLE') or 1800)
+    DB_POOL_PRE_PING = os.environ.get('DB_POOL_PRE_PING', 'True') == 'True'
+
+    # Read replicas for @read_only routes (comma-separated URIs; see services/db_routing.py)
+    DB_REPLICA_URIS = [uri.strip() for uri in (os.environ.get('DB_REPLICA_URIS') or '').split(',') if uri.strip()]
+    REPLICA_MAX_LAG_SECONDS = float(os.environ.get('REPLICA_MAX_LAG_SECONDS') or 5)
+    REPLICA_CHECK_INTERVAL = float(os.environ.get('REPLICA_CHECK_INTERVAL') or 5)
+    REPLICA_LAG_SOURCE = os.environ.get('REPLICA_LAG_SOURCE') or 'auto'
+
+    # Tenant shards ("name=uri,name=uri"; see services/sharding.py). The main database
+    # is the catalog and the 'default' shard.
+    DB_SHARD_URIS = dict(item.strip().split('=', 1) for item in (os.environ.get('DB_SHARD_URIS') or '').split(',') if item.strip())
+    SHARD_DIRECTORY_TTL = float(os.environ.get('SHARD_DIRECTORY_TTL') or 5)
+
     # File Uploads
-    UPLOAD_FOLDER = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'app', 'static', 'uploads')
+    # Report screenshots: outside app/static, served only to admins by admin.screenshot
+    UPLOAD_FOLDER = os.environ.get('UPLOAD_FOLDER') or os.path.join(os.path.dirname(os.path.abspath(__file__)), 'instance', 'screenshots')
     MAX_CONTENT_LENGTH = 16 * 1024 * 1024  # 16MB max limit
 
     # Security Settings
@@ -40,15 +60,77 @@ class Config:
     TELEGRAM_BOT_TOKEN = os.environ.get('TELEGRAM_BOT_TOKEN')
     TELEGRAM_CHAT_ID = os.environ.get('TELEGRAM_CHAT_ID')
 
+    # SQL Profiler (per-request query counts + N+1 detection, shown at /admin/perf)
+    SQL_PROFILER_ENABLED = os.environ.get('SQL_PROFILER_ENABLED', 'True') == 'True'
+    SQL_PROFILER_SAMPLE_RATE = float(os.environ.get('SQL_PROFILER_SAMPLE_RATE') or 0.05)
+    SQL_PROFILER_N_PLUS_ONE_THRESHOLD = int(os.environ.get('SQL_PROFILER_N_PLUS_ONE_THRESHOLD') or 10)
+    SQL_PROFILER_BUFFER_SIZE = 200
+    SQL_PROFILER_HEADERS = False
+
+    # Metrics (Prometheus text at /metrics, merged across worker processes)
+    METRICS_ENABLED = os.environ.get('METRICS_ENABLED', 'True') == 'True'
+    METRICS_DIR = os.environ.get('METRICS_DIR') or os.path.join(os.path.dirname(os.path.abspath(__file__)), 'instance', 'metrics')
+    METRICS_FLUSH_INTERVAL = int(os.environ.get('METRICS_FLUSH_INTERVAL') or 10)
+    METRICS_ALLOW_REMOTE = os.environ.get('METRICS_ALLOW_REMOTE', 'False') == 'True'
+
+    # Load the ML model and chatbot index in create_app instead of on first request
+    WARMUP_ON_STARTUP = os.environ.get('WARMUP_ON_STARTUP', 'False') == 'True'
+
+    # ML model / chatbot index artifacts (joblib; arrays memory-mapped read-only so
+    # pre-forked workers share their pages instead of each holding a copy)
+    ML_ARTIFACT_DIR = os.environ.get('ML_ARTIFACT_DIR') or os.path.join(os.path.dirname(os.path.abspath(__file__)), 'instance', 'ml')
+    ML_MMAP_ARTIFACTS = os.environ.get('ML_MMAP_ARTIFACTS', 'True') == 'True'
+    CHATBOT_KNOWLEDGE_PATH = os.environ.get('CHATBOT_KNOWLEDGE_PATH')  # default: app/chatbot_knowledge.json
+
+    # Shared counters for rate limits and the free-tier weekly quota (see services/counter_store.py):
+    # memory:// (one process), sqlite:////path/file.db (workers on one host) or database (all hosts)
+    COUNTER_STORE_URL = os.environ.get('COUNTER_STORE_URL') or 'sqlite:///' + os.path.join(os.path.dirname(os.path.abspath(__file__)), 'instance', 'counters.db')
+    RATELIMIT_STORAGE_URI = 'counterstore://'
+    RATELIMIT_STRATEGY = os.environ.get('RATELIMIT_STRATEGY') or 'sliding-window-counter'
+    FREE_WEEKLY_SCENARIO_LIMIT = 5
+
+    # Campaign delivery (see services/campaign_scheduler.py): sends per minute per org and overall,
+    # targets per SMTP batch, and the window / daily hours Quick Launch campaigns are spread over
+    CAMPAIGN_RATE_PER_ORG = int(os.environ.get('CAMPAIGN_RATE_PER_ORG') or 1200)
+    CAMPAIGN_RATE_GLOBAL = int(os.environ.get('CAMPAIGN_RATE_GLOBAL') or 6000)
+    CAMPAIGN_BATCH_SIZE = int(os.environ.get('CAMPAIGN_BATCH_SIZE') or 200)
+    CAMPAIGN_DEFAULT_WINDOW_HOURS = float(os.environ.get('CAMPAIGN_DEFAULT_WINDOW_HOURS') or 72)
+    CAMPAIGN_DEFAULT_SEND_HOURS = os.environ.get('CAMPAIGN_DEFAULT_SEND_HOURS', '09:00-17:00')
+    CAMPAIGN_LINK_URL = os.environ.get('CAMPAIGN_LINK_URL') or 'http://127.0.0.1:5000/c/{token}'
+    CAMPAIGN_OPEN_URL = os.environ.get('CAMPAIGN_OPEN_URL') or 'http://127.0.0.1:5000/c/{token}/o.gif'
+
+    # Open / click hits are appended to per-worker logs here and loaded in batches by
+    # `flask campaigns ingest` (see services/tracking_events.py)
+    TRACKING_LOG_DIR = os.environ.get('TRACKING_LOG_DIR') or os.path.join(os.path.dirname(os.path.abspath(__file__)), 'instance', 'tracking')
+    TRACKING_INGEST_BATCH = int(os.environ.get('TRACKING_INGEST_BATCH') or 5000)
+
+    # Suspicious reports whose texts are at least this similar (estimated Jaccard of word
+    # 3-grams) are triaged as one cluster (see services/report_clusters.py)
+    REPORT_CLUSTER_SIMILARITY = float(os.environ.get('REPORT_CLUSTER_SIMILARITY') or 0.6)
+
+    # Post-commit work of submit_response (achievements, ML retrain) runs in a thread
+    DEFER_SIDE_EFFECTS_IN_THREAD = True
+
+    # Sampling profiler (GLOBAL_ADMIN adds ?_profile=1 or X-Profile: 1 to a request)
+    PROFILER_ENABLED = os.environ.get('PROFILER_ENABLED', 'True') == 'True'
+    PROFILER_DIR = os.environ.get('PROFILER_DIR') or os.path.join(os.path.dirname(os.path.abspath(__file__)), 'instance', 'profiles')
+    PROFILER_INTERVAL = float(os.environ.get('PROFILER_INTERVAL') or 0.005)
+    PROFILER_MAX_SECONDS = 30
+    PROFILER_KEEP = 50
+
 class DevelopmentConfig(Config):
     """Development configuration"""
     DEBUG = True
     SQLALCHEMY_ECHO = True
+    SQL_PROFILER_SAMPLE_RATE = 1.0
+    SQL_PROFILER_HEADERS = True
 
 class ProductionConfig(Config):
     """Production configuration"""
     DEBUG = False
     SQLALCHEMY_ECHO = False
+    WARMUP_ON_STARTUP = os.environ.get('WARMUP_ON_STARTUP', 'True') == 'True'
+    COUNTER_STORE_URL = os.environ.get('COUNTER_STORE_URL') or 'database'
     
     @classmethod
     def init_app(cls, app):
@@ -62,7 +144,10 @@ class ProductionConfig(Config):
 class TestingConfig(Config):
     """Testing configuration"""
     TESTING = True
-    SQLALCHEMY_DATABASE_URI = 'sqlite:///:memory:'
+    SQLALCHEMY_DATABASE_URI = os.environ.get('TEST_DATABASE_URL') or 'sqlite:///:memory:'
+    COUNTER_STORE_URL = os.environ.get('COUNTER_STORE_URL') or 'memory://'
+    # In-memory SQLite shares one connection across threads, so keep side effects inline
+    DEFER_SIDE_EFFECTS_IN_THREAD = ':memory:' not in SQLALCHEMY_DATABASE_URI
 
 # Configuration dictionary
 config = {
@@ -0,0 +1,428 @@
+"""
+Synthetic large-tenant data generator
+Bulk-creates organizations, departments, teams, users, scenario responses,
+audit rows and notifications with Core executemany inserts (no ORM objects),
+so route benchmarks can run against realistic volumes.
+
+Usage:
+    python generate_tenant_data.py --orgs 5 --users 20000 --responses 1000000
+    python generate_tenant_data.py --config testing ...   (in-memory; use benchmark_routes.py --generate instead)
+
+Every row created by one run shares a tag prefix (usernames, org names) so
+several runs can coexist in the same database.
+"""
+import argparse
+import bisect
+import random
+import time
+import uuid
+from collections import defaultdict
+from datetime import datetime, timedelta
+from sqlalchemy import select, update, bindparam
+from werkzeug.security import generate_password_hash
+
+from app import create_app, db
+from app.models import (
+    User, Role, UserRole, Organization, Department, Team, Scenario, UserResponse,
+    LearningProgress, AuditLog, Notification, NotificationType, LearningPath, Topic,
+    DifficultyLevel, LearningModule, Category, ContentType, UserProgress, UserStats, UserCategoryStats
+)
+from app.services.summary_tables import vulnerability_level
+
+SCENARIO_TYPES = ['Phishing', 'Baiting', 'Pretexting']
+DEPARTMENT_NAMES = ['Engineering', 'Finance', 'Sales', 'Support', 'HR', 'Legal', 'Marketing', 'Operations',
+                    'IT', 'Procurement', 'Research', 'Security']
+AUDIT_ACTIONS = [('login', 'auth'), ('logout', 'auth'), ('tool_use', 'tool'), ('submit_response', 'scenario'),
+                 ('view_module', 'module'), ('report_suspicious', 'report')]
+NOTIFICATION_TYPES = ['achievement', 'reminder', 'campaign', 'system']
+HISTORY_DAYS = 180
+
+def _insert(table, rows, batch_size):
+    """executemany in fixed-size batches; returns rows written"""
+    written = 0
+    for start in range(0, len(rows), batch_size):
+        chunk = rows[start:start + batch_size]
+        db.session.execute(table.insert(), chunk)
+        written += len(chunk)
+    db.session.commit()
+    return written
+
+def _stream_insert(table, row_iter, batch_size):
+    """Like _insert, but never holds more than one batch in memory"""
+    written = 0
+    batch = []
+    for row in row_iter:
+        batch.append(row)
+        if len(batch) >= batch_size:
+            db.session.execute(table.insert(), batch)
+            db.session.commit()
+            written += len(batch)
+            batch = []
+    if batch:
+        db.session.execute(table.insert(), batch)
+        db.session.commit()
+        written += len(batch)
+    return written
+
+def _random_timestamp(now, rng):
+    return now - timedelta(seconds=rng.randint(0, HISTORY_DAYS * 86400))
+
+# ==========================================
+# Reference data (created once, reused by later runs)
+# ==========================================
+
+def _get_or_create(model, defaults=None, **lookup):
+    obj = model.query.filter_by(**lookup).first()
+    if obj is None:
+        obj = model(**lookup, **(defaults or {}))
+        db.session.add(obj)
+        db.session.flush()
+    return obj
+
+def ensure_reference_data(scenarios_per_type=20, topics=5, levels_per_topic=4, modules_per_level=4):
+    """Roles, notification types, scenarios and a learning path the routes need"""
+    roles = {name: _get_or_create(Role, role_name=name, defaults={'is_system_role': True})
+             for name in ('GLOBAL_ADMIN', 'ORG_ADMIN', 'LEARNER')}
+    notification_types = [_get_or_create(NotificationType, type_name=name, defaults={'description': 'Synthetic'})
+                          for name in NOTIFICATION_TYPES]
+
+    for scenario_type in SCENARIO_TYPES:
+        existing = Scenario.query.filter_by(scenario_type=scenario_type).count()
+        for i in range(existing, scenarios_per_type):
+            options = [f'{scenario_type} option {j}' for j in range(4)]
+            db.session.add(Scenario(
+                scenario_type=scenario_type,
+                difficulty_level=random.choice(['easy', 'medium', 'hard']),
+                scenario_description=f'Synthetic {scenario_type} scenario #{i + 1}',
+                correct_answer=options[i % 4],
+                options_json=options,
+                explanation='Synthetic scenario for benchmarking.'
+            ))
+
+    path = LearningPath.query.first()
+    if path is None:
+        path = LearningPath(path_name='Security Awareness', description='Synthetic learning path')
+        db.session.add(path)
+        db.session.flush()
+
+    if Topic.query.count() == 0:
+        category = _get_or_create(Category, category_name='Phishing')
+        content_type = _get_or_create(ContentType, type_name='theory')
+        for t in range(1, topics + 1):
+            topic = Topic(topic_number=t, topic_name=f'Synthetic Topic {t}')
+            db.session.add(topic)
+            db.session.flush()
+            for level_number in range(1, levels_per_topic + 1):
+                level = DifficultyLevel(topic_id=topic.topic_id, level_number=level_number,
+                                        level_name=['Fundamentals', 'Intermediate', 'Advanced', 'Expert'][(level_number - 1) % 4])
+                db.session.add(level)
+                db.session.flush()
+                for m in range(modules_per_level):
+                    db.session.add(LearningModule(
+                        difficulty_level_id=level.difficulty_level_id,
+                        category_id=category.category_id,
+                        type_id=content_type.type_id,
+                        title=f'Topic {t} level {level_number} module {m + 1}',
+                        content_json={'sections': []},
+                        order_index=m
+                    ))
+
+    db.session.commit()
+    return {
+        'roles': {name: role.role_id for name, role in roles.items()},
+        'notification_type_ids': [nt.type_id for nt in notification_types],
+        'scenarios': [(s.scenario_id, s.scenario_type, s.correct_answer)
+                      for s in Scenario.query.filter(Scenario.scenario_type.in_(SCENARIO_TYPES)).all()],
+        'module_ids': [m.module_id for m in LearningModule.query.with_entities(LearningModule.module_id).all()],
+        'path_id': path.path_id
+    }
+
+# ==========================================
+# Tenant data
+# ==========================================
+
+def generate(orgs=5, depts_per_org=8, teams_per_dept=3, users=10000, responses=200000,
+             audit_rows=100000, notifications=50000, progress_per_user=6, pro_share=0.2,
+             batch_size=5000, seed=42, tag=None):
+    """
+    Create one synthetic tenant set. Returns a summary with row counts,
+    timings and ids the benchmark needs (org admins, learners, path).
+    """
+    rng = random.Random(seed)
+    tag = tag or f'bench{uuid.uuid4().hex[:6]}'
+    now = datetime.utcnow()
+    timings = {}
+    counts = {}
+
+    started = time.perf_counter()
+    ref = ensure_reference_data()
+    timings['reference_data'] = time.perf_counter() - started
+
+    # --- Organizations, departments, teams ---
+    started = time.perf_counter()
+    counts['organizations'] = _insert(Organization.__table__, [
+        {'name': f'{tag} Org {i + 1}', 'sector': rng.choice(['Finance', 'Health', 'Retail', 'Tech']),
+         'size_bucket': 'large', 'country': 'IN', 'timezone': 'Asia/Kolkata', 'is_active': True,
+         'created_at': now, 'updated_at': now}
+        for i in range(orgs)
+    ], batch_size)
+    org_rows = db.session.execute(
+        select(Organization.org_id, Organization.name).where(Organization.name.like(f'{tag} Org %'))
+        .order_by(Organization.org_id)
+    ).all()
+
+    counts['departments'] = _insert(Department.__table__, [
+        {'org_id': org_id, 'name': DEPARTMENT_NAMES[d % len(DEPARTMENT_NAMES)] + (f' {d // len(DEPARTMENT_NAMES) + 1}' if d >= len(DEPARTMENT_NAMES) else ''),
+         'created_at': now}
+        for org_id, _ in org_rows for d in range(depts_per_org)
+    ], batch_size)
+    org_ids = [org_id for org_id, _ in org_rows]
+    dept_rows = db.session.execute(
+        select(Department.dept_id, Department.org_id).where(Department.org_id.in_(org_ids))
+    ).all()
+
+    counts['teams'] = _insert(Team.__table__, [
+        {'dept_id': dept_id, 'name': f'Team {t + 1}', 'created_at': now}
+        for dept_id, _ in dept_rows for t in range(teams_per_dept)
+    ], batch_size)
+    dept_ids = [dept_id for dept_id, _ in dept_rows]
+    team_rows = db.session.execute(select(Team.team_id, Team.dept_id).where(Team.dept_id.in_(dept_ids))).all()
+    timings['org_structure'] = time.perf_counter() - started
+
+    depts_by_org = defaultdict(list)
+    for dept_id, org_id in dept_rows:
+        depts_by_org[org_id].append(dept_id)
+    teams_by_dept = defaultdict(list)
+    for team_id, dept_id in team_rows:
+        teams_by_dept[dept_id].append(team_id)
+    org_names = dict(org_rows)
+
+    # --- Users (org sizes are skewed: the first org is the "large tenant") ---
+    started = time.perf_counter()
+    password_hash = generate_password_hash('benchmark')
+    org_weights = [1.0 / (i + 1) for i in range(len(org_ids))]
+    user_rows = []
+    for i in range(users):
+        # First user of each org becomes its admin
+        org_id = org_ids[i] if i < len(org_ids) else rng.choices(org_ids, weights=org_weights)[0]
+        dept_id = rng.choice(depts_by_org[org_id]) if depts_by_org[org_id] else None
+        team_id = rng.choice(teams_by_dept[dept_id]) if teams_by_dept.get(dept_id) else None
+        user_rows.append({
+            'username': f'{tag}_u{i}',
+            'password': password_hash,
+            'email': f'{tag}_u{i}@example.com',
+            'created_date': _random_timestamp(now, rng),
+            'total_score': 0,
+            'vulnerability_level': 'Medium',
+            'organization': org_names[org_id],
+            'account_type': 'Organization',
+            'org_id': org_id,
+            'dept_id': dept_id,
+            'team_id': team_id,
+            'subscription_tier': 'pro' if rng.random() < pro_share else 'free',
+            'weekly_scenario_count': 0,
+            'last_week_reset': now
+        })
+    counts['users'] = _insert(User.__table__, user_rows, batch_size)
+    del user_rows
+
+    user_rows = db.session.execute(
+        select(User.user_id, User.username, User.org_id, User.subscription_tier).where(User.username.like(f'{tag}\\_u%', escape='\\'))
+        .order_by(User.user_id)
+    ).all()
+    user_ids = [row.user_id for row in user_rows]
+    usernames = {row.user_id: row.username for row in user_rows}
+    org_admin_ids = user_ids[:len(org_ids)]
+    admin_set = set(org_admin_ids)
+    learner_rows = user_rows[len(org_ids):]
+
+    counts['user_roles'] = _insert(UserRole.__table__, [
+        {'user_id': uid, 'role_id': ref['roles']['ORG_ADMIN'] if uid in admin_set else ref['roles']['LEARNER'],
+         'assigned_date': now}
+        for uid in user_ids
+    ], batch_size)
+    timings['users'] = time.perf_counter() - started
+
+    # --- Scenario responses (activity per user is heavy-tailed) ---
+    started = time.perf_counter()
+    skill = {uid: rng.uniform(0.3, 0.95) for uid in user_ids}
+    cumulative = _cumulative([rng.paretovariate(1.2) for _ in user_ids])
+    totals = defaultdict(lambda: [0, 0, 0])  # (user_id, type) -> [attempts, correct, response_time]
+    score = defaultdict(int)
+
+    def response_rows():
+        for _ in range(responses):
+            uid = user_ids[_weighted_index(rng, cumulative)]
+            scenario_id, scenario_type, correct_answer = rng.choice(ref['scenarios'])
+            is_correct = rng.random() < skill[uid]
+            response_time = rng.randint(5, 120)
+            bucket = totals[(uid, scenario_type)]
+            bucket[0] += 1
+            bucket[2] += response_time
+            if is_correct:
+                bucket[1] += 1
+                score[uid] += 10
+            yield {
+                'user_id': uid,
+                'scenario_id': scenario_id,
+                'user_response': correct_answer[:50] if is_correct else 'wrong answer',
+                'is_correct': is_correct,
+                'response_time': response_time,
+                'timestamp': _random_timestamp(now, rng)
+            }
+
+    counts['user_responses'] = _stream_insert(UserResponse.__table__, response_rows(), batch_size)
+    timings['user_responses'] = time.perf_counter() - started
+
+    # --- Derived per-user state: scores, vulnerability levels, success rates and summaries ---
+    started = time.perf_counter()
+    user_totals = defaultdict(lambda: [0, 0, 0])
+    for (uid, _), (attempts, correct, response_time) in totals.items():
+        user_total = user_totals[uid]
+        user_total[0] += attempts
+        user_total[1] += correct
+        user_total[2] += response_time
+
+    users_table = User.__table__
+    score_rows = [{'uid': uid, 'score': score.get(uid, 0), 'level': vulnerability_level(correct, attempts)}
+                  for uid, (attempts, correct, _) in user_totals.items()]
+    for start in range(0, len(score_rows), batch_size):
+        db.session.execute(
+            update(users_table).where(users_table.c.user_id == bindparam('uid'))
+            .values(total_score=bindparam('score'), vulnerability_level=bindparam('level')),
+            score_rows[start:start + batch_size]
+        )
+    db.session.commit()
+
+    counts['user_stats'] = _insert(UserStats.__table__, [
+        {'user_id': uid, 'total_attempts': attempts, 'correct_attempts': correct,
+         'total_response_time': response_time, 'timed_attempts': attempts, 'achievements': 0, 'last_updated': now}
+        for uid, (attempts, correct, response_time) in user_totals.items()
+    ], batch_size)
+    counts['user_category_stats'] = _insert(UserCategoryStats.__table__, [
+        {'user_id': uid, 'category': scenario_type, 'attempts': attempts, 'correct': correct,
+         'total_response_time': response_time, 'timed_attempts': attempts, 'last_updated': now}
+        for (uid, scenario_type), (attempts, correct, response_time) in totals.items()
+    ], batch_size)
+
+    def progress_row(uid):
+        row = {'user_id': uid, 'last_updated': now}
+        for scenario_type in SCENARIO_TYPES:
+            attempts, correct, _ = totals.get((uid, scenario_type), (0, 0, 0))
+            prefix = scenario_type.lower()
+            row[f'{prefix}_attempts'] = attempts
+            row[f'{prefix}_correct'] = correct
+            row[f'{prefix}_success_rate'] = correct * 100.0 / attempts if attempts else 0.0
+        return row
+
+    counts['learning_progress'] = _insert(LearningProgress.__table__, [progress_row(uid) for uid in user_ids], batch_size)
+
+    def progress_rows():
+        modules = ref['module_ids']
+        for uid in user_ids:
+            for module_id in rng.sample(modules, min(progress_per_user, len(modules))):
+                status = rng.choice(['unlocked', 'in_progress', 'completed', 'completed'])
+                viewed = _random_timestamp(now, rng)
+                yield {
+                    'user_id': uid, 'module_id': module_id, 'status': status,
+                    'score': rng.randint(50, 100) if status == 'completed' else 0,
+                    'completed_at': viewed if status == 'completed' else None,
+                    'first_viewed_at': viewed, 'last_activity_at': viewed, 'view_count': rng.randint(1, 5)
+                }
+
+    counts['user_progress'] = _stream_insert(UserProgress.__table__, progress_rows(), batch_size)
+    timings['derived_state'] = time.perf_counter() - started
+
+    # --- Audit trail and notifications ---
+    started = time.perf_counter()
+
+    def audit_rows_iter():
+        for _ in range(audit_rows):
+            uid = user_ids[_weighted_index(rng, cumulative)]
+            action_type, resource_type = rng.choice(AUDIT_ACTIONS)
+            yield {
+                'user_id': uid, 'username': usernames[uid], 'action_type': action_type,
+                'resource_type': resource_type, 'action_description': f'Synthetic {action_type}',
+                'ip_address': f'10.{rng.randint(0, 255)}.{rng.randint(0, 255)}.{rng.randint(1, 254)}',
+                'request_method': 'POST' if action_type != 'logout' else 'GET',
+                'request_url': f'/{action_type.replace("_", "-")}', 'status': 'success' if rng.random() < 0.97 else 'failure',
+                'severity': 'low', 'timestamp': _random_timestamp(now, rng)
+            }
+
+    counts['audit_logs'] = _stream_insert(AuditLog.__table__, audit_rows_iter(), batch_size)
+
+    def notification_rows():
+        for _ in range(notifications):
+            created = _random_timestamp(now, rng)
+            status = rng.choice(['pending', 'sent', 'sent', 'read', 'read', 'archived'])
+            yield {
+                'user_id': rng.choice(user_ids), 'type_id': rng.choice(ref['notification_type_ids']),
+                'title': 'Synthetic notification', 'message': 'Generated for benchmarking.',
+                'status': status, 'priority': rng.choice(['low', 'medium', 'medium', 'high']),
+                'sent_at': created if status != 'pending' else None,
+                'read_at': created if status in ('read', 'archived') else None,
+                'created_date': created
+            }
+
+    counts['notifications'] = _stream_insert(Notification.__table__, notification_rows(), batch_size)
+    timings['activity_logs'] = time.perf_counter() - started
+
+    return {
+        'tag': tag,
+        'counts': counts,
+        'timings': {k: round(v, 2) for k, v in timings.items()},
+        'org_admin_ids': org_admin_ids,
+        'largest_org_admin_id': org_admin_ids[0] if org_admin_ids else None,
+        'learner_ids': [row.user_id for row in learner_rows],
+        'pro_learner_ids': [row.user_id for row in learner_rows if row.subscription_tier == 'pro'],
+        'scenarios': ref['scenarios'],
+        'path_id': ref['path_id']
+    }
+
+def _cumulative(weights):
+    total = 0.0
+    cumulative = []
+    for w in weights:
+        total += w
+        cumulative.append(total)
+    return cumulative
+
+def _weighted_index(rng, cumulative):
+    """O(log n) weighted pick; random.choices() rebuilds cum_weights on every call"""
+    return bisect.bisect_left(cumulative, rng.random() * cumulative[-1])
+
+def main():
+    parser = argparse.ArgumentParser(description='Bulk-generate synthetic tenants for benchmarking')
+    parser.add_argument('--config', default='development', help='Config name (development, production, testing)')
+    parser.add_argument('--orgs', type=int, default=5)
+    parser.add_argument('--depts-per-org', type=int, default=8)
+    parser.add_argument('--teams-per-dept', type=int, default=3)
+    parser.add_argument('--users', type=int, default=10000)
+    parser.add_argument('--responses', type=int, default=200000)
+    parser.add_argument('--audit-rows', type=int, default=100000)
+    parser.add_argument('--notifications', type=int, default=50000)
+    parser.add_argument('--progress-per-user', type=int, default=6)
+    parser.add_argument('--batch-size', type=int, default=5000)
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--tag', help='Prefix for generated names (default: random)')
+    args = parser.parse_args()
+
+    app = create_app(args.config)
+    with app.app_context():
+        db.engine.echo = False  # DevelopmentConfig echoes SQL; far too slow for bulk loads
+        db.create_all()  # same as `flask create-schema`; existing tables are left alone
+        started = time.perf_counter()
+        summary = generate(orgs=args.orgs, depts_per_org=args.depts_per_org, teams_per_dept=args.teams_per_dept,
+                           users=args.users, responses=args.responses, audit_rows=args.audit_rows,
+                           notifications=args.notifications, progress_per_user=args.progress_per_user,
+                           batch_size=args.batch_size, seed=args.seed, tag=args.tag)
+        elapsed = time.perf_counter() - started
+
+        print(f"\nGenerated tenant set '{summary['tag']}' in {elapsed:.1f}s")
+        for table, count in summary['counts'].items():
+            print(f"  {table:<20} {count:>10,}")
+        print("Phase timings (s): " + ', '.join(f'{k}={v}' for k, v in summary['timings'].items()))
+        print(f"Largest org admin user_id: {summary['largest_org_admin_id']}")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,28 @@
+"""
+Gunicorn settings for production (pre-fork mode)
+    FLASK_ENV=production gunicorn -c gunicorn.conf.py run:app
+
+preload_app makes the master import run.py, so create_app() - and its warmup
+of the ML model and chatbot index (WARMUP_ON_STARTUP) - runs once before the
+workers are forked. Their memory-mapped arrays are then shared by every worker
+instead of each worker loading its own copy on its first request.
+"""
+import multiprocessing
+import os
+
+bind = os.environ.get('GUNICORN_BIND', '0.0.0.0:5000')
+workers = int(os.environ.get('GUNICORN_WORKERS') or multiprocessing.cpu_count() * 2 + 1)
+preload_app = os.environ.get('GUNICORN_PRELOAD', 'True') == 'True'
+# Recycle workers now and then; a restarted worker maps the shared artifacts again
+max_requests = int(os.environ.get('GUNICORN_MAX_REQUESTS') or 5000)
+max_requests_jitter = 500
+
+os.environ.setdefault('WARMUP_ON_STARTUP', 'True' if preload_app else 'False')
+
+def post_fork(server, worker):
+    # The master's DB connections (primary and replicas) must not be shared with the forked worker
+    from app import db
+    app = server.app.wsgi()
+    with app.app_context():
+        for engine in db.engines.values():
+            engine.dispose(close=False)
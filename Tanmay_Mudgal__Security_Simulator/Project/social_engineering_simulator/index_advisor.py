@@ -0,0 +1,375 @@
+"""
+Query-log-driven index advisor
+1. Runs the route benchmark workload (benchmark_routes.py) and captures every
+   statement by normalized shape: count, total time and one sample with its
+   parameters
+2. EXPLAINs each hot shape and derives candidate composite indexes from its
+   predicates: equality columns first, then one range / ORDER BY column, plus
+   a covering variant when the query reads only a few more columns
+3. Builds each candidate on the benchmark database, re-times the shapes it
+   could serve, drops it again, and ranks candidates by estimated time saved
+   per workload run (per-execution saving x executions). Writes to the table
+   during the workload are shown as the index's maintenance cost
+4. Writes a versioned migration (migrations/versions/NNNN_advisor_indexes.py)
+   with the accepted suggestions, applies it, re-runs the benchmark and
+   prints the before/after latencies
+
+A composite is also timed on the queries its leading columns serve. The
+pick is greedy by marginal saving: each round takes the candidate saving the
+most on top of those already accepted, and must save at least
+--min-saving-ms per workload run with at least --min-speedup on the queries
+it serves. An accepted index replaces an accepted prefix of itself. Add the printed db.Index(...) lines to
+the models so databases built with create-schema get them too.
+
+Usage:
+    python index_advisor.py --users 5000 --responses 200000
+    python index_advisor.py --config development --tag bench1a2b3c --dry-run
+"""
+import argparse
+import os
+import re
+import statistics
+import time
+from collections import defaultdict
+
+from benchmark_routes import ROUTES, RouteBenchmark, load_tenant, print_table
+
+_TABLE_REF = re.compile(r'\b(?:FROM|JOIN)\s+(\w+)(?:\s+(?:AS\s+)?(\w+))?', re.I)
+_PREDICATE = re.compile(
+    r'\b(\w+)\.(\w+)\s*(=|!=|<>|<=|>=|<|>|\bIN\b|\bIS\b|\bBETWEEN\b|\bLIKE\b)\s*(\(?\s*[\w.?:%]+)', re.I)
+_ORDER_BY = re.compile(r'\bORDER BY\s+(.+?)(?:\bLIMIT\b|\bOFFSET\b|\)|$)', re.I)
+_GROUP_BY = re.compile(r'\bGROUP BY\s+(.+?)(?:\bHAVING\b|\bORDER BY\b|\bLIMIT\b|\)|$)', re.I)
+_SELECT_LIST = re.compile(r'^\s*SELECT\s+(.+?)\s+FROM\b', re.I)
+_COLUMN = re.compile(r'\b(\w+)\.(\w+)\b')
+_KEYWORDS = {'ON', 'WHERE', 'JOIN', 'LEFT', 'INNER', 'OUTER', 'GROUP', 'ORDER', 'LIMIT', 'SET', 'AND', 'OR'}
+
+class QueryLog:
+    """Statements executed during the workload, grouped by normalized shape"""
+
+    def __init__(self):
+        self.shapes = {}
+
+    def install(self, engine):
+        from sqlalchemy import event
+        from app.services.sql_profiler import normalize_statement
+
+        def before(conn, cursor, statement, parameters, context, executemany):
+            conn.info.setdefault('advisor_start', []).append(time.perf_counter())
+
+        def after(conn, cursor, statement, parameters, context, executemany):
+            elapsed = (time.perf_counter() - conn.info['advisor_start'].pop()) * 1000
+            if conn.info.get('advisor_paused') or executemany:
+                return
+            shape = normalize_statement(statement)
+            entry = self.shapes.setdefault(shape, {'shape': shape, 'count': 0, 'total_ms': 0.0,
+                                                   'statement': statement, 'parameters': parameters})
+            entry['count'] += 1
+            entry['total_ms'] += elapsed
+
+        event.listen(engine, 'before_cursor_execute', before)
+        event.listen(engine, 'after_cursor_execute', after)
+
+    def hot(self, limit):
+        reads = [s for s in self.shapes.values() if s['shape'].lstrip().upper().startswith(('SELECT', 'UPDATE', 'DELETE'))]
+        return sorted(reads, key=lambda s: s['total_ms'], reverse=True)[:limit]
+
+    def writes_per_table(self):
+        writes = defaultdict(int)
+        for s in self.shapes.values():
+            match = re.match(r'\s*(?:INSERT INTO|UPDATE|DELETE FROM)\s+(\w+)', s['shape'], re.I)
+            if match:
+                writes[match.group(1)] += s['count']
+        return writes
+
+def explain(conn, statement, parameters):
+    """Short plan lines for a statement (SQLite EXPLAIN QUERY PLAN / MySQL EXPLAIN)"""
+    if conn.dialect.name == 'sqlite':
+        return [row[-1] for row in conn.exec_driver_sql('EXPLAIN QUERY PLAN ' + statement, parameters)]
+    if conn.dialect.name == 'mysql':
+        rows = conn.exec_driver_sql('EXPLAIN ' + statement, parameters).mappings().all()
+        return [f"{r['table']}: {r['type']} key={r['key']} rows={r['rows']} {r['Extra'] or ''}".strip() for r in rows]
+    return []
+
+def needs_help(plan):
+    """Full scans, filesorts and temp tables in a plan"""
+    return any(re.search(r'^SCAN (?!.*COVERING INDEX)|TEMP B-TREE|: ALL |: index |filesort|temporary', line)
+               for line in plan)
+
+def candidates(shape, existing):
+    """{(table, columns)} composite / covering indexes that could serve a statement shape"""
+    aliases = {}
+    for table, alias in _TABLE_REF.findall(shape):
+        aliases[table] = table
+        if alias and alias.upper() not in _KEYWORDS:
+            aliases[alias] = table
+
+    equality, ranges = defaultdict(list), defaultdict(list)
+    for alias, column, op, rhs in _PREDICATE.findall(shape):
+        table = aliases.get(alias)
+        if table is None:
+            continue
+        target = equality if op.upper() in ('=', 'IN', 'IS') else ranges
+        if column not in target[table]:
+            target[table].append(column)
+        # The other side of a join condition gets looked up by this value
+        other = _COLUMN.match(rhs.strip('( '))
+        if other and op == '=' and aliases.get(other.group(1)) and other.group(2) not in equality[aliases[other.group(1)]]:
+            equality[aliases[other.group(1)]].append(other.group(2))
+
+    ordering = defaultdict(list)
+    for pattern in (_ORDER_BY, _GROUP_BY):
+        for clause in pattern.findall(shape):
+            for alias, column in _COLUMN.findall(clause):
+                if aliases.get(alias) and column not in ordering[aliases[alias]]:
+                    ordering[aliases[alias]].append(column)
+
+    selected = defaultdict(list)
+    select_list = _SELECT_LIST.match(shape)
+    if select_list:
+        for alias, column in _COLUMN.findall(select_list.group(1)):
+            if aliases.get(alias) and column not in selected[aliases[alias]]:
+                selected[aliases[alias]].append(column)
+
+    found = set()
+    for table in set(equality) | set(ranges) | set(ordering):
+        if table not in existing:
+            continue
+        eq = [c for c in equality[table] if c in existing[table]['columns']]
+        tail = [c for c in (ranges[table] + ordering[table]) if c not in eq and c in existing[table]['columns']][:1]
+        columns = tuple(eq + tail)
+        if not columns or (len(columns) == 1 and columns[0] in existing[table]['pk']):
+            continue
+        if any(index[:len(columns)] == columns for index in existing[table]['indexes']):
+            continue
+        found.add((table, columns))
+        extra = [c for c in selected[table] if c not in columns and c not in existing[table]['pk']]
+        if 0 < len(extra) <= 2 and len(columns) + len(extra) <= 5:
+            found.add((table, columns + tuple(extra)))
+    return found
+
+def index_name(table, columns):
+    name = f"idx_{table}_{'_'.join(columns)}"
+    return name if len(name) <= 64 else name[:55] + f'_{abs(hash(name)) % 10**8:08d}'
+
+def existing_indexes(engine):
+    import sqlalchemy as sa
+    inspector = sa.inspect(engine)
+    result = {}
+    for table in inspector.get_table_names():
+        pk = tuple(inspector.get_pk_constraint(table)['constrained_columns'])
+        indexes = [tuple(i['column_names']) for i in inspector.get_indexes(table)]
+        indexes += [tuple(u['column_names']) for u in inspector.get_unique_constraints(table)]
+        result[table] = {'columns': {c['name'] for c in inspector.get_columns(table)},
+                         'pk': pk, 'indexes': [pk] + indexes}
+    return result
+
+def time_statement(conn, statement, parameters, repeat):
+    """Median ms of executing and fully fetching a statement (reads only)"""
+    samples = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        conn.exec_driver_sql(statement, parameters).fetchall()
+        samples.append((time.perf_counter() - started) * 1000)
+    return statistics.median(samples)
+
+def evaluate(engine, log, hot, repeat):
+    """Build each candidate, re-time the shapes that could use it, drop it again"""
+    existing = existing_indexes(engine)
+    served = defaultdict(list)
+    for entry in hot:
+        for candidate in candidates(entry['shape'], existing):
+            served[candidate].append(entry)
+    # A composite also serves every query its leading columns serve
+    for (table, columns), entries in list(served.items()):
+        for (other_table, other_columns), other_entries in list(served.items()):
+            if other_table == table and len(other_columns) < len(columns) \
+                    and columns[:len(other_columns)] == other_columns:
+                entries.extend(e for e in other_entries if e not in entries)
+
+    writes = log.writes_per_table()
+    results = []
+    with engine.connect() as conn:
+        conn.info['advisor_paused'] = True  # the advisor's own queries aren't workload
+        selects = [e for e in hot if e['shape'].lstrip().upper().startswith('SELECT')]
+        baseline = {e['shape']: time_statement(conn, e['statement'], e['parameters'], repeat) for e in selects}
+        for (table, columns), entries in sorted(served.items()):
+            name = index_name(table, columns)
+            started = time.perf_counter()
+            conn.exec_driver_sql(f"CREATE INDEX {name} ON {table} ({', '.join(columns)})")
+            conn.commit()
+            build_s = time.perf_counter() - started
+            saving, before_ms, after_ms, plans, per_shape = 0.0, 0.0, 0.0, [], {}
+            for entry in entries:
+                if entry['shape'] not in baseline:
+                    continue
+                after = per_shape[entry['shape']] = \
+                    time_statement(conn, entry['statement'], entry['parameters'], repeat)
+                before = baseline[entry['shape']]
+                saving += (before - after) * entry['count']
+                before_ms += before * entry['count']
+                after_ms += after * entry['count']
+                plans.append(explain(conn, entry['statement'], entry['parameters']))
+            conn.exec_driver_sql(f'DROP INDEX {name}' + (f' ON {table}' if conn.dialect.name == 'mysql' else ''))
+            conn.commit()
+            results.append({
+                'table': table, 'columns': columns, 'name': name,
+                'shapes': len(entries), 'executions': sum(e['count'] for e in entries),
+                'before_ms': before_ms, 'after_ms': after_ms, 'saving_ms': saving,
+                'speedup': before_ms / after_ms if after_ms else 1.0,
+                'uses_index': any(name in line for plan in plans for line in plan),
+                'build_s': build_s, 'table_writes': writes.get(table, 0),
+                'per_shape': per_shape, 'counts': {e['shape']: e['count'] for e in entries},
+                'baseline': {e['shape']: baseline[e['shape']] for e in entries if e['shape'] in baseline}
+            })
+        conn.info.pop('advisor_paused')
+    results.sort(key=lambda r: r['saving_ms'], reverse=True)
+    return results
+
+def choose(results, min_saving_ms, min_speedup):
+    """
+    Greedy pick by marginal saving: each round takes the candidate that
+    saves the most on top of the indexes already accepted (a query counts
+    at its fastest time under any accepted index), so a composite that
+    extends a prefix wins over the prefix and siblings that only repeat an
+    accepted index's gain are dropped
+    """
+    best = {}  # shape -> fastest time so far
+    accepted, remaining = [], [r for r in results if r['uses_index'] and r['speedup'] >= min_speedup]
+
+    def marginal(r):
+        return sum(max(0.0, best.get(shape, r['baseline'][shape]) - after) * r['counts'][shape]
+                   for shape, after in r['per_shape'].items())
+
+    while remaining:
+        r = max(remaining, key=marginal)
+        gain = marginal(r)
+        if gain < min_saving_ms:
+            break
+        remaining.remove(r)
+        # A prefix of an accepted index adds nothing the longer one can't do
+        if any(a['table'] == r['table'] and a['columns'][:len(r['columns'])] == r['columns'] for a in accepted):
+            continue
+        accepted = [a for a in accepted if not (a['table'] == r['table']
+                                                and r['columns'][:len(a['columns'])] == a['columns'])]
+        r['marginal_ms'] = gain
+        accepted.append(r)
+        for shape, after in r['per_shape'].items():
+            best[shape] = min(best.get(shape, r['baseline'][shape]), after)
+    return accepted
+
+def write_migration(accepted, directory=None):
+    from app.services.migration_runner import VERSIONS_DIR, discover
+    directory = directory or VERSIONS_DIR
+    existing = discover(directory)
+    version = f'{int(existing[-1].version) + 1:04d}' if existing else '0001'
+    path = os.path.join(directory, f'{version}_advisor_indexes.py')
+    lines = ['"""', 'Composite indexes suggested by index_advisor.py', '"""', '', 'def upgrade(op):']
+    for r in accepted:
+        lines.append(f"    # saves ~{r['marginal_ms']:.0f} ms per workload run over {r['executions']} queries "
+                     f"({r['speedup']:.1f}x); {r['table_writes']} writes to {r['table']}")
+        lines.append(f"    op.create_index('{r['table']}', '{r['name']}', {list(r['columns'])!r})")
+    with open(path, 'w') as f:
+        f.write('\n'.join(lines) + '\n')
+    return version, path
+
+def run_workload(app, tenant, routes, requests, seed):
+    bench = RouteBenchmark(app, tenant, seed=seed)
+    return [bench.run(route, requests, warmup=3) for route in routes]
+
+def main():
+    parser = argparse.ArgumentParser(description='Suggest composite indexes from the benchmark workload')
+    parser.add_argument('--config', default='testing')
+    parser.add_argument('--database-url', help='Override TestingConfig database (e.g. sqlite:////tmp/bench.db)')
+    parser.add_argument('--tag', help='Use an existing generated tenant instead of generating one')
+    parser.add_argument('--routes', default=','.join(ROUTES))
+    parser.add_argument('--requests', type=int, default=100, help='Requests per route in each workload run')
+    parser.add_argument('--top', type=int, default=40, help='Hot statement shapes to analyse')
+    parser.add_argument('--repeat', type=int, default=15, help='Timed executions per shape and candidate')
+    parser.add_argument('--min-saving-ms', type=float, default=50.0, help='Per workload run')
+    parser.add_argument('--min-speedup', type=float, default=1.3)
+    parser.add_argument('--dry-run', action='store_true', help="Only report; don't write or apply a migration")
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--users', type=int, default=2000)
+    parser.add_argument('--responses', type=int, default=50000)
+    args = parser.parse_args()
+
+    if args.database_url:
+        os.environ['TEST_DATABASE_URL'] = args.database_url
+    os.environ.setdefault('SQL_PROFILER_SAMPLE_RATE', '0')
+
+    from app import create_app, db
+    from generate_tenant_data import generate
+    from app.services.migration_runner import MigrationRunner
+
+    app = create_app(args.config)
+    app.config.update(WTF_CSRF_ENABLED=False, RATELIMIT_ENABLED=False)
+    routes = [r.strip() for r in args.routes.split(',') if r.strip()]
+
+    with app.app_context():
+        db.engine.echo = False
+        db.create_all()
+        tenant = load_tenant(args.tag) if args.tag else generate(
+            orgs=5, users=args.users, responses=args.responses, audit_rows=args.responses // 2,
+            notifications=args.users * 5, seed=args.seed)
+        db.session.remove()
+        engine = db.engine
+
+    log = QueryLog()
+    log.install(engine)
+    print('Capturing workload...')
+    before = run_workload(app, tenant, routes, args.requests, args.seed)
+    hot = log.hot(args.top)
+
+    print(f'\n{len(log.shapes)} statement shapes; hottest reads:')
+    with engine.connect() as conn:
+        conn.info['advisor_paused'] = True
+        for entry in hot[:15]:
+            plan = explain(conn, entry['statement'], entry['parameters'])
+            flag = '!' if needs_help(plan) else ' '
+            print(f"{flag} {entry['total_ms']:>8.1f} ms {entry['count']:>5}x  {entry['shape'][:110]}")
+            for line in plan:
+                print(f'              {line[:110]}')
+        conn.info.pop('advisor_paused')
+
+    with app.app_context():
+        results = evaluate(engine, log, hot, args.repeat)
+    accepted = choose(results, args.min_saving_ms, args.min_speedup)
+
+    print(f"\n{'':2}{'index':<58} {'queries':>7} {'saving/run':>11} {'speedup':>8} {'writes':>7} {'build':>7}")
+    for r in results:
+        mark = '+' if r in accepted else ' '
+        print(f"{mark} {r['table'] + '(' + ', '.join(r['columns']) + ')':<58} {r['executions']:>7} "
+              f"{r['saving_ms']:>9.0f}ms {r['speedup']:>7.1f}x {r['table_writes']:>7} {r['build_s']:>6.2f}s")
+    print("(+ accepted; saving = per-query time saved x executions in one workload run, on its own)")
+    for r in accepted:
+        print(f"  {r['name']}: {r['marginal_ms']:.0f} ms on top of the other accepted indexes")
+
+    if not accepted:
+        print('\nNo index worth adding.')
+        return
+    print('\nModel declarations (add to __table_args__):')
+    for r in accepted:
+        print(f"    {r['table']}: db.Index('{r['name']}', {', '.join(repr(c) for c in r['columns'])}),")
+    if args.dry_run:
+        return
+
+    version, path = write_migration(accepted)
+    print(f'\nWrote {path}')
+    with app.app_context():
+        runner = MigrationRunner(engine)
+        if not runner.history():
+            runner.stamp(f'{int(version) - 1:04d}')  # a benchmark database is built by create_all
+        runner.upgrade(version)
+
+    print('\nRe-running the workload with the new indexes...')
+    after = run_workload(app, tenant, routes, args.requests, args.seed)
+    print('\nBefore:')
+    print_table(before)
+    print('\nAfter:')
+    print_table(after)
+    print(f"\n{'route':<16} {'p50 before':>11} {'p50 after':>10} {'p99 before':>11} {'p99 after':>10}")
+    for b, a in zip(before, after):
+        print(f"{b['route']:<16} {b['p50_ms']:>11} {a['p50_ms']:>10} {b['p99_ms']:>11} {a['p99_ms']:>10}")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,6 @@
+-- Baseline: the schema as built by schema.sql / `flask create-schema` plus the
+-- one-off scripts and .sql files in migrations/ that predate versioned
+-- migrations. Nothing to run; it marks where the version history starts.
+--
+-- A database created from scratch with `flask create-schema` already has
+-- every later change too: record that with `flask migrations stamp`.
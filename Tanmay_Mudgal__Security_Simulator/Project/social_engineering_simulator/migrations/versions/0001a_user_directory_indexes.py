@@ -0,0 +1,12 @@
+"""
+Indexes for the paginated admin user directory (was migrations/add_user_directory_indexes.sql)
+
+Keyset pages walk users by user_id inside an org/department, and the role
+filter probes user_roles by role first.
+"""
+
+def upgrade(op):
+    op.create_index('users', 'idx_users_org_user', ['org_id', 'user_id'])
+    op.create_index('users', 'idx_users_dept_user', ['dept_id', 'user_id'])
+    op.create_index('users', 'idx_users_email', ['email'])
+    op.create_index('user_roles', 'idx_user_roles_role_user', ['role_id', 'user_id'])
@@ -0,0 +1,19 @@
+"""
+Shared cache for admin dashboard / analytics metrics (was migrations/add_metric_snapshots.sql)
+
+Each row holds one metric's last computed value plus its TTL window and how
+long the computation took (see services/metrics_cache.py). Only the main
+database uses it.
+"""
+
+def upgrade(op):
+    value = 'TEXT' if op.dialect == 'sqlite' else 'JSON'
+    op.execute(f"""
+        CREATE TABLE IF NOT EXISTS metric_snapshots (
+            metric_key VARCHAR(100) NOT NULL PRIMARY KEY,
+            value_json {value} NULL,
+            computed_at DATETIME NULL DEFAULT CURRENT_TIMESTAMP,
+            expires_at DATETIME NOT NULL,
+            stale_until DATETIME NOT NULL,
+            compute_ms FLOAT DEFAULT 0
+        )""")
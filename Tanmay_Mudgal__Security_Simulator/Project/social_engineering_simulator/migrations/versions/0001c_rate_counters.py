@@ -0,0 +1,17 @@
+"""
+Shared counters for rate limits and the free-tier weekly scenario quota (was migrations/add_rate_counters.sql)
+
+Used by COUNTER_STORE_URL=database (see services/counter_store.py): one row
+per key and window; expired rows are restarted by the next hit and pruned
+periodically. Only the main database uses it.
+"""
+
+def upgrade(op):
+    expires_at = 'REAL' if op.dialect == 'sqlite' else 'DOUBLE'
+    op.execute(f"""
+        CREATE TABLE IF NOT EXISTS rate_counters (
+            counter_key VARCHAR(255) NOT NULL PRIMARY KEY,
+            hits INT NOT NULL DEFAULT 0,
+            expires_at {expires_at} NOT NULL
+        )""")
+    op.create_index('rate_counters', 'idx_rate_counters_expires', ['expires_at'])
@@ -0,0 +1,18 @@
+"""
+Replica lag heartbeat (was migrations/add_replica_heartbeat.sql)
+
+`flask db-heartbeat` bumps this row on the primary every second; a replica
+is as far behind as its copy of beat_at is old. Used when SHOW REPLICA
+STATUS isn't available (e.g. separate test servers, managed replicas).
+"""
+import time
+
+def upgrade(op):
+    beat_at = 'REAL' if op.dialect == 'sqlite' else 'DOUBLE'
+    op.execute(f"""
+        CREATE TABLE IF NOT EXISTS replica_heartbeat (
+            beat_id INT NOT NULL PRIMARY KEY,
+            beat_at {beat_at} NOT NULL
+        )""")
+    insert_ignore = 'INSERT OR IGNORE' if op.dialect == 'sqlite' else 'INSERT IGNORE'
+    op.execute(f"{insert_ignore} INTO replica_heartbeat (beat_id, beat_at) VALUES (1, :now)", {'now': time.time()})
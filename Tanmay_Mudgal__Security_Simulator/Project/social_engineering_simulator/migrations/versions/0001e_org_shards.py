@@ -0,0 +1,30 @@
+"""
+Tenant sharding directory (was migrations/add_org_shards.sql; see services/sharding.py)
+
+Maps an organization to the shard holding its users, responses, progress,
+etc. Only the catalog (main) database uses it; orgs without a row are on the
+'default' shard, i.e. the catalog itself.
+
+Primary keys must be unique across shards so an org can be moved without
+renumbering its rows. Give every MySQL server (catalog included) the same
+increment and its own offset, e.g. with three databases in my.cnf:
+    catalog:  auto_increment_increment = 10, auto_increment_offset = 1
+    shard a:  auto_increment_increment = 10, auto_increment_offset = 2
+    shard b:  auto_increment_increment = 10, auto_increment_offset = 3
+and start each shard's counters above the catalog's current maximums.
+"""
+
+def upgrade(op):
+    if op.dialect == 'sqlite':
+        status = "VARCHAR(9) NOT NULL DEFAULT 'active'"
+        updated_at = 'DATETIME NULL DEFAULT CURRENT_TIMESTAMP'
+    else:
+        status = "ENUM('active', 'moving', 'read_only') NOT NULL DEFAULT 'active'"
+        updated_at = 'DATETIME NULL DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP'
+    op.execute(f"""
+        CREATE TABLE IF NOT EXISTS org_shards (
+            org_id INT NOT NULL PRIMARY KEY,
+            shard VARCHAR(50) NOT NULL DEFAULT 'default',
+            status {status},
+            updated_at {updated_at}
+        )""")
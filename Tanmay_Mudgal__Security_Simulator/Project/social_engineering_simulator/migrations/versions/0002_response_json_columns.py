@@ -0,0 +1,8 @@
+"""
+Incident-response drills: ordered steps on scenarios, full answer on responses
+(was apply_db_patch.py)
+"""
+
+def upgrade(op):
+    op.add_column('scenarios', 'steps_json', 'TEXT')
+    op.add_column('user_responses', 'response_json', 'TEXT')
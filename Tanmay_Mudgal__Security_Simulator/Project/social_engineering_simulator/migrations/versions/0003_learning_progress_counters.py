@@ -0,0 +1,32 @@
+"""
+Running attempt/correct counters on learning_progress
+(was migrations/add_learning_progress_counters.sql, whose single UPDATE ... JOIN
+over every user_responses row locked learning_progress for the whole backfill)
+"""
+
+TYPES = ('phishing', 'baiting', 'pretexting')
+
+def _count(scenario_type, correct_only):
+    return (
+        "(SELECT COUNT(*) FROM user_responses ur JOIN scenarios s ON s.scenario_id = ur.scenario_id"
+        f" WHERE ur.user_id = learning_progress.user_id AND s.scenario_type = '{scenario_type.capitalize()}'"
+        + (" AND ur.is_correct = 1" if correct_only else "") + ")"
+    )
+
+def upgrade(op):
+    for kind in TYPES:
+        op.add_column('learning_progress', f'{kind}_attempts', 'INT NOT NULL DEFAULT 0')
+        op.add_column('learning_progress', f'{kind}_correct', 'INT NOT NULL DEFAULT 0')
+
+    # Per-user lookups on the submit path
+    op.create_index('learning_progress', 'idx_learning_progress_user', ['user_id'])
+    op.create_index('assigned_lessons', 'idx_assigned_lessons_user_lesson', ['user_id', 'lesson_id'])
+
+    op.backfill('counters', 'learning_progress', ', '.join(
+        f'{kind}_attempts = {_count(kind, False)}, {kind}_correct = {_count(kind, True)}' for kind in TYPES
+    ))
+    # Separate pass: SQLite evaluates every SET expression against the old row
+    op.backfill('success_rates', 'learning_progress', ', '.join(
+        f'{kind}_success_rate = CASE WHEN {kind}_attempts > 0'
+        f' THEN {kind}_correct * 100.0 / {kind}_attempts ELSE {kind}_success_rate END' for kind in TYPES
+    ))
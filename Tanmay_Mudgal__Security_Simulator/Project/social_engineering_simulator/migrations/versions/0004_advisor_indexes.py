@@ -0,0 +1,9 @@
+"""
+Composite indexes suggested by index_advisor.py
+"""
+
+def upgrade(op):
+    # saves ~15780 ms per workload run over 2142 queries (16.2x); 63 writes to user_responses
+    op.create_index('user_responses', 'idx_user_responses_user_id_is_correct_timestamp', ['user_id', 'is_correct', 'timestamp'])
+    # saves ~445 ms per workload run over 1638 queries (12.6x); 63 writes to user_responses
+    op.create_index('user_responses', 'idx_user_responses_user_id_timestamp', ['user_id', 'timestamp'])
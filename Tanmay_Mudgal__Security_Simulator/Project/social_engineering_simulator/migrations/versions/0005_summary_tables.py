@@ -0,0 +1,118 @@
+"""
+Summary tables behind the reporting views (see app/services/summary_tables.py)
+
+The calculate_user_accuracy trigger ran a COUNT/SUM over all of a user's
+responses on every insert, and user_performance_summary, global_leaderboard
+and user_category_performance aggregated the raw tables on every read. The
+views keep their names and columns but now select from user_stats and
+user_category_stats, which the app updates by delta on each response.
+
+Apply this before deploying the code that maintains the tables, then run
+`flask summaries verify --repair` once it is live to count the responses
+saved in between.
+"""
+
+RANGE = '{column} > :_lo AND {column} <= :_hi'
+
+def _accuracy(correct, attempts):
+    return f'ROUND({correct} * 100.0 / NULLIF({attempts}, 0), 2)'
+
+VIEWS = {
+    'user_performance_summary': f"""
+        SELECT u.user_id, u.username, u.email, u.total_score, u.vulnerability_level,
+               COALESCE(s.total_attempts, 0) AS total_attempts,
+               COALESCE(s.correct_attempts, 0) AS correct_attempts,
+               {_accuracy('s.correct_attempts', 's.total_attempts')} AS accuracy_percentage,
+               s.total_response_time * 1.0 / NULLIF(s.timed_attempts, 0) AS avg_response_time,
+               COALESCE(s.achievements, 0) AS total_achievements,
+               u.created_date AS member_since
+        FROM users u
+        LEFT JOIN user_stats s ON s.user_id = u.user_id""",
+    'global_leaderboard': f"""
+        SELECT ROW_NUMBER() OVER (ORDER BY u.total_score DESC, u.created_date ASC) AS `rank`,
+               u.user_id, u.username, u.total_score, u.vulnerability_level,
+               s.total_attempts AS scenarios_completed,
+               {_accuracy('s.correct_attempts', 's.total_attempts')} AS accuracy,
+               s.achievements AS achievements_earned
+        FROM users u
+        JOIN user_stats s ON s.user_id = u.user_id
+        WHERE s.total_attempts > 0
+        ORDER BY u.total_score DESC
+        LIMIT 50""",
+    'user_category_performance': f"""
+        SELECT u.user_id, u.username, c.category, c.attempts, c.correct,
+               {_accuracy('c.correct', 'c.attempts')} AS accuracy,
+               c.total_response_time * 1.0 / NULLIF(c.timed_attempts, 0) AS avg_time
+        FROM user_category_stats c
+        JOIN users u ON u.user_id = c.user_id
+        WHERE c.attempts > 0""",
+}
+
+RESPONSE_TOTALS = ('COUNT(*) AS attempts, SUM(CASE WHEN ur.is_correct = 1 THEN 1 ELSE 0 END) AS correct, '
+                   'COALESCE(SUM(ur.response_time), 0) AS response_time, COUNT(ur.response_time) AS timed')
+
+def upgrade(op):
+    serial = 'INTEGER PRIMARY KEY AUTOINCREMENT' if op.dialect == 'sqlite' else 'INT AUTO_INCREMENT PRIMARY KEY'
+    op.execute("""
+        CREATE TABLE IF NOT EXISTS user_stats (
+            user_id INT NOT NULL PRIMARY KEY,
+            total_attempts INT NOT NULL DEFAULT 0,
+            correct_attempts INT NOT NULL DEFAULT 0,
+            total_response_time BIGINT NOT NULL DEFAULT 0,
+            timed_attempts INT NOT NULL DEFAULT 0,
+            achievements INT NOT NULL DEFAULT 0,
+            last_updated DATETIME,
+            FOREIGN KEY (user_id) REFERENCES users(user_id)
+        )""")
+    op.execute(f"""
+        CREATE TABLE IF NOT EXISTS user_category_stats (
+            stat_id {serial},
+            user_id INT NOT NULL,
+            category VARCHAR(50) NOT NULL,
+            attempts INT NOT NULL DEFAULT 0,
+            correct INT NOT NULL DEFAULT 0,
+            total_response_time BIGINT NOT NULL DEFAULT 0,
+            timed_attempts INT NOT NULL DEFAULT 0,
+            last_updated DATETIME,
+            CONSTRAINT uq_user_category_stats UNIQUE (user_id, category),
+            FOREIGN KEY (user_id) REFERENCES users(user_id)
+        )""")
+
+    # Each users range is recounted from scratch, so a retried batch can't double count
+    op.backfill('user_stats', 'users', statements=[
+        f"DELETE FROM user_stats WHERE {RANGE.format(column='user_id')}",
+        f"""INSERT INTO user_stats (user_id, total_attempts, correct_attempts, total_response_time,
+                                    timed_attempts, achievements, last_updated)
+            SELECT u.user_id, COALESCE(r.attempts, 0), COALESCE(r.correct, 0), COALESCE(r.response_time, 0),
+                   COALESCE(r.timed, 0), COALESCE(a.earned, 0), CURRENT_TIMESTAMP
+            FROM users u
+            LEFT JOIN (SELECT ur.user_id, {RESPONSE_TOTALS} FROM user_responses ur
+                       WHERE {RANGE.format(column='ur.user_id')} GROUP BY ur.user_id) r ON r.user_id = u.user_id
+            LEFT JOIN (SELECT user_id, COUNT(*) AS earned FROM achievements
+                       WHERE {RANGE.format(column='user_id')} GROUP BY user_id) a ON a.user_id = u.user_id
+            WHERE {RANGE.format(column='u.user_id')} AND (r.user_id IS NOT NULL OR a.user_id IS NOT NULL)""",
+    ])
+    op.backfill('user_category_stats', 'users', statements=[
+        f"DELETE FROM user_category_stats WHERE {RANGE.format(column='user_id')}",
+        f"""INSERT INTO user_category_stats (user_id, category, attempts, correct, total_response_time,
+                                             timed_attempts, last_updated)
+            SELECT ur.user_id, s.scenario_type, {RESPONSE_TOTALS}, CURRENT_TIMESTAMP
+            FROM user_responses ur
+            JOIN scenarios s ON s.scenario_id = ur.scenario_id
+            WHERE {RANGE.format(column='ur.user_id')}
+            GROUP BY ur.user_id, s.scenario_type""",
+    ])
+    op.backfill('vulnerability_level', 'users', """vulnerability_level = (
+        SELECT CASE WHEN correct_attempts * 100.0 / total_attempts >= 80 THEN 'Low'
+                    WHEN correct_attempts * 100.0 / total_attempts >= 50 THEN 'Medium'
+                    ELSE 'High' END
+        FROM user_stats s WHERE s.user_id = users.user_id)""",
+        where='user_id IN (SELECT user_id FROM user_stats WHERE total_attempts > 0)')
+
+    op.execute('DROP TRIGGER IF EXISTS calculate_user_accuracy')
+    for name, select in VIEWS.items():
+        if op.dialect == 'mysql':
+            op.execute(f'CREATE OR REPLACE VIEW {name} AS {select}')
+        else:
+            op.execute(f'DROP VIEW IF EXISTS {name}')
+            op.execute(f'CREATE VIEW {name} AS {select}')
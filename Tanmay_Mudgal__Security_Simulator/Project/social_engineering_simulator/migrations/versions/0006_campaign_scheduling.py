@@ -0,0 +1,17 @@
+"""
+Campaign delivery windows for the send scheduler (services/campaign_scheduler.py)
+
+Campaigns launched before the scheduler have no window, so the dispatcher
+leaves them alone. Schedule them one by one (`flask campaigns schedule <id>`)
+or all at once with the default window and send hours
+(`flask campaigns schedule --reschedule-legacy`).
+"""
+
+def upgrade(op):
+    op.add_column('campaigns', 'send_window_start', 'DATETIME NULL')
+    op.add_column('campaigns', 'send_window_end', 'DATETIME NULL')
+    op.add_column('campaigns', 'send_hours', 'VARCHAR(11) NULL')
+    op.add_column('campaigns', 'paused_at', 'DATETIME NULL')
+
+    # Pending-target scans and per-status counts of one campaign
+    op.create_index('campaign_targets', 'idx_campaign_targets_campaign_status', ['campaign_id', 'status', 'target_id'])
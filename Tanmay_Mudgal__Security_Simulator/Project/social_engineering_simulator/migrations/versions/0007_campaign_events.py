@@ -0,0 +1,20 @@
+"""
+Open / click events of campaign emails (see services/tracking_events.py)
+"""
+
+def upgrade(op):
+    big_serial = 'INTEGER PRIMARY KEY AUTOINCREMENT' if op.dialect == 'sqlite' else 'BIGINT AUTO_INCREMENT PRIMARY KEY'
+    op.execute(f"""
+        CREATE TABLE IF NOT EXISTS campaign_events (
+            event_id {big_serial},
+            campaign_id INT NOT NULL,
+            target_id INT NOT NULL,
+            event_type VARCHAR(10) NOT NULL,
+            occurred_at DATETIME NOT NULL,
+            ip_address VARCHAR(45),
+            user_agent VARCHAR(255),
+            CONSTRAINT uq_campaign_events_target_type UNIQUE (target_id, event_type),
+            FOREIGN KEY (campaign_id) REFERENCES campaigns(campaign_id),
+            FOREIGN KEY (target_id) REFERENCES campaign_targets(target_id)
+        )""")
+    op.create_index('campaign_events', 'idx_campaign_events_campaign_type', ['campaign_id', 'event_type'])
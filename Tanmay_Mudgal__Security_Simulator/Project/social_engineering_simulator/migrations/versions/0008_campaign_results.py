@@ -0,0 +1,24 @@
+"""
+Campaign results cube (see services/campaign_results.py)
+
+The dispatcher and the tracking ingester keep it current from the next
+deploy on; run `flask campaigns rebuild-results` once that is live to count
+the campaigns sent and tracked before it.
+"""
+
+def upgrade(op):
+    serial = 'INTEGER PRIMARY KEY AUTOINCREMENT' if op.dialect == 'sqlite' else 'INT AUTO_INCREMENT PRIMARY KEY'
+    op.execute(f"""
+        CREATE TABLE IF NOT EXISTS campaign_results (
+            result_id {serial},
+            campaign_id INT NOT NULL,
+            dept_id INT NOT NULL DEFAULT 0,
+            team_id INT NOT NULL DEFAULT 0,
+            day DATE NOT NULL,
+            sent INT NOT NULL DEFAULT 0,
+            opened INT NOT NULL DEFAULT 0,
+            clicked INT NOT NULL DEFAULT 0,
+            reported INT NOT NULL DEFAULT 0,
+            CONSTRAINT uq_campaign_results_cell UNIQUE (campaign_id, dept_id, team_id, day),
+            FOREIGN KEY (campaign_id) REFERENCES campaigns(campaign_id)
+        )""")
@@ -0,0 +1,40 @@
+"""
+Near-duplicate clusters of suspicious reports (see services/report_clusters.py)
+
+Run `flask reports recluster` once the code that maintains them is live, to
+sign and cluster the reports submitted before.
+"""
+
+def upgrade(op):
+    serial = 'INTEGER PRIMARY KEY AUTOINCREMENT' if op.dialect == 'sqlite' else 'INT AUTO_INCREMENT PRIMARY KEY'
+    status = ("VARCHAR(9) DEFAULT 'Pending'" if op.dialect == 'sqlite'
+              else "ENUM('Pending', 'Approved', 'Rejected', 'Converted') DEFAULT 'Pending'")
+    op.execute(f"""
+        CREATE TABLE IF NOT EXISTS report_clusters (
+            cluster_id {serial},
+            org_id INT NULL,
+            representative_id INT NULL,
+            signature BLOB NULL,
+            category VARCHAR(50) NOT NULL,
+            status {status},
+            admin_notes TEXT,
+            report_count INT NOT NULL DEFAULT 0,
+            pending_count INT NOT NULL DEFAULT 0,
+            first_reported_at DATETIME NULL,
+            last_reported_at DATETIME NULL,
+            FOREIGN KEY (org_id) REFERENCES organizations(org_id)
+        )""")
+    op.create_index('report_clusters', 'idx_report_clusters_status_last', ['status', 'last_reported_at', 'cluster_id'])
+    big_serial = 'INTEGER PRIMARY KEY AUTOINCREMENT' if op.dialect == 'sqlite' else 'BIGINT AUTO_INCREMENT PRIMARY KEY'
+    op.execute(f"""
+        CREATE TABLE IF NOT EXISTS report_cluster_bands (
+            band_id {big_serial},
+            band_hash BIGINT NOT NULL,
+            cluster_id INT NOT NULL,
+            CONSTRAINT uq_report_cluster_bands_hash_cluster UNIQUE (band_hash, cluster_id),
+            FOREIGN KEY (cluster_id) REFERENCES report_clusters(cluster_id)
+        )""")
+
+    op.add_column('suspicious_reports', 'signature', 'BLOB NULL')
+    op.add_column('suspicious_reports', 'cluster_id', 'INT NULL')
+    op.create_index('suspicious_reports', 'idx_suspicious_reports_cluster_status', ['cluster_id', 'status', 'report_id'])
@@ -0,0 +1,48 @@
+"""
+One user_progress row per (user_id, module_id)
+
+schema.sql always had this key, but databases built from the models didn't,
+and concurrent first views could insert a second row. Module views are now
+upserted on it (services/module_views.py). Duplicates are merged into the
+oldest row first: views added up, the earliest first view, the latest
+activity and completion, the best score and the furthest status.
+"""
+import sqlalchemy as sa
+
+STATUS_ORDER = ('locked', 'unlocked', 'in_progress', 'completed')
+
+def _merge(rows):
+    def present(column):
+        return [row[column] for row in rows if row[column] is not None]
+    return {
+        'view_count': sum(present('view_count')),
+        'first_viewed_at': min(present('first_viewed_at'), default=None),
+        'last_activity_at': max(present('last_activity_at'), default=None),
+        'completed_at': max(present('completed_at'), default=None),
+        'score': max(present('score'), default=0),
+        'status': max(present('status'), key=STATUS_ORDER.index, default='locked'),
+    }
+
+def upgrade(op):
+    if op.has_index('user_progress', 'unique_user_module'):
+        op.log('  index unique_user_module already exists')
+        return
+    with op.engine.begin() as conn:
+        duplicated = conn.execute(sa.text(
+            'SELECT user_id, module_id FROM user_progress GROUP BY user_id, module_id HAVING COUNT(*) > 1')).all()
+        for user_id, module_id in duplicated:
+            key = {'user_id': user_id, 'module_id': module_id}
+            rows = conn.execute(sa.text(
+                'SELECT progress_id, score, status, completed_at, first_viewed_at, last_activity_at, view_count '
+                'FROM user_progress WHERE user_id = :user_id AND module_id = :module_id ORDER BY progress_id'),
+                key).mappings().all()
+            keep = rows[0]['progress_id']
+            conn.execute(sa.text(
+                'UPDATE user_progress SET view_count = :view_count, first_viewed_at = :first_viewed_at, '
+                'last_activity_at = :last_activity_at, completed_at = :completed_at, score = :score, '
+                'status = :status WHERE progress_id = :keep'), dict(_merge(rows), keep=keep))
+            conn.execute(sa.text('DELETE FROM user_progress WHERE user_id = :user_id AND module_id = :module_id '
+                                 'AND progress_id <> :keep'), dict(key, keep=keep))
+    if duplicated:
+        op.log(f'  merged duplicate rows of {len(duplicated)} (user, module) pairs')
+    op.create_index('user_progress', 'unique_user_module', ['user_id', 'module_id'], unique=True)
@@ -0,0 +1,40 @@
+"""
+Background job queue and cron schedules (see services/jobs.py)
+
+Only the main database uses them; `flask jobs work` fills job_schedules from
+the registered schedules when it starts.
+"""
+
+def upgrade(op):
+    serial = 'INTEGER PRIMARY KEY AUTOINCREMENT' if op.dialect == 'sqlite' else 'BIGINT AUTO_INCREMENT PRIMARY KEY'
+    status = ("VARCHAR(9) NOT NULL DEFAULT 'queued'" if op.dialect == 'sqlite'
+              else "ENUM('queued', 'running', 'succeeded', 'failed') NOT NULL DEFAULT 'queued'")
+    payload = 'TEXT' if op.dialect == 'sqlite' else 'JSON'
+    op.execute(f"""
+        CREATE TABLE IF NOT EXISTS jobs (
+            job_id {serial},
+            name VARCHAR(100) NOT NULL,
+            payload {payload} NULL,
+            status {status},
+            run_at DATETIME NOT NULL,
+            attempts INT NOT NULL DEFAULT 0,
+            max_attempts INT NOT NULL DEFAULT 3,
+            lease_owner VARCHAR(100) NULL,
+            lease_expires_at DATETIME NULL,
+            last_error TEXT,
+            schedule VARCHAR(100) NULL,
+            created_at DATETIME NULL,
+            started_at DATETIME NULL,
+            finished_at DATETIME NULL,
+            duration_ms FLOAT NULL
+        )""")
+    op.create_index('jobs', 'idx_jobs_status_run_at', ['status', 'run_at'])
+    op.create_index('jobs', 'idx_jobs_name_status', ['name', 'status'])
+    op.execute("""
+        CREATE TABLE IF NOT EXISTS job_schedules (
+            name VARCHAR(100) NOT NULL PRIMARY KEY,
+            cron VARCHAR(100) NOT NULL,
+            next_run_at DATETIME NOT NULL,
+            last_run_at DATETIME NULL,
+            last_job_id BIGINT NULL
+        )""")